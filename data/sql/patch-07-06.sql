@@ -0,0 +1,22 @@
+-- Queue of jobs that are run after the transaction that created them
+
+CREATE TYPE background_job_status AS ENUM ('pending', 'done', 'failed');
+
+CREATE TABLE background_job (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v1(),
+    te_id bigint UNIQUE REFERENCES transaction_entry(id) DEFAULT new_te(),
+
+    job_type text NOT NULL,
+    data jsonb,
+    status background_job_status NOT NULL DEFAULT 'pending',
+    attempts integer NOT NULL DEFAULT 0,
+    max_attempts integer NOT NULL DEFAULT 5,
+    created_date timestamp NOT NULL DEFAULT now(),
+    run_after timestamp NOT NULL DEFAULT now(),
+    finished_date timestamp,
+    error text
+);
+CREATE RULE update_te AS ON UPDATE TO background_job DO ALSO SELECT update_te(old.te_id, 'background_job');
+
+CREATE INDEX background_job_pending_idx ON background_job (run_after)
+    WHERE status = 'pending';
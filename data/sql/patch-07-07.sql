@@ -0,0 +1,57 @@
+-- Stock of each storable on each branch, summed over its batches
+
+CREATE TABLE product_stock_summary (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v1(),
+    te_id bigint UNIQUE REFERENCES transaction_entry(id) DEFAULT new_te(),
+
+    storable_id uuid NOT NULL REFERENCES storable(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    branch_id uuid NOT NULL REFERENCES branch(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    quantity numeric(20, 3) NOT NULL DEFAULT 0,
+    -- The sum of quantity * stock_cost of the stock items. Not rounded,
+    -- so it is always equal to the sum of the products
+    total_cost numeric NOT NULL DEFAULT 0,
+    UNIQUE (storable_id, branch_id)
+);
+-- There's no update_te rule: the rows are maintained by the trigger
+-- below and are never synchronized. Also, ON CONFLICT cannot be used
+-- on a table that has an UPDATE rule.
+
+CREATE OR REPLACE FUNCTION update_stock_summary() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.storable_id IS NOT NULL THEN
+        UPDATE product_stock_summary SET
+                quantity = quantity - OLD.quantity,
+                total_cost = total_cost - OLD.quantity * COALESCE(OLD.stock_cost, 0)
+            WHERE storable_id = OLD.storable_id AND branch_id = OLD.branch_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.storable_id IS NOT NULL THEN
+        INSERT INTO product_stock_summary
+                (storable_id, branch_id, quantity, total_cost)
+            VALUES
+                (NEW.storable_id, NEW.branch_id, NEW.quantity,
+                 NEW.quantity * COALESCE(NEW.stock_cost, 0))
+            ON CONFLICT (storable_id, branch_id) DO UPDATE SET
+                quantity = product_stock_summary.quantity + EXCLUDED.quantity,
+                total_cost = product_stock_summary.total_cost + EXCLUDED.total_cost;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_stock_summary_trigger
+    AFTER INSERT OR DELETE OR
+          UPDATE OF quantity, stock_cost, storable_id, branch_id
+    ON product_stock_item
+    FOR EACH ROW
+    EXECUTE PROCEDURE update_stock_summary();
+
+INSERT INTO product_stock_summary (storable_id, branch_id, quantity, total_cost)
+    SELECT storable_id, branch_id, SUM(quantity),
+           SUM(quantity * COALESCE(stock_cost, 0))
+        FROM product_stock_item
+        WHERE storable_id IS NOT NULL
+        GROUP BY storable_id, branch_id;
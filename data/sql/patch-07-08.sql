@@ -0,0 +1,116 @@
+-- Credit balances of the payers, maintained by triggers on payment
+
+CREATE TABLE client_credit_balance (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v1(),
+    te_id bigint UNIQUE REFERENCES transaction_entry(id) DEFAULT new_te(),
+
+    person_id uuid NOT NULL UNIQUE REFERENCES person(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    -- Paid 'credit' payments: out payments add to it, in payments
+    -- subtract from it
+    credit_balance numeric(20, 2) NOT NULL DEFAULT 0,
+    -- Pending or confirmed 'store_credit' in payments
+    store_credit_debit numeric(20, 2) NOT NULL DEFAULT 0
+);
+-- Like product_stock_summary, there's no update_te rule: the rows are
+-- maintained by the triggers below and ON CONFLICT cannot be used on a
+-- table that has an UPDATE rule.
+
+CREATE OR REPLACE FUNCTION apply_client_credit_delta(
+    payer_id_ uuid, p payment, sign_ integer) RETURNS void AS $$
+DECLARE
+    method_ text;
+    credit_ numeric(20, 2) := 0;
+    store_credit_ numeric(20, 2) := 0;
+BEGIN
+    IF payer_id_ IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT method_name INTO method_ FROM payment_method WHERE id = p.method_id;
+    IF method_ = 'credit' AND p.status = 'paid' THEN
+        IF p.payment_type = 'out' THEN
+            credit_ := COALESCE(p.paid_value, 0);
+        ELSE
+            credit_ := -COALESCE(p.paid_value, 0);
+        END IF;
+    ELSIF (method_ = 'store_credit' AND p.payment_type = 'in' AND
+           p.status IN ('pending', 'confirmed')) THEN
+        store_credit_ := COALESCE(p.value, 0);
+    ELSE
+        RETURN;
+    END IF;
+
+    INSERT INTO client_credit_balance
+            (person_id, credit_balance, store_credit_debit)
+        VALUES
+            (payer_id_, sign_ * credit_, sign_ * store_credit_)
+        ON CONFLICT (person_id) DO UPDATE SET
+            credit_balance = client_credit_balance.credit_balance +
+                             EXCLUDED.credit_balance,
+            store_credit_debit = client_credit_balance.store_credit_debit +
+                                 EXCLUDED.store_credit_debit;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_client_credit_balance() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_client_credit_delta(
+            (SELECT payer_id FROM payment_group WHERE id = OLD.group_id),
+            OLD, -1);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_client_credit_delta(
+            (SELECT payer_id FROM payment_group WHERE id = NEW.group_id),
+            NEW, 1);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_client_credit_balance_trigger
+    AFTER INSERT OR DELETE OR
+          UPDATE OF status, payment_type, value, paid_value, method_id, group_id
+    ON payment
+    FOR EACH ROW
+    EXECUTE PROCEDURE update_client_credit_balance();
+
+CREATE OR REPLACE FUNCTION update_client_credit_balance_payer() RETURNS trigger AS $$
+DECLARE
+    p payment%ROWTYPE;
+BEGIN
+    FOR p IN SELECT * FROM payment WHERE group_id = NEW.id LOOP
+        PERFORM apply_client_credit_delta(OLD.payer_id, p, -1);
+        PERFORM apply_client_credit_delta(NEW.payer_id, p, 1);
+    END LOOP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_client_credit_balance_payer_trigger
+    AFTER UPDATE OF payer_id ON payment_group
+    FOR EACH ROW
+    WHEN (OLD.payer_id IS DISTINCT FROM NEW.payer_id)
+    EXECUTE PROCEDURE update_client_credit_balance_payer();
+
+INSERT INTO client_credit_balance (person_id, credit_balance, store_credit_debit)
+    SELECT pg.payer_id,
+           SUM(CASE WHEN pm.method_name = 'credit' AND p.status = 'paid' THEN
+                   CASE WHEN p.payment_type = 'out' THEN COALESCE(p.paid_value, 0)
+                        ELSE -COALESCE(p.paid_value, 0) END
+               ELSE 0 END),
+           SUM(CASE WHEN pm.method_name = 'store_credit' AND
+                         p.payment_type = 'in' AND
+                         p.status IN ('pending', 'confirmed') THEN
+                   COALESCE(p.value, 0)
+               ELSE 0 END)
+        FROM payment p
+        JOIN payment_group pg ON pg.id = p.group_id
+        JOIN payment_method pm ON pm.id = p.method_id
+        WHERE pg.payer_id IS NOT NULL AND
+              pm.method_name IN ('credit', 'store_credit')
+        GROUP BY pg.payer_id;
@@ -0,0 +1,75 @@
+-- Monthly checkpoints of the account balances, maintained by a trigger
+-- on account_transaction
+
+CREATE TABLE account_balance_checkpoint (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v1(),
+    te_id bigint UNIQUE REFERENCES transaction_entry(id) DEFAULT new_te(),
+
+    account_id uuid NOT NULL REFERENCES account(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    -- The midnight of the first day of the month
+    month timestamp NOT NULL,
+    -- The sum of the transactions of the month to the account
+    incoming numeric(20, 2) NOT NULL DEFAULT 0,
+    -- The sum of the transactions of the month from the account
+    outgoing numeric(20, 2) NOT NULL DEFAULT 0,
+    UNIQUE (account_id, month)
+);
+-- Like product_stock_summary, there's no update_te rule: the rows are
+-- maintained by the trigger below and ON CONFLICT cannot be used on a
+-- table that has an UPDATE rule.
+
+CREATE OR REPLACE FUNCTION apply_account_balance_delta(
+    t account_transaction, sign_ integer) RETURNS void AS $$
+BEGIN
+    -- A transaction that was not adjusted has the same source and
+    -- destination, so it is both incoming and outgoing
+    INSERT INTO account_balance_checkpoint
+            (account_id, month, incoming, outgoing)
+        VALUES
+            (t.account_id, date_trunc('month', t.date),
+             sign_ * t.value, 0)
+        ON CONFLICT (account_id, month) DO UPDATE SET
+            incoming = account_balance_checkpoint.incoming + EXCLUDED.incoming;
+
+    INSERT INTO account_balance_checkpoint
+            (account_id, month, incoming, outgoing)
+        VALUES
+            (t.source_account_id, date_trunc('month', t.date),
+             0, sign_ * t.value)
+        ON CONFLICT (account_id, month) DO UPDATE SET
+            outgoing = account_balance_checkpoint.outgoing + EXCLUDED.outgoing;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_account_balance_checkpoint() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_account_balance_delta(OLD, -1);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_account_balance_delta(NEW, 1);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_account_balance_checkpoint_trigger
+    AFTER INSERT OR DELETE OR
+          UPDATE OF account_id, source_account_id, value, date
+    ON account_transaction
+    FOR EACH ROW
+    EXECUTE PROCEDURE update_account_balance_checkpoint();
+
+INSERT INTO account_balance_checkpoint (account_id, month, incoming, outgoing)
+    SELECT account_id, month, SUM(incoming), SUM(outgoing)
+        FROM (SELECT account_id, date_trunc('month', date) AS month,
+                     value AS incoming, 0 AS outgoing
+                  FROM account_transaction
+              UNION ALL
+              SELECT source_account_id, date_trunc('month', date),
+                     0, value
+                  FROM account_transaction) AS movement
+        GROUP BY account_id, month;
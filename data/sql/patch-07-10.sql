@@ -0,0 +1,34 @@
+-- Reorder suggestions of each storable on each branch, calculated from
+-- its sales, stock and pending purchases
+
+CREATE TABLE product_reorder_suggestion (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v1(),
+    te_id bigint UNIQUE REFERENCES transaction_entry(id) DEFAULT new_te(),
+
+    storable_id uuid NOT NULL REFERENCES storable(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    branch_id uuid NOT NULL REFERENCES branch(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    -- The main supplier of the product for the branch, if there's one
+    supplier_id uuid REFERENCES supplier(id)
+        ON UPDATE CASCADE ON DELETE SET NULL,
+    calculated_date timestamp NOT NULL,
+    -- How many days of sales were considered
+    days integer NOT NULL CONSTRAINT positive_days CHECK (days > 0),
+    quantity_sold numeric(20, 3) NOT NULL DEFAULT 0,
+    -- The average quantity sold per day
+    daily_sales numeric(20, 3) NOT NULL DEFAULT 0,
+    stock numeric(20, 3) NOT NULL DEFAULT 0,
+    to_receive numeric(20, 3) NOT NULL DEFAULT 0,
+    lead_time integer NOT NULL DEFAULT 0,
+    -- How many days the stock lasts at the current sales. NULL when
+    -- nothing was sold
+    days_of_cover numeric(20, 2),
+    abc_class text NOT NULL CONSTRAINT valid_abc_class
+        CHECK (abc_class IN ('A', 'B', 'C')),
+    reorder_point numeric(20, 3) NOT NULL DEFAULT 0,
+    suggested_quantity numeric(20, 3) NOT NULL DEFAULT 0,
+    UNIQUE (storable_id, branch_id)
+);
+-- There's no update_te rule: the rows are recalculated from the other
+-- tables and are never synchronized.
@@ -0,0 +1,29 @@
+-- Snapshots of the stock of each storable on each branch, so the stock at
+-- a date doesn't need to sum all the stock_transaction_history before it
+
+CREATE TABLE product_stock_snapshot (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v1(),
+    te_id bigint UNIQUE REFERENCES transaction_entry(id) DEFAULT new_te(),
+
+    -- The transactions made before this date are in the snapshot
+    date timestamp NOT NULL,
+    storable_id uuid NOT NULL REFERENCES storable(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    branch_id uuid NOT NULL REFERENCES branch(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    batch_id uuid REFERENCES storable_batch(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    quantity numeric(20, 3) NOT NULL
+);
+-- There's no update_te rule: the rows are recalculated from
+-- stock_transaction_history and are never synchronized.
+
+CREATE INDEX product_stock_snapshot_date_storable_branch_idx
+    ON product_stock_snapshot (date, storable_id, branch_id);
+
+-- Only the transactions after the last snapshot are summed
+CREATE INDEX stock_transaction_history_date_idx
+    ON stock_transaction_history (date);
+
+-- Take the missing snapshots and schedule the next ones
+INSERT INTO background_job (job_type) VALUES ('stock-snapshots');
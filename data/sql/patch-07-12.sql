@@ -0,0 +1,30 @@
+-- Notify the id and the table of the deleted rows of the tables kept in
+-- memory by the processes. The new_te and update_te notifications can't
+-- tell them that a row is gone.
+
+CREATE OR REPLACE FUNCTION notify_delete_row() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('delete_row', OLD.id::text || ',' || TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER notify_delete_row_trigger
+    AFTER DELETE ON sellable
+    FOR EACH ROW EXECUTE PROCEDURE notify_delete_row();
+
+CREATE TRIGGER notify_delete_row_trigger
+    AFTER DELETE ON sellable_category
+    FOR EACH ROW EXECUTE PROCEDURE notify_delete_row();
+
+CREATE TRIGGER notify_delete_row_trigger
+    AFTER DELETE ON client_category_price
+    FOR EACH ROW EXECUTE PROCEDURE notify_delete_row();
+
+CREATE TRIGGER notify_delete_row_trigger
+    AFTER DELETE ON product_component
+    FOR EACH ROW EXECUTE PROCEDURE notify_delete_row();
+
+CREATE TRIGGER notify_delete_row_trigger
+    AFTER DELETE ON storable_batch
+    FOR EACH ROW EXECUTE PROCEDURE notify_delete_row();
@@ -0,0 +1,76 @@
+-- The account balance checkpoints are no longer updated by the trigger on
+-- account_transaction: every payment of every station updated the same
+-- rows, those of the current month of the tills and sales accounts, and
+-- kept them locked until its transaction was committed.
+
+DROP TRIGGER update_account_balance_checkpoint_trigger ON account_transaction;
+DROP FUNCTION update_account_balance_checkpoint();
+DROP FUNCTION apply_account_balance_delta(account_transaction, integer);
+
+-- The changes to the transactions that were not rolled up into the
+-- checkpoints yet. The trigger only inserts new rows, so the transactions
+-- don't wait for each other, and the account-checkpoints background job
+-- moves them to the checkpoints.
+CREATE TABLE account_balance_delta (
+    id bigserial PRIMARY KEY,
+    account_id uuid NOT NULL REFERENCES account(id)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    -- The midnight of the first day of the month
+    month timestamp NOT NULL,
+    incoming numeric(20, 2) NOT NULL DEFAULT 0,
+    outgoing numeric(20, 2) NOT NULL DEFAULT 0
+);
+-- There's no te_id: the rows are temporary and are never synchronized.
+
+CREATE OR REPLACE FUNCTION insert_account_balance_delta(
+    t account_transaction, sign_ integer) RETURNS void AS $$
+BEGIN
+    -- A transaction that was not adjusted has the same source and
+    -- destination, so it is both incoming and outgoing
+    INSERT INTO account_balance_delta (account_id, month, incoming, outgoing)
+        VALUES (t.account_id, date_trunc('month', t.date),
+                sign_ * t.value, 0),
+               (t.source_account_id, date_trunc('month', t.date),
+                0, sign_ * t.value);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION insert_account_balance_deltas() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM insert_account_balance_delta(OLD, -1);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM insert_account_balance_delta(NEW, 1);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER insert_account_balance_deltas_trigger
+    AFTER INSERT OR DELETE OR
+          UPDATE OF account_id, source_account_id, value, date
+    ON account_transaction
+    FOR EACH ROW
+    EXECUTE PROCEDURE insert_account_balance_deltas();
+
+-- The sums of the transactions of the account up to the end of the month,
+-- so the balance is read from the last checkpoint of the account
+ALTER TABLE account_balance_checkpoint
+    ADD COLUMN total_incoming numeric(20, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN total_outgoing numeric(20, 2) NOT NULL DEFAULT 0;
+
+UPDATE account_balance_checkpoint SET
+        total_incoming = totals.total_incoming,
+        total_outgoing = totals.total_outgoing
+    FROM (SELECT id,
+                 SUM(incoming) OVER w AS total_incoming,
+                 SUM(outgoing) OVER w AS total_outgoing
+              FROM account_balance_checkpoint
+              WINDOW w AS (PARTITION BY account_id ORDER BY month)) AS totals
+    WHERE totals.id = account_balance_checkpoint.id;
+
+-- Roll up the deltas every day
+INSERT INTO background_job (job_type) VALUES ('account-checkpoints');
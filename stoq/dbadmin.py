@@ -512,6 +512,424 @@ class StoqCommandHandler:
         from stoqlib.lib.sintegragenerator import generate
         generate(filename, start, end)
 
+    def cmd_generate_scale_data(self, options):
+        """Generate a large dataset for performance testing"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+        logging.getLogger('stoqlib.domain.scaledata').setLevel(logging.INFO)
+
+        import datetime
+        from stoqlib.database.admin import USER_ADMIN_DEFAULT_NAME
+        from stoqlib.database.runtime import new_store
+        from stoqlib.domain.person import LoginUser
+        from stoqlib.domain.scaledata import ScaleDataCreator
+
+        start_date = None
+        if options.start_date:
+            start_date = datetime.datetime.strptime(options.start_date,
+                                                    '%Y-%m-%d').date()
+
+        with new_store() as store:
+            user = store.find(LoginUser,
+                              username=USER_ADMIN_DEFAULT_NAME).one()
+            creator = ScaleDataCreator(
+                store, user, seed=options.seed,
+                branches=options.branches,
+                sellables=options.sellables,
+                days=int(options.years * 365),
+                sales_per_day=options.sales_per_day,
+                start_date=start_date,
+                chunk_size=options.chunk_size)
+            for name, elapsed in creator.create():
+                print('%s: %.2fs' % (name, elapsed))
+            store.retval = not options.dry
+
+    def opt_generate_scale_data(self, parser, group):
+        group.add_option('', '--seed',
+                         action='store',
+                         type='int',
+                         default=0,
+                         dest='seed')
+        group.add_option('', '--branches',
+                         action='store',
+                         type='int',
+                         default=3,
+                         dest='branches')
+        group.add_option('', '--sellables',
+                         action='store',
+                         type='int',
+                         default=1000000,
+                         dest='sellables')
+        group.add_option('', '--years',
+                         action='store',
+                         type='float',
+                         default=2,
+                         dest='years')
+        group.add_option('', '--sales-per-day',
+                         action='store',
+                         type='int',
+                         default=200,
+                         help='Number of sales per branch per day',
+                         dest='sales_per_day')
+        group.add_option('', '--start-date',
+                         action='store',
+                         help='Date of the first sale (YYYY-MM-DD)',
+                         dest='start_date')
+        group.add_option('', '--chunk-size',
+                         action='store',
+                         type='int',
+                         default=1000,
+                         dest='chunk_size')
+
+    def cmd_benchmark(self, options):
+        """Run the performance benchmarks"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+
+        from stoqlib.database.admin import USER_ADMIN_DEFAULT_NAME
+        from stoqlib.database.runtime import get_default_store
+        from stoqlib.domain.person import Branch, LoginUser
+        from stoqlib.domain.station import BranchStation
+        from stoqlib.lib.benchmark import (BenchmarkRunner, compare_results,
+                                           format_results, load_results,
+                                           save_results)
+        from stoqlib.lib.benchmarkcases import get_benchmarks
+
+        store = get_default_store()
+        branch = store.find(Branch, acronym=options.branch).one()
+        if branch is None:
+            print('Branch %s not found' % (options.branch, ))
+            return 1
+        station = store.find(BranchStation, branch=branch,
+                             is_active=True).order_by(BranchStation.name).first()
+        if station is None:
+            print('Branch %s has no active stations' % (options.branch, ))
+            return 1
+        user = store.find(LoginUser, username=USER_ADMIN_DEFAULT_NAME).one()
+
+        benchmarks = get_benchmarks(options.benchmarks)
+        runner = BenchmarkRunner(branch, station, user, repeat=options.repeat)
+        results = runner.run(benchmarks)
+        print(format_results(results))
+
+        if options.output:
+            save_results(results, options.output)
+
+        if options.baseline:
+            regressions = compare_results(load_results(options.baseline),
+                                          results, options.tolerance)
+            for name, metric, old, new in regressions:
+                print('REGRESSION: %s %s went from %s to %s' % (
+                    name, metric, old, new))
+            if regressions:
+                return 1
+        return 0
+
+    def opt_benchmark(self, parser, group):
+        group.add_option('', '--branch',
+                         action='store',
+                         default='SC01',
+                         help='Acronym of the branch to run the benchmarks on',
+                         dest='branch')
+        group.add_option('', '--benchmark',
+                         action='append',
+                         help='Only run the benchmarks matching this pattern',
+                         dest='benchmarks')
+        group.add_option('', '--repeat',
+                         action='store',
+                         type='int',
+                         default=5,
+                         dest='repeat')
+        group.add_option('', '--output',
+                         action='store',
+                         help='Save the results to this json file',
+                         dest='output')
+        group.add_option('', '--baseline',
+                         action='store',
+                         help='Compare the results with this json file',
+                         dest='baseline')
+        group.add_option('', '--tolerance',
+                         action='store',
+                         type='float',
+                         default=0.2,
+                         help='Allowed relative increase of time and memory',
+                         dest='tolerance')
+
+    def cmd_load_test(self, options):
+        """Simulate concurrent checkouts on many POS stations"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+
+        from stoqlib.database.admin import USER_ADMIN_DEFAULT_NAME
+        from stoqlib.database.runtime import get_default_store
+        from stoqlib.domain.person import Branch, LoginUser
+        from stoqlib.lib.loadtest import PosLoadTest
+
+        store = get_default_store()
+        branch = store.find(Branch, acronym=options.branch).one()
+        if branch is None:
+            print('Branch %s not found' % (options.branch, ))
+            return 1
+        user = store.find(LoginUser, username=USER_ADMIN_DEFAULT_NAME).one()
+
+        load_test = PosLoadTest(branch, user,
+                                stations=options.stations,
+                                sales_per_station=options.sales,
+                                max_items=options.max_items,
+                                sellables=options.sellables,
+                                card_ratio=options.card_ratio,
+                                think_time=options.think_time,
+                                station_prefix=options.station_prefix,
+                                commit=not options.dry,
+                                retries=options.retries,
+                                seed=options.seed)
+        load_test.prepare()
+        stats = load_test.run()
+        print(stats.format())
+        return 0
+
+    def opt_load_test(self, parser, group):
+        group.add_option('', '--branch',
+                         action='store',
+                         default='SC01',
+                         help='Acronym of the branch where the sales are made',
+                         dest='branch')
+        group.add_option('', '--stations',
+                         action='store',
+                         type='int',
+                         default=30,
+                         dest='stations')
+        group.add_option('', '--sales',
+                         action='store',
+                         type='int',
+                         default=100,
+                         help='Number of sales per station',
+                         dest='sales')
+        group.add_option('', '--max-items',
+                         action='store',
+                         type='int',
+                         default=20,
+                         dest='max_items')
+        group.add_option('', '--sellables',
+                         action='store',
+                         type='int',
+                         default=200,
+                         help='Number of sellables the items are picked from',
+                         dest='sellables')
+        group.add_option('', '--card-ratio',
+                         action='store',
+                         type='float',
+                         default=0.3,
+                         dest='card_ratio')
+        group.add_option('', '--think-time',
+                         action='store',
+                         type='float',
+                         default=0,
+                         help='Maximum seconds to wait between sales',
+                         dest='think_time')
+        group.add_option('', '--station-prefix',
+                         action='store',
+                         default='loadtest',
+                         dest='station_prefix')
+        group.add_option('', '--retries',
+                         action='store',
+                         type='int',
+                         default=0,
+                         help='Retry checkouts that failed because of conflicts',
+                         dest='retries')
+        group.add_option('', '--seed',
+                         action='store',
+                         type='int',
+                         default=0,
+                         dest='seed')
+
+    def cmd_replay_offline(self, options):
+        """Replay the sales done while the database was not reachable"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+
+        from stoqlib.database.admin import USER_ADMIN_DEFAULT_NAME
+        from stoqlib.database.runtime import get_default_store
+        from stoqlib.domain.offlinejournal import (OfflineJournal,
+                                                   OfflineReplayer)
+        from stoqlib.domain.person import LoginUser
+
+        store = get_default_store()
+        user = store.find(LoginUser, username=USER_ADMIN_DEFAULT_NAME).one()
+
+        journal = OfflineJournal(options.journal)
+        if options.retry_conflicts:
+            for operation in journal.get_conflicts():
+                journal.set_status(operation.id, journal.STATUS_PENDING)
+
+        report = OfflineReplayer(journal, user).replay()
+        journal.close()
+        print(report.format())
+        return 1 if report.conflicts else 0
+
+    def opt_replay_offline(self, parser, group):
+        group.add_option('', '--journal',
+                         action='store',
+                         help='The journal file, defaults to the one of '
+                              'this station',
+                         dest='journal')
+        group.add_option('', '--retry-conflicts',
+                         action='store_true',
+                         default=False,
+                         help='Also replay the operations that had conflicts',
+                         dest='retry_conflicts')
+
+    def cmd_compile_ibpt(self, options):
+        """Compile the IBPT tax tables to the indexes used when selling"""
+        from stoqlib.lib.ibpt import compile_ibpt_indexes
+
+        for filename in compile_ibpt_indexes(options.output_dir):
+            print(filename)
+        return 0
+
+    def opt_compile_ibpt(self, parser, group):
+        group.add_option('', '--output-dir',
+                         action='store',
+                         help='Where to write the indexes, defaults to '
+                              'the directory of the tables',
+                         dest='output_dir')
+
+    def cmd_account_checkpoints(self, options):
+        """Verify or rebuild the balance checkpoints of the accounts"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+
+        from stoqlib.database.runtime import new_store
+        from stoqlib.domain.account import AccountBalanceCheckpoint
+
+        with new_store() as store:
+            if options.rebuild:
+                count = AccountBalanceCheckpoint.rebuild(store)
+                print('%d checkpoints were created' % (count, ))
+                return 0
+
+            errors = AccountBalanceCheckpoint.verify(store)
+            store.retval = False
+
+        for account_id, month, expected, found in errors:
+            print('%s %s: expected %s/%s (total %s/%s), '
+                  'found %s/%s (total %s/%s)' % (
+                      (account_id, month.strftime('%Y-%m')) +
+                      expected + found))
+        if errors:
+            print('%d checkpoints are wrong, use --rebuild to fix '
+                  'them' % (len(errors), ))
+            return 1
+        return 0
+
+    def opt_account_checkpoints(self, parser, group):
+        group.add_option('', '--rebuild',
+                         action='store_true',
+                         default=False,
+                         help='Recreate all the checkpoints from the '
+                              'transactions',
+                         dest='rebuild')
+
+    def cmd_reorder_suggestions(self, options):
+        """Calculate the purchases suggested for the storables"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+
+        from stoqlib.database.runtime import new_store
+        from stoqlib.domain.backgroundjob import BackgroundJob
+        from stoqlib.domain.reorder import ProductReorderSuggestion
+
+        with new_store() as store:
+            if options.background:
+                BackgroundJob.enqueue(store, u'reorder-suggestions',
+                                      days=options.days,
+                                      cover_days=options.cover_days)
+                print('The suggestions will be calculated by the jobs worker')
+                return 0
+
+            count = ProductReorderSuggestion.rebuild(
+                store, days=options.days, cover_days=options.cover_days)
+        print('%d suggestions were calculated' % (count, ))
+        return 0
+
+    def opt_reorder_suggestions(self, parser, group):
+        group.add_option('', '--days',
+                         action='store',
+                         type='int',
+                         default=None,
+                         help='How many days of sales should be considered',
+                         dest='days')
+        group.add_option('', '--cover-days',
+                         action='store',
+                         type='int',
+                         default=None,
+                         help='How many days of sales a purchase should cover',
+                         dest='cover_days')
+        group.add_option('', '--background',
+                         action='store_true',
+                         default=False,
+                         help='Queue a job to calculate them instead',
+                         dest='background')
+
+    def cmd_stock_snapshots(self, options):
+        """Take the monthly snapshots of the stock that are missing"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+
+        from stoqlib.database.runtime import new_store
+        from stoqlib.domain.product import ProductStockSnapshot
+
+        with new_store() as store:
+            if options.rebuild:
+                dates = ProductStockSnapshot.rebuild(store)
+            else:
+                dates = ProductStockSnapshot.update(store)
+        print('%d snapshots were taken' % (len(dates), ))
+        return 0
+
+    def opt_stock_snapshots(self, parser, group):
+        group.add_option('', '--rebuild',
+                         action='store_true',
+                         default=False,
+                         help='Remove all the snapshots and take them again',
+                         dest='rebuild')
+
+    def cmd_run_jobs(self, options):
+        """Run the jobs queued to be done in background"""
+        self._read_config(options, register_station=False)
+        self._setup_logging()
+
+        from stoqlib.database.tables import get_table_types
+        from stoqlib.domain.backgroundjob import (BackgroundJobWorker,
+                                                  run_pending_jobs)
+
+        if options.once:
+            # The handlers are registered when the domain modules are imported
+            get_table_types()
+            print('%d jobs were run' % (run_pending_jobs(), ))
+            return 0
+
+        worker = BackgroundJobWorker(interval=options.interval)
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
+        return 0
+
+    def opt_run_jobs(self, parser, group):
+        group.add_option('', '--once',
+                         action='store_true',
+                         default=False,
+                         help='Run the pending jobs and exit',
+                         dest='once')
+        group.add_option('', '--interval',
+                         action='store',
+                         type='int',
+                         default=5,
+                         help='Seconds to wait for new jobs when there are '
+                              'none pending',
+                         dest='interval')
+
     def cmd_shell(self, options):
         """Drop to a shell for executing SQL queries"""
         self._read_config(options, register_station=False,
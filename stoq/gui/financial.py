@@ -28,7 +28,6 @@ stoq/gui/financial/financial.py:
 """
 
 import datetime
-import decimal
 
 from dateutil.relativedelta import relativedelta
 from gi.repository import Gtk, GObject, Pango
@@ -61,7 +60,7 @@ from stoqlib.lib.dateutils import get_month_names
 from stoqlib.lib.message import yesno
 from stoqlib.lib.translation import stoqlib_gettext as _
 from stoqlib.reporting.payment import AccountTransactionReport
-from storm.expr import And, Or
+from storm.expr import And
 
 from stoq.gui.shell.shellapp import ShellApp
 
@@ -74,7 +73,7 @@ class FinancialSearchResults(SearchResultListView):
     def search_completed(self, results):
         page = self.page
         executer = page.search.get_query_executer()
-        if executer.search_spec == AccountTransactionView:
+        if issubclass(executer.search_spec, AccountTransactionView):
             page.append_transactions(results)
         else:
             super(FinancialSearchResults, self).search_completed(results)
@@ -161,18 +160,20 @@ class TransactionPage(object):
         return store.find(search_spec)
 
     def _transaction_query(self, store):
-        queries = [Or(self.model.id == AccountTransaction.account_id,
-                      self.model.id == AccountTransaction.source_account_id)]
-
-        queries.extend(self._append_date_query(AccountTransaction.date))
-        return store.find(AccountTransactionView, And(*queries))
+        # The view only finds the transactions of this account, and the
+        # running balance depends on the results being ordered by date
+        search_spec = self.search.get_query_executer().search_spec
+        queries = self._append_date_query(AccountTransaction.date)
+        results = store.find(search_spec, *queries)
+        return results.order_by(*AccountTransactionView.balance_order)
 
     def show(self):
         self.search.show()
 
     def _setup_search(self):
         if self.model.kind == 'account':
-            self.search.set_search_spec(AccountTransactionView)
+            self.search.set_search_spec(
+                AccountTransactionView.get_balance_view(self.model))
             self.search.set_text_field_columns(['description'])
             self.search.set_query(self._transaction_query)
         elif self.model.kind == 'payable':
@@ -252,34 +253,32 @@ class TransactionPage(object):
                              data_type=currency)]
 
     def append_transactions(self, transactions):
+        # The running balance of the account comes from the database
         for transaction in transactions:
             description = transaction.get_account_description(self.model)
-            value = transaction.get_value(self.model)
+            value = transaction.account_value
             # If a transaction has the source equals to the destination account.
             # Show the same transaction, but with reversed value.
             if transaction.source_account_id == transaction.dest_account_id:
-                self._add_transaction(transaction, description, -value)
-            self._add_transaction(transaction, description, value)
-        self.update_totals()
+                self._add_transaction(transaction, description, -value,
+                                      transaction.balance - value)
+            self._add_transaction(transaction, description, value,
+                                  transaction.balance)
 
-    def _add_transaction(self, transaction, description, value):
+    def _add_transaction(self, transaction, description, value, total):
         item = Settable(transaction=transaction)
-        self._update_transaction(item, transaction, description, value)
+        self._update_transaction(item, transaction, description, value, total)
         self.search.result_view.append(item)
         return item
 
-    def _update_transaction(self, item, transaction, description, value):
+    def _update_transaction(self, item, transaction, description, value,
+                            total):
         item.account = description
         item.date = transaction.date
         item.description = transaction.description
         item.value = value
         item.code = transaction.code
-
-    def update_totals(self):
-        total = decimal.Decimal('0')
-        for item in self.search.result_view:
-            total += item.value
-            item.total = total
+        item.total = total
 
     def _edit_transaction_dialog(self, item):
         store = api.new_store()
@@ -295,7 +294,6 @@ class TransactionPage(object):
         store.confirm(transaction)
         if transaction:
             self.app.refresh_pages()
-            self.update_totals()
             self.app.accounts.refresh_accounts(self.app.store)
         store.close()
 
@@ -315,7 +313,6 @@ class TransactionPage(object):
         store.confirm(transaction)
         if transaction:
             self.app.refresh_pages()
-            self.update_totals()
             self.app.accounts.refresh_accounts(self.app.store)
         store.close()
 
@@ -734,9 +731,6 @@ class FinancialApp(ShellApp):
                      _(u"Remove transaction"), _(u"Keep transaction")):
             return
 
-        account_transactions = self.get_current_page()
-        account_transactions.result_view.remove(item)
-
         store = api.new_store()
         if isinstance(item.transaction, AccountTransactionView):
             account_transaction = store.fetch(item.transaction.transaction)
@@ -744,7 +738,8 @@ class FinancialApp(ShellApp):
             account_transaction = store.fetch(item.transaction)
         account_transaction.delete(account_transaction.id, store=store)
         store.commit(close=True)
-        account_transactions.update_totals()
+        # The balances of the transactions after it have changed
+        self.get_current_page().refresh()
 
     def _print_transaction_report(self):
         assert not self._is_accounts_tab()
@@ -34,17 +34,21 @@ from kiwi.datatypes import converter, ValidationError
 from kiwi.python import Settable
 from kiwi.ui.objectlist import Column
 from kiwi.ui.widgets.contextmenu import ContextMenu, ContextMenuItem
-from storm.expr import And, Lower
 
 from stoqdrivers.enum import UnitType
 from stoqlib.api import api
+from stoqlib.database.exceptions import CONNECTION_ERRORS, is_connection_error
 from stoqlib.gui.base.dialogs import (get_current_toplevel, add_current_toplevel,
                                       _pop_current_toplevel)
 from stoqlib.domain.payment.group import PaymentGroup
 from stoqlib.domain.person import Transporter, Client
-from stoqlib.domain.product import StorableBatch
+from stoqlib.domain.events import TillOpenedEvent
+from stoqlib.domain.offlinejournal import (OfflineReplayer, OfflineSale,
+                                           get_offline_journal)
+from stoqlib.domain.priceresolver import get_price_resolver
 from stoqlib.domain.sale import Delivery, Sale, SaleToken
 from stoqlib.domain.sellable import Sellable
+from stoqlib.domain.sellablelookup import get_sellable_lookup_index
 from stoqlib.exceptions import StoqlibError, TaxError
 from stoqlib.gui.events import (POSConfirmSaleEvent,
                                 CloseLoanWizardFinishEvent,
@@ -59,6 +63,7 @@ from stoqlib.lib.message import warning, info, yesno, marker
 from stoqlib.lib.parameters import sysparam
 from stoqlib.lib.pluginmanager import get_plugin_manager
 from stoqlib.lib.translation import stoqlib_gettext as _
+from stoqlib.lib.warmup import TillWarmup
 from stoqlib.gui.base.dialogs import push_fullscreen, pop_fullscreen
 from stoqlib.gui.dialogs.batchselectiondialog import BatchDecreaseSelectionDialog
 from stoqlib.gui.dialogs.credentialsdialog import CredentialsDialog
@@ -89,6 +94,9 @@ from stoq.gui.shell.shellapp import ShellApp
 
 log = logging.getLogger(__name__)
 
+# How often, in seconds, to try to reconnect while selling offline
+_RECONNECT_INTERVAL = 30
+
 
 @public(since="1.5.0")
 class TemporarySaleItem(object):
@@ -112,7 +120,7 @@ class TemporarySaleItem(object):
             self.location = ''
 
         if price is None:
-            price = sellable.price
+            price = get_price_resolver().get_price(sellable)
         self.base_price = sellable.base_price
         self.price = price
         self.deliver = deliver
@@ -167,6 +175,63 @@ class TemporarySaleItem(object):
         return '%s %s' % (qtd_string, self.unit)
 
 
+class OfflineSaleItem(TemporarySaleItem):
+    """A sale item added while the database is not reachable
+
+    There is no |sellable| to refer to, only what was saved on the catalog
+    snapshot of the :class:`offline journal
+    <stoqlib.domain.offlinejournal.OfflineJournal>`.
+    """
+
+    sellable = None
+    batch = None
+    service = None
+    location = ''
+    notes = None
+    estimated_fix_date = None
+    deliver = False
+    parent_item = None
+    original_sale_item = None
+    quantity_decreased = 0
+
+    def __init__(self, sellable_id, code, description, quantity, price,
+                 batch_id=None, unit=''):
+        self.sellable_id = sellable_id
+        self.batch_id = batch_id
+        self.code = code
+        self.description = description
+        self.unit = unit
+        self.quantity = Decimal('%.3f' % quantity)
+        self.base_price = price
+        self.price = price
+        self.can_remove = True
+        self.can_remove_child = True
+        self.children_items = []
+
+    @classmethod
+    def from_catalog_item(cls, catalog_item, quantity):
+        return cls(sellable_id=catalog_item.sellable_id,
+                   code=catalog_item.code,
+                   description=catalog_item.description,
+                   quantity=quantity,
+                   price=catalog_item.price,
+                   batch_id=catalog_item.batch_id)
+
+    @classmethod
+    def from_temporary_item(cls, item):
+        return cls(sellable_id=item.sellable.id,
+                   code=item.code,
+                   description=item.description,
+                   quantity=item.quantity,
+                   price=item.price,
+                   batch_id=item.batch and item.batch.id,
+                   unit=item.unit)
+
+    @property
+    def full_description(self):
+        return self.description
+
+
 class FakeToken():
     """Fake token for direct sales.
 
@@ -210,6 +275,13 @@ class PosApp(ShellApp):
         self._token = None
         self._till_open = False
         self._manager = None
+        self._warmup = None
+        # Selling with the offline journal, since the database is not
+        # reachable
+        self._offline = False
+        self._offline_infobar = None
+        self._offline_sale_args = None
+        self._reconnect_source = None
 
         # The sellable and batch selected, in case the parameter
         # CONFIRM_QTY_ON_BARCODE_ACTIVATE is used.
@@ -345,6 +417,7 @@ class PosApp(ShellApp):
         self._printer.run_initial_checks()
 
         CloseLoanWizardFinishEvent.connect(self._on_CloseLoanWizardFinishEvent)
+        TillOpenedEvent.connect(self._on_TillOpenedEvent)
 
     def deactivate(self):
         api.user_settings.set('pos-show-details-viewer',
@@ -354,8 +427,12 @@ class PosApp(ShellApp):
         # disconnect, the callback from this instance would still be called, but
         # its no longer valid.
         CloseLoanWizardFinishEvent.disconnect(self._on_CloseLoanWizardFinishEvent)
+        TillOpenedEvent.disconnect(self._on_TillOpenedEvent)
 
         self._printer.disable_midnight_check()
+        if self._reconnect_source is not None:
+            GLib.source_remove(self._reconnect_source)
+            self._reconnect_source = None
 
     def setup_focus(self):
         if sysparam.get_bool('USE_SALE_TOKEN') and self._token is None:
@@ -627,31 +704,8 @@ class PosApp(ShellApp):
             text = barinfo.code
             weight = barinfo.weight
 
-        batch = None
-        query = Sellable.status == Sellable.STATUS_AVAILABLE
-
-        # FIXME: Put this logic for getting the sellable based on
-        # barcode/code/batch_number on domain. Note that something very
-        # simular is done on abstractwizard.py
-
-        sellable = self.store.find(
-            Sellable, And(query, Lower(Sellable.barcode) == text.lower())).one()
-
-        # If the barcode didnt match, maybe the user typed the product code
-        if not sellable:
-            sellable = self.store.find(
-                Sellable, And(query, Lower(Sellable.code) == text.lower())).one()
-
-        # If none of the above found, try to get the batch number
-        if not sellable:
-            query = Lower(StorableBatch.batch_number) == text.lower()
-            batch = self.store.find(StorableBatch, query).one()
-            if batch:
-                sellable = batch.storable.product.sellable
-                if not sellable.is_available:
-                    # If the sellable is not available, reset both
-                    sellable = None
-                    batch = None
+        # The barcode is tried first, then the code and the batch number
+        sellable, batch = get_sellable_lookup_index().find(self.store, text)
 
         # The user can't add the parent product of a grid directly to the sale.
         # TODO: Display a dialog to let the user choose an specific grid product.
@@ -687,6 +741,18 @@ class PosApp(ShellApp):
         text = _(u"POS operations requires a connected fiscal printer.")
         self.till_status_label.set_text(text)
 
+    def _warm_up_caches(self):
+        if self._warmup is not None:
+            return
+
+        warmup = TillWarmup(self.store, api.get_current_station(self.store))
+
+        def finished(results):
+            log.info('POS warm-up finished:\n%s', warmup.format())
+
+        self._warmup = warmup
+        warmup.run_idle(callback=finished)
+
     def _till_status_changed(self, closed, blocked):
         def large(s):
             return '<span weight="bold" size="xx-large">%s</span>' % (
@@ -704,6 +770,10 @@ class PosApp(ShellApp):
         else:
             text = large(_("Till open"))
             self._till_open = True
+            self._warm_up_caches()
+            self._setup_offline_sale()
+            # Send what was sold offline before the POS was restarted
+            GLib.idle_add(self._replay_offline_journal)
 
         self.till_status_label.set_use_markup(True)
         self.till_status_label.set_justify(Gtk.Justification.CENTER)
@@ -738,7 +808,7 @@ class PosApp(ShellApp):
         has_products = False
         has_services = False
         for sale_item in self.sale_items:
-            if sale_item and sale_item.sellable.product:
+            if sale_item and sale_item.sellable and sale_item.sellable.product:
                 has_products = True
             if sale_item and sale_item.service:
                 has_services = True
@@ -776,6 +846,8 @@ class PosApp(ShellApp):
             self.till_status_box.set_visible(not self._sale_started)
 
         self.sale_items_pane.set_visible(self._sale_started)
+        if self._offline:
+            self.set_sensitive(self._get_online_widgets(), False)
 
         self._update_totals()
         self._update_buttons()
@@ -792,7 +864,10 @@ class PosApp(ShellApp):
                 api.escape(format_quantity(sale_item.quantity)),
                 api.escape(get_formatted_price(sale_item.price)))
 
-            if sellable.service:
+            if sellable is None:
+                # Added while offline, there is nothing else to show
+                extra_markup_parts = []
+            elif sellable.service:
                 fix_date = (sale_item.estimated_fix_date.strftime('%x')
                             if sale_item.estimated_fix_date else '')
                 extra_markup_parts = [
@@ -880,6 +955,8 @@ class PosApp(ShellApp):
     def _check_delivery_removed(self, sale_item):
         # If a delivery was removed, we need to remove all
         # the references to it eg self._delivery
+        if self._delivery is None:
+            return
         if (sale_item.sellable ==
                 sysparam.get_object(self.store, 'DELIVERY_SERVICE').sellable):
             self._delivery = None
@@ -924,6 +1001,20 @@ class PosApp(ShellApp):
           will move to the quantity field. Otherwise, we will just add the
           sellable.
         """
+        if self._offline:
+            self._add_offline_item()
+            return
+
+        try:
+            self._add_online_item(confirm_quantity)
+        except CONNECTION_ERRORS as e:
+            if not is_connection_error(e) or not self._go_offline(e):
+                raise
+            # The barcode is cleared after the item is added
+            if self.barcode.get_text():
+                self._add_offline_item()
+
+    def _add_online_item(self, confirm_quantity):
         sellable, batch = self._get_sellable_and_batch()
         if not sellable:
             message = (_("The barcode '%s' does not exist. "
@@ -1298,6 +1389,10 @@ class PosApp(ShellApp):
             self._clear_order()
             return
 
+        if self._offline:
+            self._checkout_offline()
+            return
+
         # FIXME: We should create self._current_store when adding the first
         # item, so we can simplify a lot of code on this module by using it
         # directly. The way it is now, most of the items will come from
@@ -1309,7 +1404,14 @@ class PosApp(ShellApp):
             savepoint = 'before_run_fiscalprinter_confirm'
             store.savepoint(savepoint)
         else:
-            store = api.new_store()
+            try:
+                store = api.new_store()
+            except CONNECTION_ERRORS as e:
+                if (save_only or not is_connection_error(e) or
+                        not self._go_offline(e)):
+                    raise
+                self._checkout_offline()
+                return
             savepoint = None
 
         if self._trade:
@@ -1451,6 +1553,167 @@ class PosApp(ShellApp):
                 exc = sys.exc_info()
                 collect_traceback(exc, submit=True)
 
+    #
+    # Offline
+    #
+
+    def _setup_offline_sale(self):
+        # What the sales saved on the offline journal need, fetched while
+        # the database is still reachable
+        salesperson = api.get_current_user(self.store).person.sales_person
+        if salesperson is None:
+            self._offline_sale_args = None
+            return
+        self._offline_sale_args = dict(
+            branch_id=api.get_current_branch(self.store).id,
+            station_id=api.get_current_station(self.store).id,
+            salesperson_id=salesperson.id)
+
+    def _can_sell_offline(self):
+        if self._offline_sale_args is None:
+            return False
+        # Tokens and orders confirmed on the till need the database
+        if (sysparam.get_bool('USE_SALE_TOKEN') or
+                sysparam.get_bool('CONFIRM_SALES_ON_TILL')):
+            return False
+        # The fiscal documents can't be emitted without it either
+        if get_plugin_manager().is_any_active(['ecf', 'nfce', 'sat', 'tef']):
+            return False
+        if self._trade or self._delivery or self._current_store:
+            return False
+        if get_offline_journal().get_catalog_date() is None:
+            return False
+        for item in self.sale_items:
+            if (item.service or item.parent_item or item.children_items or
+                    item.original_sale_item or item.quantity_decreased):
+                return False
+        return True
+
+    def _get_online_widgets(self):
+        # What can't be used while selling offline
+        return [self.advanced_search, self.client_button, self.delivery_button,
+                self.save_button, self.edit_item_button, self.NewDelivery,
+                self.NewTrade, self.PaymentReceive, self.LoanClose,
+                self.WorkOrderClose, self.TillOpen, self.TillClose,
+                self.TillVerify]
+
+    def _go_offline(self, error):
+        """Keep selling with the offline journal
+
+        :param error: the error raised when the connection was lost
+        :returns: ``False`` if the current sale can't go on offline
+        """
+        log.warning('The database is not reachable: %s', error)
+        if not self._can_sell_offline():
+            return False
+
+        items = [OfflineSaleItem.from_temporary_item(item)
+                 for item in self.sale_items]
+        if self._coupon is not None:
+            # The items will be registered when the sale is replayed
+            self._coupon.cancel()
+            self._coupon = None
+
+        self._offline = True
+        self.sale_items.clear()
+        for item in items:
+            self.sale_items.append(None, item)
+
+        self._offline_infobar = self.window.add_info_bar(
+            Gtk.MessageType.WARNING,
+            _("The database is not reachable. The sales are being saved on "
+              "this computer and will be sent when the connection is back. "
+              "Only money payments can be received meanwhile."))
+        self._reconnect_source = GLib.timeout_add_seconds(
+            _RECONNECT_INTERVAL, self._try_go_online)
+        self._update_widgets()
+        return True
+
+    def _try_go_online(self):
+        # Don't mix the items sold offline with the ones sold online
+        if self._sale_started:
+            return True
+
+        try:
+            # Reconnect, the changes pending when it was lost are gone
+            self.store.rollback(close=False)
+            self._replay_offline_journal()
+        except CONNECTION_ERRORS as e:
+            # Even if it's just a conflict with another transaction, try
+            # again later
+            log.info('Could not go back online: %s', e)
+            return True
+
+        log.info('The database is reachable again')
+        self._offline = False
+        self._reconnect_source = None
+        if self._offline_infobar is not None:
+            self._offline_infobar.destroy()
+            self._offline_infobar = None
+        # This updates the till status and the widgets
+        self._printer.check_till()
+        return False
+
+    def _add_offline_item(self):
+        text = self.barcode.get_text().strip()
+        quantity = self._read_quantity()
+        if not text or quantity == 0:
+            return
+
+        fmt = api.sysparam.get_int('SCALE_BARCODE_FORMAT')
+        barinfo = parse_barcode(text, fmt)
+        if barinfo:
+            text = barinfo.code
+
+        catalog_item = get_offline_journal().find_sellable(text)
+        if catalog_item is None:
+            info(_("The barcode '%s' is not in the items that can be sold "
+                   "while the database is not reachable.") % (text, ))
+            self.barcode.set_text('')
+            self.barcode.grab_focus()
+            return
+
+        if barinfo:
+            quantity = barinfo.weight
+            if barinfo.mode == BarcodeInfo.MODE_PRICE:
+                quantity = barinfo.price / catalog_item.price
+
+        self._update_added_item(
+            OfflineSaleItem.from_catalog_item(catalog_item, quantity))
+        self._update_widgets()
+
+    def _checkout_offline(self):
+        total = self._get_subtotal()
+        if not yesno(_("The database is not reachable, so the sale will be "
+                       "saved on this computer and sent when the connection "
+                       "is back.\n\nReceive %s in money?") % (
+                           converter.as_string(currency, total), ),
+                     Gtk.ResponseType.YES, _("Receive"), _("Don't receive")):
+            return
+
+        client_id = self._suggested_client and self._suggested_client.id
+        sale = OfflineSale(client_id=client_id, **self._offline_sale_args)
+        for item in self.sale_items:
+            sale.add_item(item.sellable_id, item.quantity, item.price,
+                          batch_id=item.batch_id)
+        sale.add_payment(u'money', total)
+        get_offline_journal().add_sale(sale)
+        log.info("Saved sale %s on the offline journal", sale.id)
+        self._clear_order()
+
+    def _replay_offline_journal(self):
+        journal = get_offline_journal()
+        if not journal.get_pending():
+            return
+
+        user = api.get_current_user(self.store)
+        report = OfflineReplayer(journal, user).replay()
+        log.info("Replayed the offline journal:\n%s", report.format())
+        journal.purge()
+        if report.conflicts:
+            warning(_("Some of the sales done while the database was not "
+                      "reachable could not be saved"), report.format())
+
     #
     # Coupon related
     #
@@ -1478,7 +1741,7 @@ class PosApp(ShellApp):
         See :class:`stoqlib.gui.fiscalprinter.FiscalCoupon` for more information
         """
         self._sale_started = True
-        if self._confirm_sales_on_till:
+        if self._confirm_sales_on_till or self._offline:
             return
 
         if self._coupon is None:
@@ -1490,7 +1753,7 @@ class PosApp(ShellApp):
         return self._coupon.add_item(sale_item)
 
     def _coupon_remove_item(self, sale_item):
-        if self._confirm_sales_on_till:
+        if self._confirm_sales_on_till or self._offline:
             return
 
         assert self._coupon
@@ -1705,7 +1968,7 @@ class PosApp(ShellApp):
 
         # In the future, let the user select the category somehow
         category = None
-        default_price = sellable.get_price_for_category(category)
+        default_price = get_price_resolver().get_price(sellable, category)
         if (not sysparam.get_bool('ALLOW_HIGHER_SALE_PRICE') and
                 value > default_price):
             return ValidationError(_(u'The sell price cannot be greater '
@@ -1805,6 +2068,15 @@ class PosApp(ShellApp):
             return True
         return False
 
+    def _on_TillOpenedEvent(self, till):
+        # The POS may have been kept running since the last time the till
+        # was opened (e.g. yesterday), so warm up again. Unless it is still
+        # warming up, since the steps would run twice at the same time
+        if self._warmup is not None and self._warmup.running:
+            return
+        self._warmup = None
+        self._warm_up_caches()
+
     def _on_CloseLoanWizardFinishEvent(self, loans, sale, wizard):
         for item in wizard.get_sold_items():
             sellable, quantity, price = item
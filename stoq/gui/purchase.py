@@ -44,7 +44,8 @@ from stoqlib.gui.search.productsearch import (ProductSearch,
                                               ProductStockSearch,
                                               ProductClosedStockSearch,
                                               ProductsSoldSearch)
-from stoqlib.gui.search.purchasesearch import PurchasedItemsSearch
+from stoqlib.gui.search.purchasesearch import (PurchasedItemsSearch,
+                                               SuggestedPurchaseSearch)
 from stoqlib.gui.search.searchcolumns import IdentifierColumn, SearchColumn
 from stoqlib.gui.search.searchfilters import ComboSearchFilter, DateSearchFilter
 from stoqlib.gui.search.sellableunitsearch import SellableUnitSearch
@@ -137,6 +138,8 @@ class PurchaseApp(ShellApp):
              group.get("search_purchased_items")),
             ("ProductsSoldSearch", None, _("Sold products..."),
              group.get("search_products_sold")),
+            ("SearchSuggestedPurchases", None, _("Suggested purchases..."),
+             group.get("search_suggested_purchases")),
             ("ProductsPriceSearch", None, _("Prices..."),
              group.get("search_prices")),
             ("SearchInConsignmentItems", None, _("Search consigment items..."),
@@ -191,6 +194,7 @@ class PurchaseApp(ShellApp):
             self.SearchQuotes,
             self.SearchPurchasedItems,
             self.ProductsSoldSearch,
+            self.SearchSuggestedPurchases,
             self.ProductsPriceSearch,
             self.SearchInConsignmentItems,
         ])
@@ -544,6 +548,9 @@ class PurchaseApp(ShellApp):
     def on_ProductsSoldSearch__activate(self, action):
         self.run_dialog(ProductsSoldSearch, self.store)
 
+    def on_SearchSuggestedPurchases__activate(self, action):
+        self.run_dialog(SuggestedPurchaseSearch, self.store)
+
     def on_ProductsPriceSearch__activate(self, action):
         with api.new_store() as store:
             self.run_dialog(SellableMassEditorDialog, store)
@@ -55,7 +55,8 @@ from stoqlib.gui.search.productsearch import (ProductSearchQuantity,
                                               ProductBrandByBranchSearch,
                                               ProductBatchSearch,
                                               ProductClosedStockSearch)
-from stoqlib.gui.search.purchasesearch import PurchasedItemsSearch
+from stoqlib.gui.search.purchasesearch import (PurchasedItemsSearch,
+                                               SuggestedPurchaseSearch)
 from stoqlib.gui.search.transfersearch import (TransferOrderSearch,
                                                TransferItemSearch)
 from stoqlib.gui.search.searchcolumns import SearchColumn, QuantityColumn
@@ -109,6 +110,9 @@ class StockApp(ShellApp):
             ("SearchPurchasedStockItems", None, _("Purchased items..."),
              group.get('search_purchased_stock_items'),
              _("Search for purchased items")),
+            ("SearchSuggestedPurchases", None, _("Suggested purchases..."),
+             group.get('search_suggested_purchases'),
+             _("Search for the purchases suggested for the products")),
             ("SearchBrandItems", None, _("Brand items..."),
              group.get('search_brand_items'),
              _("Search for brand items on stock")),
@@ -171,6 +175,7 @@ class StockApp(ShellApp):
             self.SearchStockDecrease,
             self.SearchReturnedItems,
             self.SearchPurchasedStockItems,
+            self.SearchSuggestedPurchases,
             self.SearchStockItems,
             self.SearchBrandItems,
             self.SearchBrandItemsByBranch,
@@ -602,6 +607,9 @@ class StockApp(ShellApp):
     def on_SearchPurchasedStockItems__activate(self, action):
         self.run_dialog(PurchasedItemsSearch, self.store)
 
+    def on_SearchSuggestedPurchases__activate(self, action):
+        self.run_dialog(SuggestedPurchaseSearch, self.store)
+
     def on_SearchStockItems__activate(self, action):
         self.run_dialog(ProductStockSearch, self.store)
 
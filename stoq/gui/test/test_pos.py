@@ -32,8 +32,10 @@ import mock
 from gi.repository import Gdk, Gtk
 
 from stoqlib.api import api
+from stoqlib.database.exceptions import OperationalError
 from stoqlib.database.runtime import StoqlibStore
 from stoqlib.domain.events import TillOpenEvent
+from stoqlib.domain.offlinejournal import OfflineJournal
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.sale import Sale, SaleItem
@@ -55,7 +57,7 @@ from stoqlib.gui.search.sellablesearch import SaleSellableSearch
 from stoqlib.gui.search.servicesearch import ServiceSearch
 from stoqlib.reporting.booklet import BookletReport
 
-from stoq.gui.pos import PosApp, TemporarySaleItem
+from stoq.gui.pos import OfflineSaleItem, PosApp, TemporarySaleItem
 from stoq.gui.test.baseguitest import BaseGUITest
 
 __tests__ = 'stoq/gui/pos.py'
@@ -663,6 +665,63 @@ class TestPos(BaseGUITest):
 
             self.assertEqual(2, float(pos.quantity.get_text()))
 
+    @mock.patch('stoq.gui.pos.yesno')
+    @mock.patch('stoq.gui.pos.get_offline_journal')
+    def test_sell_offline(self, get_offline_journal, yesno):
+        sellable = self.create_sellable(price=15, code=u'OFF01')
+        journal = OfflineJournal(filename=':memory:')
+        journal.save_catalog(self.store, self.current_branch)
+        get_offline_journal.return_value = journal
+        yesno.return_value = True
+
+        pos = self._get_pos_with_open_till()
+        sale_item = self._add_product(pos, self.create_sellable(price=10))
+
+        with contextlib.ExitStack() as stack:
+            get_index = stack.enter_context(
+                mock.patch('stoq.gui.pos.get_sellable_lookup_index'))
+            get_index.return_value.find.side_effect = OperationalError(
+                'connection lost')
+            timeout_add = stack.enter_context(
+                mock.patch('stoq.gui.pos.GLib.timeout_add_seconds'))
+            pos.barcode.set_text(u'OFF01')
+            self.activate(pos.barcode)
+
+        self.assertTrue(pos._offline)
+        timeout_add.assert_called_once_with(30, pos._try_go_online)
+        self.assertFalse(pos.advanced_search.get_sensitive())
+        # The item added before the connection was lost is kept
+        self.assertEqual([type(item) for item in pos.sale_items],
+                         [OfflineSaleItem, OfflineSaleItem])
+
+        # The catalog of the journal is used directly now
+        pos.barcode.set_text(u'OFF01')
+        self.activate(pos.barcode)
+        self.assertEqual(len(pos.sale_items), 3)
+
+        self.activate(pos.ConfirmOrder)
+        self.assertEqual(len(pos.sale_items), 0)
+        operation, = journal.get_pending()
+        self.assertEqual(operation.kind, OfflineJournal.KIND_SALE)
+        self.assertEqual([item['sellable_id'] for item in
+                          operation.data['items']],
+                         [str(sale_item.sellable.id), str(sellable.id),
+                          str(sellable.id)])
+        self.assertEqual(operation.data['payments'],
+                         [dict(method_name=u'money', value=u'40.00')])
+
+    def test_sell_offline_not_possible(self):
+        with self.sysparam(CONFIRM_SALES_ON_TILL=True):
+            pos = self._get_pos_with_open_till()
+            with mock.patch('stoq.gui.pos.get_sellable_lookup_index') as get_index:
+                get_index.return_value.find.side_effect = OperationalError(
+                    'connection lost')
+                pos.barcode.set_text(u'OFF01')
+                with self.assertRaises(OperationalError):
+                    pos._add_sale_item(confirm_quantity=False)
+
+        self.assertFalse(pos._offline)
+
     def test_set_additional_info(self):
         from stoqlib.domain.product import Product
 
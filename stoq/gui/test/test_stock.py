@@ -36,7 +36,8 @@ from stoqlib.gui.search.receivingsearch import PurchaseReceivingSearch
 from stoqlib.gui.search.productsearch import (ProductSearchQuantity,
                                               ProductStockSearch,
                                               ProductClosedStockSearch)
-from stoqlib.gui.search.purchasesearch import PurchasedItemsSearch
+from stoqlib.gui.search.purchasesearch import (PurchasedItemsSearch,
+                                               SuggestedPurchaseSearch)
 from stoqlib.gui.search.transfersearch import (TransferOrderSearch,
                                                TransferItemSearch)
 from stoqlib.gui.search.stockdecreasesearch import StockDecreaseSearch
@@ -143,6 +144,8 @@ class TestStock(BaseGUITest):
                                TransferItemSearch, [])
         self._check_run_dialog(app.SearchPurchasedStockItems,
                                PurchasedItemsSearch, [])
+        self._check_run_dialog(app.SearchSuggestedPurchases,
+                               SuggestedPurchaseSearch, [])
         self._check_run_dialog(app.SearchStockItems,
                                ProductStockSearch, [])
         self._check_run_dialog(app.SearchClosedStockItems,
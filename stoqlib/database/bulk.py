@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Reading and writing a lot of rows at once"""
+
+from storm.expr import Insert
+
+
+def find_in_chunks(store, columns, query=None, chunk_size=5000):
+    """Find rows a chunk at a time, ordered by their primary key
+
+    Each chunk is fetched by its own query, starting after the last key
+    of the previous chunk instead of using an offset, so fetching a chunk
+    is as fast at the end of the table as it is at the beginning.
+
+    :param store: a store
+    :param columns: a sequence of columns. The first one must be the
+        primary key of the table
+    :param query: a query to filter the rows
+    :param chunk_size: the maximum number of rows of a chunk
+    :returns: an iterator of lists of rows
+    """
+    key = columns[0]
+    last = None
+    while True:
+        queries = [query] if query is not None else []
+        if last is not None:
+            queries.append(key > last)
+        rows = list(store.find(tuple(columns), *queries).order_by(
+            key)[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+def bulk_insert(store, columns, rows, chunk_size=1000):
+    """Insert a lot of rows using multi-row INSERT statements
+
+    :param store: a store
+    :param columns: a sequence of domain class columns, all from
+        the same table
+    :param rows: an iterable of tuples, with values in the
+        same order of *columns*
+    :param chunk_size: how many rows to send in each statement
+    :returns: the number of rows inserted
+    """
+    table = columns[0].cls
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            store.execute(Insert(columns, table=table, values=chunk))
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        store.execute(Insert(columns, table=table, values=chunk))
+        count += len(chunk)
+    return count
@@ -30,10 +30,11 @@ This is just a layer on top of the Python DBAPI we're using to access the
 database
 """
 
-from storm.exceptions import StormError
+from storm.exceptions import DisconnectionError, StormError
 
 from psycopg2 import (Error, IntegrityError, InterfaceError, OperationalError,
                       ProgrammingError)
+from psycopg2.extensions import QueryCanceledError, TransactionRollbackError
 
 
 PostgreSQLError = Error
@@ -42,6 +43,46 @@ OperationalError = OperationalError
 ProgrammingError = ProgrammingError
 InterfaceError = InterfaceError
 
+#: The errors raised when the connection to the database is lost or
+#: could not be established. Some :class:`OperationalError` are not about
+#: the connection, use :func:`is_connection_error` to tell them apart
+CONNECTION_ERRORS = (DisconnectionError, InterfaceError, OperationalError)
+
+#: SQLSTATE of the error raised when the server detects a deadlock
+DEADLOCK_DETECTED = '40P01'
+
+#: SQLSTATE of the error raised when a transaction could not be serialized
+#: with a concurrent one
+SERIALIZATION_FAILURE = '40001'
+
+
+def is_transaction_conflict(error):
+    """Check if an error was caused by a conflict with another transaction
+
+    When that happens, the server rolls back the whole transaction and it
+    is safe to run it again.
+
+    :param error: an exception
+    :returns: ``True`` if the error is a deadlock or a serialization failure
+    """
+    return getattr(error, 'pgcode', None) in (DEADLOCK_DETECTED,
+                                              SERIALIZATION_FAILURE)
+
+
+def is_connection_error(error):
+    """Check if an error was caused by the connection to the database
+
+    Deadlocks, serialization failures and statement timeouts are
+    :class:`OperationalError` too, but the connection is still usable.
+
+    :param error: an exception
+    :returns: ``True`` if the connection was lost or could not be
+        established
+    """
+    if isinstance(error, (QueryCanceledError, TransactionRollbackError)):
+        return False
+    return isinstance(error, CONNECTION_ERRORS)
+
 
 class SQLError(Exception):
     pass
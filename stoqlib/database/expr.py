@@ -392,3 +392,85 @@ def compile_over(compile, expr, state):
 
     result += ')'
     return result
+
+
+class ForUpdate(Expr):
+    """Lock the rows returned by a select
+
+    Usage:
+
+    ForUpdate(Select(ProductStockItem.id, order_by=ProductStockItem.id))
+
+    Which gets compiled to:
+
+    SELECT product_stock_item.id FROM product_stock_item
+        ORDER BY product_stock_item.id FOR UPDATE
+
+    The rows are locked in the order they are returned, so use an ORDER BY
+    to always lock them in the same order and avoid deadlocks.
+
+    When skip_locked is True, rows locked by other transactions are skipped
+    instead of waiting for them, which is useful to implement queues.
+    """
+    # http://www.postgresql.org/docs/9.5/static/sql-select.html#SQL-FOR-UPDATE-SHARE
+    __slots__ = ('select', 'skip_locked')
+
+    def __init__(self, select, skip_locked=False):
+        self.select = select
+        self.skip_locked = skip_locked
+
+
+@expr_compile.when(ForUpdate)
+def compile_for_update(compile, expr, state):
+    statement = '%s FOR UPDATE' % expr_compile(expr.select, state)
+    if expr.skip_locked:
+        statement += ' SKIP LOCKED'
+    return statement
+
+
+class WithRecursive(Expr):
+    """Select from a recursive common table expression
+
+    Usage:
+
+    tree = Table('tree')
+    WithRecursive(tree, ['id', 'parent_id'],
+                  Select([Category.id, Category.parent_id],
+                         where=Eq(Category.parent_id, None)),
+                  Select([Category.id, Category.parent_id],
+                         where=Category.parent_id == Column('id', tree)),
+                  Select(Column('id', tree)))
+
+    Which gets compiled to:
+
+    WITH RECURSIVE tree(id, parent_id) AS (
+        SELECT category.id, category.parent_id FROM category
+            WHERE category.parent_id IS NULL
+        UNION
+        SELECT category.id, category.parent_id FROM category, tree
+            WHERE category.parent_id = tree.id)
+    SELECT tree.id FROM tree
+
+    The rows of the recursive part are merged with UNION, so rows that
+    were already found are not followed again and cycles end the
+    recursion instead of making it endless.
+    """
+    # https://www.postgresql.org/docs/9.5/static/queries-with.html
+    __slots__ = ('table', 'columns', 'anchor', 'recursive', 'select')
+
+    def __init__(self, table, columns, anchor, recursive, select):
+        self.table = table
+        self.columns = columns
+        self.anchor = anchor
+        self.recursive = recursive
+        self.select = select
+
+
+@expr_compile.when(WithRecursive)
+def compile_with_recursive(compile, expr, state):
+    return 'WITH RECURSIVE %s(%s) AS (%s UNION %s) %s' % (
+        expr_compile(expr.table, state),
+        ', '.join(expr.columns),
+        expr_compile(expr.anchor, state),
+        expr_compile(expr.recursive, state),
+        expr_compile(expr.select, state))
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Knowing when other processes change the domain rows
+
+The database sends a ``new_te`` or ``update_te`` notification, with the
+te_id and the table of the row, when a row is inserted or updated. For
+the tables kept in memory, it also sends a ``delete_row`` notification,
+with the id and the table of the row, when a row is deleted. Listening to
+them lets a process keep data from the database in memory and forget it
+only when another process changes it.
+
+A single :class:`ChangeListener` receives them for the whole process and
+hands them to the :class:`NotifiedCache` objects interested in each table.
+"""
+
+import collections
+import logging
+import select
+import threading
+import weakref
+
+from stoqlib.database.settings import db_settings
+from stoqlib.lib.threadutils import threadit
+
+log = logging.getLogger(__name__)
+
+
+class Changes(collections.defaultdict):
+    """The rows of some tables changed since the last poll
+
+    It maps the table names to the te_ids of the inserted or updated
+    rows. The deleted rows have no te_id anymore, :attr:`deleted` maps
+    the table names to their ids.
+    """
+
+    def __init__(self):
+        super(Changes, self).__init__(set)
+        self.deleted = collections.defaultdict(set)
+
+    def has_changes(self, table):
+        """If any row of a table was changed
+
+        :param table: the name of the table
+        """
+        return bool(self.get(table) or self.deleted.get(table))
+
+
+class ChangeListener(object):
+    """Listens to the notifications sent when a domain row changes
+
+    The notifications are received by a separate connection, in autocommit
+    mode, so they are delivered as soon as the changes are committed,
+    regardless of what the stores are doing. A thread reads them as they
+    arrive, so they don't pile up on the server while the caches are not
+    used, and keeps the ones of the tables each cache listens to until the
+    cache asks for them. Reading them does not require a round trip to
+    the database.
+
+    The connection is opened when the first cache is registered. If it is
+    lost, the caches are unregistered and will register again, opening
+    a new one, the next time they ask for their changes.
+    """
+
+    #: how long the thread waits for a notification before checking if
+    #: the listener was closed, in seconds
+    timeout = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        # cache -> {table: set of te_ids}
+        self._changes = weakref.WeakKeyDictionary()
+
+    #
+    #  Public API
+    #
+
+    def register(self, cache):
+        """Start keeping the changes of the tables of a cache
+
+        Only the changes made after this are kept.
+
+        :param cache: a :class:`NotifiedCache`
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+                threadit(self._read_notifications, self._conn)
+            self._changes[cache] = Changes()
+
+    def unregister(self, cache):
+        """Stop keeping the changes of the tables of a cache
+
+        :param cache: a :class:`NotifiedCache`
+        """
+        with self._lock:
+            self._changes.pop(cache, None)
+
+    def pop_changes(self, cache):
+        """Get the changes received for a cache since the last call
+
+        :param cache: a :class:`NotifiedCache`
+        :returns: the :class:`Changes`, or ``None`` if the cache is not
+            registered, in which case some changes may have been missed
+        """
+        with self._lock:
+            changes = self._changes.get(cache)
+            if changes is not None:
+                self._changes[cache] = Changes()
+            return changes
+
+    def close(self):
+        """Close the connection and unregister all the caches"""
+        with self._lock:
+            # The thread closes the connection when it notices this
+            self._conn = None
+            self._changes.clear()
+
+    #
+    #  Private
+    #
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(db_settings.get_store_dsn())
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        cursor.execute("LISTEN new_te; LISTEN update_te; LISTEN delete_row;")
+        cursor.close()
+        return conn
+
+    def _read_notifications(self, conn):
+        while self._conn is conn:
+            try:
+                select.select([conn], [], [], self.timeout)
+                conn.poll()
+            except Exception as e:
+                log.warning("Lost the database notifications: %s", e)
+                # The caches will notice they were unregistered, and
+                # that they may have missed some changes
+                with self._lock:
+                    if self._conn is conn:
+                        self._conn = None
+                        self._changes.clear()
+                break
+
+            with self._lock:
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0))
+        conn.close()
+
+    def _dispatch(self, notify):
+        row_id, sep, table = notify.payload.partition(',')
+        for cache, changes in self._changes.items():
+            if table not in cache.tables:
+                continue
+            if notify.channel == 'delete_row':
+                changes.deleted[table].add(row_id)
+            else:
+                changes[table].add(int(row_id))
+
+
+class NotifiedCache(object):
+    """A cache of some tables that is cleared when they change
+
+    Subclasses set :attr:`tables` and implement :meth:`clear` and
+    :meth:`refresh`, which should call :meth:`poll` and forget what the
+    changes made outdated.
+
+    When the cache can't listen to the notifications, or stops receiving
+    them, it is cleared. In the first case, it works without them: only
+    the changes made by this process are noticed then. In the second, it
+    listens again the next time it is polled.
+
+    :param listen: if the cache should listen to the database
+        notifications to know when another process changes a row
+    """
+
+    #: the names of the tables whose changes are listened to
+    tables = ()
+
+    def __init__(self, listen=True):
+        self.listen = listen
+
+    #
+    #  Public API
+    #
+
+    def poll(self):
+        """Get the changes made to :attr:`tables` since the last poll
+
+        :returns: the :class:`Changes`
+        """
+        if not self.listen:
+            return Changes()
+
+        listener = get_change_listener()
+        changes = listener.pop_changes(self)
+        if changes is not None:
+            return changes
+
+        # Not listening yet, or the notifications were lost
+        try:
+            listener.register(self)
+        except Exception as e:
+            log.warning("Could not listen to the database "
+                        "notifications: %s", e)
+            self.listen = False
+        # Nothing that was cached before listening can be trusted
+        self.clear()
+        return Changes()
+
+    def refresh(self, store):
+        """Forget what was changed by other processes
+
+        :param store: a store
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Forget everything, it will be loaded again when needed"""
+        raise NotImplementedError
+
+    def clear_on_rollback(self, store):
+        """Clear the cache if the changes of a store are discarded
+
+        Until they are committed, the changes made in *store* are only
+        seen by it, but they may be cached if it is used to load the
+        cache. This should be called when something cached is changed
+        in *store*, so they are not kept if they are rolled back.
+
+        :param store: a store
+        """
+        store.add_rollback_hook(self.clear)
+
+    def close(self):
+        """Stop listening to the database notifications and clear the cache
+        """
+        if self.listen:
+            get_change_listener().unregister(self)
+        self.clear()
+
+
+_listener = None
+
+
+def get_change_listener():
+    """Get the listener of the notifications of this process
+
+    :returns: a :class:`ChangeListener`
+    """
+    global _listener
+    if _listener is None:
+        _listener = ChangeListener()
+    return _listener
@@ -24,6 +24,7 @@
 Kiwi integration for Stoq/Storm
 """
 
+import json
 import re
 import threading
 import queue
@@ -264,7 +265,9 @@ class AsyncQueryOperation(GObject.GObject):
         Note that this can only be called when the *finish* signal
         has been emitted.
 
-        :returns: a :class:`AsyncResultSet` containing the result
+        :returns: a :class:`AsyncResultSet` containing the result, or
+            the :class:`storm.database.Result` itself if the operation
+            was created without a resultset
         """
         assert self.status == self.STATUS_FINISHED
 
@@ -273,6 +276,8 @@ class AsyncQueryOperation(GObject.GObject):
 
         result = self._conn.result_factory(self._conn,
                                            self._async_cursor)
+        if self.resultset is None:
+            return result
         return AsyncResultSet(self.resultset, result)
 
     def cancel(self):
@@ -330,6 +335,19 @@ class QueryExecuter(object):
     :cvar default_search_limit: The default search limit.
     """
 
+    #: The summary of the results (see :meth:`.get_post_result`) is always
+    #: computed exactly
+    SUMMARY_EXACT = u'exact'
+
+    #: The number of results is estimated by the database planner when
+    #: there are many of them, and the exact summary is computed later,
+    #: with :meth:`.get_post_result_async`
+    SUMMARY_ESTIMATE = u'estimate'
+
+    #: When using :attr:`.SUMMARY_ESTIMATE`, results estimated to have
+    #: less rows than this are counted exactly anyway, since that is cheap
+    ESTIMATE_THRESHOLD = 5000
+
     def __init__(self, store=None):
         self._columns = {}
         self._limit = -1
@@ -340,6 +358,7 @@ class QueryExecuter(object):
         self._filter_query_callbacks = {}
         self._query = self._default_query
         self.post_result = None
+        self.summary_mode = self.SUMMARY_EXACT
         self._operation_executer = _OperationExecuter.get_instance()
 
     # Public API
@@ -495,19 +514,79 @@ class QueryExecuter(object):
 
         self._query = callback
 
+    def set_summary_mode(self, mode):
+        """Sets how the summary of the results is computed
+
+        :param mode: :attr:`.SUMMARY_EXACT` or :attr:`.SUMMARY_ESTIMATE`
+        """
+        assert mode in [self.SUMMARY_EXACT, self.SUMMARY_ESTIMATE], mode
+        self.summary_mode = mode
+
     def get_post_result(self, result):
-        descs, query = self.search_spec.post_search_callback(result)
-        # This should not be present in the query, since post_search_callback
-        # should only use aggregate functions.
-        query.order_by = Undef
-        query.group_by = Undef
-        store = self.store
-        values = store.execute(query).get_one()
-        assert len(descs) == len(values), (descs, values)
-        data = {}
-        for desc, value in zip(descs, list(values)):
-            data[desc] = value
-        return Settable(**data)
+        """Get the summary of the results of a search
+
+        The summary has the values described by the search spec's
+        ``post_search_callback`` (e.g. ``count`` and ``sum``) and an
+        ``estimated`` attribute. When it is ``True``, ``count`` was
+        estimated by the planner, the other values are ``None`` and
+        the exact summary should be computed with
+        :meth:`.get_post_result_async`.
+
+        :param result: the resultset returned by :meth:`.search`
+        :returns: a :class:`kiwi.python.Settable`
+        """
+        descs, query = self._get_post_query(result)
+        if self.summary_mode == self.SUMMARY_ESTIMATE:
+            count = self.estimate_count(result)
+            if count >= self.ESTIMATE_THRESHOLD:
+                data = dict.fromkeys(descs)
+                data['count'] = count
+                return Settable(estimated=True, **data)
+
+        values = self.store.execute(query).get_one()
+        return self._build_post_result(descs, values)
+
+    def get_post_result_async(self, result, callback):
+        """Compute the exact summary of the results in another connection
+
+        Like :meth:`.search_async`, the query is executed in another
+        connection, so it only sees what was committed.
+
+        :param result: the resultset returned by :meth:`.search`
+        :param callback: called in the main loop with the summary, like
+            the one returned by :meth:`.get_post_result`, when it is ready
+        :returns: the query operation, which can be cancelled
+        """
+        descs, query = self._get_post_query(result)
+        operation = AsyncQueryOperation(self.store, None, query)
+
+        def finish(operation):
+            values = operation.get_result().get_one()
+            callback(self._build_post_result(descs, values))
+
+        operation.connect('finish', finish)
+        self._operation_executer.schedule(operation)
+        return operation
+
+    def estimate_count(self, result):
+        """Get the number of rows the planner estimates *result* will have
+
+        This only asks the planner, so it is cheap even for queries that
+        would take a long time to count.
+
+        :param result: a resultset
+        :returns: the estimated number of rows
+        """
+        select = result._get_select()
+        select.order_by = Undef
+        state = State()
+        statement = compile(select, state)
+        row = self.store.execute('EXPLAIN (FORMAT JSON) ' + statement,
+                                 state.parameters).get_one()
+        plan = row[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
 
     def get_ordered_result(self, result, attribute):
         if issubclass(self.search_spec, Viewable):
@@ -524,6 +603,21 @@ class QueryExecuter(object):
     def _default_query(self, store):
         return store.find(self.search_spec)
 
+    def _get_post_query(self, result):
+        descs, query = self.search_spec.post_search_callback(result)
+        # This should not be present in the query, since post_search_callback
+        # should only use aggregate functions.
+        query.order_by = Undef
+        query.group_by = Undef
+        return descs, query
+
+    def _build_post_result(self, descs, values):
+        assert len(descs) == len(values), (descs, values)
+        data = {}
+        for desc, value in zip(descs, list(values)):
+            data[desc] = value
+        return Settable(estimated=False, **data)
+
     def parse_states(self, states):
         """Parses the state given and return a tuple where the first element is
         the queries that should be used, and the second is a 'having' that
@@ -23,9 +23,13 @@
 ##
 """ Runtime routines for applications"""
 
-from collections import namedtuple
+from collections import Counter, namedtuple
+import functools
 import logging
+import random
 import sys
+import threading
+import time
 import warnings
 import weakref
 import os
@@ -37,7 +41,8 @@ from storm.info import get_obj_info
 from storm.store import Store, ResultSet, PENDING_REMOVE, PENDING_ADD
 from storm.tracer import trace
 
-from stoqlib.database.exceptions import InterfaceError, OperationalError
+from stoqlib.database.exceptions import (InterfaceError, OperationalError,
+                                         is_transaction_conflict)
 from stoqlib.database.interfaces import (
     ICurrentBranch,
     ICurrentBranchStation, ICurrentUser)
@@ -241,6 +246,9 @@ class StoqlibStore(Store):
         # When using savepoints, this stack will hold what objects were changed
         # (created, deleted or edited) inside that savepoint.
         self._dirties = [[]]
+        # Functions to call when the changes are discarded,
+        # see add_rollback_hook
+        self._rollback_hooks = []
         self.retval = True
         self.obsolete = False
 
@@ -457,6 +465,7 @@ class StoqlibStore(Store):
 
         self._savepoints = []
         self._dirties = [[]]
+        self._rollback_hooks = []
 
         # Reload objects on all other opened stores
         for obj in touched_objs:
@@ -518,6 +527,7 @@ class StoqlibStore(Store):
             # If we rollback completely, we need to clear all savepoints
             self._savepoints = []
             self._dirties = [[]]
+            self._run_rollback_hooks(discard=True)
 
         # Rolling back resets the application name.
         self._setup_application_name()
@@ -538,6 +548,8 @@ class StoqlibStore(Store):
 
         super(StoqlibStore, self).close()
         self.obsolete = True
+        # The changes that were not committed are lost
+        self._run_rollback_hooks(discard=True)
 
     @public(since="1.5.0")
     def fetch(self, obj):
@@ -614,7 +626,16 @@ class StoqlibStore(Store):
         # Objects may have changed in this transaction.
         # Make sure to autorelad the original values after the rollback
         for obj_info in self._cache.get_cached():
-            self.autoreload(obj_info.get_obj())
+            obj = obj_info.get_obj()
+            self.autoreload(obj)
+            # Like Store.invalidate does, let the object drop anything it
+            # computed from the old values
+            hook = getattr(obj, '__storm_invalidated__', None)
+            if hook is not None:
+                hook()
+
+        # The changes made before the savepoint may still be rolled back
+        self._run_rollback_hooks(discard=False)
 
     def savepoint_exists(self, name):
         """Checks if the given savepoint's name exists
@@ -625,6 +646,23 @@ class StoqlibStore(Store):
         """
         return name in self._savepoints
 
+    def add_rollback_hook(self, func):
+        """Call a function when the changes of this store are discarded
+
+        This is meant for caches kept outside of the store: one loaded
+        while this store had uncommitted changes may have them, and needs
+        to forget them when they are rolled back.
+
+        *func* is called without arguments every time the store is rolled
+        back to a savepoint and, at most once, when it is completely rolled
+        back or closed without committing. Committing removes it. Adding
+        the same function twice does not call it twice.
+
+        :param func: the function to call
+        """
+        if func not in self._rollback_hooks:
+            self._rollback_hooks.append(func)
+
     def confirm(self, commit):
         """Encapsulated method for committing/aborting changes in models.
 
@@ -644,6 +682,13 @@ class StoqlibStore(Store):
     #  Private
     #
 
+    def _run_rollback_hooks(self, discard):
+        hooks = self._rollback_hooks[:]
+        if discard:
+            self._rollback_hooks = []
+        for hook in hooks:
+            hook()
+
     def _setup_application_name(self):
         """Sets a friendly name for postgres connection
 
@@ -708,6 +753,97 @@ def new_store():
     return StoqlibStore()
 
 
+_retries = Counter()
+_retries_lock = threading.Lock()
+
+
+def run_in_transaction(func, *args, max_retries=5, backoff=0.05,
+                       max_backoff=1.0, **kwargs):
+    """Run a unit of work in a new store, retrying it on conflicts
+
+    *func* is called with a new store as its first argument, followed by
+    *args* and *kwargs*. The store is committed after it returns (unless
+    ``store.retval`` was set to ``False``) and closed.
+
+    If the transaction fails because of a deadlock or a serialization
+    failure, the store is rolled back and *func* is called again with a
+    new store, after sleeping a random time (to avoid the same transactions
+    colliding again) that grows exponentially with the number of attempts.
+
+    Since *func* may be called more than once, it should not keep state
+    between calls: domain objects must be fetched again from the store it
+    receives, and it should only have side effects on the database.
+
+    :param func: the unit of work
+    :param max_retries: how many times the unit of work can be retried.
+        After that, the error is raised
+    :param backoff: the maximum time, in seconds, to wait before the first
+        retry. It doubles on each retry
+    :param max_backoff: the maximum time, in seconds, to wait before any
+        retry
+    :returns: what *func* returned
+    """
+    name = getattr(func, '__qualname__', repr(func))
+    attempt = 0
+    while True:
+        store = new_store()
+        try:
+            retval = func(store, *args, **kwargs)
+            store.confirm(commit=store.retval)
+            store.close()
+            return retval
+        except Exception as e:
+            if not store.obsolete:
+                store.rollback(close=True)
+            if not is_transaction_conflict(e) or attempt >= max_retries:
+                raise
+
+            attempt += 1
+            with _retries_lock:
+                _retries[name] += 1
+            delay = random.uniform(0, min(max_backoff,
+                                          backoff * 2 ** (attempt - 1)))
+            log.info('Transaction conflict running %s (%s), retrying in '
+                     '%.3fs (attempt %d)', name, e.pgcode, delay, attempt)
+            time.sleep(delay)
+
+
+def retry_on_conflict(max_retries=5, backoff=0.05, max_backoff=1.0):
+    """Decorator that runs the decorated function with
+    :func:`run_in_transaction`
+
+    The function should receive a store as its first argument, which
+    must not be passed by the callsite::
+
+        @retry_on_conflict()
+        def confirm_sale(store, sale_id):
+            sale = store.get(Sale, sale_id)
+            sale.confirm(...)
+
+        confirm_sale(sale.id)
+
+    See :func:`run_in_transaction` for the meaning of the arguments.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return run_in_transaction(func, *args, max_retries=max_retries,
+                                      backoff=backoff,
+                                      max_backoff=max_backoff, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_transaction_retries():
+    """Get how many times units of work were retried because of conflicts
+
+    :returns: a dict mapping the name of the retried function to the
+        number of retries, since the process started
+    """
+    with _retries_lock:
+        return dict(_retries)
+
+
 #
 # User methods
 #
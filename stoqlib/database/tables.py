@@ -49,6 +49,7 @@ _tables = [
     ('parameter', ["ParameterData"]),
     ('account', ['Account',
                  'AccountTransaction',
+                 'AccountBalanceCheckpoint',
                  'BankAccount',
                  'BillOption']),
     ('profile', ["UserProfile", "ProfileSettings"]),
@@ -72,6 +73,7 @@ _tables = [
                 "EmployeeRoleHistory",
                 "ClientCategory",
                 "ClientSalaryHistory",
+                "ClientCreditBalance",
                 "CreditCheckHistory",
                 "UserBranchAccess"]),
     ('synchronization', ["BranchSynchronization"]),
@@ -113,6 +115,8 @@ _tables = [
                  "ProductSupplierInfo",
                  'StockTransactionHistory',
                  "ProductStockItem",
+                 "ProductStockSummary",
+                 "ProductStockSnapshot",
                  "GridGroup",
                  "GridAttribute",
                  "GridOption",
@@ -168,6 +172,8 @@ _tables = [
     ('event', ['Event']),
     ('certificate', ['Certificate']),
     ('message', ['Message']),
+    ('backgroundjob', ['BackgroundJob']),
+    ('reorder', ['ProductReorderSuggestion']),
 ]
 
 # table name (e.g. "Person") -> class
@@ -26,9 +26,10 @@
 
 import datetime
 
-from storm.expr import Cast, Sum
+from storm.expr import Cast, Column, Select, Sum, Table
 
-from stoqlib.database.expr import Case, Between, GenerateSeries, Field, Over
+from stoqlib.database.expr import (Case, Between, GenerateSeries, Field,
+                                   ForUpdate, Over, WithRecursive)
 from stoqlib.domain.event import Event
 from stoqlib.domain.test.domaintest import DomainTest
 
@@ -131,3 +132,38 @@ class ViewableTest(DomainTest):
 
         self.assertEqual(data, [
             (i, 55, sum(range(i + 1)), i) for i in range(11)])
+
+    def test_for_update(self):
+        self.clean_domain([Event])
+        for i in range(3):
+            Event(store=self.store, date=datetime.datetime(2012, 1, i + 1),
+                  event_type=Event.TYPE_SYSTEM, description=u'')
+
+        query = ForUpdate(Select(Event.date, order_by=Event.date))
+        data = [row[0] for row in self.store.execute(query)]
+        self.assertEqual(data, [datetime.datetime(2012, 1, i + 1)
+                                for i in range(3)])
+
+        query = ForUpdate(Select(Event.date, order_by=Event.date),
+                          skip_locked=True)
+        data = [row[0] for row in self.store.execute(query)]
+        self.assertEqual(data, [datetime.datetime(2012, 1, i + 1)
+                                for i in range(3)])
+
+    def test_with_recursive(self):
+        series = Table('series')
+        n = Column('n', series)
+        query = WithRecursive(series, ['n'],
+                              Select(Cast(1, 'integer')),
+                              Select(n + 1, where=n < 5),
+                              Select(n, order_by=n))
+        data = [row[0] for row in self.store.execute(query)]
+        self.assertEqual(data, [1, 2, 3, 4, 5])
+
+        # Rows that were already found end the recursion
+        query = WithRecursive(series, ['n'],
+                              Select(Cast(1, 'integer')),
+                              Select(n % 3 + 1),
+                              Select(n, order_by=n))
+        data = [row[0] for row in self.store.execute(query)]
+        self.assertEqual(data, [1, 2, 3])
@@ -27,6 +27,7 @@ import mock
 
 from stoqlib.domain.test.domaintest import DomainTest
 from stoqlib.domain.person import ClientCategory
+from stoqlib.domain.views import ProductFullStockView
 from stoqlib.database.queryexecuter import (QueryExecuter,
                                             StringQueryState)
 
@@ -135,3 +136,35 @@ class QueryExecuterTest(DomainTest):
         finally:
             self.clean_domain([ClientCategory])
             self.store.commit()
+
+    def test_estimate_count(self):
+        for i in range(3):
+            self.create_client_category(u'Category %d' % (i, ))
+        count = self.qe.estimate_count(self.store.find(ClientCategory))
+        self.assertTrue(isinstance(count, int))
+        self.assertTrue(count >= 0)
+
+    def test_get_post_result(self):
+        self.create_storable(stock=5)
+        qe = QueryExecuter(self.store)
+        qe.set_search_spec(ProductFullStockView)
+        result = qe.search()
+
+        post = qe.get_post_result(result)
+        self.assertFalse(post.estimated)
+        self.assertEqual(post.count, result.count())
+        self.assertEqual(post.sum, sum(view.stock for view in result))
+
+        # Few rows are still counted exactly
+        qe.set_summary_mode(QueryExecuter.SUMMARY_ESTIMATE)
+        with mock.patch.object(qe, 'estimate_count', return_value=10):
+            exact = qe.get_post_result(result)
+        self.assertFalse(exact.estimated)
+        self.assertEqual((exact.count, exact.sum), (post.count, post.sum))
+
+        with mock.patch.object(qe, 'estimate_count',
+                               return_value=QueryExecuter.ESTIMATE_THRESHOLD):
+            estimated = qe.get_post_result(result)
+        self.assertTrue(estimated.estimated)
+        self.assertEqual(estimated.count, QueryExecuter.ESTIMATE_THRESHOLD)
+        self.assertEqual(estimated.sum, None)
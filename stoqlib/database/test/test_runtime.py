@@ -26,9 +26,12 @@
 
 import mock
 
-from stoqlib.database.exceptions import InterfaceError
+from stoqlib.database.exceptions import (DEADLOCK_DETECTED, InterfaceError,
+                                         SERIALIZATION_FAILURE)
 from stoqlib.database.properties import UnicodeCol
-from stoqlib.database.runtime import new_store, StoqlibStore, autoreload_object
+from stoqlib.database.runtime import (new_store, StoqlibStore, autoreload_object,
+                                      get_transaction_retries, retry_on_conflict,
+                                      run_in_transaction)
 from stoqlib.domain.base import Domain
 from stoqlib.domain.person import Person, Client, ClientView
 from stoqlib.domain.test.domaintest import DomainTest
@@ -301,6 +304,29 @@ class StoqlibStoreTest(DomainTest):
         self.assertRaises(InterfaceError, store.savepoint, 'XXX')
         self.assertRaises(InterfaceError, store.rollback_to_savepoint, 'XXX')
 
+    def test_rollback_hook(self):
+        hook = mock.Mock()
+        store = new_store()
+        store.add_rollback_hook(hook)
+        store.add_rollback_hook(hook)
+        store.commit()
+        store.rollback(close=False)
+        self.assertEqual(hook.call_count, 0)
+
+        store.add_rollback_hook(hook)
+        store.savepoint('savepoint')
+        store.rollback_to_savepoint('savepoint')
+        self.assertEqual(hook.call_count, 1)
+        store.rollback(close=False)
+        self.assertEqual(hook.call_count, 2)
+        store.rollback(close=False)
+        self.assertEqual(hook.call_count, 2)
+
+        # Closing discards the changes that were not committed
+        store.add_rollback_hook(hook)
+        store.close()
+        self.assertEqual(hook.call_count, 3)
+
     def test_autoreload(self):
         # Create 3 stores.
         store1 = new_store()
@@ -424,6 +450,97 @@ class StoqlibStoreTest(DomainTest):
         self.assertEqual(obj.on_update_called_count, 0)
 
 
+class _ConflictError(Exception):
+    def __init__(self, pgcode):
+        super(_ConflictError, self).__init__(pgcode)
+        self.pgcode = pgcode
+
+
+class TestRunInTransaction(DomainTest):
+
+    def _new_store(self):
+        store = mock.Mock(obsolete=False, retval=True)
+        self.stores.append(store)
+        return store
+
+    def setUp(self):
+        super(TestRunInTransaction, self).setUp()
+        self.stores = []
+        patcher = mock.patch('stoqlib.database.runtime.new_store',
+                             self._new_store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('stoqlib.database.runtime.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run_in_transaction(self):
+        func = mock.Mock(return_value=10, __qualname__='func')
+        self.assertEqual(run_in_transaction(func, 1, foo=2), 10)
+        store = self.stores[0]
+        func.assert_called_once_with(store, 1, foo=2)
+        store.confirm.assert_called_once_with(commit=True)
+        store.close.assert_called_once_with()
+        self.assertEqual(self.sleep.call_count, 0)
+
+    def test_run_in_transaction_retval(self):
+        def func(store):
+            store.retval = False
+
+        run_in_transaction(func)
+        self.stores[0].confirm.assert_called_once_with(commit=False)
+
+    def test_run_in_transaction_retry(self):
+        retries = get_transaction_retries().get('conflicting', 0)
+        errors = [_ConflictError(DEADLOCK_DETECTED),
+                  _ConflictError(SERIALIZATION_FAILURE)]
+
+        def func(store):
+            if errors:
+                raise errors.pop(0)
+            return 'done'
+        func.__qualname__ = 'conflicting'
+
+        self.assertEqual(run_in_transaction(func, backoff=0.1), 'done')
+        self.assertEqual(len(self.stores), 3)
+        for store in self.stores[:2]:
+            store.rollback.assert_called_once_with(close=True)
+            self.assertEqual(store.confirm.call_count, 0)
+        self.stores[2].confirm.assert_called_once_with(commit=True)
+
+        self.assertEqual(self.sleep.call_count, 2)
+        self.assertTrue(0 <= self.sleep.call_args_list[0][0][0] <= 0.1)
+        self.assertTrue(0 <= self.sleep.call_args_list[1][0][0] <= 0.2)
+        self.assertEqual(get_transaction_retries()['conflicting'],
+                         retries + 2)
+
+    def test_run_in_transaction_max_retries(self):
+        func = mock.Mock(side_effect=_ConflictError(DEADLOCK_DETECTED),
+                         __qualname__='func')
+        with self.assertRaises(_ConflictError):
+            run_in_transaction(func, max_retries=2)
+        self.assertEqual(func.call_count, 3)
+
+    def test_run_in_transaction_other_errors(self):
+        func = mock.Mock(side_effect=ValueError, __qualname__='func')
+        with self.assertRaises(ValueError):
+            run_in_transaction(func)
+        self.assertEqual(func.call_count, 1)
+        self.stores[0].rollback.assert_called_once_with(close=True)
+
+    def test_retry_on_conflict(self):
+        errors = [_ConflictError(DEADLOCK_DETECTED)]
+
+        @retry_on_conflict(max_retries=1)
+        def func(store, value):
+            if errors:
+                raise errors.pop(0)
+            return value
+
+        self.assertEqual(func(5), 5)
+        self.assertEqual(len(self.stores), 2)
+
+
 class TestStoqlibResultSet(DomainTest):
 
     def test_fast_iter_single_table(self):
@@ -40,24 +40,44 @@ import collections
 import datetime
 
 from kiwi.currency import currency
-from storm.expr import And, LeftJoin, Or
+from storm.databases.postgres import Returning
+from storm.expr import (Alias, And, Column, Delete, Desc, Join, LeftJoin,
+                        Max, Or, Select, Sum, Table)
 from storm.info import ClassAlias
 from storm.references import Reference
 from zope.interface import implementer
 
-from stoqlib.database.expr import TransactionTimestamp, Date
+from stoqlib.database.bulk import bulk_insert
+from stoqlib.database.expr import (Case, Date, DateTrunc, Field, Over,
+                                   TransactionTimestamp, UnionAll)
 from stoqlib.database.properties import (DateTimeCol, EnumCol, IdCol,
                                          IntCol, PriceCol, UnicodeCol)
 from stoqlib.database.viewable import Viewable
+from stoqlib.domain.backgroundjob import BackgroundJob, register_job_handler
 from stoqlib.domain.base import Domain
 from stoqlib.domain.interfaces import IDescribable
 from stoqlib.domain.station import BranchStation
 from stoqlib.exceptions import PaymentError
+from stoqlib.lib.dateutils import localnow, localtoday
 from stoqlib.lib.parameters import sysparam
 from stoqlib.lib.translation import stoqlib_gettext
 
 _ = stoqlib_gettext
 
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def _get_month(date):
+    return date.replace(day=1)
+
+
+def _get_next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _get_datetime(date):
+    return datetime.datetime.combine(date, datetime.time.min)
+
 
 class BillOption(Domain):
     """List of values for bill (boleto) generation
@@ -287,8 +307,39 @@ class Account(Domain):
             raise TypeError("end must be a datetime.datetime, not %s" % (
                 type(end), ))
 
-        query = And(Date(AccountTransaction.date) >= start,
-                    Date(AccountTransaction.date) <= end,
+        # Date(transaction.date) is compared to the datetimes, so a start
+        # with a time skips its own day
+        first_day = start.date()
+        if start.time() != datetime.time.min:
+            first_day += _ONE_DAY
+        last_day = end.date()
+
+        # The whole months of the interval are read from the checkpoints
+        # and only the transactions of its first and last months are summed
+        first_month = _get_month(first_day)
+        if first_month != first_day:
+            first_month = _get_next_month(first_month)
+        end_month = _get_month(last_day)
+        if last_day + _ONE_DAY == _get_next_month(end_month):
+            end_month = _get_next_month(end_month)
+
+        if first_month >= end_month:
+            return currency(self._get_transactions_total(first_day, last_day))
+
+        # A transaction from and to this account is both incoming and
+        # outgoing, so it doesn't change the total
+        total = AccountBalanceCheckpoint.get_total(self.store, self,
+                                                   first_month, end_month)
+        if first_day < first_month:
+            total += self._get_transactions_total(first_day,
+                                                  first_month - _ONE_DAY)
+        if end_month <= last_day:
+            total += self._get_transactions_total(end_month, last_day)
+        return currency(total)
+
+    def _get_transactions_total(self, first_day, last_day):
+        query = And(Date(AccountTransaction.date) >= first_day,
+                    Date(AccountTransaction.date) <= last_day,
                     AccountTransaction.source_account_id != AccountTransaction.account_id)
 
         transactions = self.store.find(AccountTransaction, query)
@@ -298,7 +349,7 @@ class Account(Domain):
         positive_values = incoming.sum(AccountTransaction.value) or 0
         negative_values = outgoing.sum(AccountTransaction.value) or 0
 
-        return currency(positive_values - negative_values)
+        return positive_values - negative_values
 
     def can_remove(self):
         """If the account can be removed.
@@ -570,6 +621,291 @@ class AccountTransaction(Domain):
             raise AssertionError
 
 
+# The changes to the |accounttransactions| that were not moved to the
+# checkpoints yet, see AccountBalanceCheckpoint. The table is only written
+# by the database, so it has no domain class
+_delta = Table('account_balance_delta')
+_delta_account_id = Column('account_id', _delta)
+_delta_month = Column('month', _delta)
+_delta_incoming = Column('incoming', _delta)
+_delta_outgoing = Column('outgoing', _delta)
+
+
+class AccountBalanceCheckpoint(Domain):
+    """The transactions of an |account| in a month
+
+    A trigger on the account_transaction table records each change to the
+    |accounttransactions| as a delta in the account_balance_delta table.
+    It only inserts rows there, so the transactions of different stations
+    don't wait for each other, and :meth:`.update` moves the deltas to the
+    checkpoints later. That is done every day by an ``account-checkpoints``
+    background job.
+
+    Each checkpoint also keeps the sums of the transactions of the
+    |account| up to the end of its month, so the balance of an |account|
+    is its last checkpoint plus its deltas, see :meth:`.get_balance_query`.
+    The checkpoints should never be changed by hand, :meth:`.verify` and
+    :meth:`.rebuild` can be used to check and fix them.
+    """
+
+    __storm_table__ = 'account_balance_checkpoint'
+
+    account_id = IdCol()
+
+    #: the |account|
+    account = Reference(account_id, 'Account.id')
+
+    #: the midnight of the first day of the month
+    month = DateTimeCol()
+
+    #: the sum of the |accounttransactions| of the month to the |account|
+    incoming = PriceCol(default=0)
+
+    #: the sum of the |accounttransactions| of the month from the |account|
+    outgoing = PriceCol(default=0)
+
+    #: the sum of the |accounttransactions| to the |account| up to the end
+    #: of the month
+    total_incoming = PriceCol(default=0)
+
+    #: the sum of the |accounttransactions| from the |account| up to the
+    #: end of the month
+    total_outgoing = PriceCol(default=0)
+
+    @classmethod
+    def get_balance_query(cls):
+        """Get a query of the balances of the |accounts|
+
+        :returns: a query with the ``account_id`` and the sums of the
+          ``incoming`` and ``outgoing`` |accounttransactions| of each
+          |account| that has any
+        """
+        last_month = Select(
+            [cls.account_id, Alias(Max(cls.month), 'month')],
+            tables=[cls], group_by=[cls.account_id])
+        checkpoints = Select(
+            [cls.account_id, Alias(cls.total_incoming, 'incoming'),
+             Alias(cls.total_outgoing, 'outgoing')],
+            tables=[cls,
+                    Join(Alias(last_month, '_last_month'),
+                         And(Field('_last_month', 'account_id') ==
+                             cls.account_id,
+                             Field('_last_month', 'month') == cls.month))])
+        deltas = Select(
+            [_delta_account_id, _delta_incoming, _delta_outgoing],
+            tables=[_delta])
+
+        account_id = Field('_balance', 'account_id')
+        return Select(
+            [account_id,
+             Alias(Sum(Field('_balance', 'incoming')), 'incoming'),
+             Alias(Sum(Field('_balance', 'outgoing')), 'outgoing')],
+            tables=[Alias(UnionAll(checkpoints, deltas), '_balance')],
+            group_by=[account_id])
+
+    @classmethod
+    def get_total(cls, store, account, first_month, end_month):
+        """Get the total of the |accounttransactions| of some months
+
+        :param store: a store
+        :param account: the |account|
+        :param first_month: the first day of the first month
+        :param end_month: the first day of the month after the last one
+        :returns: the sum of the incoming transactions minus the sum of
+          the outgoing ones
+        """
+        checkpoints = store.find(
+            cls, And(cls.account_id == account.id,
+                     cls.month >= _get_datetime(first_month),
+                     cls.month < _get_datetime(end_month)))
+        deltas = store.execute(Select(
+            [Sum(_delta_incoming), Sum(_delta_outgoing)],
+            where=And(_delta_account_id == account.id,
+                      _delta_month >= _get_datetime(first_month),
+                      _delta_month < _get_datetime(end_month)),
+            tables=[_delta])).get_one()
+        return ((checkpoints.sum(cls.incoming) or 0) + (deltas[0] or 0) -
+                (checkpoints.sum(cls.outgoing) or 0) - (deltas[1] or 0))
+
+    @classmethod
+    def update(cls, store):
+        """Move the deltas to the checkpoints
+
+        :param store: a store
+        :returns: the number of checkpoints changed
+        """
+        # The deltas are removed and returned by the same statement, so
+        # the ones inserted meanwhile are left for the next time
+        result = store.execute(Returning(
+            Delete(table=_delta),
+            columns=[_delta_account_id, _delta_month, _delta_incoming,
+                     _delta_outgoing]))
+        deltas = collections.defaultdict(lambda: [0, 0])
+        for account_id, month, incoming, outgoing in result:
+            values = deltas[account_id, month]
+            values[0] += incoming
+            values[1] += outgoing
+
+        first_months = {}
+        for (account_id, month), (incoming, outgoing) in deltas.items():
+            checkpoint = store.find(cls, account_id=account_id,
+                                    month=month).one()
+            if checkpoint is None:
+                checkpoint = cls(store=store, account_id=account_id,
+                                 month=month)
+            checkpoint.incoming += incoming
+            checkpoint.outgoing += outgoing
+            first_months[account_id] = min(
+                month, first_months.get(account_id, month))
+
+        # The totals of the months after the changed ones change too
+        for account_id, month in first_months.items():
+            previous = store.find(
+                cls, And(cls.account_id == account_id,
+                         cls.month < month)).order_by(Desc(cls.month)).first()
+            total_incoming = previous.total_incoming if previous else 0
+            total_outgoing = previous.total_outgoing if previous else 0
+            for checkpoint in store.find(
+                    cls, And(cls.account_id == account_id,
+                             cls.month >= month)).order_by(cls.month):
+                total_incoming += checkpoint.incoming
+                total_outgoing += checkpoint.outgoing
+                checkpoint.total_incoming = total_incoming
+                checkpoint.total_outgoing = total_outgoing
+        return len(deltas)
+
+    @classmethod
+    def calculate(cls, store):
+        """Calculate the checkpoints from the |accounttransactions|
+
+        :param store: a store
+        :returns: a dict mapping (account id, month) to a
+          (incoming, outgoing, total incoming, total outgoing) tuple
+        """
+        values = cls._get_transaction_values(store)
+        return cls._add_totals(values, sorted(values))
+
+    @classmethod
+    def verify(cls, store):
+        """Compare the checkpoints to the |accounttransactions|
+
+        The deltas that were not moved to the checkpoints yet are counted
+        as if they were.
+
+        :param store: a store
+        :returns: a list of (account id, month, expected, found) tuples
+          for the checkpoints that are wrong, sorted by account and month.
+          *expected* and *found* are (incoming, outgoing, total incoming,
+          total outgoing) tuples
+        """
+        checkpoints = {}
+        for row in store.find((cls.account_id, cls.month, cls.incoming,
+                               cls.outgoing, cls.total_incoming,
+                               cls.total_outgoing)):
+            checkpoints[row[:2]] = row[2:]
+        deltas = {}
+        for row in store.execute(Select(
+                [_delta_account_id, _delta_month, Sum(_delta_incoming),
+                 Sum(_delta_outgoing)],
+                tables=[_delta],
+                group_by=[_delta_account_id, _delta_month])):
+            deltas[row[:2]] = row[2:]
+        values = cls._get_transaction_values(store)
+        keys = sorted(set(values) | set(checkpoints) | set(deltas))
+        expected = cls._add_totals(values, keys)
+
+        errors = []
+        # account id -> the totals of its last checkpoint and the sums of
+        # its deltas up to the current month
+        totals = {}
+        for key in keys:
+            account_id = key[0]
+            total_incoming, total_outgoing, pending_incoming, \
+                pending_outgoing = totals.get(account_id, (0, 0, 0, 0))
+            incoming, outgoing = deltas.get(key, (0, 0))
+            pending_incoming += incoming
+            pending_outgoing += outgoing
+            if key in checkpoints:
+                checkpoint = checkpoints[key]
+                incoming += checkpoint[0]
+                outgoing += checkpoint[1]
+                total_incoming, total_outgoing = checkpoint[2:]
+            totals[account_id] = (total_incoming, total_outgoing,
+                                  pending_incoming, pending_outgoing)
+
+            found = (incoming, outgoing, total_incoming + pending_incoming,
+                     total_outgoing + pending_outgoing)
+            if expected[key] != found:
+                errors.append(key + (expected[key], found))
+        return errors
+
+    @classmethod
+    def rebuild(cls, store):
+        """Recreate all the checkpoints from the |accounttransactions|
+
+        The transactions can't be changed until *store* is committed or
+        rolled back, otherwise their deltas could be lost.
+
+        :param store: a store
+        :returns: the number of checkpoints created
+        """
+        store.execute('LOCK TABLE account_balance_delta IN EXCLUSIVE MODE')
+        store.execute(Delete(table=_delta))
+        store.find(cls).remove()
+        rows = [key + values for key, values
+                in cls.calculate(store).items()]
+        return bulk_insert(
+            store, (cls.account_id, cls.month, cls.incoming, cls.outgoing,
+                    cls.total_incoming, cls.total_outgoing),
+            rows)
+
+    #
+    #  Private
+    #
+
+    @classmethod
+    def _get_transaction_values(cls, store):
+        # {(account id, month): [incoming, outgoing]}
+        month = DateTrunc(u'month', AccountTransaction.date)
+        values = collections.defaultdict(lambda: [0, 0])
+        for index, column in enumerate([AccountTransaction.account_id,
+                                        AccountTransaction.source_account_id]):
+            result = store.find((column, month,
+                                 Sum(AccountTransaction.value)))
+            result = result.group_by(column, month)
+            for account_id, first_day, value in result:
+                values[account_id, first_day][index] += value
+        return values
+
+    @classmethod
+    def _add_totals(cls, values, keys):
+        # Adds the sums up to the end of each month to the values of the
+        # months. The keys must be sorted
+        result = {}
+        totals = {}
+        for key in keys:
+            incoming, outgoing = values.get(key, (0, 0))
+            total_incoming, total_outgoing = totals.get(key[0], (0, 0))
+            totals[key[0]] = (total_incoming + incoming,
+                              total_outgoing + outgoing)
+            result[key] = (incoming, outgoing) + totals[key[0]]
+        return result
+
+
+@register_job_handler(u'account-checkpoints')
+def _update_account_checkpoints(store):
+    AccountBalanceCheckpoint.update(store)
+    # Keep a single job waiting for the next day
+    pending = store.find(
+        BackgroundJob,
+        And(BackgroundJob.job_type == u'account-checkpoints',
+            BackgroundJob.status == BackgroundJob.STATUS_PENDING,
+            BackgroundJob.run_after > localnow()))
+    if pending.is_empty():
+        job = BackgroundJob.enqueue(store, u'account-checkpoints')
+        job.run_after = localtoday() + _ONE_DAY
+
+
 class AccountTransactionView(Viewable):
     """AccountTransactionView provides a fast view
     of the transactions tied to a specific |account|.
@@ -602,12 +938,91 @@ class AccountTransactionView(Viewable):
                  AccountTransaction.source_account_id == Account_Source.id),
     ]
 
+    #: The order of the running balance of :meth:`.get_balance_view`
+    balance_order = [AccountTransaction.date, AccountTransaction.id]
+
     @classmethod
     def get_for_account(cls, account, store):
         """Get all transactions for this |account|, see Account.transaction"""
         return store.find(cls, Or(account.id == AccountTransaction.account_id,
                                   account.id == AccountTransaction.source_account_id))
 
+    @classmethod
+    def get_balance_view(cls, account):
+        """Get a view of the transactions of an |account| with its balance
+
+        Besides the columns of this view, the returned one has
+        ``account_value``, the same as :meth:`.get_value`, and ``balance``,
+        the running balance of the |account| after the transaction,
+        computed by the database with a window function over the results
+        ordered by date. A transaction that was not adjusted doesn't change
+        the balance.
+
+        Only the transactions of the |account| are found by it and the
+        results should be ordered by :attr:`.balance_order`.
+
+        :param account: an |account|
+        :returns: a subclass of this view
+        """
+        # Like ProductFullStockView.find_by_branch, make sure to create the
+        # class only once for each account
+        hv = cls.highjacked.get(account.id, None)
+        if hv is None:
+            t = AccountTransaction
+            value_by_type = Case(t.operation_type == t.TYPE_IN,
+                                 t.value, -t.value)
+            value = Case(t.source_account_id == account.id, -t.value, t.value)
+            hv = type(
+                "Balance%s" % (cls.__name__, ),
+                (cls, ),
+                dict(account_value=Case(t.source_account_id == t.account_id,
+                                        value_by_type, value),
+                     balance=Over(Sum(Case(t.source_account_id == t.account_id,
+                                           0, value)),
+                                  [], cls.balance_order),
+                     clause=Or(t.account_id == account.id,
+                               t.source_account_id == account.id),
+                     _account_id=account.id))
+            cls.highjacked[account.id] = hv
+            hv.highjacked[account.id] = hv
+        return hv
+
+    @classmethod
+    def find_balance_page(cls, store, account, after=None, limit=None,
+                          query=None):
+        """Get a page of the transactions of an |account| with its balance
+
+        The pages are found using the date and id of the last transaction
+        of the previous page, instead of an offset, and the balance of that
+        transaction is carried to the ones of the page.
+
+        :param store: a store
+        :param account: an |account|
+        :param after: the last transaction of the previous page, as
+          returned by this method, or ``None`` for the first page
+        :param limit: how many transactions there should be in the page
+        :param query: a query to filter the transactions
+        :returns: a list of the views returned by :meth:`.get_balance_view`
+        """
+        view = cls.get_balance_view(account)
+        queries = []
+        if query is not None:
+            queries.append(query)
+        if after is not None:
+            queries.append(Or(AccountTransaction.date > after.date,
+                              And(AccountTransaction.date == after.date,
+                                  AccountTransaction.id > after.id)))
+
+        results = store.find(view, *queries).order_by(*cls.balance_order)
+        if limit is not None:
+            results.config(limit=limit)
+
+        transactions = list(results)
+        if after is not None:
+            for transaction in transactions:
+                transaction.balance += after.balance
+        return transactions
+
     def get_account_description(self, account):
         """Get description of the other |account|, eg.
         the one which is transfered to/from.
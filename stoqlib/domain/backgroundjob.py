@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+Work that is done after the transaction that asked for it.
+
+Some of the side effects of an operation (e.g. creating the commissions or
+logging the event of a confirmed |sale|) don't need to be done while the
+user waits for it. Those can be queued as a :class:`BackgroundJob` in the
+same transaction, so they are only visible (and run) if the transaction is
+committed, and are run later by a worker.
+
+The queue lives in the database, so it survives restarts and can be
+consumed by more than one worker at the same time: the jobs are locked
+with ``FOR UPDATE SKIP LOCKED``, so each one is run by a single worker.
+
+The work is done by a handler registered for the type of the job::
+
+    @register_job_handler(u'sale-commissions')
+    def create_commissions(store, sale_id):
+        ...
+
+    BackgroundJob.enqueue(store, u'sale-commissions', sale_id=sale.id)
+
+Jobs that fail are retried a few times, waiting longer after each attempt,
+and then marked as failed.
+"""
+
+import datetime
+import logging
+import threading
+
+from storm.expr import And, Select
+
+from stoqlib.database.expr import ForUpdate
+from stoqlib.database.properties import (DateTimeCol, EnumCol, IntCol,
+                                         JsonCol, UnicodeCol)
+from stoqlib.database.runtime import run_in_transaction
+from stoqlib.domain.base import Domain
+from stoqlib.lib.dateutils import localnow
+from stoqlib.lib.translation import stoqlib_gettext
+
+_ = stoqlib_gettext
+log = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def register_job_handler(job_type):
+    """Register the function decorated as the handler of *job_type*
+
+    The handler is called with the store where the job is being run and
+    the data of the job as keyword arguments.
+    """
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+def get_job_handler(job_type):
+    return _handlers.get(job_type)
+
+
+class BackgroundJob(Domain):
+    """A job that is run in the background by a worker"""
+
+    __storm_table__ = 'background_job'
+
+    #: the job is waiting to be run
+    STATUS_PENDING = u'pending'
+
+    #: the job was run successfully
+    STATUS_DONE = u'done'
+
+    #: the job failed more than :obj:`.max_attempts` times
+    STATUS_FAILED = u'failed'
+
+    statuses = {
+        STATUS_PENDING: _(u'Pending'),
+        STATUS_DONE: _(u'Done'),
+        STATUS_FAILED: _(u'Failed'),
+    }
+
+    #: how long to wait before retrying a job that failed the first time.
+    #: It doubles after each attempt
+    RETRY_DELAY = datetime.timedelta(seconds=30)
+
+    #: the type of the job, used to find its handler
+    job_type = UnicodeCol()
+
+    #: the arguments passed to the handler
+    data = JsonCol(default=None)
+
+    #: the status of the job, one of the ``STATUS_*`` constants
+    status = EnumCol(allow_none=False, default=STATUS_PENDING)
+
+    #: how many times running the job failed
+    attempts = IntCol(default=0)
+
+    #: how many times the job is run before it is marked as failed
+    max_attempts = IntCol(default=5)
+
+    #: when the job was created
+    created_date = DateTimeCol(default_factory=localnow)
+
+    #: the job will not be run before this date
+    run_after = DateTimeCol(default_factory=localnow)
+
+    #: when the job was done or marked as failed
+    finished_date = DateTimeCol(default=None)
+
+    #: the error of the last failed attempt
+    error = UnicodeCol(default=None)
+
+    #
+    #  Classmethods
+    #
+
+    @classmethod
+    def enqueue(cls, store, job_type, **data):
+        """Queue a new job
+
+        The job will only be seen by the workers after *store* is committed.
+
+        :param job_type: the type of the job. A handler must be registered
+            for it with :func:`register_job_handler`
+        :param data: the arguments for the handler. They must be
+            serializable as json
+        """
+        assert job_type in _handlers, job_type
+        return cls(store=store, job_type=job_type, data=data)
+
+    @classmethod
+    def fetch_next(cls, store):
+        """Lock and return the next job that should be run
+
+        Jobs already locked by other workers are skipped.
+
+        :returns: a :class:`BackgroundJob` or ``None`` if there's no
+            job to run
+        """
+        query = ForUpdate(
+            Select(cls.id,
+                   where=And(cls.status == cls.STATUS_PENDING,
+                             cls.run_after <= localnow()),
+                   order_by=cls.run_after,
+                   limit=1),
+            skip_locked=True)
+        row = store.execute(query).get_one()
+        if row is None:
+            return None
+        return store.get(cls, row[0])
+
+    @classmethod
+    def lock(cls, store, job_id):
+        """Lock the job with *job_id*
+
+        :returns: the :class:`BackgroundJob` or ``None`` if it is locked
+            by another worker
+        """
+        query = ForUpdate(Select(cls.id, where=cls.id == job_id),
+                          skip_locked=True)
+        if store.execute(query).get_one() is None:
+            return None
+        return store.get(cls, job_id)
+
+    #
+    #  Public API
+    #
+
+    def run(self):
+        """Run the handler of this job and mark it as done"""
+        assert self.status == self.STATUS_PENDING
+        handler = get_job_handler(self.job_type)
+        if handler is None:
+            raise ValueError("There's no handler for job type %r" % (
+                self.job_type, ))
+
+        handler(self.store, **(self.data or {}))
+        self.status = self.STATUS_DONE
+        self.finished_date = localnow()
+
+    def fail(self, error):
+        """Register that running this job failed
+
+        The job is scheduled to run again later, unless it already failed
+        :obj:`.max_attempts` times, in which case it is marked as failed.
+
+        :param error: the exception raised by the handler
+        """
+        self.attempts += 1
+        self.error = str(error)
+        if self.attempts >= self.max_attempts:
+            self.status = self.STATUS_FAILED
+            self.finished_date = localnow()
+        else:
+            delay = self.RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.run_after = localnow() + delay
+
+
+def _fail_job(store, job_id, error):
+    job = BackgroundJob.lock(store, job_id)
+    if job is not None:
+        job.fail(error)
+
+
+def run_next_job():
+    """Run the next job, in a transaction of its own
+
+    :returns: the id of the job that was run (even if it failed) or
+        ``None`` if there was no job to run
+    """
+    job_ids = []
+
+    def run(store):
+        job = BackgroundJob.fetch_next(store)
+        if job is None:
+            return None
+        job_ids.append(job.id)
+        job.run()
+        return job.id
+
+    try:
+        return run_in_transaction(run)
+    except Exception as e:
+        if not job_ids:
+            raise
+        log.exception('Background job %s failed', job_ids[-1])
+        # The transaction that ran the job was rolled back, so this needs a
+        # new one. The job was unlocked meanwhile, so it is locked again
+        run_in_transaction(_fail_job, job_ids[-1], e)
+        return job_ids[-1]
+
+
+def run_pending_jobs(limit=None):
+    """Run the jobs that are waiting to be run
+
+    :param limit: the maximum number of jobs to run or ``None`` to run
+        until there are no more jobs waiting
+    :returns: how many jobs were run
+    """
+    count = 0
+    while limit is None or count < limit:
+        if run_next_job() is None:
+            break
+        count += 1
+    return count
+
+
+class BackgroundJobWorker(threading.Thread):
+    """A thread that runs the jobs as they are queued
+
+    :param interval: how many seconds to wait before looking for new
+        jobs when the queue is empty
+    """
+
+    def __init__(self, interval=5):
+        super(BackgroundJobWorker, self).__init__(name='BackgroundJobWorker')
+        self.daemon = True
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        # The handlers are registered when the domain modules are imported
+        from stoqlib.database.tables import get_table_types
+        get_table_types()
+
+        while not self._stop_event.is_set():
+            try:
+                run_pending_jobs()
+            except Exception:
+                log.exception('Could not run the background jobs')
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """Stop the worker after the job being run, if any, is done"""
+        self._stop_event.set()
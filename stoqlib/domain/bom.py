@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+The bill of materials of the composed |products|.
+
+A composed product is made of |components|, which can be composed
+products themselves. Walking that structure through
+:meth:`Product.get_components() <stoqlib.domain.product.Product.get_components>`
+takes a query for each product of each level, and the stock and the
+lead time of each component take a few more.
+
+:class:`BillOfMaterials` loads all the levels of the components of some
+products with a single recursive query and keeps them in memory. Given
+the quantities of some products to be manufactured, it explodes them
+into the quantities needed of each component, the shortages of a
+|branch| and the time to manufacture them, reading the stock and the
+lead times of all the components involved at once.
+
+The components of a product are forgotten when one of its |components|
+is created, removed or changed, either by this process (through the
+domain hooks) or by another one (through the ``new_te``, ``update_te``
+and ``delete_row`` notifications the database sends when a row is
+inserted, updated or deleted).
+"""
+
+import collections
+import logging
+from decimal import Decimal
+
+from storm.expr import Column, LeftJoin, Max, Select, Sum, Table
+
+from stoqlib.database.expr import WithRecursive
+from stoqlib.database.notifications import NotifiedCache
+from stoqlib.domain.product import (Product, ProductComponent,
+                                    ProductStockSummary, ProductSupplierInfo)
+from stoqlib.domain.production import ProductionItem
+
+log = logging.getLogger(__name__)
+
+#: A |component| of a product: the quantity of the component product
+#: needed to manufacture one unit of it
+BOMLine = collections.namedtuple('BOMLine', ['component_id', 'quantity'])
+
+#: The information about a product needed to plan its manufacture
+BOMProductInfo = collections.namedtuple(
+    'BOMProductInfo', ['product_id', 'is_composed', 'manage_stock',
+                       'production_time', 'lead_time', 'stock'])
+
+#: The shortage of a product: the quantity needed, the quantity in stock
+#: and the quantity that is missing, which should be manufactured if the
+#: product has components or purchased otherwise
+BOMShortage = collections.namedtuple(
+    'BOMShortage', ['product_id', 'needed', 'stock', 'missing',
+                    'has_components'])
+
+
+class BillOfMaterials(NotifiedCache):
+    """A cache of the |components| of the composed |products|
+
+    The components are read from the store passed to the methods, with
+    its uncommitted changes. The cache is cleared when a component is
+    changed and again if the change is rolled back, so they are not kept
+    after that.
+
+    The methods that take ``requirements`` accept either a dict or a
+    sequence of ``(product_id, quantity)`` pairs, with the quantities of
+    the products to be manufactured. A product appearing more than once
+    has its quantities summed.
+
+    :param listen: if the cache should listen to the database
+        notifications to know when another process changes a component
+    """
+
+    tables = (ProductComponent.__storm_table__, )
+
+    def __init__(self, listen=True):
+        super(BillOfMaterials, self).__init__(listen=listen)
+        self._clear()
+
+    #
+    #  Public API
+    #
+
+    def get_components(self, store, product_id):
+        """Get the |components| of a product
+
+        :param store: a store
+        :param product_id: the id of the |product|
+        :returns: a tuple of :class:`BOMLine`
+        """
+        return self._get_lines(store, [product_id])[product_id]
+
+    def get_component_ids(self, store, product_id):
+        """Get the ids of all the components of a product
+
+        :param store: a store
+        :param product_id: the id of the |product|
+        :returns: a frozenset with the ids of the components of the
+            product, their components and so on
+        """
+        lines = self._get_lines(store, [product_id])
+        component_ids = set()
+        pending = [product_id]
+        while pending:
+            for line in lines.get(pending.pop(), ()):
+                if line.component_id not in component_ids:
+                    component_ids.add(line.component_id)
+                    pending.append(line.component_id)
+        return frozenset(component_ids)
+
+    def explode(self, store, requirements):
+        """Get the gross quantities of the components needed
+
+        No stock is considered: all the components of the products and of
+        their components are needed in full.
+
+        :param store: a store
+        :param requirements: the quantities of the products to manufacture
+        :returns: a dict mapping the id of each component to the quantity
+            needed of it
+        """
+        requirements = _sum_requirements(requirements)
+        lines = self._get_lines(store, requirements)
+        needed = collections.defaultdict(Decimal)
+        pending = collections.defaultdict(Decimal, requirements)
+        for product_id in _sort_by_level(lines, requirements):
+            quantity = pending.pop(product_id, 0)
+            for line in lines.get(product_id, ()):
+                needed[line.component_id] += quantity * line.quantity
+                pending[line.component_id] += quantity * line.quantity
+        return dict(needed)
+
+    def get_shortages(self, store, requirements, branch):
+        """Get the components that are missing in the stock of a branch
+
+        The products in the requirements are manufactured in full. The
+        quantity needed of each component is netted against its stock on
+        the |branch| and, when a component that has components of its own
+        is missing, only the missing quantity is manufactured, so only its
+        components are needed. Components that don't manage stock are
+        never missing.
+
+        :param store: a store
+        :param requirements: the quantities of the products to manufacture
+        :param branch: the |branch| whose stock is used
+        :returns: a dict mapping the id of each component to a
+            :class:`BOMShortage`
+        """
+        requirements = _sum_requirements(requirements)
+        lines = self._get_lines(store, requirements)
+        infos = self.get_product_infos(store, requirements, branch)
+        needed = collections.defaultdict(Decimal)
+        shortages = {}
+        for product_id in _sort_by_level(lines, requirements):
+            # A product is exploded only after all the products using it,
+            # so all that is needed of it is known here
+            quantity = requirements.get(product_id, 0)
+            if product_id in needed:
+                info = infos[product_id]
+                stock = info.stock if info.manage_stock else needed[product_id]
+                missing = max(needed[product_id] - stock, Decimal(0))
+                shortages[product_id] = BOMShortage(
+                    product_id, needed[product_id], info.stock, missing,
+                    bool(lines.get(product_id)))
+                quantity += missing
+
+            for line in lines.get(product_id, ()):
+                needed[line.component_id] += quantity * line.quantity
+        return shortages
+
+    def get_lead_times(self, store, requirements, branch):
+        """Get the time to obtain some products
+
+        For a composed product, that is its production time plus the
+        longest time to obtain one of its components whose stock on the
+        |branch| is not enough to manufacture it. For the other products,
+        that is the longest lead time of their |suppliers|.
+
+        :param store: a store
+        :param requirements: the quantities of the products to obtain
+        :param branch: the |branch| whose stock is used
+        :returns: a dict mapping the id of each product to the estimated
+            time in days to obtain it
+        """
+        requirements = _sum_requirements(requirements)
+        lines = self._get_lines(store, requirements)
+        infos = self.get_product_infos(store, requirements, branch)
+
+        def lead_time(product_id, quantity, visiting):
+            info = infos[product_id]
+            if not info.is_composed:
+                return info.lead_time
+            components_time = 0
+            visiting = visiting | set([product_id])
+            for line in lines[product_id]:
+                component = infos[line.component_id]
+                needed = quantity * line.quantity
+                # Products without stock control are always available,
+                # and we may have enough of the others to produce
+                if (not component.manage_stock or component.stock >= needed or
+                        line.component_id in visiting):
+                    continue
+                components_time = max(
+                    components_time,
+                    lead_time(line.component_id, needed, visiting))
+            return info.production_time + components_time
+
+        return dict((product_id, lead_time(product_id, quantity, set()))
+                    for product_id, quantity in requirements.items())
+
+    def sort_by_level(self, store, product_ids):
+        """Sort some products and all their components by their level
+
+        :param store: a store
+        :param product_ids: the ids of the |products|
+        :returns: a list with the ids of the products and of all their
+            components, each one after all the products using it (their
+            low-level code order, in MRP terms)
+        """
+        return _sort_by_level(self._get_lines(store, product_ids),
+                              product_ids)
+
+    def get_product_infos(self, store, product_ids, branch):
+        """Get the information about some products needed to plan
+
+        The stock is always read from the database, it is not cached.
+
+        :param store: a store
+        :param product_ids: the ids of the |products|
+        :param branch: the |branch| whose stock is used
+        :returns: a dict mapping the id of each product to a
+            :class:`BOMProductInfo`
+        """
+        product_ids = _get_reachable(self._get_lines(store, product_ids),
+                                     product_ids)
+        if not product_ids:
+            return {}
+
+        tables = [Product,
+                  LeftJoin(ProductSupplierInfo,
+                           ProductSupplierInfo.product_id == Product.id)]
+        query = Product.id.is_in(product_ids)
+        results = store.using(*tables).find(
+            (Product.id, Product.is_composed, Product.manage_stock,
+             Product.production_time, Max(ProductSupplierInfo.lead_time)),
+            query).group_by(Product.id)
+        stock = dict(store.find(
+            (ProductStockSummary.storable_id,
+             Sum(ProductStockSummary.quantity)),
+            ProductStockSummary.storable_id.is_in(product_ids),
+            ProductStockSummary.branch_id == branch.id).group_by(
+                ProductStockSummary.storable_id))
+
+        infos = {}
+        for (product_id, is_composed, manage_stock,
+             production_time, lead_time) in results:
+            infos[product_id] = BOMProductInfo(
+                product_id, is_composed, manage_stock, production_time or 0,
+                lead_time or 0, stock.get(product_id) or Decimal(0))
+        return infos
+
+    def get_order_requirements(self, store, orders):
+        """Get the quantities of the products still to be manufactured
+
+        :param store: a store
+        :param orders: the |productions| whose items are considered
+        :returns: a dict mapping the id of each |product| to the quantity
+            of it that was neither produced nor lost yet, which can be used
+            as the ``requirements`` of the other methods
+        """
+        order_ids = [order.id for order in orders]
+        if not order_ids:
+            return {}
+        remaining = ProductionItem.quantity - (ProductionItem.produced +
+                                               ProductionItem.lost)
+        results = store.find(
+            (ProductionItem.product_id, Sum(remaining)),
+            ProductionItem.order_id.is_in(order_ids),
+            remaining > 0).group_by(ProductionItem.product_id)
+        return dict(results)
+
+    def refresh(self, store):
+        """Forget the components that another process changed
+
+        This is cheap when nothing has changed, since reading the
+        notifications does not query the database. It is done by all the
+        other methods, so it doesn't usually need to be called.
+
+        :param store: a store
+        """
+        if self.poll().has_changes(ProductComponent.__storm_table__):
+            self.clear()
+
+    def clear(self):
+        """Forget all the components, they will be loaded again when needed
+        """
+        self._clear()
+
+    #
+    #  Private
+    #
+
+    def _clear(self):
+        # product id -> tuple of BOMLine
+        self._lines = {}
+
+    def _get_lines(self, store, product_ids):
+        self.refresh(store)
+        missing = set(product_ids) - set(self._lines)
+        if missing:
+            self._load(store, missing)
+        return self._lines
+
+    def _load(self, store, product_ids):
+        # The components of the products, of their components and so on
+        tree = Table('bom_line')
+        columns = ['product_id', 'component_id', 'quantity']
+        component_columns = [ProductComponent.product_id,
+                             ProductComponent.component_id,
+                             ProductComponent.quantity]
+        query = WithRecursive(
+            tree, columns,
+            Select(component_columns,
+                   where=ProductComponent.product_id.is_in(product_ids)),
+            Select(component_columns,
+                   where=ProductComponent.product_id == Column('component_id',
+                                                               tree)),
+            Select([Column(column, tree) for column in columns]))
+
+        lines = collections.defaultdict(list)
+        for product_id, component_id, quantity in store.execute(query):
+            lines[product_id].append(BOMLine(component_id, quantity))
+            # Products without components are not in the results
+            lines.setdefault(component_id, [])
+        for product_id in product_ids:
+            lines.setdefault(product_id, [])
+        for product_id, product_lines in lines.items():
+            self._lines[product_id] = tuple(product_lines)
+        log.debug('Bill of materials loaded: %d products', len(lines))
+
+
+def _sum_requirements(requirements):
+    if isinstance(requirements, dict):
+        requirements = requirements.items()
+    summed = collections.defaultdict(Decimal)
+    for product_id, quantity in requirements:
+        summed[product_id] += quantity
+    return dict(summed)
+
+
+def _get_reachable(lines, product_ids):
+    # The products and all their components
+    reachable = set()
+    pending = list(product_ids)
+    while pending:
+        product_id = pending.pop()
+        if product_id in reachable:
+            continue
+        reachable.add(product_id)
+        pending.extend(line.component_id for line in lines.get(product_id, ()))
+    return reachable
+
+
+def _sort_by_level(lines, product_ids):
+    # The products reachable from product_ids, each one after all the
+    # products using it (their low-level code order, in MRP terms)
+    reachable = _get_reachable(lines, product_ids)
+    parents = collections.Counter()
+    for product_id in reachable:
+        for line in lines.get(product_id, ()):
+            parents[line.component_id] += 1
+
+    ordered = []
+    pending = [product_id for product_id in reachable if not parents[product_id]]
+    while pending:
+        product_id = pending.pop()
+        ordered.append(product_id)
+        for line in lines.get(product_id, ()):
+            parents[line.component_id] -= 1
+            if not parents[line.component_id]:
+                pending.append(line.component_id)
+
+    if len(ordered) < len(reachable):
+        log.warning('The components of %d products are circular',
+                    len(reachable) - len(ordered))
+    return ordered
+
+
+_bom = None
+
+
+def get_bill_of_materials():
+    """Get the bill of materials of this process
+
+    :returns: a :class:`BillOfMaterials`
+    """
+    global _bom
+    if _bom is None:
+        _bom = BillOfMaterials()
+    return _bom
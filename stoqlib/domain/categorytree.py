@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+The hierarchy of the |sellablecategories|.
+
+A category inherits the markup, the commission and the tax constant of its
+parents, and a category filter should also match the |sellables| of the
+children of the category. Walking the hierarchy through the references
+takes a query for each level, and finding all the children of a category
+takes a query for each of them.
+
+:class:`CategoryTree` loads all the categories with a single query and
+keeps, for each of them, the list of its parents and the set of all its
+children, so both are found without querying the database.
+
+The tree is forgotten when a category is created, removed or has one of
+the cached attributes changed, either by this process (through the domain
+hooks) or by another one (through the ``new_te``, ``update_te`` and
+``delete_row`` notifications the database sends when a row is inserted,
+updated or deleted).
+"""
+
+import collections
+import logging
+
+from stoqlib.database.notifications import NotifiedCache
+from stoqlib.domain.sellable import SellableCategory
+
+log = logging.getLogger(__name__)
+
+#: A |sellablecategory| in the tree
+CategoryNode = collections.namedtuple(
+    'CategoryNode', ['id', 'category_id', 'description', 'suggested_markup',
+                     'salesperson_commission', 'tax_constant_id'])
+
+
+class CategoryTree(NotifiedCache):
+    """A cache of the hierarchy of the |sellablecategories|
+
+    The categories are read from the store passed to the methods, with
+    its uncommitted changes. The tree is cleared when a category is changed
+    and again if the change is rolled back, so they are not kept after that.
+
+    :param listen: if the tree should listen to the database
+        notifications to know when another process changes a category
+    """
+
+    tables = (SellableCategory.__storm_table__, )
+
+    #: the attributes of the categories that are kept in the tree
+    attributes = CategoryNode._fields[1:]
+
+    def __init__(self, listen=True):
+        super(CategoryTree, self).__init__(listen=listen)
+        self._clear()
+
+    #
+    #  Public API
+    #
+
+    def get_parents(self, store, category_id):
+        """Get the parents of a |sellablecategory|
+
+        :param store: a store
+        :param category_id: the id of the |sellablecategory|
+        :returns: a tuple of :class:`CategoryNode`, starting with the
+            direct parent of the category and ending with its base category
+        """
+        nodes = self._get_nodes(store, category_id)
+        parents = self._parents.get(category_id)
+        if parents is not None:
+            return parents
+
+        parents = []
+        node = nodes.get(category_id)
+        while node is not None and node.category_id is not None:
+            node = nodes.get(node.category_id)
+            # A circular hierarchy would never end otherwise
+            if node is None or node in parents:
+                break
+            parents.append(node)
+        parents = self._parents[category_id] = tuple(parents)
+        return parents
+
+    def get_children_ids(self, store, category_id):
+        """Get the ids of all the children of a |sellablecategory|
+
+        :param store: a store
+        :param category_id: the id of the |sellablecategory|
+        :returns: a frozenset with the ids of the children of the category,
+            their children and so on
+        """
+        self._get_nodes(store, category_id)
+        children_ids = self._children_ids.get(category_id)
+        if children_ids is not None:
+            return children_ids
+
+        children_ids = set()
+        pending = [category_id]
+        while pending:
+            for child_id in self._direct_children.get(pending.pop(), []):
+                if child_id not in children_ids and child_id != category_id:
+                    children_ids.add(child_id)
+                    pending.append(child_id)
+        children_ids = self._children_ids[category_id] = frozenset(children_ids)
+        return children_ids
+
+    def refresh(self, store):
+        """Forget the tree if another process changed a category
+
+        This is cheap when nothing has changed, since reading the
+        notifications does not query the database. It is done by
+        :meth:`.get_parents` and :meth:`.get_children_ids`, so it doesn't
+        usually need to be called.
+
+        :param store: a store
+        """
+        if self.poll().has_changes(SellableCategory.__storm_table__):
+            self.clear()
+
+    def clear(self):
+        """Forget the tree, it will be loaded again when needed"""
+        self._clear()
+
+    #
+    #  Private
+    #
+
+    def _clear(self):
+        # category id -> CategoryNode
+        self._nodes = None
+        # category id -> the ids of its direct children
+        self._direct_children = None
+        self._parents = {}
+        self._children_ids = {}
+
+    def _get_nodes(self, store, category_id):
+        self.refresh(store)
+        # A category that is not in the tree was created after it was
+        # loaded, by a process we are not listening to
+        if self._nodes is None or category_id not in self._nodes:
+            self._load(store)
+        return self._nodes
+
+    def _load(self, store):
+        self._clear()
+        columns = (SellableCategory.id, ) + tuple(
+            getattr(SellableCategory, attr) for attr in self.attributes)
+        self._nodes = {}
+        self._direct_children = collections.defaultdict(list)
+        for row in store.find(columns):
+            node = CategoryNode(*row)
+            self._nodes[node.id] = node
+            if node.category_id is not None:
+                self._direct_children[node.category_id].append(node.id)
+        log.debug('Category tree loaded: %d categories', len(self._nodes))
+
+
+_tree = None
+
+
+def get_category_tree():
+    """Get the category tree of this process
+
+    :returns: a :class:`CategoryTree`
+    """
+    global _tree
+    if _tree is None:
+        _tree = CategoryTree()
+    return _tree
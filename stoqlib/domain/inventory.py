@@ -28,13 +28,14 @@
 import collections
 from decimal import Decimal
 
-from storm.expr import And, Eq, Cast, Join, LeftJoin, Or, Coalesce
+from storm.expr import (And, Eq, Cast, Insert, Join, LeftJoin, Ne, Or,
+                        Coalesce, Select)
 from storm.references import Reference, ReferenceSet
 
 from stoqlib.database.properties import (QuantityCol, PriceCol, DateTimeCol,
                                          IntCol, UnicodeCol, IdentifierCol,
                                          IdCol, BoolCol, EnumCol)
-from stoqlib.database.expr import StatementTimestamp
+from stoqlib.database.expr import Case, StatementTimestamp
 from stoqlib.database.viewable import Viewable
 from stoqlib.domain.base import Domain, IdentifiableDomain
 from stoqlib.domain.fiscal import FiscalBookEntry
@@ -43,6 +44,7 @@ from stoqlib.domain.product import (StockTransactionHistory, StorableBatch, Prod
                                     Storable, ProductStockItem)
 from stoqlib.domain.sellable import Sellable
 from stoqlib.domain.station import BranchStation
+from stoqlib.exceptions import StockError
 from stoqlib.lib.dateutils import localnow
 from stoqlib.lib.translation import stoqlib_gettext
 
@@ -369,18 +371,16 @@ class Inventory(IdentifiableDomain):
             raise AssertionError("You can not close an inventory which is "
                                  "already closed!")
 
-        for item in self.inventory_items:
-            if (item.actual_quantity is None or
-                    item.recorded_quantity == item.actual_quantity):
-                continue
-
-            # FIXME: We are setting this here because, when generating a
-            # sintegra file, even if this item wasn't really adjusted (e.g.
-            # adjustment_qty bellow is 0) it needs to be specified and not
-            # setting this would result on self.get_cost returning 0.  Maybe
-            # we should resolve this in another way
-            # We don't call item.adjust since it needs an invoice number
-            item.is_adjusted = True
+        # FIXME: We are setting this here because, when generating a
+        # sintegra file, even if this item wasn't really adjusted (e.g.
+        # adjustment_qty bellow is 0) it needs to be specified and not
+        # setting this would result on self.get_cost returning 0.  Maybe
+        # we should resolve this in another way
+        # We don't call item.adjust since it needs an invoice number
+        self.inventory_items.find(
+            Ne(InventoryItem.actual_quantity, None),
+            InventoryItem.recorded_quantity != InventoryItem.actual_quantity).set(
+                is_adjusted=True)
 
         self.close_date = StatementTimestamp()
         self.status = Inventory.STATUS_CLOSED
@@ -430,6 +430,131 @@ class Inventory(IdentifiableDomain):
             And(InventoryItem.recorded_quantity != InventoryItem.counted_quantity,
                 Eq(InventoryItem.is_adjusted, False)))
 
+    def adjust_items(self, user: LoginUser, reason=u"", chunk_size=1000):
+        """Adjust all the counted items of this inventory
+
+        The :attr:`InventoryItem.actual_quantity` of every counted item that
+        was not adjusted yet is set to its
+        :attr:`InventoryItem.counted_quantity` and its stock is adjusted,
+        just like :meth:`InventoryItem.adjust` would do. The stock
+        transactions and the fiscal book entries are inserted by the
+        database, *chunk_size* items at a time, so this is a lot faster
+        than adjusting each item. Note that ``ProductStockUpdateEvent``
+        is not emitted for those items.
+
+        This is a generator, so the adjustment progress can be displayed:
+        a tuple (adjusted, total) is yielded after each chunk of items.
+
+        :param user: the |loginuser| responsible for the adjustment
+        :param reason: the reason of the adjustment of the items
+        :param chunk_size: how many items are adjusted at once
+        :raises: :exc:`stoqlib.exceptions.StockError` if there is not
+            enough stock to decrease for any of the items
+        """
+        assert self.is_open()
+        store = self.store
+        self.inventory_items.find(
+            Eq(InventoryItem.is_adjusted, False),
+            Ne(InventoryItem.counted_quantity, None)).set(
+                actual_quantity=InventoryItem.counted_quantity,
+                reason=reason)
+
+        query = And(InventoryItem.inventory_id == self.id,
+                    Eq(InventoryItem.is_adjusted, False),
+                    Ne(InventoryItem.actual_quantity, None))
+        # The products without stock control need to have their storables
+        # created, so there's no way around adjusting them one by one
+        no_storables = list(store.using(
+            InventoryItem,
+            LeftJoin(Storable, Storable.id == InventoryItem.product_id)).find(
+                InventoryItem, And(query, Eq(Storable.id, None))))
+
+        query = And(query,
+                    InventoryItem.actual_quantity != InventoryItem.recorded_quantity)
+        tables = [
+            InventoryItem,
+            Join(Storable, Storable.id == InventoryItem.product_id),
+            LeftJoin(ProductStockItem,
+                     And(ProductStockItem.storable_id == Storable.id,
+                         ProductStockItem.branch_id == self.branch_id,
+                         Or(ProductStockItem.batch_id == InventoryItem.batch_id,
+                            And(Eq(ProductStockItem.batch_id, None),
+                                Eq(InventoryItem.batch_id, None))))),
+        ]
+        missing_stock = store.using(*tables).find(
+            InventoryItem.id,
+            And(query,
+                InventoryItem.actual_quantity < InventoryItem.recorded_quantity,
+                Coalesce(ProductStockItem.quantity, 0) <
+                InventoryItem.recorded_quantity - InventoryItem.actual_quantity))
+        if not missing_stock.is_empty():
+            raise StockError(
+                _('Quantity to decrease is greater than the available stock.'))
+
+        item_ids = list(store.using(*tables).find(InventoryItem.id, query).order_by(
+            InventoryItem.id))
+        total = len(no_storables) + len(item_ids)
+        for item in no_storables:
+            item.adjust(user, self.invoice_number)
+        adjusted = len(no_storables)
+        if adjusted:
+            yield adjusted, total
+
+        for start in range(0, len(item_ids), chunk_size):
+            chunk = item_ids[start:start + chunk_size]
+            # The stock items are updated by the database when the stock
+            # transactions are inserted, like the ones created by
+            # Storable.increase_stock and Storable.decrease_stock
+            store.execute(Insert(
+                (StockTransactionHistory.date,
+                 StockTransactionHistory.quantity,
+                 StockTransactionHistory.unit_cost,
+                 StockTransactionHistory.type,
+                 StockTransactionHistory.object_id,
+                 StockTransactionHistory.responsible_id,
+                 StockTransactionHistory.storable_id,
+                 StockTransactionHistory.branch_id,
+                 StockTransactionHistory.batch_id),
+                table=StockTransactionHistory,
+                values=Select(
+                    (StatementTimestamp(),
+                     InventoryItem.actual_quantity - InventoryItem.recorded_quantity,
+                     Case(InventoryItem.actual_quantity < InventoryItem.recorded_quantity,
+                          ProductStockItem.stock_cost),
+                     Cast(StockTransactionHistory.TYPE_INVENTORY_ADJUST,
+                          'stock_transaction_history_type'),
+                     InventoryItem.id,
+                     Cast(str(user.id), 'uuid'),
+                     Storable.id,
+                     Cast(str(self.branch_id), 'uuid'),
+                     InventoryItem.batch_id),
+                    where=InventoryItem.id.is_in(chunk),
+                    tables=tables)))
+            store.execute(Insert(
+                (FiscalBookEntry.date,
+                 FiscalBookEntry.entry_type,
+                 FiscalBookEntry.is_reversal,
+                 FiscalBookEntry.invoice_number,
+                 FiscalBookEntry.branch_id,
+                 FiscalBookEntry.cfop_id),
+                table=FiscalBookEntry,
+                values=Select(
+                    (StatementTimestamp(),
+                     FiscalBookEntry.TYPE_INVENTORY,
+                     False,
+                     Cast(self.invoice_number, 'integer'),
+                     Cast(str(self.branch_id), 'uuid'),
+                     InventoryItem.cfop_data_id),
+                    where=InventoryItem.id.is_in(chunk),
+                    tables=[InventoryItem])))
+            store.find(InventoryItem, InventoryItem.id.is_in(chunk)).set(
+                is_adjusted=True)
+            # The stock items and storables in the cache are outdated now
+            store.autoreload()
+
+            adjusted += len(chunk)
+            yield adjusted, total
+
     def has_adjusted_items(self):
         """Returns if we already have an item adjusted or not.
 
@@ -479,18 +604,7 @@ class Inventory(IdentifiableDomain):
             InventoryItem.inventory_id == self.id)
 
     @classmethod
-    def get_sellables_for_inventory(cls, store, branch, extra_query=None):
-        """Returns a generator with the necessary data about the stock to open an Inventory
-
-        :param store: The store to fetch data from
-        :param branch: The branch that is being inventoried
-        :param query: A query that should be used to restrict the storables for
-            the inventory. This can filter based on categories or other aspects
-            of the product.
-
-        :returns: a generator of the following objects:
-            (Sellable, Product, Storable, StorableBatch, ProductStockItem)
-        """
+    def _get_stock_tables_and_query(cls, branch, extra_query=None):
         # XXX: If we should want all storables to be inclued in the inventory, even if if
         #      never had a ProductStockItem before, than we should inclue this query in the
         #      LeftJoin with ProductStockItem below
@@ -507,6 +621,22 @@ class Inventory(IdentifiableDomain):
                                Or(ProductStockItem.batch_id == StorableBatch.id,
                                   Eq(ProductStockItem.batch_id, None)))),
                   ]
+        return tables, query
+
+    @classmethod
+    def get_sellables_for_inventory(cls, store, branch, extra_query=None):
+        """Returns a generator with the necessary data about the stock to open an Inventory
+
+        :param store: The store to fetch data from
+        :param branch: The branch that is being inventoried
+        :param query: A query that should be used to restrict the storables for
+            the inventory. This can filter based on categories or other aspects
+            of the product.
+
+        :returns: a generator of the following objects:
+            (Sellable, Product, Storable, StorableBatch, ProductStockItem)
+        """
+        tables, query = cls._get_stock_tables_and_query(branch, extra_query)
         return store.using(*tables).find(
             (Sellable, Product, Storable, StorableBatch, ProductStockItem),
             query)
@@ -525,21 +655,35 @@ class Inventory(IdentifiableDomain):
                         open_date=localnow(),
                         responsible_id=responsible.id)
 
-        for data in cls.get_sellables_for_inventory(store, branch, query):
-            sellable, product, storable, batch, stock_item = data
-            quantity = stock_item and stock_item.quantity or 0
-            if storable.is_batch:
-                # This used to test 'stock_item.quantity > 0' too to avoid
-                # creating inventory items for old batches not used anymore.
-                # We can't do that since that would make it impossible to
-                # adjust a batch that was wrongly set to 0. We need to find a
-                # way to mark the batches as "not used anymore" because they
-                # tend to grow to very large proportions and we are duplicating
-                # everyone here
-                if batch and stock_item:
-                    inventory.add_product(product, quantity, batch=batch)
-            else:
-                inventory.add_product(product, quantity)
+        tables, query = cls._get_stock_tables_and_query(branch, query)
+        # This used to test 'stock_item.quantity > 0' for batches too to
+        # avoid creating inventory items for old batches not used anymore.
+        # We can't do that since that would make it impossible to adjust a
+        # batch that was wrongly set to 0. We need to find a way to mark the
+        # batches as "not used anymore" because they tend to grow to very
+        # large proportions and we are duplicating everyone here
+        query = And(query, Or(Eq(Storable.is_batch, False),
+                              And(Ne(StorableBatch.id, None),
+                                  Ne(ProductStockItem.id, None))))
+        # The items are created by the database, all at once, instead of
+        # creating an InventoryItem object for each product
+        store.execute(Insert(
+            (InventoryItem.product_id,
+             InventoryItem.batch_id,
+             InventoryItem.product_cost,
+             InventoryItem.recorded_quantity,
+             InventoryItem.reason,
+             InventoryItem.inventory_id),
+            table=InventoryItem,
+            values=Select(
+                (Product.id,
+                 Case(Eq(Storable.is_batch, True), StorableBatch.id),
+                 Sellable.cost,
+                 Coalesce(ProductStockItem.quantity, 0),
+                 u"",
+                 Cast(str(inventory.id), 'uuid')),
+                where=query,
+                tables=tables)))
         return inventory
 
 
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+Material requirements planning of the open |productions|.
+
+Each |productionmaterial| knows how much of its |product| is needed by
+its |production|, but deciding what to do about the materials that are
+missing used to be done order by order, reading the stock of each
+material with its own queries.
+
+:class:`MaterialRequirementsPlan` does that for all the open productions
+at once. The materials still needed by them are summed by |branch|, and
+each product is netted, on each branch, against its stock and the
+quantities that are on their way to it: the pending quantities of the
+confirmed |purchases| and of the sent |transfers|. What is missing is
+transferred from the branches that have stock to spare and, if that is
+not enough, either manufactured, when the product has |components|
+(which are then planned the same way), or purchased.
+
+All the data is read with a few queries, regardless of the number of
+productions, materials and branches.
+"""
+
+import collections
+from decimal import Decimal
+
+from storm.expr import And, Eq, Join, Sum
+
+from stoqlib.domain.bom import get_bill_of_materials
+from stoqlib.domain.product import (Product, ProductStockSummary,
+                                    ProductSupplierInfo)
+from stoqlib.domain.production import ProductionMaterial, ProductionOrder
+from stoqlib.domain.purchase import PurchaseItem, PurchaseOrder
+from stoqlib.domain.transfer import TransferOrder, TransferOrderItem
+
+#: The requirement of a product on a |branch|: the gross quantity needed,
+#: the quantity in stock, the quantity on its way to the branch and the net
+#: quantity that is missing
+MRPRequirement = collections.namedtuple(
+    'MRPRequirement', ['branch_id', 'product_id', 'gross', 'stock',
+                       'scheduled', 'net'])
+
+#: A quantity of a product with |components| to manufacture on a |branch|
+PlannedProduction = collections.namedtuple(
+    'PlannedProduction', ['branch_id', 'product_id', 'quantity'])
+
+#: A quantity of a product to transfer from a |branch| to another
+PlannedTransfer = collections.namedtuple(
+    'PlannedTransfer', ['source_branch_id', 'destination_branch_id',
+                        'product_id', 'quantity'])
+
+#: A quantity of a product to purchase for a |branch|, from its main
+#: |supplier| (if it has one) and the days it takes to deliver it
+PlannedPurchase = collections.namedtuple(
+    'PlannedPurchase', ['branch_id', 'product_id', 'quantity', 'supplier_id',
+                        'lead_time'])
+
+
+class MaterialRequirementsPlan(object):
+    """The plan to obtain the materials needed by the open |productions|
+
+    Create it and call :meth:`.run` to fill the lists of
+    :attr:`.requirements`, :attr:`.productions`, :attr:`.transfers` and
+    :attr:`.purchases`. Nothing is changed in the database.
+
+    :param store: a store
+    :param branches: the |branches| to plan for. Only their productions,
+        stock and incoming quantities are considered. Defaults to all the
+        branches
+    :param bom: the :class:`stoqlib.domain.bom.BillOfMaterials` used to
+        explode the products. Defaults to the one of this process
+    """
+
+    #: the statuses of the |productions| whose materials are planned
+    statuses = [ProductionOrder.ORDER_OPENED,
+                ProductionOrder.ORDER_WAITING,
+                ProductionOrder.ORDER_PRODUCING]
+
+    def __init__(self, store, branches=None, bom=None):
+        self.store = store
+        self.branch_ids = (None if branches is None else
+                           set(branch.id for branch in branches))
+        self.bom = bom or get_bill_of_materials()
+        #: a list of :class:`MRPRequirement`
+        self.requirements = []
+        #: a list of :class:`PlannedProduction`
+        self.productions = []
+        #: a list of :class:`PlannedTransfer`
+        self.transfers = []
+        #: a list of :class:`PlannedPurchase`
+        self.purchases = []
+
+    #
+    #  Public API
+    #
+
+    def run(self):
+        """Plan the materials of the open |productions|
+
+        The materials already allocated to a production were removed from
+        the stock, so only the quantities still to be allocated are
+        needed.
+
+        :returns: self
+        """
+        store = self.store
+        gross = self._get_demand()
+        if not gross:
+            return self
+
+        product_ids = self.bom.sort_by_level(store, gross)
+        manage_stock = dict(store.find((Product.id, Product.manage_stock),
+                                       Product.id.is_in(product_ids)))
+        stock = self._get_stock(product_ids)
+        scheduled = self._get_scheduled(product_ids)
+
+        to_purchase = []
+        # Each product is planned only after all the products using it,
+        # so all that is needed of it is known here
+        for product_id in product_ids:
+            needed = gross.get(product_id)
+            # Products without stock control are always available
+            if not needed or not manage_stock.get(product_id):
+                continue
+
+            missing, surplus = self._net(product_id, needed,
+                                         stock.get(product_id, {}),
+                                         scheduled.get(product_id, {}))
+            lines = self.bom.get_components(store, product_id)
+            for branch_id in sorted(missing):
+                quantity = self._transfer(product_id, branch_id,
+                                          missing[branch_id], surplus)
+                if not quantity:
+                    continue
+                if lines:
+                    self.productions.append(
+                        PlannedProduction(branch_id, product_id, quantity))
+                    for line in lines:
+                        component = gross.setdefault(line.component_id, {})
+                        component[branch_id] = (
+                            component.get(branch_id, 0) +
+                            quantity * line.quantity)
+                else:
+                    to_purchase.append((branch_id, product_id, quantity))
+
+        self._purchase(to_purchase)
+        return self
+
+    #
+    #  Private
+    #
+
+    def _get_query(self, branch_column, *queries):
+        queries = list(queries)
+        if self.branch_ids is not None:
+            queries.append(branch_column.is_in(self.branch_ids))
+        return And(*queries)
+
+    def _group(self, results):
+        # product id -> branch id -> quantity
+        grouped = collections.defaultdict(dict)
+        for branch_id, product_id, quantity in results:
+            grouped[product_id][branch_id] = quantity
+        return grouped
+
+    def _get_demand(self):
+        remaining = ProductionMaterial.needed - ProductionMaterial.allocated
+        tables = [ProductionMaterial,
+                  Join(ProductionOrder,
+                       ProductionOrder.id == ProductionMaterial.order_id)]
+        query = self._get_query(ProductionOrder.branch_id,
+                                ProductionOrder.status.is_in(self.statuses),
+                                remaining > 0)
+        results = self.store.using(*tables).find(
+            (ProductionOrder.branch_id, ProductionMaterial.product_id,
+             Sum(remaining)),
+            query).group_by(ProductionOrder.branch_id,
+                            ProductionMaterial.product_id)
+        return self._group(results)
+
+    def _get_stock(self, product_ids):
+        query = self._get_query(
+            ProductStockSummary.branch_id,
+            ProductStockSummary.storable_id.is_in(product_ids))
+        results = self.store.find(
+            (ProductStockSummary.branch_id, ProductStockSummary.storable_id,
+             Sum(ProductStockSummary.quantity)),
+            query).group_by(
+                ProductStockSummary.branch_id, ProductStockSummary.storable_id)
+        return self._group(results)
+
+    def _get_scheduled(self, product_ids):
+        store = self.store
+        pending = PurchaseItem.quantity - PurchaseItem.quantity_received
+        tables = [PurchaseItem,
+                  Join(PurchaseOrder, PurchaseOrder.id == PurchaseItem.order_id)]
+        query = self._get_query(
+            PurchaseOrder.branch_id,
+            PurchaseOrder.status == PurchaseOrder.ORDER_CONFIRMED,
+            PurchaseItem.sellable_id.is_in(product_ids),
+            pending > 0)
+        purchased = store.using(*tables).find(
+            (PurchaseOrder.branch_id, PurchaseItem.sellable_id, Sum(pending)),
+            query).group_by(PurchaseOrder.branch_id, PurchaseItem.sellable_id)
+
+        tables = [TransferOrderItem,
+                  Join(TransferOrder,
+                       TransferOrder.id == TransferOrderItem.transfer_order_id)]
+        query = self._get_query(
+            TransferOrder.destination_branch_id,
+            TransferOrder.status == TransferOrder.STATUS_SENT,
+            TransferOrderItem.sellable_id.is_in(product_ids))
+        transferred = store.using(*tables).find(
+            (TransferOrder.destination_branch_id, TransferOrderItem.sellable_id,
+             Sum(TransferOrderItem.quantity)),
+            query).group_by(TransferOrder.destination_branch_id,
+                            TransferOrderItem.sellable_id)
+
+        scheduled = collections.defaultdict(
+            lambda: collections.defaultdict(Decimal))
+        for branch_id, product_id, quantity in list(purchased) + list(transferred):
+            scheduled[product_id][branch_id] += quantity
+        return scheduled
+
+    def _net(self, product_id, needed, stock, scheduled):
+        missing = {}
+        # The stock a branch has beyond what it needs, which can be
+        # transferred to the others
+        surplus = {}
+        for branch_id in set(needed) | set(stock):
+            gross = needed.get(branch_id, Decimal(0))
+            in_stock = stock.get(branch_id, Decimal(0))
+            incoming = scheduled.get(branch_id, Decimal(0))
+            net = max(gross - in_stock - incoming, Decimal(0))
+            if gross:
+                self.requirements.append(MRPRequirement(
+                    branch_id, product_id, gross, in_stock, incoming, net))
+            if net:
+                missing[branch_id] = net
+            elif in_stock > gross:
+                surplus[branch_id] = in_stock - gross
+        return missing, surplus
+
+    def _transfer(self, product_id, branch_id, quantity, surplus):
+        # The branches with more to spare first, so the transfers are as
+        # few as possible
+        for source_id in sorted(surplus, key=lambda b: (-surplus[b], b)):
+            transferred = min(quantity, surplus[source_id])
+            if not transferred:
+                continue
+            self.transfers.append(PlannedTransfer(
+                source_id, branch_id, product_id, transferred))
+            surplus[source_id] -= transferred
+            quantity -= transferred
+            if not quantity:
+                break
+        return quantity
+
+    def _purchase(self, to_purchase):
+        if not to_purchase:
+            return
+        product_ids = set(product_id for _, product_id, _ in to_purchase)
+        suppliers = dict(
+            (product_id, (supplier_id, lead_time, minimum_purchase))
+            for product_id, supplier_id, lead_time, minimum_purchase in
+            self.store.find((ProductSupplierInfo.product_id,
+                             ProductSupplierInfo.supplier_id,
+                             ProductSupplierInfo.lead_time,
+                             ProductSupplierInfo.minimum_purchase),
+                            ProductSupplierInfo.product_id.is_in(product_ids),
+                            Eq(ProductSupplierInfo.is_main_supplier, True)))
+
+        for branch_id, product_id, quantity in to_purchase:
+            supplier_id, lead_time, minimum_purchase = suppliers.get(
+                product_id, (None, 0, 0))
+            self.purchases.append(PlannedPurchase(
+                branch_id, product_id, max(quantity, minimum_purchase or 0),
+                supplier_id, lead_time))
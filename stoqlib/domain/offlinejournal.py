@@ -0,0 +1,670 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+Selling while the database is not reachable.
+
+:class:`OfflineJournal` is a local SQLite file that holds a snapshot of
+the catalog, so |sellables| can still be found, and queues what was done
+while offline: :class:`OfflineSale` (with its payments) and |till| entries.
+
+When the database is reachable again, :class:`OfflineReplayer` replays
+the queued operations in the order they were done, through the same
+domain path used when online (:meth:`Sale.order <stoqlib.domain.sale.Sale.order>`
+and :meth:`Sale.confirm <stoqlib.domain.sale.Sale.confirm>`).
+
+Replaying is idempotent: the objects are created with the id they were
+given offline, so an operation that was committed but not marked as
+replayed in the journal (e.g. because the station crashed) is noticed
+and not replayed again. Operations that can't be replayed (e.g. there is
+not enough stock anymore) are marked as conflicts, with the reason, and
+need to be resolved by hand.
+"""
+
+import collections
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from decimal import Decimal
+
+from stoqlib.database.bulk import find_in_chunks
+from stoqlib.database.exceptions import (CONNECTION_ERRORS,
+                                         is_connection_error)
+from stoqlib.database.runtime import run_in_transaction
+from stoqlib.lib.dateutils import localnow
+from stoqlib.lib.osutils import get_application_dir
+from stoqlib.lib.translation import stoqlib_gettext
+
+_ = stoqlib_gettext
+log = logging.getLogger(__name__)
+
+_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS catalog (
+    sellable_id TEXT PRIMARY KEY,
+    barcode TEXT,
+    code TEXT,
+    description TEXT,
+    price TEXT,
+    price_end TEXT,
+    next_price TEXT
+);
+CREATE INDEX IF NOT EXISTS catalog_barcode_idx ON catalog (lower(barcode));
+CREATE INDEX IF NOT EXISTS catalog_code_idx ON catalog (lower(code));
+CREATE TABLE IF NOT EXISTS batch (
+    batch_id TEXT PRIMARY KEY,
+    batch_number TEXT,
+    sellable_id TEXT
+);
+CREATE INDEX IF NOT EXISTS batch_number_idx ON batch (lower(batch_number));
+CREATE TABLE IF NOT EXISTS operation (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    date TEXT NOT NULL,
+    data TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT
+);
+"""
+
+# Where a new catalog snapshot is saved before replacing the current one
+_STAGING_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS catalog_staging AS
+    SELECT * FROM catalog WHERE 0;
+CREATE TEMP TABLE IF NOT EXISTS batch_staging AS
+    SELECT * FROM batch WHERE 0;
+DELETE FROM catalog_staging;
+DELETE FROM batch_staging;
+"""
+
+#: A |sellable| in the catalog snapshot
+CatalogItem = collections.namedtuple(
+    'CatalogItem', ['sellable_id', 'barcode', 'code', 'description', 'price',
+                    'batch_id'])
+
+#: An operation queued in the journal
+JournalOperation = collections.namedtuple(
+    'JournalOperation', ['id', 'kind', 'date', 'data', 'status', 'error'])
+
+
+def _format_date(date):
+    return date.strftime(_DATE_FORMAT)
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, _DATE_FORMAT)
+
+
+def _get_next_prices(resolver, sellables, prices):
+    # The prices of the sellables after the day their current prices
+    # stop being valid, like when a promotion starts or ends
+    by_end = collections.defaultdict(list)
+    for sellable in sellables:
+        end = prices[sellable.id].end
+        if end is not None:
+            by_end[end].append(sellable)
+
+    next_prices = {}
+    for end, end_sellables in by_end.items():
+        next_prices.update(resolver.get_prices(
+            end_sellables, date=end + datetime.timedelta(days=1)))
+    return next_prices
+
+
+class OfflineSale(object):
+    """A sale done while offline
+
+    :param branch_id: the id of the |branch| where the sale was done
+    :param station_id: the id of the |branchstation|
+    :param salesperson_id: the id of the |salesperson|
+    :param client_id: the id of the |client|, if any
+    :param id: the id the |sale| will have. A new one is generated if
+        not given
+    :param date: when the sale was done. Defaults to now
+    """
+
+    def __init__(self, branch_id, station_id, salesperson_id, client_id=None,
+                 id=None, date=None):
+        self.id = id or str(uuid.uuid1())
+        self.date = date or localnow()
+        self.branch_id = branch_id
+        self.station_id = station_id
+        self.salesperson_id = salesperson_id
+        self.client_id = client_id
+        self.items = []
+        self.payments = []
+
+    #
+    #  Public API
+    #
+
+    def add_item(self, sellable_id, quantity, price, batch_id=None):
+        """Add an item to the sale
+
+        :param sellable_id: the id of the |sellable|
+        :param quantity: the quantity sold
+        :param price: the price the item was sold for
+        :param batch_id: the id of the |batch|, if any
+        """
+        self.items.append(dict(sellable_id=str(sellable_id),
+                               quantity=Decimal(quantity),
+                               price=Decimal(price),
+                               batch_id=batch_id and str(batch_id)))
+
+    def add_payment(self, method_name, value):
+        """Add a payment to the sale
+
+        :param method_name: the name of the |paymentmethod|
+        :param value: the value paid
+        """
+        self.payments.append(dict(method_name=method_name,
+                                  value=Decimal(value)))
+
+    def get_total(self):
+        return sum((item['quantity'] * item['price'] for item in self.items),
+                   Decimal(0))
+
+    def to_dict(self):
+        return dict(
+            branch_id=str(self.branch_id),
+            station_id=str(self.station_id),
+            salesperson_id=str(self.salesperson_id),
+            client_id=self.client_id and str(self.client_id),
+            items=[dict(item, quantity=str(item['quantity']),
+                        price=str(item['price']))
+                   for item in self.items],
+            payments=[dict(payment, value=str(payment['value']))
+                      for payment in self.payments])
+
+    @classmethod
+    def from_dict(cls, id, date, data):
+        sale = cls(data['branch_id'], data['station_id'],
+                   data['salesperson_id'], client_id=data['client_id'],
+                   id=id, date=date)
+        for item in data['items']:
+            sale.add_item(**item)
+        for payment in data['payments']:
+            sale.add_payment(**payment)
+        return sale
+
+
+class OfflineJournal(object):
+    """The local journal of a station
+
+    :param filename: the SQLite file. Defaults to ``offline.db`` in the
+        application directory
+    """
+
+    KIND_SALE = u'sale'
+    KIND_TILL_ENTRY = u'till-entry'
+
+    STATUS_PENDING = u'pending'
+    STATUS_REPLAYED = u'replayed'
+    STATUS_CONFLICT = u'conflict'
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = os.path.join(get_application_dir(), 'offline.db')
+        self.filename = filename
+        self._conn = sqlite3.connect(filename)
+        self._conn.executescript(_SCHEMA)
+        columns = [row[1] for row in
+                   self._conn.execute("PRAGMA table_info(catalog)")]
+        if 'next_price' not in columns:
+            # A snapshot saved without the price windows. It is replaced
+            # by the next one anyway
+            with self._conn:
+                self._conn.execute("DROP TABLE catalog")
+                self._conn.execute("DELETE FROM meta WHERE key = ?",
+                                   (u'catalog_date', ))
+            self._conn.executescript(_SCHEMA)
+
+    #
+    #  Catalog
+    #
+
+    def save_catalog(self, store, branch):
+        """Save a snapshot of the available |sellables| and their |batches|
+
+        The prices are the ones the POS would charge without a |client|,
+        from the :class:`price resolver
+        <stoqlib.domain.priceresolver.PriceResolver>`. Since the snapshot is
+        saved again when the |till| is opened, only the current price and
+        the one after it, for when a promotion starts or ends, are kept.
+
+        :param store: a store
+        :param branch: the |branch| of the station
+        """
+        for count in self.iter_save_catalog(store, branch):
+            pass
+
+    def iter_save_catalog(self, store, branch, chunk_size=5000):
+        """Save the catalog snapshot a chunk of rows at a time
+
+        Like :meth:`.save_catalog`, but lets the caller do something else
+        between the chunks. The current snapshot is only replaced after
+        all the chunks are saved.
+
+        :param store: a store
+        :param branch: the |branch| of the station
+        :param chunk_size: how many rows to save at a time
+        :returns: an iterator of how many rows each chunk saved
+        """
+        from stoqlib.domain.priceresolver import get_price_resolver
+        from stoqlib.domain.product import StorableBatch
+        from stoqlib.domain.sellable import Sellable
+
+        resolver = get_price_resolver()
+        self._conn.executescript(_STAGING_SCHEMA)
+        for rows in find_in_chunks(
+                store, (Sellable.id, Sellable),
+                Sellable.status == Sellable.STATUS_AVAILABLE,
+                chunk_size=chunk_size):
+            sellables = [sellable for id_, sellable in rows]
+            prices = resolver.get_resolved_prices(sellables)
+            next_prices = _get_next_prices(resolver, sellables, prices)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO catalog_staging VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((str(s.id), s.barcode, s.code, s.description,
+                      str(prices[s.id].price),
+                      prices[s.id].end and prices[s.id].end.isoformat(),
+                      s.id in next_prices and str(next_prices[s.id]) or None)
+                     for s in sellables))
+            yield len(rows)
+
+        for rows in find_in_chunks(
+                store, (StorableBatch.id, StorableBatch.batch_number,
+                        StorableBatch.storable_id),
+                chunk_size=chunk_size):
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO batch_staging VALUES (?, ?, ?)",
+                    ((str(id_), batch_number, str(storable_id))
+                     for id_, batch_number, storable_id in rows))
+            yield len(rows)
+
+        with self._conn:
+            self._conn.execute("DELETE FROM catalog")
+            self._conn.execute("DELETE FROM batch")
+            self._conn.execute(
+                "INSERT INTO catalog SELECT * FROM catalog_staging")
+            self._conn.execute("INSERT INTO batch SELECT * FROM batch_staging")
+            self._conn.execute("DELETE FROM catalog_staging")
+            self._conn.execute("DELETE FROM batch_staging")
+            self._set_meta(u'branch_id', str(branch.id))
+            self._set_meta(u'catalog_date', _format_date(localnow()))
+
+    def get_catalog_date(self):
+        """Get when the catalog snapshot was saved
+
+        :returns: a datetime or ``None`` if there is no snapshot
+        """
+        value = self._get_meta(u'catalog_date')
+        return value and _parse_date(value)
+
+    def find_sellable(self, text, date=None):
+        """Find a |sellable| in the catalog snapshot
+
+        Like :meth:`SellableLookupIndex.find
+        <stoqlib.domain.sellablelookup.SellableLookupIndex.find>`, the
+        barcode is tried first, then the code and the batch number.
+
+        :param text: the barcode, code or batch number
+        :param date: the day of the sale, to get the price. Defaults
+            to today
+        :returns: a :class:`CatalogItem` or ``None`` if nothing was found
+        """
+        if date is None:
+            date = localnow().date()
+        text = text.lower()
+        columns = ("catalog.sellable_id, catalog.barcode, catalog.code, "
+                   "catalog.description, catalog.price, catalog.price_end, "
+                   "catalog.next_price")
+        for column in ['barcode', 'code']:
+            rows = self._conn.execute(
+                "SELECT %s FROM catalog WHERE lower(%s) = ?" % (
+                    columns, column), (text, )).fetchall()
+            if len(rows) == 1:
+                return self._build_catalog_item(rows[0], date)
+
+        row = self._conn.execute(
+            "SELECT %s, batch.batch_id FROM batch "
+            "JOIN catalog ON catalog.sellable_id = batch.sellable_id "
+            "WHERE lower(batch.batch_number) = ?" % (columns, ),
+            (text, )).fetchone()
+        if row is not None:
+            return self._build_catalog_item(row[:-1], date, batch_id=row[-1])
+        return None
+
+    #
+    #  Operations
+    #
+
+    def add_sale(self, sale):
+        """Queue a sale done offline
+
+        :param sale: an :class:`OfflineSale`
+        """
+        self._add_operation(self.KIND_SALE, sale.id, sale.date,
+                            sale.to_dict())
+
+    def add_till_entry(self, station_id, value, reason, id=None, date=None):
+        """Queue a |till| entry done offline
+
+        :param station_id: the id of the |branchstation|
+        :param value: the value of the entry. Positive for credits and
+            negative for debits
+        :param reason: the description of the entry
+        :param id: the id the |tillentry| will have. A new one is generated
+            if not given
+        :param date: when the entry was done. Defaults to now
+        :returns: the id of the entry
+        """
+        id = id or str(uuid.uuid1())
+        self._add_operation(self.KIND_TILL_ENTRY, id, date or localnow(),
+                            dict(station_id=str(station_id),
+                                 value=str(Decimal(value)),
+                                 reason=reason))
+        return id
+
+    def get_operations(self, status=None):
+        """Get the queued operations, in the order they were done
+
+        :param status: if given, only get operations with this status
+        :returns: a list of :class:`JournalOperation`
+        """
+        query = "SELECT id, kind, date, data, status, error FROM operation"
+        args = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            args = (status, )
+        query += " ORDER BY rowid"
+        return [JournalOperation(id_, kind, _parse_date(date),
+                                 json.loads(data), status, error)
+                for id_, kind, date, data, status, error in
+                self._conn.execute(query, args)]
+
+    def get_pending(self):
+        return self.get_operations(self.STATUS_PENDING)
+
+    def get_conflicts(self):
+        return self.get_operations(self.STATUS_CONFLICT)
+
+    def set_status(self, operation_id, status, error=None):
+        """Set the status of an operation
+
+        Setting it back to :obj:`.STATUS_PENDING` makes a conflict be
+        replayed again, after it was resolved.
+
+        :param operation_id: the id of the operation
+        :param status: the new status
+        :param error: the reason of a conflict
+        """
+        with self._conn:
+            self._conn.execute(
+                "UPDATE operation SET status = ?, error = ? WHERE id = ?",
+                (status, error, operation_id))
+
+    def purge(self):
+        """Remove the replayed operations from the journal"""
+        with self._conn:
+            self._conn.execute("DELETE FROM operation WHERE status = ?",
+                               (self.STATUS_REPLAYED, ))
+
+    def close(self):
+        self._conn.close()
+
+    #
+    #  Private
+    #
+
+    def _add_operation(self, kind, id, date, data):
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO operation VALUES (?, ?, ?, ?, ?, NULL)",
+                (str(id), kind, _format_date(date), json.dumps(data),
+                 self.STATUS_PENDING))
+
+    def _build_catalog_item(self, row, date, batch_id=None):
+        (sellable_id, barcode, code, description, price, price_end,
+         next_price) = row
+        if (price_end is not None and next_price is not None and
+                date.isoformat() > price_end):
+            price = next_price
+        return CatalogItem(sellable_id, barcode, code, description,
+                           Decimal(price), batch_id)
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?",
+                                 (key, )).fetchone()
+        return row and row[0]
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                           (key, value))
+
+
+class ReplayReport(object):
+    """What happened when replaying a journal
+
+    :ivar replayed: the ids of the operations that were replayed
+    :ivar skipped: the ids of the operations that were already in the
+        database, and were only marked as replayed
+    :ivar conflicts: a list of (operation id, reason) of the operations
+        that could not be replayed
+    """
+
+    def __init__(self):
+        self.replayed = []
+        self.skipped = []
+        self.conflicts = []
+
+    def format(self):
+        lines = ['replayed: %d' % (len(self.replayed), ),
+                 'already replayed: %d' % (len(self.skipped), ),
+                 'conflicts: %d' % (len(self.conflicts), )]
+        for operation_id, reason in self.conflicts:
+            lines.append('  %s: %s' % (operation_id, reason))
+        return '\n'.join(lines)
+
+
+class OfflineReplayer(object):
+    """Replays the operations queued on a journal
+
+    :param journal: the :class:`OfflineJournal`
+    :param user: the |loginuser| responsible for the replayed operations
+    """
+
+    def __init__(self, journal, user):
+        self.journal = journal
+        self.user_id = user.id
+
+    #
+    #  Public API
+    #
+
+    def replay(self):
+        """Replay all the pending operations
+
+        Each operation is replayed in its own transaction. If the
+        connection is lost again, the replay stops and the error is raised;
+        the remaining operations are kept pending.
+
+        :returns: a :class:`ReplayReport`
+        """
+        report = ReplayReport()
+        replay_funcs = {
+            OfflineJournal.KIND_SALE: self._replay_sale,
+            OfflineJournal.KIND_TILL_ENTRY: self._replay_till_entry,
+        }
+        for operation in self.journal.get_pending():
+            try:
+                replayed = run_in_transaction(replay_funcs[operation.kind],
+                                              operation)
+            except CONNECTION_ERRORS as e:
+                if is_connection_error(e):
+                    raise
+                # A conflict with another transaction or a timeout. Stop
+                # here, so the operations are still replayed in order
+                log.warning('Could not replay %s %s now: %s', operation.kind,
+                            operation.id, e)
+                break
+            except Exception as e:
+                log.warning('Could not replay %s %s: %s', operation.kind,
+                            operation.id, e)
+                reason = str(e) or type(e).__name__
+                self.journal.set_status(operation.id,
+                                        OfflineJournal.STATUS_CONFLICT,
+                                        reason)
+                report.conflicts.append((operation.id, reason))
+                continue
+
+            self.journal.set_status(operation.id,
+                                    OfflineJournal.STATUS_REPLAYED)
+            if replayed:
+                report.replayed.append(operation.id)
+            else:
+                report.skipped.append(operation.id)
+        return report
+
+    #
+    #  Private
+    #
+
+    def _replay_sale(self, store, operation):
+        from stoqlib.domain.payment.group import PaymentGroup
+        from stoqlib.domain.payment.method import PaymentMethod
+        from stoqlib.domain.payment.payment import Payment
+        from stoqlib.domain.person import (Branch, Client, LoginUser,
+                                           SalesPerson)
+        from stoqlib.domain.product import StorableBatch
+        from stoqlib.domain.sale import Sale
+        from stoqlib.domain.sellable import Sellable
+        from stoqlib.exceptions import PaymentMethodError, SellableError
+
+        if store.get(Sale, operation.id) is not None:
+            return False
+
+        offline_sale = OfflineSale.from_dict(operation.id, operation.date,
+                                             operation.data)
+        branch = store.get(Branch, offline_sale.branch_id)
+        station, till = self._get_open_till(store, offline_sale.station_id)
+        user = store.get(LoginUser, self.user_id)
+        client = (offline_sale.client_id and
+                  store.get(Client, offline_sale.client_id))
+
+        sale = Sale(store=store,
+                    id=offline_sale.id,
+                    branch=branch,
+                    station=station,
+                    salesperson=store.get(SalesPerson,
+                                          offline_sale.salesperson_id),
+                    client=client,
+                    group=PaymentGroup(store=store),
+                    open_date=offline_sale.date,
+                    status=Sale.STATUS_QUOTE,
+                    coupon_id=None)
+        for item in offline_sale.items:
+            sellable = store.get(Sellable, item['sellable_id'])
+            if sellable is None:
+                raise SellableError(_("The item %s does not exist anymore") %
+                                    (item['sellable_id'], ))
+            batch = item['batch_id'] and store.get(StorableBatch,
+                                                   item['batch_id'])
+            sale.add_sellable(sellable, quantity=item['quantity'],
+                              price=item['price'], batch=batch)
+        sale.order(user)
+
+        for payment in offline_sale.payments:
+            method = PaymentMethod.get_by_name(store, payment['method_name'])
+            if method is None:
+                raise PaymentMethodError(
+                    _("The payment method %s does not exist") %
+                    (payment['method_name'], ))
+            method.create_payment(branch, station, Payment.TYPE_IN,
+                                  sale.group, payment['value'],
+                                  due_date=offline_sale.date)
+
+        sale.confirm(user, till=till)
+        sale.confirm_date = offline_sale.date
+        return True
+
+    def _replay_till_entry(self, store, operation):
+        from stoqlib.domain.till import TillEntry
+
+        if store.get(TillEntry, operation.id) is not None:
+            return False
+
+        station, till = self._get_open_till(store,
+                                            operation.data['station_id'])
+        TillEntry(store=store,
+                  id=operation.id,
+                  date=operation.date,
+                  value=Decimal(operation.data['value']),
+                  description=operation.data['reason'],
+                  till=till,
+                  station=station,
+                  branch=station.branch)
+        return True
+
+    def _get_open_till(self, store, station_id):
+        from stoqlib.domain.station import BranchStation
+        from stoqlib.domain.till import Till
+        from stoqlib.exceptions import TillError
+
+        station = store.get(BranchStation, station_id)
+        if station is None:
+            raise TillError(_("The station %s does not exist anymore") %
+                            (station_id, ))
+        till = Till.get_current(store, station)
+        # Without a till, the payments would not be registered on it
+        if till is None:
+            raise TillError(_("There is no open till on station %s") %
+                            (station.name, ))
+        return station, till
+
+
+_journal = None
+
+
+def get_offline_journal():
+    """Get the :class:`OfflineJournal` of this station
+
+    The catalog snapshot is saved when the |till| is opened, so the POS
+    can keep selling if the database becomes unreachable.
+
+    :returns: an :class:`OfflineJournal`
+    """
+    global _journal
+    if _journal is None:
+        _journal = OfflineJournal()
+    return _journal
@@ -1100,14 +1100,9 @@ class Client(Domain):
 
     @property
     def remaining_store_credit(self):
-        from stoqlib.domain.payment.views import InPaymentView
-        status_query = Or(InPaymentView.status == Payment.STATUS_PENDING,
-                          InPaymentView.status == Payment.STATUS_CONFIRMED)
-        query = And(InPaymentView.person_id == self.person.id,
-                    status_query,
-                    InPaymentView.method_name == u'store_credit')
-
-        debit = self.store.find(InPaymentView, query).sum(InPaymentView.value) or currency('0.0')
+        debit = self.store.find(
+            ClientCreditBalance.store_credit_debit,
+            person_id=self.person_id).one() or 0
         return currency(self.credit_limit - debit)
 
     def get_credit_transactions(self):
@@ -1141,16 +1136,37 @@ class Client(Domain):
         """Returns a client's credit balance.
 
         :returns: The client's credit balance."""
-        transactions = self.get_credit_transactions()
+        balance = self.store.find(ClientCreditBalance.credit_balance,
+                                  person_id=self.person_id).one()
+        return currency(balance or 0)
 
-        balance = 0
-        for payment in transactions:
-            if payment.payment_type == payment.TYPE_OUT:
-                balance += payment.paid_value
-            else:
-                balance -= payment.paid_value
+    @classmethod
+    def get_credit_account_balances(cls, store, clients):
+        """Get the credit balances of many clients at once
 
-        return currency(balance)
+        :param store: a store
+        :param clients: a sequence of |clients|
+        :returns: a dict mapping the ids of the |clients| to their
+          :obj:`.credit_account_balance`
+        """
+        balances = ClientCreditBalance.find_for_clients(store, clients)
+        return dict((client.id, currency(balances[client.person_id][0]))
+                    for client in clients)
+
+    @classmethod
+    def get_remaining_store_credits(cls, store, clients):
+        """Get the remaining store credits of many clients at once
+
+        :param store: a store
+        :param clients: a sequence of |clients|
+        :returns: a dict mapping the ids of the |clients| to their
+          :obj:`.remaining_store_credit`
+        """
+        balances = ClientCreditBalance.find_for_clients(store, clients)
+        return dict(
+            (client.id,
+             currency(client.credit_limit - balances[client.person_id][1]))
+            for client in clients)
 
     @property
     def salary(self):
@@ -1214,6 +1230,51 @@ class Client(Domain):
         return True
 
 
+class ClientCreditBalance(Domain):
+    """The credit balances of a |person| as a payer
+
+    The rows are maintained by triggers on the payment and payment_group
+    tables, so the balances of a |client| can be read without summing all
+    of its payments. They should never be changed by hand.
+    """
+
+    __storm_table__ = 'client_credit_balance'
+
+    person_id = IdCol()
+
+    #: the |person| that pays the |payments|
+    person = Reference(person_id, 'Person.id')
+
+    #: the sum of the paid |payments| with the credit method, out payments
+    #: (credit given to the client) adding and in payments subtracting
+    credit_balance = PriceCol(default=0)
+
+    #: the sum of the pending and confirmed in |payments| with the
+    #: store_credit method
+    store_credit_debit = PriceCol(default=0)
+
+    @classmethod
+    def find_for_clients(cls, store, clients):
+        """Get the balances of many |clients| with a single query
+
+        :param store: a store
+        :param clients: a sequence of |clients|
+        :returns: a dict mapping the ids of the |persons| of the |clients|
+          to a (credit_balance, store_credit_debit) tuple. It defaults to
+          zeros for the clients that never had a credit |payment|
+        """
+        balances = collections.defaultdict(lambda: (0, 0))
+        person_ids = set(client.person_id for client in clients)
+        if not person_ids:
+            return balances
+
+        for person_id, credit, debit in store.find(
+                (cls.person_id, cls.credit_balance, cls.store_credit_debit),
+                cls.person_id.is_in(person_ids)):
+            balances[person_id] = (credit, debit)
+        return balances
+
+
 @implementer(IActive)
 @implementer(IDescribable)
 class Supplier(Domain):
@@ -2119,6 +2180,9 @@ class ClientView(Viewable):
     # ClientCategory
     client_category = ClientCategory.name
 
+    # ClientCreditBalance
+    credit_account_balance = Coalesce(ClientCreditBalance.credit_balance, 0)
+
     # Address
     street = Address.street
     streetnumber = Address.streetnumber
@@ -2135,6 +2199,8 @@ class ClientView(Viewable):
                  Person.id == Company.person_id),
         LeftJoin(ClientCategory,
                  Client.category_id == ClientCategory.id),
+        LeftJoin(ClientCreditBalance,
+                 ClientCreditBalance.person_id == Person.id),
         LeftJoin(Address,
                  And(Address.person_id == Person.id,
                      Eq(Address.is_main_address, True))),
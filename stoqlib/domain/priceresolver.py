@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+Resolving the price a |sellable| is sold for.
+
+The price depends on the |clientcategory| of the |client| (through
+:class:`~stoqlib.domain.sellable.ClientCategoryPrice`), on the promotion
+of the |sellable| and on the ``DEFAULT_TABLE_PRICE`` parameter. Resolving
+it takes a query for each category price, and the sale interfaces do that
+every time the price or the quantity of an item is validated.
+
+:class:`PriceResolver` keeps the resolved prices in memory, together with
+the interval of days where they are valid: a price resolved during a
+promotion is only used until the promotion ends, and a price resolved
+before a promotion starts is only used until the day before it starts.
+
+The prices are forgotten when the |sellable| or one of its category prices
+are changed, either by this process (through the domain hooks) or by
+another one (through the ``new_te``, ``update_te`` and ``delete_row``
+notifications the database sends when a row is inserted, updated or
+deleted).
+"""
+
+import collections
+import datetime
+import logging
+
+from storm.expr import And
+
+from stoqlib.database.notifications import NotifiedCache
+from stoqlib.domain.sellable import ClientCategoryPrice, Sellable
+from stoqlib.lib.dateutils import localnow
+from stoqlib.lib.parameters import sysparam
+
+log = logging.getLogger(__name__)
+
+#: A resolved price. *start* and *end* are the first and last days (both
+#: inclusive) where the price is valid, ``None`` meaning there's no limit
+ResolvedPrice = collections.namedtuple('ResolvedPrice',
+                                       ['price', 'start', 'end'])
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def _get_date(date):
+    if date is None:
+        return localnow().date()
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    return date
+
+
+def resolve_price(sellable, date, category_price=None, default_price=None):
+    """Resolve the price of a |sellable| on a given day
+
+    This is the same price :meth:`Sellable.get_price_for_category
+    <stoqlib.domain.sellable.Sellable.get_price_for_category>` would
+    return on *date*.
+
+    :param sellable: a |sellable|
+    :param date: a :class:`datetime.date`
+    :param category_price: the price of the |sellable| for the
+        |clientcategory| of the |client|, if there's one
+    :param default_price: the price of the |sellable| for the
+        ``DEFAULT_TABLE_PRICE`` category, if there's one
+    :returns: a :class:`ResolvedPrice`
+    """
+    if category_price is not None:
+        return ResolvedPrice(category_price, None, None)
+
+    if default_price is None:
+        default_price = sellable.base_price
+
+    start = sellable.on_sale_start_date
+    end = sellable.on_sale_end_date
+    # Like Sellable.is_on_sale, the promotion needs a price and at least
+    # one of the dates, and the hours of the dates are ignored
+    if not sellable.on_sale_price or (not start and not end):
+        return ResolvedPrice(default_price, None, None)
+
+    start = start and start.date()
+    end = end and end.date()
+    if start and date < start:
+        return ResolvedPrice(default_price, None, start - _ONE_DAY)
+    if end and date > end:
+        return ResolvedPrice(default_price, end + _ONE_DAY, None)
+    return ResolvedPrice(sellable.on_sale_price, start, end)
+
+
+class PriceResolver(NotifiedCache):
+    """A cache of the prices of the |sellables|
+
+    The prices are read from the store passed to the methods, with its
+    uncommitted changes. The prices of a |sellable| are forgotten when it
+    or one of its |clientcategory| prices is changed, and all the prices
+    are forgotten if the change is rolled back, so they are not kept
+    after that.
+
+    :param listen: if the resolver should listen to the database
+        notifications to know when another process changes a price
+    """
+
+    tables = (Sellable.__storm_table__, ClientCategoryPrice.__storm_table__)
+
+    def __init__(self, listen=True):
+        super(PriceResolver, self).__init__(listen=listen)
+        # sellable id -> {(category id, default category id): ResolvedPrice}
+        self._prices = {}
+
+    #
+    #  Public API
+    #
+
+    def get_price(self, sellable, category=None, date=None):
+        """Get the price of a |sellable|
+
+        :param sellable: a |sellable|
+        :param category: the |clientcategory| of the |client| or ``None``
+        :param date: the day of the sale, a :class:`datetime.date` or
+            :class:`datetime.datetime`. Defaults to today
+        :returns: the price
+        """
+        return self.get_prices([sellable], category, date)[sellable.id]
+
+    def get_prices(self, sellables, category=None, date=None):
+        """Get the prices of many |sellables|
+
+        The prices that are not cached are resolved together, with a
+        single query, so this should be used to price a whole cart or
+        price list.
+
+        :param sellables: a sequence of |sellables|, all from the same store
+        :param category: the |clientcategory| of the |client| or ``None``
+        :param date: the day of the sale, a :class:`datetime.date` or
+            :class:`datetime.datetime`. Defaults to today
+        :returns: a dict mapping the ids of the |sellables| to their prices
+        """
+        resolved = self.get_resolved_prices(sellables, category, date)
+        return dict((sellable_id, resolved_price.price)
+                    for sellable_id, resolved_price in resolved.items())
+
+    def get_resolved_prices(self, sellables, category=None, date=None):
+        """Get the prices of many |sellables| and the days they are valid
+
+        Like :meth:`.get_prices`, but also tells when each price starts
+        and stops being valid, for instance when a promotion ends.
+
+        :param sellables: a sequence of |sellables|, all from the same store
+        :param category: the |clientcategory| of the |client| or ``None``
+        :param date: the day of the sale, a :class:`datetime.date` or
+            :class:`datetime.datetime`. Defaults to today
+        :returns: a dict mapping the ids of the |sellables| to their
+            :class:`ResolvedPrice`
+        """
+        sellables = list(sellables)
+        if not sellables:
+            return {}
+
+        self.refresh(sellables[0].store)
+        date = _get_date(date)
+        key = (category and category.id,
+               sysparam.get_object_id('DEFAULT_TABLE_PRICE'))
+
+        prices = {}
+        missing = []
+        for sellable in sellables:
+            resolved = self._prices.get(sellable.id, {}).get(key)
+            if (resolved is None or
+                    (resolved.start is not None and date < resolved.start) or
+                    (resolved.end is not None and date > resolved.end)):
+                missing.append(sellable)
+            else:
+                prices[sellable.id] = resolved
+
+        if missing:
+            prices.update(self._resolve(missing, key, date))
+        return prices
+
+    def refresh(self, store):
+        """Forget the prices changed by other processes
+
+        This is cheap when nothing has changed, since reading the
+        notifications does not query the database. It is done by
+        :meth:`.get_prices`, so it doesn't usually need to be called.
+
+        :param store: a store
+        """
+        changes = self.poll()
+        if changes.deleted.get(ClientCategoryPrice.__storm_table__):
+            # Their sellables are not known anymore
+            self.clear()
+            return
+        for sellable_id in changes.deleted.get(Sellable.__storm_table__, ()):
+            self.invalidate(sellable_id)
+
+        sellable_te_ids = changes.get(Sellable.__storm_table__)
+        if sellable_te_ids:
+            for sellable_id in store.find(
+                    Sellable.id, Sellable.te_id.is_in(sellable_te_ids)):
+                self.invalidate(sellable_id)
+
+        category_price_te_ids = changes.get(
+            ClientCategoryPrice.__storm_table__)
+        if category_price_te_ids:
+            for sellable_id in store.find(
+                    ClientCategoryPrice.sellable_id,
+                    ClientCategoryPrice.te_id.is_in(category_price_te_ids)):
+                self.invalidate(sellable_id)
+
+    def invalidate(self, sellable_id):
+        """Forget the prices of a |sellable|
+
+        :param sellable_id: the id of the |sellable|
+        """
+        self._prices.pop(sellable_id, None)
+
+    def clear(self):
+        """Forget all the prices"""
+        self._prices.clear()
+
+    #
+    #  Private
+    #
+
+    def _resolve(self, sellables, key, date):
+        category_id, default_id = key
+        category_ids = set(i for i in key if i is not None)
+        category_prices = {}
+        if category_ids:
+            store = sellables[0].store
+            query = And(
+                ClientCategoryPrice.sellable_id.is_in(
+                    set(s.id for s in sellables)),
+                ClientCategoryPrice.category_id.is_in(category_ids))
+            columns = (ClientCategoryPrice.sellable_id,
+                       ClientCategoryPrice.category_id,
+                       ClientCategoryPrice.price)
+            for sellable_id, price_category_id, price in store.find(
+                    columns, query):
+                category_prices[sellable_id, price_category_id] = price
+
+        prices = {}
+        for sellable in sellables:
+            resolved = resolve_price(
+                sellable, date,
+                category_price=category_prices.get((sellable.id, category_id)),
+                default_price=category_prices.get((sellable.id, default_id)))
+            self._prices.setdefault(sellable.id, {})[key] = resolved
+            prices[sellable.id] = resolved
+        return prices
+
+
+_resolver = None
+
+
+def get_price_resolver():
+    """Get the price resolver of this process
+
+    :returns: a :class:`PriceResolver`
+    """
+    global _resolver
+    if _resolver is None:
+        _resolver = PriceResolver()
+    return _resolver
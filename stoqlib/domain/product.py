@@ -90,17 +90,19 @@ from kiwi.currency import currency
 from storm.references import Reference, ReferenceSet
 from storm.exceptions import NotOneError
 from storm.expr import (And, Eq, LeftJoin, Alias, Sum, Coalesce, Select, Join,
-                        Cast, Or, In)
+                        Cast, Or, In, Insert)
+from storm.info import get_obj_info
 from zope.interface import implementer
 
-from stoqlib.database.expr import (Field, TransactionTimestamp,
+from stoqlib.database.expr import (Field, ForUpdate, TransactionTimestamp,
                                    ArrayAgg, Contains, IsContainedBy,
-                                   SplitPart)
+                                   SplitPart, UnionAll)
 from stoqlib.database.properties import (BoolCol, DateTimeCol, DecimalCol,
                                          EnumCol, IdCol, IntCol, PercentCol,
                                          PriceCol, QuantityCol, UnicodeCol)
 from stoqlib.database.runtime import autoreload_object
 from stoqlib.database.viewable import Viewable
+from stoqlib.domain.backgroundjob import BackgroundJob, register_job_handler
 from stoqlib.domain.base import Domain
 from stoqlib.domain.events import (ProductCreateEvent, ProductEditEvent,
                                    ProductRemoveEvent, ProductStockUpdateEvent)
@@ -109,7 +111,7 @@ from stoqlib.domain.overrides import ProductBranchOverride
 from stoqlib.domain.person import Person, Branch, LoginUser
 from stoqlib.domain.sellable import Sellable
 from stoqlib.exceptions import StockError
-from stoqlib.lib.dateutils import localnow, localtoday
+from stoqlib.lib.dateutils import localdatetime, localnow, localtoday
 from stoqlib.lib.defaults import quantize
 from stoqlib.lib.parameters import sysparam
 from stoqlib.lib.stringutils import next_value_for
@@ -612,22 +614,10 @@ class Product(Domain):
         :param branch: the |branch|
         """
         assert self.is_composed
-
-        # Components maximum lead time
-        comp_max_time = 0
-        for i in self.get_components():
-            # Products without manage stock control doesnt have storable
-            if not i.component.manage_stock:
-                continue
-            storable = i.component.storable
-            needed = quantity * i.quantity
-            stock = storable.get_balance_for_branch(branch)
-            # We have enough of this component items to produce.
-            if stock >= needed:
-                continue
-            comp_max_time = max(comp_max_time,
-                                i.component.get_max_lead_time(needed, branch))
-        return self.production_time + comp_max_time
+        from stoqlib.domain.bom import get_bill_of_materials
+        lead_times = get_bill_of_materials().get_lead_times(
+            self.store, {self.id: quantity}, branch)
+        return lead_times[self.id]
 
     def get_max_lead_time(self, quantity, branch):
         """Returns the longest lead time for this product.
@@ -788,12 +778,10 @@ class Product(Domain):
         :returns: ``True`` if the given product is one of our component or a
           component of our components, otherwise ``False``.
         """
-        for component in self.get_components():
-            if product is component.component:
-                return True
-            if component.component.is_composed_by(product):
-                return True
-        return False
+        from stoqlib.domain.bom import get_bill_of_materials
+        component_ids = get_bill_of_materials().get_component_ids(self.store,
+                                                                  self.id)
+        return product.id in component_ids
 
     def child_exists(self, options):
         """Check if the child already exists
@@ -1258,6 +1246,40 @@ class ProductStockItem(Domain):
     #: The |batch| that the storable is in.
     batch = Reference(batch_id, 'StorableBatch.id')
 
+    #
+    #  Classmethods
+    #
+
+    @classmethod
+    def lock_for_update(cls, store, branch, storable_ids):
+        """Lock the stock items of some |storables| on a |branch|
+
+        Operations that move the stock of more than one |storable| (e.g.
+        confirming a |sale|) should call this before doing so. Otherwise
+        the stock items would be locked in the order the items are
+        processed and two concurrent operations with the same storables
+        in a different order could deadlock. Here they are locked all at
+        once, ordered by their primary key.
+
+        The lock is held until the end of the transaction.
+
+        :param store: a store
+        :param branch: the |branch| of the stock items
+        :param storable_ids: the ids of the |storables|. Ids of objects
+            that are not storables (e.g. services) are ignored
+        :returns: the ids of the locked stock items, in the order they
+            were locked
+        """
+        storable_ids = sorted(set(storable_ids))
+        if not storable_ids:
+            return []
+
+        query = Select(cls.id,
+                       where=And(cls.branch_id == branch.id,
+                                 cls.storable_id.is_in(storable_ids)),
+                       order_by=cls.id)
+        return [row[0] for row in store.execute(ForUpdate(query))]
+
     @property
     def transactions(self):
         return self.store.find(StockTransactionHistory,
@@ -1266,6 +1288,34 @@ class ProductStockItem(Domain):
                                batch=self.batch)
 
 
+class ProductStockSummary(Domain):
+    """The stock of a |storable| in a |branch|, summed over its |batches|
+
+    This is maintained by the database, by a trigger on the
+    ``product_stock_item`` table, so the stock searches don't need to
+    aggregate all the stock items. It should never be modified directly.
+    """
+
+    __storm_table__ = 'product_stock_summary'
+
+    storable_id = IdCol()
+
+    #: the |storable|
+    storable = Reference(storable_id, 'Storable.id')
+
+    branch_id = IdCol()
+
+    #: the |branch|
+    branch = Reference(branch_id, 'Branch.id')
+
+    #: the sum of the quantities of the stock items
+    quantity = QuantityCol(default=0)
+
+    #: the sum of the quantities of the stock items multiplied by their
+    #: stock costs
+    total_cost = DecimalCol(default=0)
+
+
 class Storable(Domain):
     '''Storable represents the stock of a |product|.
 
@@ -1464,8 +1514,8 @@ class Storable(Domain):
 
         :returns: the amount of stock available in all |branches|
         """
-        stock_items = self.get_stock_items()
-        return stock_items.sum(ProductStockItem.quantity) or Decimal(0)
+        summaries = self.store.find(ProductStockSummary, storable=self)
+        return summaries.sum(ProductStockSummary.quantity) or Decimal(0)
 
     def get_balance_for_branch(self, branch):
         """Return the stock balance for the |product| in a |branch|. If this
@@ -1476,10 +1526,9 @@ class Storable(Domain):
         :param branch: the |branch| to get the stock balance for
         :returns: the amount of stock available in the |branch|
         """
-        store = self.store
-        stock_items = store.find(ProductStockItem, storable=self,
-                                 branch=branch)
-        return stock_items.sum(ProductStockItem.quantity) or Decimal(0)
+        summaries = self.store.find(ProductStockSummary, storable=self,
+                                    branch=branch)
+        return summaries.sum(ProductStockSummary.quantity) or Decimal(0)
 
     def get_stock_items(self):
         """Fetches the stock items available for all |branches|.
@@ -1912,6 +1961,181 @@ class StockTransactionHistory(Domain):
         return self.types[self.type] % number
 
 
+class ProductStockSnapshot(Domain):
+    """The stock of a |storable| in a |branch| at a date
+
+    The stock at a date is the sum of all the |stocktransactionhistory|
+    made before it. The snapshots are taken for all the storables at once,
+    at the first day of each month, so :meth:`.get_stock_at` only needs
+    to sum the transactions made after the last snapshot before the date.
+
+    Only the stock that is not zero is kept in a snapshot. They should
+    never be changed by hand, :meth:`.rebuild` can be used to fix them
+    if a transaction is created with a date before the last snapshot.
+
+    The missing snapshots are taken every month by a ``stock-snapshots``
+    background job, or by ``stoqdbadmin stock_snapshots``, which takes
+    all of them again when given ``--rebuild``.
+    """
+
+    __storm_table__ = 'product_stock_snapshot'
+
+    #: the transactions made before this date are in the snapshot
+    date = DateTimeCol()
+
+    storable_id = IdCol()
+
+    #: the |storable|
+    storable = Reference(storable_id, 'Storable.id')
+
+    branch_id = IdCol()
+
+    #: the |branch|
+    branch = Reference(branch_id, 'Branch.id')
+
+    batch_id = IdCol(default=None)
+
+    #: the |batch|, if the |storable| is controlled by batches
+    batch = Reference(batch_id, 'StorableBatch.id')
+
+    #: the stock at :obj:`.date`
+    quantity = QuantityCol()
+
+    @classmethod
+    def get_snapshot_date(cls, store, date):
+        """Get the date of the last snapshot taken up to a date
+
+        :param store: a store
+        :param date: the date
+        :returns: the date of the snapshot or ``None`` if there's no
+            snapshot before *date*
+        """
+        return store.find(cls, cls.date <= date).max(cls.date)
+
+    @classmethod
+    def get_stock_at(cls, store, date, branch=None, storable_ids=None):
+        """Get the stock of the |storables| at a date
+
+        :param store: a store
+        :param date: the date. The transactions made before it are counted
+        :param branch: if not ``None``, only the stock of this |branch|
+        :param storable_ids: if not ``None``, only the stock of the
+            storables with these ids
+        :returns: a dict mapping (storable id, branch id, batch id) to the
+            quantity in stock. Only the stock that is not zero is in it
+        """
+        query = cls._get_stock_query(store, date, branch=branch,
+                                     storable_ids=storable_ids)
+        return dict(((storable_id, branch_id, batch_id), quantity)
+                    for storable_id, branch_id, batch_id, quantity
+                    in store.execute(query))
+
+    @classmethod
+    def create(cls, store, date):
+        """Take a snapshot of the stock of all the |storables|
+
+        A snapshot that was already taken at *date* is replaced.
+
+        :param store: a store
+        :param date: the date of the snapshot
+        """
+        store.find(cls, date=date).remove()
+        store.execute(Insert(
+            (cls.date, cls.storable_id, cls.branch_id, cls.batch_id,
+             cls.quantity),
+            table=cls,
+            values=cls._get_stock_query(store, date, columns=[date])))
+
+    @classmethod
+    def update(cls, store):
+        """Take the snapshots missing since the last one
+
+        A snapshot is taken at the first day of each month that started
+        after the last snapshot, or after the first |stocktransactionhistory|
+        if there's no snapshot.
+
+        :param store: a store
+        :returns: the dates of the snapshots taken
+        """
+        last_date = store.find(cls).max(cls.date)
+        if last_date is None:
+            last_date = store.find(StockTransactionHistory).min(
+                StockTransactionHistory.date)
+            if last_date is None:
+                return []
+
+        dates = []
+        date = cls._get_next_month(last_date)
+        now = localnow()
+        while date <= now:
+            cls.create(store, date)
+            dates.append(date)
+            date = cls._get_next_month(date)
+        return dates
+
+    @classmethod
+    def rebuild(cls, store):
+        """Remove all the snapshots and take them again
+
+        :param store: a store
+        :returns: the dates of the snapshots taken
+        """
+        store.find(cls).remove()
+        return cls.update(store)
+
+    @classmethod
+    def _get_stock_query(cls, store, date, branch=None, storable_ids=None,
+                         columns=None):
+        snapshot_date = cls.get_snapshot_date(store, date)
+        selects = []
+        for table in [cls, StockTransactionHistory]:
+            query = []
+            if branch is not None:
+                query.append(table.branch_id == branch.id)
+            if storable_ids is not None:
+                query.append(table.storable_id.is_in(storable_ids))
+            if table is cls:
+                if snapshot_date is None:
+                    continue
+                query.append(cls.date == snapshot_date)
+            else:
+                query.append(table.date < date)
+                if snapshot_date is not None:
+                    query.append(table.date >= snapshot_date)
+            selects.append(Select(
+                (table.storable_id, table.branch_id, table.batch_id,
+                 table.quantity),
+                where=And(*query)))
+
+        movement = Alias(UnionAll(*selects), '_movement')
+        group_by = [Field('_movement', 'storable_id'),
+                    Field('_movement', 'branch_id'),
+                    Field('_movement', 'batch_id')]
+        quantity = Sum(Field('_movement', 'quantity'))
+        return Select(list(columns or []) + group_by + [quantity],
+                      tables=[movement], group_by=group_by,
+                      having=quantity != 0)
+
+    @classmethod
+    def _get_next_month(cls, date):
+        if date.month == 12:
+            return localdatetime(date.year + 1, 1, 1)
+        return localdatetime(date.year, date.month + 1, 1)
+
+
+@register_job_handler(u'stock-snapshots')
+def _update_stock_snapshots(store):
+    ProductStockSnapshot.update(store)
+    # Keep a single job waiting for the next month
+    pending = store.find(
+        BackgroundJob, And(BackgroundJob.job_type == u'stock-snapshots',
+                           BackgroundJob.status == BackgroundJob.STATUS_PENDING,
+                           BackgroundJob.run_after > localnow()))
+    if pending.is_empty():
+        job = BackgroundJob.enqueue(store, u'stock-snapshots')
+        job.run_after = ProductStockSnapshot._get_next_month(localnow())
+
+
 class ProductComponent(Domain):
     """A |product| and it's related |component| eg other product
 
@@ -1941,6 +2165,40 @@ class ProductComponent(Domain):
     #: indicate the price this component has in the final package
     price = PriceCol()
 
+    def __init__(self, store, **kwargs):
+        super(ProductComponent, self).__init__(store=store, **kwargs)
+        # on_delete is not called when the component is removed in the
+        # same transaction it was created, but it may be cached already
+        get_obj_info(self).event.hook('removed', self._on_removed, store)
+
+    #
+    #  Domain
+    #
+
+    def on_delete(self):
+        _invalidate_bill_of_materials(self.store)
+
+    def on_object_changed(self, attr, old_value, value):
+        # This is also called when the component is created, so a
+        # component created in this transaction is forgotten if it is
+        # rolled back
+        if attr in ['product_id', 'component_id', 'quantity']:
+            _invalidate_bill_of_materials(self.store)
+
+    #
+    #  Private
+    #
+
+    def _on_removed(self, obj_info, store):
+        _invalidate_bill_of_materials(store)
+
+
+def _invalidate_bill_of_materials(store):
+    from stoqlib.domain.bom import get_bill_of_materials
+    bom = get_bill_of_materials()
+    bom.clear()
+    bom.clear_on_rollback(store)
+
 
 @implementer(IDescribable)
 class ProductQualityTest(Domain):
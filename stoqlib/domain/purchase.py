@@ -48,7 +48,7 @@ from stoqlib.domain.interfaces import IContainer, IDescribable
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.product import (StockTransactionHistory, Storable,
-                                    ProductStockItem)
+                                    ProductStockSummary)
 from stoqlib.domain.person import (Person, Branch, Company, Supplier,
                                    Transporter, LoginUser)
 from stoqlib.domain.sellable import Sellable, SellableUnit
@@ -825,7 +825,7 @@ class PurchaseItemView(Viewable):
     total_item = (PurchaseItem.cost * PurchaseItem.quantity) + ipi_value
     total_item_received = (PurchaseItem.cost * PurchaseItem.quantity_received) + ipi_value
     total_sold = (PurchaseItem.cost * PurchaseItem.quantity_sold) + ipi_value
-    current_stock = Sum(ProductStockItem.quantity)
+    current_stock = Sum(ProductStockSummary.quantity)
 
     purchase_id = PurchaseOrder.id
     sellable_id = Sellable.id
@@ -838,9 +838,9 @@ class PurchaseItemView(Viewable):
         Join(PurchaseOrder, PurchaseOrder.id == PurchaseItem.order_id),
         Join(Sellable, Sellable.id == PurchaseItem.sellable_id),
         LeftJoin(SellableUnit, SellableUnit.id == Sellable.unit_id),
-        LeftJoin(ProductStockItem,
-                 And(ProductStockItem.storable_id == PurchaseItem.sellable_id,
-                     ProductStockItem.branch_id == PurchaseOrder.branch_id))
+        LeftJoin(ProductStockSummary,
+                 And(ProductStockSummary.storable_id == PurchaseItem.sellable_id,
+                     ProductStockSummary.branch_id == PurchaseOrder.branch_id))
     ]
 
     group_by = [PurchaseItem.id, Sellable.id, PurchaseOrder.id, SellableUnit.id]
@@ -41,8 +41,8 @@ from stoqlib.domain.payment.group import PaymentGroup
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.person import LoginUser
-from stoqlib.domain.product import (ProductHistory, StockTransactionHistory,
-                                    StorableBatch)
+from stoqlib.domain.product import (ProductHistory, ProductStockItem,
+                                    StockTransactionHistory, StorableBatch)
 from stoqlib.domain.purchase import PurchaseOrder
 from stoqlib.domain.stockdecrease import StockDecreaseItem
 from stoqlib.lib.dateutils import localnow
@@ -269,6 +269,9 @@ class ReceivingOrder(IdentifiableDomain):
         if self.receiving_invoice:
             self.receiving_invoice.confirm(user)
 
+        ProductStockItem.lock_for_update(
+            self.store, self.branch,
+            [item.sellable_id for item in self.get_items()])
         for item in self.get_items():
             item.add_stock_items(user)
 
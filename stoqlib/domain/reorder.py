@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+Reorder suggestions of the |storables|.
+
+Deciding what to purchase used to be done product by product, looking at
+the sales history, the stock and the pending |purchases| of each one.
+
+:meth:`ProductReorderSuggestion.rebuild` does that for all the storables
+of the |branches| at once, reading each kind of data with a single grouped
+query, and stores the results in the ``product_reorder_suggestion`` table,
+so the purchase wizard and :class:`SuggestedPurchaseView` can read them
+without doing any calculation.
+
+For each storable in each branch it calculates:
+
+* the average quantity sold per day in the last days;
+* for how many days the stock lasts at that pace;
+* the ABC class of the storable in the branch, by the value of its sales;
+* the reorder point: the minimum quantity of the storable or what is sold
+  while waiting for the main |supplier| to deliver it, whichever is bigger;
+* the quantity to purchase when the stock plus what is being received is
+  not above the reorder point, enough to reach the maximum quantity of the
+  storable or to cover the sales of some more days.
+
+The suggestions are rebuilt by ``stoqdbadmin reorder_suggestions`` or by a
+``reorder-suggestions`` :class:`~stoqlib.domain.backgroundjob.BackgroundJob`.
+"""
+
+import collections
+import datetime
+from decimal import Decimal, ROUND_CEILING
+
+from storm.expr import And, Coalesce, Eq, Join, LeftJoin, Ne, Sum
+from storm.info import ClassAlias
+from storm.references import Reference
+
+from stoqlib.database.bulk import bulk_insert
+from stoqlib.database.expr import NullIf
+from stoqlib.database.properties import (DateTimeCol, DecimalCol, EnumCol,
+                                         IdCol, IntCol, QuantityCol)
+from stoqlib.database.viewable import Viewable
+from stoqlib.domain.backgroundjob import register_job_handler
+from stoqlib.domain.base import Domain
+from stoqlib.domain.overrides import StorableBranchOverride
+from stoqlib.domain.person import Branch, Company, Person, Supplier
+from stoqlib.domain.product import (Product, ProductHistory,
+                                    ProductStockSummary, ProductSupplierInfo,
+                                    Storable)
+from stoqlib.domain.purchase import PurchaseItem, PurchaseOrder
+from stoqlib.domain.sellable import Sellable, SellableCategory, SellableUnit
+from stoqlib.lib.dateutils import localnow
+from stoqlib.lib.translation import stoqlib_gettext
+
+_ = stoqlib_gettext
+
+#: The calculated suggestion of a |storable| in a |branch|. The fields are
+#: the same as the columns of :class:`ProductReorderSuggestion`
+ReorderSuggestion = collections.namedtuple(
+    'ReorderSuggestion', ['storable_id', 'branch_id', 'supplier_id',
+                          'calculated_date', 'days', 'quantity_sold',
+                          'daily_sales', 'stock', 'to_receive', 'lead_time',
+                          'days_of_cover', 'abc_class', 'reorder_point',
+                          'suggested_quantity'])
+
+_QUANTITY = Decimal('0.001')
+_DAYS = Decimal('0.01')
+
+
+class ProductReorderSuggestion(Domain):
+    """The purchase suggested for a |storable| in a |branch|
+
+    The suggestions are calculated by :meth:`.rebuild` and should never be
+    changed by hand.
+    """
+
+    __storm_table__ = 'product_reorder_suggestion'
+
+    #: the storables responsible for most of the value sold
+    CLASS_A = u'A'
+
+    #: the storables responsible for a small part of the value sold
+    CLASS_B = u'B'
+
+    #: the storables responsible for almost nothing of the value sold
+    CLASS_C = u'C'
+
+    abc_classes = collections.OrderedDict([
+        (CLASS_A, _(u'A')),
+        (CLASS_B, _(u'B')),
+        (CLASS_C, _(u'C')),
+    ])
+
+    #: the share of the value sold by a |branch| up to which the storables
+    #: are in each class, from the best selling ones
+    abc_limits = [(Decimal('0.80'), CLASS_A),
+                  (Decimal('0.95'), CLASS_B)]
+
+    #: how many days of sales are considered by default
+    DEFAULT_DAYS = 90
+
+    #: how many days of sales a purchase should cover by default
+    DEFAULT_COVER_DAYS = 30
+
+    storable_id = IdCol()
+
+    #: the |storable|
+    storable = Reference(storable_id, 'Storable.id')
+
+    branch_id = IdCol()
+
+    #: the |branch|
+    branch = Reference(branch_id, 'Branch.id')
+
+    supplier_id = IdCol(default=None)
+
+    #: the main |supplier| of the |storable| for the |branch|
+    supplier = Reference(supplier_id, 'Supplier.id')
+
+    #: when the suggestion was calculated
+    calculated_date = DateTimeCol()
+
+    #: how many days of sales were considered
+    days = IntCol()
+
+    #: the quantity sold in those days
+    quantity_sold = QuantityCol(default=0)
+
+    #: the average quantity sold per day
+    daily_sales = QuantityCol(default=0)
+
+    #: the stock of the |storable| in the |branch|
+    stock = QuantityCol(default=0)
+
+    #: the quantity of the confirmed |purchases| still to be received
+    to_receive = QuantityCol(default=0)
+
+    #: how many days the main |supplier| takes to deliver
+    lead_time = IntCol(default=0)
+
+    #: how many days the stock lasts at the current sales, ``None`` when
+    #: nothing was sold
+    days_of_cover = DecimalCol(default=None)
+
+    #: the ABC class, one of the ``CLASS_*`` constants
+    abc_class = EnumCol(allow_none=False, default=CLASS_C)
+
+    #: the stock plus the quantity to receive at which a purchase is needed
+    reorder_point = QuantityCol(default=0)
+
+    #: the quantity that should be purchased
+    suggested_quantity = QuantityCol(default=0)
+
+    #
+    #  Classmethods
+    #
+
+    @classmethod
+    def get_suggestion(cls, store, product, branch):
+        """Get the suggestion of a |product| in a |branch|
+
+        :param store: a store
+        :param product: the |product|
+        :param branch: the |branch|
+        :returns: a :class:`ProductReorderSuggestion` or ``None`` if the
+            product has no suggestion in the branch
+        """
+        return store.find(cls, storable_id=product.id,
+                          branch_id=branch.id).one()
+
+    @classmethod
+    def calculate(cls, store, branches=None, days=None, cover_days=None):
+        """Calculate the suggestions of the |storables|
+
+        All the storables that are not closed and have stock, sales,
+        pending purchases or a minimum or maximum quantity in a |branch|
+        have a suggestion in it.
+
+        :param store: a store
+        :param branches: the |branches| to calculate the suggestions for.
+            Defaults to all the active branches
+        :param days: how many days of sales are considered
+        :param cover_days: how many days of sales a purchase should cover
+        :returns: a list of :class:`ReorderSuggestion`
+        """
+        return _Calculator(store, branches, days or cls.DEFAULT_DAYS,
+                           cover_days or cls.DEFAULT_COVER_DAYS).run()
+
+    @classmethod
+    def rebuild(cls, store, branches=None, days=None, cover_days=None):
+        """Replace the suggestions with new ones
+
+        See :meth:`.calculate` for the parameters.
+
+        :returns: the number of suggestions created
+        """
+        suggestions = cls.calculate(store, branches=branches, days=days,
+                                    cover_days=cover_days)
+        results = store.find(cls)
+        if branches is not None:
+            results = results.find(
+                cls.branch_id.is_in([branch.id for branch in branches]))
+        results.remove()
+        return bulk_insert(
+            store, [getattr(cls, field) for field in ReorderSuggestion._fields],
+            [tuple(suggestion) for suggestion in suggestions])
+
+
+class _Calculator(object):
+    def __init__(self, store, branches, days, cover_days):
+        self.store = store
+        if branches is None:
+            branches = store.find(Branch, Eq(Branch.is_active, True))
+        self.branch_ids = set(branch.id for branch in branches)
+        self.days = days
+        self.cover_days = cover_days
+        self.now = localnow()
+
+    def run(self):
+        if not self.branch_ids:
+            return []
+
+        storables = self._get_storables()
+        limits = self._get_limits()
+        stock = self._get_stock()
+        sales = self._get_sales()
+        to_receive = self._get_to_receive()
+        suppliers = self._get_suppliers()
+
+        keys = set(stock) | set(sales) | set(to_receive) | set(limits)
+        for storable_id, (minimum, maximum, cost, fraction) in storables.items():
+            if minimum or maximum:
+                keys.update((storable_id, branch_id)
+                            for branch_id in self.branch_ids)
+
+        suggestions = []
+        values = collections.defaultdict(list)
+        for storable_id, branch_id in keys:
+            if storable_id not in storables:
+                continue
+            minimum, maximum, cost, fraction = storables[storable_id]
+            minimum, maximum = limits.get((storable_id, branch_id),
+                                          (minimum, maximum))
+            supplier_id, lead_time, minimum_purchase = suppliers.get(
+                (storable_id, branch_id), (None, 0, 0))
+            sold = sales.get((storable_id, branch_id), Decimal(0))
+            values[branch_id].append((sold * (cost or 0), storable_id))
+            suggestions.append(self._suggest(
+                storable_id, branch_id, supplier_id, sold,
+                stock.get((storable_id, branch_id), Decimal(0)),
+                to_receive.get((storable_id, branch_id), Decimal(0)),
+                lead_time, minimum or 0, maximum or 0, minimum_purchase or 0,
+                fraction))
+
+        abc_classes = self._classify(values)
+        return [suggestion._replace(
+            abc_class=abc_classes[suggestion.storable_id, suggestion.branch_id])
+            for suggestion in suggestions]
+
+    #
+    #  Private
+    #
+
+    def _suggest(self, storable_id, branch_id, supplier_id, sold, stock,
+                 to_receive, lead_time, minimum, maximum, minimum_purchase,
+                 fraction):
+        daily_sales = (sold / self.days).quantize(_QUANTITY)
+        if daily_sales > 0:
+            days_of_cover = (max(stock, 0) / daily_sales).quantize(_DAYS)
+        else:
+            days_of_cover = None
+
+        reorder_point = max(Decimal(minimum), daily_sales * lead_time)
+        target = max(Decimal(maximum),
+                     reorder_point + daily_sales * self.cover_days)
+        available = stock + to_receive
+        if available <= reorder_point and available < target:
+            suggested = max(target - available, Decimal(minimum_purchase))
+            # What is not sold by fractions is also purchased by units
+            if not fraction:
+                suggested = suggested.to_integral_value(ROUND_CEILING)
+        else:
+            suggested = Decimal(0)
+
+        return ReorderSuggestion(
+            storable_id, branch_id, supplier_id, self.now, self.days, sold,
+            daily_sales, stock, to_receive, lead_time, days_of_cover,
+            ProductReorderSuggestion.CLASS_C,
+            reorder_point.quantize(_QUANTITY), suggested.quantize(_QUANTITY))
+
+    def _classify(self, values):
+        abc_classes = {}
+        for branch_id, branch_values in values.items():
+            total = sum(value for value, storable_id in branch_values)
+            accumulated = Decimal(0)
+            # The best selling storables first. The share of a storable is
+            # the one of the storables before it, so the first one is
+            # always in class A
+            for value, storable_id in sorted(branch_values, reverse=True):
+                abc_class = ProductReorderSuggestion.CLASS_C
+                if value > 0:
+                    share = accumulated / total
+                    for limit, limit_class in ProductReorderSuggestion.abc_limits:
+                        if share < limit:
+                            abc_class = limit_class
+                            break
+                accumulated += value
+                abc_classes[storable_id, branch_id] = abc_class
+        return abc_classes
+
+    def _group(self, results):
+        # (storable id, branch id) -> value
+        return dict(((storable_id, branch_id), value)
+                    for storable_id, branch_id, value in results)
+
+    def _get_storables(self):
+        tables = [Storable,
+                  Join(Sellable, Sellable.id == Storable.id),
+                  LeftJoin(SellableUnit, SellableUnit.id == Sellable.unit_id)]
+        results = self.store.using(*tables).find(
+            (Storable.id, Storable.minimum_quantity, Storable.maximum_quantity,
+             Sellable.cost, SellableUnit.allow_fraction),
+            Ne(Sellable.status, Sellable.STATUS_CLOSED))
+        return dict((storable_id, (minimum, maximum, cost, bool(fraction)))
+                    for storable_id, minimum, maximum, cost, fraction in results)
+
+    def _get_limits(self):
+        results = self.store.find(
+            (StorableBranchOverride.storable_id,
+             StorableBranchOverride.branch_id,
+             StorableBranchOverride.minimum_quantity,
+             StorableBranchOverride.maximum_quantity),
+            StorableBranchOverride.branch_id.is_in(self.branch_ids))
+        # An override without a limit keeps the one of the storable
+        limits = {}
+        for storable_id, branch_id, minimum, maximum in results:
+            if minimum is not None or maximum is not None:
+                limits[storable_id, branch_id] = (minimum, maximum)
+        return limits
+
+    def _get_stock(self):
+        return self._group(self.store.find(
+            (ProductStockSummary.storable_id, ProductStockSummary.branch_id,
+             ProductStockSummary.quantity),
+            ProductStockSummary.branch_id.is_in(self.branch_ids)))
+
+    def _get_sales(self):
+        since = self.now - datetime.timedelta(days=self.days)
+        results = self.store.find(
+            (ProductHistory.sellable_id, ProductHistory.branch_id,
+             Sum(ProductHistory.quantity_sold)),
+            And(ProductHistory.branch_id.is_in(self.branch_ids),
+                ProductHistory.sold_date >= since,
+                Ne(ProductHistory.quantity_sold, None)))
+        return self._group(results.group_by(ProductHistory.sellable_id,
+                                            ProductHistory.branch_id))
+
+    def _get_to_receive(self):
+        pending = PurchaseItem.quantity - PurchaseItem.quantity_received
+        tables = [PurchaseItem,
+                  Join(PurchaseOrder, PurchaseOrder.id == PurchaseItem.order_id)]
+        results = self.store.using(*tables).find(
+            (PurchaseItem.sellable_id, PurchaseOrder.branch_id, Sum(pending)),
+            And(PurchaseOrder.status == PurchaseOrder.ORDER_CONFIRMED,
+                PurchaseOrder.branch_id.is_in(self.branch_ids),
+                pending > 0))
+        return self._group(results.group_by(PurchaseItem.sellable_id,
+                                            PurchaseOrder.branch_id))
+
+    def _get_suppliers(self):
+        results = self.store.find(
+            (ProductSupplierInfo.product_id, ProductSupplierInfo.branch_id,
+             ProductSupplierInfo.supplier_id, ProductSupplierInfo.lead_time,
+             ProductSupplierInfo.minimum_purchase),
+            Eq(ProductSupplierInfo.is_main_supplier, True))
+        # A main supplier for a branch replaces the one for all of them
+        suppliers = {}
+        specific = set()
+        for (product_id, branch_id, supplier_id, lead_time,
+             minimum_purchase) in results:
+            info = (supplier_id, lead_time or 0, minimum_purchase)
+            if branch_id is not None:
+                if branch_id in self.branch_ids:
+                    suppliers[product_id, branch_id] = info
+                    specific.add((product_id, branch_id))
+                continue
+            for branch_id in self.branch_ids:
+                if (product_id, branch_id) not in specific:
+                    suppliers[product_id, branch_id] = info
+        return suppliers
+
+
+class SuggestedPurchaseView(Viewable):
+    """The |storables| that should be purchased, according to their
+    :class:`ProductReorderSuggestion`
+    """
+
+    Person_Branch = ClassAlias(Person, 'person_branch')
+    Person_Supplier = ClassAlias(Person, 'person_supplier')
+
+    suggestion = ProductReorderSuggestion
+    product = Product
+
+    id = ProductReorderSuggestion.id
+    branch_id = ProductReorderSuggestion.branch_id
+    supplier_id = ProductReorderSuggestion.supplier_id
+    calculated_date = ProductReorderSuggestion.calculated_date
+    quantity_sold = ProductReorderSuggestion.quantity_sold
+    daily_sales = ProductReorderSuggestion.daily_sales
+    stock = ProductReorderSuggestion.stock
+    to_receive = ProductReorderSuggestion.to_receive
+    lead_time = ProductReorderSuggestion.lead_time
+    days_of_cover = ProductReorderSuggestion.days_of_cover
+    abc_class = ProductReorderSuggestion.abc_class
+    reorder_point = ProductReorderSuggestion.reorder_point
+    suggested_quantity = ProductReorderSuggestion.suggested_quantity
+
+    code = Sellable.code
+    description = Sellable.description
+    cost = Sellable.cost
+    category_description = SellableCategory.description
+    unit = SellableUnit.description
+    minimum_quantity = Storable.minimum_quantity
+    maximum_quantity = Storable.maximum_quantity
+    branch_name = Coalesce(NullIf(Company.fancy_name, u''), Person_Branch.name)
+    supplier_name = Person_Supplier.name
+    total = ProductReorderSuggestion.suggested_quantity * Sellable.cost
+
+    tables = [
+        ProductReorderSuggestion,
+        Join(Storable, Storable.id == ProductReorderSuggestion.storable_id),
+        Join(Product, Product.id == Storable.id),
+        Join(Sellable, Sellable.id == Product.id),
+        LeftJoin(SellableCategory,
+                 SellableCategory.id == Sellable.category_id),
+        LeftJoin(SellableUnit, SellableUnit.id == Sellable.unit_id),
+        Join(Branch, Branch.id == ProductReorderSuggestion.branch_id),
+        Join(Person_Branch, Person_Branch.id == Branch.person_id),
+        Join(Company, Company.person_id == Person_Branch.id),
+        LeftJoin(Supplier,
+                 Supplier.id == ProductReorderSuggestion.supplier_id),
+        LeftJoin(Person_Supplier, Person_Supplier.id == Supplier.person_id),
+    ]
+
+    clause = ProductReorderSuggestion.suggested_quantity > 0
+
+
+@register_job_handler(u'reorder-suggestions')
+def _rebuild_reorder_suggestions(store, branch_ids=None, days=None,
+                                 cover_days=None):
+    branches = None
+    if branch_ids is not None:
+        branches = [store.get(Branch, branch_id) for branch_id in branch_ids]
+    ProductReorderSuggestion.rebuild(store, branches=branches, days=days,
+                                     cover_days=cover_days)
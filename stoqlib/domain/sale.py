@@ -36,7 +36,7 @@ from kiwi.python import Settable
 from stoqdrivers.enum import TaxType
 from storm.expr import (And, Avg, Count, LeftJoin, Join, Max, In,
                         Or, Sum, Alias, Select, Cast, Eq, Coalesce, Ne)
-from storm.info import ClassAlias
+from storm.info import ClassAlias, get_obj_info
 from storm.references import Reference, ReferenceSet
 from zope.interface import implementer
 
@@ -47,6 +47,7 @@ from stoqlib.database.properties import (UnicodeCol, DateTimeCol, IntCol,
                                          IdCol, BoolCol, EnumCol)
 from stoqlib.database.viewable import Viewable
 from stoqlib.domain.address import Address, CityLocation
+from stoqlib.domain.backgroundjob import BackgroundJob, register_job_handler
 from stoqlib.domain.base import Domain, IdentifiableDomain
 from stoqlib.domain.costcenter import CostCenter
 from stoqlib.domain.event import Event
@@ -66,13 +67,15 @@ from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.person import (Person, Client, Branch, LoginUser,
                                    SalesPerson, Company, Individual,
                                    ClientCategory)
-from stoqlib.domain.product import (Product, ProductHistory, Storable,
-                                    StockTransactionHistory, StorableBatch)
+from stoqlib.domain.product import (Product, ProductHistory, ProductStockItem,
+                                    Storable, StockTransactionHistory,
+                                    StorableBatch)
 from stoqlib.domain.returnedsale import ReturnedSale, ReturnedSaleItem
 from stoqlib.domain.sellable import Sellable, SellableCategory
 from stoqlib.domain.service import Service
 from stoqlib.domain.station import BranchStation
-from stoqlib.domain.taxes import check_tax_info_presence, InvoiceItemIpi
+from stoqlib.domain.taxes import (check_tax_info_presence, InvoiceItemIpi,
+                                  InvoiceTaxCalculator)
 from stoqlib.exceptions import SellError, StockError, DatabaseInconsistency
 from stoqlib.lib.dateutils import localnow
 from stoqlib.lib.defaults import quantize, DECIMAL_PRECISION
@@ -86,6 +89,67 @@ _ = stoqlib_gettext
 # pyflakes: Reference requires that CostCenter is imported at least once
 CostCenter  # pylint: disable=W0104
 
+
+class _SaleItemsTotals(object):
+    """The subtotal and quantity of the items of a new |sale|
+
+    The totals are updated incrementally as the items are added, removed or
+    changed, so they don't need to be summed again every time they are used.
+    The values each item contributed with are kept, so they can be
+    subtracted when it changes.
+
+    They are only kept for a sale created in the current transaction,
+    whose items can't be changed by another store or process.
+    """
+
+    def __init__(self):
+        self.subtotal = Decimal(0)
+        self.quantity = Decimal(0)
+        # id(item) -> (item, total, quantity). The item is kept here so
+        # its id is not reused while the totals are alive
+        self._items = {}
+        # id(item) -> the ipi tax object whose changes are listened to
+        self._ipis = {}
+
+    def add(self, item):
+        ipi = item.ipi_info
+        if ipi is not None and self._ipis.get(id(item)) is not ipi:
+            # The ipi value is part of the total, but it's changed on the
+            # tax object, not on the item
+            self._ipis[id(item)] = ipi
+            get_obj_info(ipi).event.hook('changed', self._on_ipi_changed,
+                                         item)
+        self.remove(item)
+        # The item may be in the middle of its creation
+        if item.price is None or item.quantity is None:
+            total = quantity = Decimal(0)
+        else:
+            total = item.get_total()
+            quantity = item.quantity
+        self._items[id(item)] = (item, total, quantity)
+        self.subtotal += total
+        self.quantity += quantity
+
+    def remove(self, item):
+        values = self._items.pop(id(item), None)
+        if values is not None:
+            self.subtotal -= values[1]
+            self.quantity -= values[2]
+
+    def _on_ipi_changed(self, obj_info, variable, old_value, value, from_db,
+                        item):
+        # Returning False removes the hook
+        if id(item) not in self._items:
+            # The item was removed from the sale
+            self._ipis.pop(id(item), None)
+            return False
+        if self._ipis.get(id(item)) is not obj_info.get_obj():
+            # The item has another ipi tax object now
+            return False
+        if variable.column.name == 'v_ipi':
+            self.add(item)
+
+
 #
 # Base Domain Classes
 #
@@ -213,6 +277,8 @@ class SaleItem(Domain):
             self.icms_info.set_item_tax(self)
         self.pis_info.set_item_tax(self)
         self.cofins_info.set_item_tax(self)
+        # The ipi value is part of the total
+        self._update_sale_totals(self.sale)
 
     #
     #  Properties
@@ -263,6 +329,22 @@ class SaleItem(Domain):
         percentage = diff / self.sale.get_sale_subtotal()
         return currency(self.price * (1 - percentage))
 
+    #
+    #  Domain hooks
+    #
+
+    def on_delete(self):
+        self._update_sale_totals(self.sale, remove=True)
+
+    def on_object_changed(self, attr, old_value, value):
+        if attr == 'sale_id':
+            if old_value is not None:
+                self._update_sale_totals(self.store.get(Sale, old_value),
+                                         remove=True)
+            self._update_sale_totals(self.sale)
+        elif attr in ['price', 'quantity']:
+            self._update_sale_totals(self.sale)
+
     #
     # Invoice implementation
     #
@@ -314,7 +396,13 @@ class SaleItem(Domain):
     #  Public API
     #
 
-    def sell(self, user: LoginUser):
+    def sell(self, user: LoginUser, update_taxes=True):
+        """Sell this item, decreasing it from the stock
+
+        :param update_taxes: if the taxes of the item should be updated.
+            Pass ``False`` when they will be updated for all the items
+            at once with :class:`stoqlib.domain.taxes.InvoiceTaxCalculator`
+        """
         if not self.sellable.is_available():
             raise SellError(_(u"%s is not available for sale. Try making it "
                               u"available first and then try again.") % (
@@ -338,7 +426,8 @@ class SaleItem(Domain):
 
             self.average_cost = item.stock_cost
         self.quantity_decreased += quantity_to_decrease
-        self.update_tax_values()
+        if update_taxes:
+            self.update_tax_values()
 
     def cancel(self, user: LoginUser):
         # This is emitted here instead of inside the if bellow because one can
@@ -507,6 +596,7 @@ class SaleItem(Domain):
             self.pis_info.update_values(self)
         if self.cofins_info:
             self.cofins_info.update_values(self)
+        self._update_sale_totals(self.sale)
 
     def has_children(self):
         return self.children_items.count() > 0
@@ -522,6 +612,21 @@ class SaleItem(Domain):
                 return component
         return None
 
+    #
+    #  Private
+    #
+
+    def _update_sale_totals(self, sale, remove=False):
+        # Only the new sales keep their totals. The others sum them
+        # every time
+        totals = sale and sale._items_totals
+        if totals is None:
+            return
+        if remove:
+            totals.remove(self)
+        else:
+            totals.add(self)
+
 
 @implementer(IContainer)
 class Delivery(Domain):
@@ -1045,7 +1150,13 @@ class Sale(IdentifiableDomain):
     #: |loginuser| that cancelled the sale
     cancel_responsible = Reference(cancel_responsible_id, 'LoginUser.id')
 
+    #: The subtotal and quantity of the items, only kept while the sale is
+    #: new, see :class:`_SaleItemsTotals`
+    _items_totals = None
+
     def __init__(self, store, branch: Branch, **kw):
+        # A new sale has no items yet, so there's nothing to sum
+        self._items_totals = _SaleItemsTotals()
         kw['invoice'] = Invoice(store=store, invoice_type=Invoice.TYPE_OUT, branch=branch)
         super(Sale, self).__init__(store=store, branch=branch, **kw)
         # Branch needs to be set before cfop, which triggers an
@@ -1054,6 +1165,12 @@ class Sale(IdentifiableDomain):
         if not 'cfop' in kw:
             self.cfop = sysparam.get_object(store, 'DEFAULT_SALES_CFOP')
 
+    def __storm_invalidated__(self):
+        # The transaction was committed or rolled back. From now on, the
+        # items may be changed by someone else, so the totals are summed
+        # every time they are needed
+        self._items_totals = None
+
     #
     # Classmethods
     #
@@ -1283,11 +1400,16 @@ class Sale(IdentifiableDomain):
         assert self.can_confirm()
         assert self.branch
 
-        for item in self.get_items():
+        items = list(self.get_items())
+        # Storable ids are the same as their sellable ids
+        ProductStockItem.lock_for_update(
+            self.store, self.branch, [item.sellable_id for item in items])
+        for item in items:
             self.validate_batch(item.batch, sellable=item.sellable)
             if item.sellable.product:
                 ProductHistory.add_sold_item(self.store, self.branch, item)
-            item.sell(user)
+            item.sell(user, update_taxes=False)
+        self.update_items_tax_values(items)
 
         self.total_amount = self.get_total_sale_amount()
 
@@ -1298,9 +1420,13 @@ class Sale(IdentifiableDomain):
         # Save operation_nature and branch in Invoice table.
         self.invoice.branch = self.branch
 
+        use_jobs = sysparam.get_bool('SALE_CONFIRM_BACKGROUND_JOBS')
         if self._create_commission_at_confirm():
-            for payment in self.payments:
-                self.create_commission(payment)
+            if use_jobs:
+                BackgroundJob.enqueue(self.store, u'sale-create-commissions',
+                                      sale_id=self.id)
+            else:
+                self.create_commissions()
 
         if self.client:
             self.group.payer = self.client.person
@@ -1327,21 +1453,29 @@ class Sale(IdentifiableDomain):
 
         # do not log money payments twice
         if not self.only_paid_with_money():
-            if self.client:
-                msg = _(u"Sale {sale_number} to client {client_name} was "
-                        u"confirmed with value {total_value:.2f}.").format(
-                    sale_number=self.identifier,
-                    client_name=self.client.person.name,
-                    total_value=self.get_total_sale_amount())
+            if use_jobs:
+                BackgroundJob.enqueue(self.store, u'sale-log-confirmed',
+                                      sale_id=self.id)
             else:
-                msg = _(u"Sale {sale_number} without a client was "
-                        u"confirmed with value {total_value:.2f}.").format(
-                    sale_number=self.identifier,
-                    total_value=self.get_total_sale_amount())
-            Event.log(self.store, Event.TYPE_SALE, msg)
+                self.log_confirmed()
 
         StockOperationConfirmedEvent.emit(self, old_status)
 
+    def log_confirmed(self):
+        """Log an |event| telling that this sale was confirmed"""
+        if self.client:
+            msg = _(u"Sale {sale_number} to client {client_name} was "
+                    u"confirmed with value {total_value:.2f}.").format(
+                sale_number=self.identifier,
+                client_name=self.client.person.name,
+                total_value=self.get_total_sale_amount())
+        else:
+            msg = _(u"Sale {sale_number} without a client was "
+                    u"confirmed with value {total_value:.2f}.").format(
+                sale_number=self.identifier,
+                total_value=self.get_total_sale_amount())
+        Event.log(self.store, Event.TYPE_SALE, msg)
+
     def set_paid(self):
         """Mark the sale as paid
         Marking a sale as paid means that all the payments have been received.
@@ -1528,6 +1662,21 @@ class Sale(IdentifiableDomain):
                     item.price = max(item.price - diff / item.quantity, Decimal('0.01'))
                     break
 
+    def update_items_tax_values(self, items=None):
+        """Update the taxes of the items of this sale at once
+
+        This is the same as calling :meth:`SaleItem.update_tax_values` on
+        each item, but faster for sales with many items.
+
+        :param items: the |saleitems| to update, all of them if ``None``
+        """
+        if items is None:
+            items = list(self.get_items())
+        InvoiceTaxCalculator(items).update()
+        for item in items:
+            # The ipi value is part of the total
+            item._update_sale_totals(self)
+
     #
     # Accessors
     #
@@ -1559,6 +1708,9 @@ class Sale(IdentifiableDomain):
 
         :returns: subtotal
         """
+        if self._items_totals is not None:
+            return currency(self._items_totals.subtotal)
+
         total = 0
         for sale_item in self.get_items():
             total += sale_item.get_total()
@@ -1592,6 +1744,8 @@ class Sale(IdentifiableDomain):
 
         :returns: number of items
         """
+        if self._items_totals is not None:
+            return self._items_totals.quantity
         return self.get_items().sum(SaleItem.quantity) or Decimal(0)
 
     def get_total_paid(self):
@@ -1893,6 +2047,14 @@ class Sale(IdentifiableDomain):
 
         return commission
 
+    def create_commissions(self):
+        """Creates the commissions for all the |payments| of this sale
+
+        See :meth:`.create_commission`
+        """
+        for payment in self.payments:
+            self.create_commission(payment)
+
     def get_first_sale_comment(self):
         first_comment = self.comments.first()
         if first_comment:
@@ -3002,3 +3164,13 @@ class SoldItemsBySalesperson(Viewable):
                  Sale.status != Sale.STATUS_CANCELLED)
     group_by = [id, branch_name, code, description, category, batch_number,
                 salesperson_name, brand]
+
+
+@register_job_handler(u'sale-create-commissions')
+def _create_sale_commissions(store, sale_id):
+    store.get(Sale, sale_id).create_commissions()
+
+
+@register_job_handler(u'sale-log-confirmed')
+def _log_sale_confirmed(store, sale_id):
+    store.get(Sale, sale_id).log_confirmed()
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+"""Scale data generator
+
+:mod:`stoqlib.domain.exampledata` creates objects one at a time, which is
+what unit tests need. This module creates production-like volumes instead:
+branches, sellables with their stock, years of sales and payments and the
+financial transactions associated with them.
+
+The few "root" objects (branches, stations, categories and accounts) are
+created through the ORM, everything else is inserted in bulk using the
+columns of the domain classes, so the resulting database is exactly the
+one the domain layer expects. The triggers on ``stock_transaction_history``
+still run, keeping ``product_stock_item`` consistent.
+
+The data is reproducible: the same ``seed`` and options will always
+generate the same objects, with the same ids.
+"""
+
+import array
+import datetime
+import logging
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from stoqlib.database.bulk import bulk_insert
+from stoqlib.lib.dateutils import localdatetime, localtoday
+from stoqlib.lib.defaults import quantize
+from stoqlib.lib.parameters import sysparam
+
+log = logging.getLogger(__name__)
+
+
+def ean13_checksum(code):
+    """Calculate the check digit for the first 12 digits of an EAN-13
+
+    :param code: a string containing 12 digits
+    :returns: the check digit, as a string
+    """
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(code))
+    return str((10 - total % 10) % 10)
+
+
+class ScaleDataCreator(object):
+    """Creates a large, realistic dataset
+
+    :param store: the store where the data will be created
+    :param user: the |loginuser| responsible for the stock transactions
+    :param seed: the seed for the random generator
+    :param branches: how many |branches| to create
+    :param sellables: how many |sellables| (all of them storables) to create
+    :param days: for how many days sales and transactions should be created
+    :param sales_per_day: how many |sales| each branch does per day
+    :param max_items_per_sale: the maximum number of items of a |sale|
+    :param start_date: the date of the first sale. Defaults to *days*
+        before today
+    :param chunk_size: how many rows are inserted at once
+    """
+
+    def __init__(self, store, user, seed=0, branches=3, sellables=1000000,
+                 days=730, sales_per_day=200, max_items_per_sale=20,
+                 start_date=None, chunk_size=1000):
+        self.store = store
+        self.user = user
+        self.seed = seed
+        self.n_branches = branches
+        self.n_sellables = sellables
+        self.days = days
+        self.sales_per_day = sales_per_day
+        self.max_items_per_sale = max_items_per_sale
+        self.start_date = start_date or (localtoday().date() -
+                                         datetime.timedelta(days=days))
+        self.chunk_size = chunk_size
+
+        self.branches = []
+        self.stations = []
+        self.categories = []
+        self.timings = []
+
+        # The random generators are split by domain, so that changing the
+        # number of sales does not change the sellables that are generated,
+        # for instance.
+        self._sellables_random = random.Random('%s-sellables' % seed)
+        self._sales_random = random.Random('%s-sales' % seed)
+        self._accounts_random = random.Random('%s-accounts' % seed)
+
+        # Prices and costs of the sellables, indexed by their position
+        self._sellable_ids = []
+        self._costs = array.array('d')
+        self._prices = array.array('d')
+        # Remaining stock, indexed by branch * n_sellables + position
+        self._stock = array.array('l')
+
+    #
+    #  Public API
+    #
+
+    def create(self):
+        """Create the whole dataset
+
+        :returns: a list of (step name, seconds spent) tuples
+        """
+        self._run_step('branches', self.create_branches)
+        self._run_step('categories', self.create_categories)
+        self._run_step('sellables', self.create_sellables)
+        self._run_step('stock', self.create_stock)
+        self._run_step('sales', self.create_sales)
+        self._run_step('accounts', self.create_account_transactions)
+        return self.timings
+
+    def create_branches(self):
+        from stoqlib.domain.address import Address, CityLocation
+        from stoqlib.domain.person import Branch, Company, Person
+        from stoqlib.domain.station import BranchStation
+
+        location = CityLocation.get_default(self.store)
+        for i in range(self.n_branches):
+            name = u'Scale branch %02d' % (i + 1, )
+            person = Person(store=self.store, name=name)
+            Company(store=self.store, person=person,
+                    fancy_name=name + u' shop')
+            Address(store=self.store, person=person, is_main_address=True,
+                    city_location=location, street=u'Main street',
+                    streetnumber=i + 1)
+            branch = Branch(store=self.store, person=person,
+                            acronym=u'SC%02d' % (i + 1, ))
+            self.user.add_access_to(branch)
+            station = BranchStation(store=self.store, branch=branch,
+                                    name=u'scale-station-%02d' % (i + 1, ),
+                                    is_active=True)
+            self.branches.append(branch)
+            self.stations.append(station)
+        self.store.flush()
+
+    def create_categories(self):
+        from stoqlib.domain.sellable import SellableCategory
+
+        for i in range(10):
+            parent = SellableCategory(store=self.store,
+                                      description=u'Scale category %d' % i)
+            self.categories.append(parent)
+            for j in range(10):
+                self.categories.append(SellableCategory(
+                    store=self.store, category=parent,
+                    description=u'Scale category %d.%d' % (i, j)))
+        self.store.flush()
+
+    def create_sellables(self):
+        from stoqdrivers.enum import TaxType
+        from stoqlib.domain.sellable import Sellable, SellableTaxConstant
+
+        tax_constant = SellableTaxConstant.get_by_type(TaxType.NONE,
+                                                       self.store)
+        tax_constant_id = tax_constant and str(tax_constant.id)
+
+        sellables = []
+        products = []
+        storables = []
+        for i, row in enumerate(self.iter_sellables()):
+            sellable_id, code, barcode, description, cost, price = row
+            category = self._sellables_random.choice(self.categories)
+            sellables.append((sellable_id, code, barcode, description,
+                              Sellable.STATUS_AVAILABLE, cost, price,
+                              str(category.id), tax_constant_id))
+            products.append((sellable_id, u'%08d' % (i % 10 ** 8)))
+            storables.append((sellable_id, ))
+            if len(sellables) >= self.chunk_size:
+                self._insert_sellables(sellables, products, storables)
+                sellables, products, storables = [], [], []
+        self._insert_sellables(sellables, products, storables)
+
+    def create_stock(self):
+        from stoqlib.domain.product import StockTransactionHistory
+
+        date = localdatetime(self.start_date.year, self.start_date.month,
+                             self.start_date.day)
+        user_id = str(self.user.id)
+        columns = (StockTransactionHistory.date,
+                   StockTransactionHistory.quantity,
+                   StockTransactionHistory.unit_cost,
+                   StockTransactionHistory.type,
+                   StockTransactionHistory.responsible_id,
+                   StockTransactionHistory.storable_id,
+                   StockTransactionHistory.branch_id)
+
+        def rows():
+            for branch in self.branches:
+                branch_id = str(branch.id)
+                for i, sellable_id in enumerate(self._sellable_ids):
+                    quantity = self._sellables_random.randint(10, 1000)
+                    self._stock.append(quantity)
+                    yield (date, Decimal(quantity),
+                           self._to_decimal(self._costs[i], 8),
+                           StockTransactionHistory.TYPE_INITIAL,
+                           user_id, sellable_id, branch_id)
+
+        bulk_insert(self.store, columns, rows(), self.chunk_size)
+
+    def create_sales(self):
+        from stoqlib.domain.fiscal import Invoice
+        from stoqlib.domain.payment.group import PaymentGroup
+        from stoqlib.domain.payment.method import PaymentMethod
+        from stoqlib.domain.payment.payment import Payment
+        from stoqlib.domain.product import (ProductHistory,
+                                            StockTransactionHistory)
+        from stoqlib.domain.sale import Sale, SaleItem
+
+        method_id = str(PaymentMethod.get_by_name(self.store, u'money').id)
+        cfop = sysparam.get_object(self.store, 'DEFAULT_SALES_CFOP')
+        cfop_id = cfop and str(cfop.id)
+        user_id = str(self.user.id)
+
+        tables = [
+            ((Invoice.id, Invoice.invoice_type, Invoice.branch_id), []),
+            ((PaymentGroup.id, ), []),
+            ((Sale.id, Sale.status, Sale.open_date, Sale.confirm_date,
+              Sale.close_date, Sale.discount_value, Sale.surcharge_value,
+              Sale.total_amount, Sale.paid, Sale.branch_id, Sale.station_id,
+              Sale.group_id, Sale.invoice_id, Sale.cfop_id), []),
+            ((SaleItem.id, SaleItem.quantity, SaleItem.quantity_decreased,
+              SaleItem.base_price, SaleItem.price, SaleItem.average_cost,
+              SaleItem.sale_id, SaleItem.sellable_id, SaleItem.cfop_id), []),
+            ((Payment.id, Payment.payment_type, Payment.status,
+              Payment.open_date, Payment.due_date, Payment.paid_date,
+              Payment.base_value, Payment.value, Payment.paid_value,
+              Payment.description, Payment.method_id, Payment.group_id,
+              Payment.branch_id, Payment.station_id), []),
+            ((StockTransactionHistory.date, StockTransactionHistory.quantity,
+              StockTransactionHistory.unit_cost, StockTransactionHistory.type,
+              StockTransactionHistory.object_id,
+              StockTransactionHistory.responsible_id,
+              StockTransactionHistory.storable_id,
+              StockTransactionHistory.branch_id), []),
+            ((ProductHistory.quantity_sold, ProductHistory.sold_date,
+              ProductHistory.branch_id, ProductHistory.sellable_id), []),
+        ]
+        (invoices, groups, sales, items,
+         payments, transactions, history) = [rows for c, rows in tables]
+
+        def flush():
+            # The order of the tables respects the foreign keys
+            for columns, rows in tables:
+                bulk_insert(self.store, columns, rows, self.chunk_size)
+                del rows[:]
+
+        rand = self._sales_random
+        for day in range(self.days):
+            date = self.start_date + datetime.timedelta(days=day)
+            for branch_index, branch in enumerate(self.branches):
+                branch_id = str(branch.id)
+                station_id = str(self.stations[branch_index].id)
+                offset = branch_index * self.n_sellables
+                for i in range(self.sales_per_day):
+                    sale_date = localdatetime(
+                        date.year, date.month, date.day,
+                        8 + i * 12 // self.sales_per_day,
+                        rand.randint(0, 59), rand.randint(0, 59))
+                    sale_id = self._new_id(rand)
+                    invoice_id = self._new_id(rand)
+                    group_id = self._new_id(rand)
+
+                    total = Decimal(0)
+                    n_items = rand.randint(1, self.max_items_per_sale)
+                    for position in self._pick_sellables(rand, n_items):
+                        quantity = rand.randint(1, 3)
+                        if self._stock[offset + position] < quantity:
+                            continue
+                        self._stock[offset + position] -= quantity
+
+                        item_id = self._new_id(rand)
+                        sellable_id = self._sellable_ids[position]
+                        price = self._to_decimal(self._prices[position], 2)
+                        cost = self._to_decimal(self._costs[position], 8)
+                        total += price * quantity
+                        items.append((item_id, quantity, quantity, price,
+                                      price, cost, sale_id, sellable_id,
+                                      cfop_id))
+                        transactions.append((
+                            sale_date, -quantity, cost,
+                            StockTransactionHistory.TYPE_SELL, item_id,
+                            user_id, sellable_id, branch_id))
+                        history.append((quantity, sale_date, branch_id,
+                                        sellable_id))
+
+                    invoices.append((invoice_id, Invoice.TYPE_OUT, branch_id))
+                    groups.append((group_id, ))
+                    sales.append((sale_id, Sale.STATUS_CONFIRMED, sale_date,
+                                  sale_date, sale_date, 0, 0, total, True,
+                                  branch_id, station_id, group_id,
+                                  invoice_id, cfop_id))
+                    if total:
+                        payments.append((
+                            self._new_id(rand), Payment.TYPE_IN,
+                            Payment.STATUS_PAID, sale_date, sale_date,
+                            sale_date, total, total, total,
+                            u'1/1 Money for sale', method_id, group_id,
+                            branch_id, station_id))
+
+                    if len(items) >= self.chunk_size:
+                        flush()
+        flush()
+
+    def create_account_transactions(self):
+        from stoqlib.domain.account import Account, AccountTransaction
+        from stoqlib.domain.payment.payment import Payment
+
+        tills = sysparam.get_object(self.store, 'TILLS_ACCOUNT')
+        sales = sysparam.get_object(self.store, 'SALES_ACCOUNT')
+        expenses = Account(store=self.store, description=u'Scale expenses',
+                           account_type=Account.TYPE_EXPENSE)
+        self.store.flush()
+
+        columns = (AccountTransaction.id, AccountTransaction.description,
+                   AccountTransaction.code,
+                   AccountTransaction.operation_type,
+                   AccountTransaction.value,
+                   AccountTransaction.source_account_id,
+                   AccountTransaction.account_id,
+                   AccountTransaction.date,
+                   AccountTransaction.payment_id)
+
+        # One transaction for each paid sale payment, like
+        # PaymentGroup.pay_method_payments does
+        branch_ids = [b.id for b in self.branches]
+        payments = self.store.find(
+            (Payment.id, Payment.identifier, Payment.value, Payment.paid_date),
+            Payment.branch_id.is_in(branch_ids)).order_by(Payment.paid_date,
+                                                          Payment.identifier)
+
+        def rows():
+            rand = self._accounts_random
+            for payment_id, identifier, value, paid_date in payments:
+                yield (self._new_id(rand), u'Payment %d' % identifier,
+                       str(identifier), AccountTransaction.TYPE_IN, value,
+                       str(sales.id), str(tills.id), paid_date,
+                       str(payment_id))
+            for day in range(self.days):
+                date = self.start_date + datetime.timedelta(days=day)
+                for i in range(rand.randint(0, 5)):
+                    value = self._to_decimal(rand.uniform(10, 5000), 2)
+                    yield (self._new_id(rand), u'Expense %d' % (i + 1, ),
+                           None, AccountTransaction.TYPE_OUT, value,
+                           str(tills.id), str(expenses.id),
+                           localdatetime(date.year, date.month, date.day),
+                           None)
+
+        bulk_insert(self.store, columns, rows(), self.chunk_size)
+
+    def iter_sellables(self):
+        """Generates the data of the sellables
+
+        This also fills the internal arrays of costs and prices that are
+        used when generating the sales.
+
+        :returns: an iterator of (id, code, barcode, description, cost,
+            price) tuples
+        """
+        rand = self._sellables_random
+        for i in range(self.n_sellables):
+            sellable_id = self._new_id(rand)
+            code = u'%07d' % (i + 1, )
+            barcode = u'789%09d' % (i + 1, )
+            barcode += ean13_checksum(barcode)
+            cost = round(rand.uniform(1, 500), 2)
+            price = round(cost * rand.uniform(1.1, 2.5), 2)
+
+            self._sellable_ids.append(sellable_id)
+            self._costs.append(cost)
+            self._prices.append(price)
+
+            yield (sellable_id, code, barcode,
+                   u'Scale product %d' % (i + 1, ),
+                   self._to_decimal(cost, 8), self._to_decimal(price, 2))
+
+    #
+    #  Private
+    #
+
+    def _run_step(self, name, func):
+        log.info('Creating scale data: %s', name)
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        self.timings.append((name, elapsed))
+        log.info('Created scale data: %s (%.2fs)', name, elapsed)
+
+    def _insert_sellables(self, sellables, products, storables):
+        from stoqlib.domain.product import Product, Storable
+        from stoqlib.domain.sellable import Sellable
+
+        bulk_insert(self.store,
+                    (Sellable.id, Sellable.code, Sellable.barcode,
+                     Sellable.description, Sellable.status, Sellable.cost,
+                     Sellable.base_price, Sellable.category_id,
+                     Sellable.tax_constant_id),
+                    sellables, self.chunk_size)
+        bulk_insert(self.store, (Product.id, Product.ncm),
+                    products, self.chunk_size)
+        bulk_insert(self.store, (Storable.id, ), storables, self.chunk_size)
+
+    def _pick_sellables(self, rand, n_items):
+        # Sales are concentrated on a small part of the catalog (roughly
+        # 80% of the items sold come from 20% of the sellables), like
+        # in a real store
+        hot = max(1, self.n_sellables // 5)
+        for i in range(n_items):
+            if rand.random() < 0.8:
+                yield rand.randrange(hot)
+            else:
+                yield rand.randrange(self.n_sellables)
+
+    def _new_id(self, rand):
+        return str(uuid.UUID(int=rand.getrandbits(128), version=4))
+
+    def _to_decimal(self, value, digits):
+        return quantize(Decimal(repr(value)), precision=digits)
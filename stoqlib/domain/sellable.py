@@ -41,7 +41,9 @@ from decimal import Decimal
 from kiwi.currency import currency
 from stoqdrivers.enum import TaxType, UnitType
 from storm.expr import And, Or, In, Eq
+from storm.info import get_obj_info
 from storm.references import Reference, ReferenceSet
+from storm.store import PENDING_ADD
 from zope.interface import implementer
 
 from stoqlib.database.properties import (BoolCol, DateTimeCol, EnumCol,
@@ -221,13 +223,18 @@ class SellableCategory(Domain):
         """
 
         descriptions = [self.description]
+        descriptions.extend(parent.description for parent in self._get_parents())
+        return u':'.join(reversed(descriptions))
 
-        parent = self.category
-        while parent:
-            descriptions.append(parent.description)
-            parent = parent.category
+    #
+    #  Private
+    #
 
-        return u':'.join(reversed(descriptions))
+    def _get_parents(self):
+        if self.category_id is None:
+            return ()
+        from stoqlib.domain.categorytree import get_category_tree
+        return get_category_tree().get_parents(self.store, self.id)
 
     #
     #  Public API
@@ -245,16 +252,25 @@ class SellableCategory(Domain):
 
         In this example, calling this from A will return ``set([B, C, D, E])``
         """
-        children = set(self.children)
-
-        if not len(children):
-            # Base case for the leafs
+        from stoqlib.domain.categorytree import get_category_tree
+        children_ids = get_category_tree().get_children_ids(self.store, self.id)
+        if not children_ids:
             return set()
 
-        for child in list(children):
-            children |= child.get_children_recursively()
+        return set(self.store.find(SellableCategory,
+                                   SellableCategory.id.is_in(children_ids)))
+
+    def get_subtree_ids(self):
+        """Returns the ids of this category and all its children, recursively
+
+        This should be used to filter the |sellables| of a category,
+        including the ones of its children, with a single ``IN`` predicate.
 
-        return children
+        :returns: a set of ids
+        """
+        from stoqlib.domain.categorytree import get_category_tree
+        tree = get_category_tree()
+        return set(tree.get_children_ids(self.store, self.id)) | set([self.id])
 
     def get_commission(self):
         """Returns the commission for this category.
@@ -262,10 +278,12 @@ class SellableCategory(Domain):
 
         :returns: the commission
         """
-        if self.category:
-            return (self.salesperson_commission or
-                    self.category.get_commission())
-        return self.salesperson_commission
+        commission = self.salesperson_commission
+        for parent in self._get_parents():
+            if commission:
+                break
+            commission = parent.salesperson_commission
+        return commission
 
     def get_markup(self):
         """Returns the markup for this category.
@@ -273,12 +291,13 @@ class SellableCategory(Domain):
 
         :returns: the markup
         """
-        if self.category:
+        markup = self.suggested_markup
+        for parent in self._get_parents():
             # Compare to None as markup can be '0'
-            if self.suggested_markup is not None:
-                return self.suggested_markup
-            return self.category.get_markup()
-        return self.suggested_markup
+            if markup is not None:
+                break
+            markup = parent.suggested_markup
+        return markup
 
     def get_tax_constant(self):
         """Returns the tax constant for this category.
@@ -286,8 +305,12 @@ class SellableCategory(Domain):
 
         :returns: the tax constant
         """
-        if self.category:
-            return self.tax_constant or self.category.get_tax_constant()
+        if self.tax_constant:
+            return self.tax_constant
+        for parent in self._get_parents():
+            if parent.tax_constant_id is not None:
+                return self.store.get(SellableTaxConstant,
+                                      parent.tax_constant_id)
         return self.tax_constant
 
     #
@@ -319,10 +342,34 @@ class SellableCategory(Domain):
     def on_update(self):
         CategoryEditEvent.emit(self)
 
+    def on_delete(self):
+        _invalidate_category_tree(self.store)
+
+    def on_object_changed(self, attr, old_value, value):
+        if attr in ['category_id', 'description', 'suggested_markup',
+                    'salesperson_commission', 'tax_constant_id']:
+            _invalidate_category_tree(self.store)
+
 
 # pylint: enable=E1101
 
 
+def _invalidate_category_tree(store):
+    from stoqlib.domain.categorytree import get_category_tree
+    tree = get_category_tree()
+    tree.clear()
+    tree.clear_on_rollback(store)
+
+
+def _invalidate_prices(store, sellable_id):
+    if sellable_id is None:
+        return
+    from stoqlib.domain.priceresolver import get_price_resolver
+    resolver = get_price_resolver()
+    resolver.invalidate(sellable_id)
+    resolver.clear_on_rollback(store)
+
+
 class ClientCategoryPrice(Domain):
     """A table that stores special prices for |clients| based on their
     |clientcategory|.
@@ -366,6 +413,20 @@ class ClientCategoryPrice(Domain):
         """Removes this client category price from the database."""
         self.store.remove(self)
 
+    #
+    # Domain hooks
+    #
+
+    def on_delete(self):
+        _invalidate_prices(self.store, self.sellable_id)
+
+    def on_object_changed(self, attr, old_value, value):
+        if attr == 'sellable_id':
+            _invalidate_prices(self.store, old_value)
+            _invalidate_prices(self.store, value)
+        elif attr in ['category_id', 'price']:
+            _invalidate_prices(self.store, self.sellable_id)
+
 
 def _validate_code(sellable, attr, code):
     if sellable.check_code_exists(code):
@@ -905,6 +966,13 @@ class Sellable(Domain):
         elif attr == 'base_price':
             self.price_last_updated = localnow()
 
+        # A sellable being created can't have its price cached yet, and
+        # getting its id would flush it
+        if (attr in ['base_price', 'on_sale_price', 'on_sale_start_date',
+                     'on_sale_end_date'] and
+                get_obj_info(self).get('pending') is not PENDING_ADD):
+            _invalidate_prices(self.store, self.id)
+
     #
     # Classmethods
     #
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+"""
+Finding a |sellable| by the text typed or scanned on an entry.
+
+The text can be the barcode or the code of the |sellable|, or the batch
+number of one of its |batches|. Looking that up in the database takes up
+to three queries, one for each attribute, which is too slow for a POS
+where a few items are scanned every second.
+
+:class:`SellableLookupIndex` keeps all those attributes in memory. It is
+meant to be loaded once per station, when the |till| is opened, and is
+kept fresh by listening to the ``new_te``, ``update_te`` and
+``delete_row`` notifications the database sends when a row is inserted,
+updated or deleted, see
+:class:`stoqlib.database.notifications.NotifiedCache`.
+
+The index is only used to avoid the queries: what it finds is checked
+against the |sellable| fetched from the store, and when it finds nothing
+(or is not loaded at all) the database is queried, so the result is
+always the same one the queries would give.
+"""
+
+import collections
+import logging
+
+from storm.expr import And, Lower
+
+from stoqlib.database.bulk import find_in_chunks
+from stoqlib.database.notifications import NotifiedCache
+from stoqlib.domain.product import StorableBatch
+from stoqlib.domain.sellable import Sellable
+
+log = logging.getLogger(__name__)
+
+#: A |sellable| in the index
+SellableLookupEntry = collections.namedtuple(
+    'SellableLookupEntry', ['sellable_id', 'barcode', 'code', 'price',
+                            'status'])
+
+#: A |batch| in the index
+BatchLookupEntry = collections.namedtuple(
+    'BatchLookupEntry', ['batch_id', 'batch_number', 'sellable_id'])
+
+_SELLABLE_COLUMNS = (Sellable.id, Sellable.barcode, Sellable.code,
+                     Sellable.base_price, Sellable.status)
+# The storable id is the same as its sellable's id
+_BATCH_COLUMNS = (StorableBatch.id, StorableBatch.batch_number,
+                  StorableBatch.storable_id)
+
+
+class SellableLookupIndex(NotifiedCache):
+    """An in-memory index of the barcodes, codes and batch numbers
+
+    :param listen: if the index should listen to the database notifications
+        to keep itself updated. Without that, changes made after the index
+        was loaded are only noticed when they cause a lookup to fail
+    """
+
+    tables = (Sellable.__storm_table__, StorableBatch.__storm_table__)
+
+    def __init__(self, listen=True):
+        super(SellableLookupIndex, self).__init__(listen=listen)
+        self.loaded = False
+        self._clear()
+
+    #
+    #  Public API
+    #
+
+    def load(self, store):
+        """Load all the |sellables| and |batches| in the index
+
+        :param store: a store
+        """
+        for count in self.iter_load(store):
+            pass
+
+    def iter_load(self, store, chunk_size=5000):
+        """Load the index a chunk of rows at a time
+
+        Loading a large catalog takes a while, so this lets the caller do
+        something else between the chunks, like handling the events of the
+        interface. The index is only used after all the chunks are loaded,
+        until then :meth:`find` queries the database.
+
+        :param store: a store
+        :param chunk_size: how many rows to load at a time
+        :returns: an iterator of how many rows each chunk loaded
+        """
+        self.clear()
+        # Only the changes made after this are processed, by the first
+        # refresh after the index is loaded
+        self.poll()
+        for rows in find_in_chunks(store, _SELLABLE_COLUMNS,
+                                   chunk_size=chunk_size):
+            self._add_sellables(rows)
+            yield len(rows)
+        for rows in find_in_chunks(store, _BATCH_COLUMNS,
+                                   chunk_size=chunk_size):
+            self._add_batches(rows)
+            yield len(rows)
+        self.loaded = True
+        log.info('Sellable lookup index loaded: %d sellables, %d batches',
+                 len(self._sellables), len(self._batches))
+
+    def refresh(self, store):
+        """Update the index with the changes notified by the database
+
+        This is cheap when nothing has changed, since reading the
+        notifications does not query the database.
+
+        :param store: a store
+        """
+        if not self.loaded:
+            return
+
+        # If the notifications were lost, the index is cleared and the
+        # lookups query the database until it is loaded again
+        changes = self.poll()
+        for sellable_id in changes.deleted.get(Sellable.__storm_table__, ()):
+            self._remove_sellable(sellable_id)
+        for batch_id in changes.deleted.get(StorableBatch.__storm_table__,
+                                            ()):
+            self._remove_batch(batch_id)
+
+        sellable_te_ids = changes.get(Sellable.__storm_table__)
+        if sellable_te_ids:
+            self._add_sellables(store.find(
+                _SELLABLE_COLUMNS, Sellable.te_id.is_in(sellable_te_ids)))
+
+        batch_te_ids = changes.get(StorableBatch.__storm_table__)
+        if batch_te_ids:
+            self._add_batches(store.find(
+                _BATCH_COLUMNS, StorableBatch.te_id.is_in(batch_te_ids)))
+
+    def clear(self):
+        """Forget all the rows, the index needs to be loaded again"""
+        self.loaded = False
+        self._clear()
+
+    def get_entry(self, sellable_id):
+        """Get the entry of a |sellable|
+
+        :param sellable_id: the id of the |sellable|
+        :returns: a :class:`SellableLookupEntry` or ``None`` if the
+            sellable is not in the index
+        """
+        return self._sellables.get(sellable_id)
+
+    def find(self, store, text, viewable=None, query=None):
+        """Find a |sellable| given a barcode, code or batch number
+
+        The barcode is tried first, then the code, since there might be a
+        |sellable| with a code equal to another one's barcode. The
+        comparison is case insensitive.
+
+        By default only available |sellables| are found. When *viewable*
+        is given, the |sellable| needs to be in it instead.
+
+        :param store: a store
+        :param text: the barcode, code or batch number
+        :param viewable: a viewable (or |sellable| subclass) with an id
+            that is the |sellable|'s id
+        :param query: a query to filter *viewable*
+        :returns: a (|sellable|, |batch|) tuple. The batch is ``None``
+            unless *text* was a batch number and both are ``None`` if
+            nothing was found
+        """
+        text = text.lower()
+        if self.loaded:
+            self.refresh(store)
+            result = self._find_in_index(store, text, viewable, query)
+            if result is not None:
+                return result
+
+        return self._find_in_database(store, text, viewable, query)
+
+    #
+    #  Private
+    #
+
+    def _clear(self):
+        self._sellables = {}
+        self._batches = {}
+        self._barcodes = collections.defaultdict(set)
+        self._codes = collections.defaultdict(set)
+        self._batch_numbers = {}
+
+    def _add_sellables(self, rows):
+        for row in rows:
+            self._remove_sellable(row[0])
+            entry = SellableLookupEntry(*row)
+            self._sellables[entry.sellable_id] = entry
+            if entry.barcode:
+                self._barcodes[entry.barcode.lower()].add(entry.sellable_id)
+            if entry.code:
+                self._codes[entry.code.lower()].add(entry.sellable_id)
+
+    def _add_batches(self, rows):
+        for row in rows:
+            self._remove_batch(row[0])
+            entry = BatchLookupEntry(*row)
+            self._batches[entry.batch_id] = entry
+            self._batch_numbers[entry.batch_number.lower()] = entry.batch_id
+
+    def _remove_sellable(self, sellable_id):
+        entry = self._sellables.pop(sellable_id, None)
+        if entry is None:
+            return
+        for key, index in [(entry.barcode, self._barcodes),
+                           (entry.code, self._codes)]:
+            if not key:
+                continue
+            ids = index[key.lower()]
+            ids.discard(sellable_id)
+            if not ids:
+                del index[key.lower()]
+
+    def _remove_batch(self, batch_id):
+        entry = self._batches.pop(batch_id, None)
+        if entry is not None:
+            self._batch_numbers.pop(entry.batch_number.lower(), None)
+
+    def _find_in_index(self, store, text, viewable, query):
+        # Returns None when the database needs to be queried, either
+        # because nothing was found or because the index is outdated
+        for attr, index in [('barcode', self._barcodes),
+                            ('code', self._codes)]:
+            ids = index.get(text)
+            if not ids:
+                continue
+            if viewable is None:
+                ids = [i for i in ids if self._sellables[i].status ==
+                       Sellable.STATUS_AVAILABLE]
+            else:
+                ids = self._filter_viewable(store, ids, viewable, query)
+            if not ids:
+                continue
+            if len(ids) > 1:
+                # Let the database decide what to do with duplicates
+                return None
+
+            sellable = store.get(Sellable, ids[0])
+            value = getattr(sellable, attr) if sellable else None
+            if (not value or value.lower() != text or
+                    (viewable is None and
+                     sellable.status != Sellable.STATUS_AVAILABLE)):
+                return None
+            return sellable, None
+
+        batch_id = self._batch_numbers.get(text)
+        if batch_id is None:
+            return None
+
+        batch = store.get(StorableBatch, batch_id)
+        if batch is None or batch.batch_number.lower() != text:
+            return None
+        sellable = batch.storable.product.sellable
+        if viewable is None:
+            if not sellable.is_available():
+                return None, None
+        elif not self._filter_viewable(store, [sellable.id],
+                                       viewable, query):
+            return None, None
+        return sellable, batch
+
+    def _filter_viewable(self, store, ids, viewable, query):
+        clause = viewable.id.is_in(ids)
+        if query is not None:
+            clause = And(clause, query)
+        return [result.id for result in store.find(viewable, clause)]
+
+    def _find_in_database(self, store, text, viewable, query):
+        if viewable is None:
+            viewable = Sellable
+            query = Sellable.status == Sellable.STATUS_AVAILABLE
+
+        for attr in [viewable.barcode, viewable.code]:
+            clause = Lower(attr) == text
+            if query is not None:
+                clause = And(clause, query)
+            result = store.find(viewable, clause).one()
+            if result:
+                if viewable is not Sellable:
+                    result = result.sellable
+                return result, None
+
+        batch = store.find(StorableBatch,
+                           Lower(StorableBatch.batch_number) == text).one()
+        if batch is None:
+            return None, None
+
+        sellable = batch.storable.product.sellable
+        clause = viewable.id == sellable.id
+        if query is not None:
+            clause = And(clause, query)
+        # Make sure the batch's sellable is also accepted
+        if store.find(viewable, clause).is_empty():
+            return None, None
+        return sellable, batch
+
+
+_index = None
+
+
+def get_sellable_lookup_index():
+    """Get the lookup index of this station
+
+    The index is not loaded until :meth:`SellableLookupIndex.load` is
+    called, usually when the |till| is opened.
+
+    :returns: a :class:`SellableLookupIndex`
+    """
+    global _index
+    if _index is None:
+        _index = SellableLookupIndex()
+    return _index
@@ -595,3 +595,215 @@ class InvoiceItemCofins(BaseCOFINS):
             return invoice_item.average_cost
 
         return 0
+
+
+#
+#   Batch calculation
+#
+
+
+_ICMS_FIELDS = [
+    'cst', 'csosn', 'bc_include_ipi', 'bc_st_include_ipi',
+    'p_red_bc', 'p_icms', 'p_fcp', 'p_red_bc_st', 'p_mva_st', 'p_icms_st',
+    'p_fcp_st', 'p_cred_sn', 'p_st', 'v_bc', 'v_icms', 'v_fcp', 'v_bc_st',
+    'v_icms_st', 'v_fcp_st', 'v_cred_icms_sn', 'v_bc_st_ret',
+    'v_icms_st_ret', 'v_fcp_st_ret']
+_IPI_FIELDS = ['cst', 'calculo', 'p_ipi', 'q_unid', 'v_unid', 'v_bc', 'v_ipi']
+_PIS_FIELDS = ['cst', 'p_pis', 'q_bc_prod', 'v_bc', 'v_pis']
+_COFINS_FIELDS = ['cst', 'p_cofins', 'q_bc_prod', 'v_bc', 'v_cofins']
+# Used as the IPI value of items without IPI information
+_NO_IPI = object()
+
+
+class InvoiceTaxCalculator(object):
+    """Updates the taxes of many invoice items at once
+
+    This does the same as calling ``update_values`` on the ICMS, IPI, PIS
+    and COFINS of each item (in that order), but:
+
+    * the tax objects of all the items are fetched with one query per tax,
+      instead of one query per item and tax
+    * the regime (crt) of the |branch| is looked up once per invoice
+    * the calculations are done on plain values instead of going through
+      the columns of the tax objects for every intermediate result. Only
+      the values that actually changed are written back to the objects, so
+      the store will only update the rows that changed when flushing.
+
+    :param items: the invoice items (e.g. |saleitems|)
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+
+    #
+    #  Public API
+    #
+
+    def update(self):
+        """Calculate and set the taxes of the items"""
+        if not self.items:
+            return
+
+        self._prefetch()
+        crts = {}
+        for item in self.items:
+            parent = item.parent
+            crt = crts.get(id(parent))
+            if crt is None:
+                crt = crts[id(parent)] = parent.branch.crt
+            simples = crt in [1, 2]
+
+            icms = item.icms_info
+            ipi = item.ipi_info
+            # The ICMS is calculated before the IPI is updated, so it uses
+            # the IPI value from before this update
+            v_ipi = ipi.v_ipi if ipi else _NO_IPI
+            if icms:
+                self._update(icms, _ICMS_FIELDS, self._calc_icms,
+                             item, simples, v_ipi)
+            if ipi:
+                self._update(ipi, _IPI_FIELDS, self._calc_ipi, item)
+            for info, rate, value in [(item.pis_info, 'p_pis', 'v_pis'),
+                                      (item.cofins_info, 'p_cofins',
+                                       'v_cofins')]:
+                if not info:
+                    continue
+                fields = _PIS_FIELDS if rate == 'p_pis' else _COFINS_FIELDS
+                self._update(info, fields, self._calc_pis_cofins, item,
+                             simples, rate, value,
+                             info._get_item_cost(item))
+
+    #
+    #  Private
+    #
+
+    def _prefetch(self):
+        store = self.items[0].store
+        for cls, attr in [(InvoiceItemIcms, 'icms_info_id'),
+                          (InvoiceItemIpi, 'ipi_info_id'),
+                          (InvoiceItemPis, 'pis_info_id'),
+                          (InvoiceItemCofins, 'cofins_info_id')]:
+            ids = set(getattr(item, attr) for item in self.items)
+            ids.discard(None)
+            if ids:
+                # This puts them in the store's cache, so the references
+                # of the items don't need to query them one by one
+                list(store.find(cls, cls.id.is_in(ids)))
+
+    def _update(self, info, fields, calc, *args):
+        old = dict((field, getattr(info, field)) for field in fields)
+        values = dict(old)
+        calc(values, *args)
+        for field, value in values.items():
+            if value != old[field]:
+                setattr(info, field, value)
+
+    def _calc_icms_st(self, v, item, v_ipi):
+        v['v_bc_st'] = quantize(item.price * item.quantity)
+        if v['bc_st_include_ipi'] and v_ipi is not _NO_IPI:
+            v['v_bc_st'] += v_ipi
+        if v['p_red_bc_st'] is not None:
+            v['v_bc_st'] -= v['v_bc_st'] * v['p_red_bc_st'] / 100
+        if v['p_mva_st'] is not None:
+            v['v_bc_st'] += v['v_bc_st'] * v['p_mva_st'] / 100
+
+        if v['v_bc_st'] is not None and v['p_icms_st'] is not None:
+            v['v_icms_st'] = v['v_bc_st'] * v['p_icms_st'] / 100
+        if v['v_icms'] is not None and v['v_icms_st'] is not None:
+            v['v_icms_st'] -= v['v_icms']
+
+        if v['v_bc_st'] is not None and v['p_fcp_st'] is not None:
+            v['v_fcp_st'] = v['v_bc_st'] * v['p_fcp_st'] / 100
+        if v['v_fcp'] is not None and v['v_fcp_st'] is not None:
+            v['v_fcp_st'] -= v['v_fcp']
+
+    def _calc_icms_normal(self, v, item, v_ipi):
+        v['v_bc'] = quantize(item.price * item.quantity)
+        if v['bc_include_ipi'] and v_ipi is not _NO_IPI:
+            v['v_bc'] += v_ipi
+        if v['p_red_bc'] is not None:
+            v['v_bc'] -= v['v_bc'] * v['p_red_bc'] / 100
+
+        if v['p_icms'] is not None and v['v_bc'] is not None:
+            v['v_icms'] = v['v_bc'] * v['p_icms'] / 100
+        if v['p_fcp'] is not None and v['v_bc'] is not None:
+            v['v_fcp'] = v['v_bc'] * v['p_fcp'] / 100
+
+    def _calc_icms_cred_sn(self, v, item):
+        if v['p_cred_sn'] is None:
+            v['p_cred_sn'] = Decimal(0)
+        if v['p_cred_sn'] >= 0:
+            v['v_cred_icms_sn'] = item.get_total() * v['p_cred_sn'] / 100
+
+    def _calc_icms_st_ret(self, v):
+        v['v_bc_st_ret'] = 0
+        v['v_icms_st_ret'] = 0
+        v['v_fcp_st_ret'] = 0
+        if v['p_fcp_st'] is not None and v['p_icms_st'] is not None:
+            v['p_st'] = v['p_fcp_st'] + v['p_icms_st']
+
+    def _calc_icms(self, v, item, simples, v_ipi):
+        # See InvoiceItemIcms._update_simples and _update_normal
+        if simples:
+            csosn = v['csosn']
+            if csosn in [300, 400, 500]:
+                self._calc_icms_st_ret(v)
+            if csosn in [101, 201]:
+                self._calc_icms_cred_sn(v, item)
+            if csosn in [201, 202, 203]:
+                self._calc_icms_st(v, item, v_ipi)
+            if csosn == 900:
+                self._calc_icms_cred_sn(v, item)
+                self._calc_icms_normal(v, item, v_ipi)
+                self._calc_icms_st(v, item, v_ipi)
+            return
+
+        cst = v['cst']
+        if cst in [0, 10]:
+            v['p_red_bc'] = Decimal(0)
+        if cst in [0, 10, 20, 51, 70, 90]:
+            self._calc_icms_normal(v, item, v_ipi)
+        if cst in [30, 40, 41, 50]:
+            v['v_icms'] = 0
+            v['v_bc'] = 0
+        if cst in [10, 30, 70, 90]:
+            self._calc_icms_st(v, item, v_ipi)
+        if cst == 60:
+            self._calc_icms_st_ret(v)
+
+    def _calc_ipi(self, v, item):
+        # See InvoiceItemIpi.update_values
+        if v['cst'] not in [0, 49, 50, 99]:
+            return
+
+        if v['calculo'] == BaseIPI.CALC_ALIQUOTA:
+            v['v_bc'] = quantize(item.price * item.quantity)
+            if v['p_ipi'] is not None:
+                v['v_ipi'] = v['v_bc'] * v['p_ipi'] / 100
+        elif v['calculo'] == BaseIPI.CALC_UNIDADE:
+            if v['q_unid'] is not None and v['v_unid'] is not None:
+                v['v_ipi'] = v['q_unid'] * v['v_unid']
+
+    def _calc_pis_cofins(self, v, item, simples, rate, value, cost):
+        # See InvoiceItemPis.update_values and InvoiceItemCofins.update_values
+        v['q_bc_prod'] = item.quantity
+        if v['cst'] in [4, 5, 6, 7, 8, 9]:
+            return
+
+        if v['cst'] == 99 and simples:
+            v['v_bc'] = 0
+            v[rate] = 0
+            v[value] = 0
+            return
+
+        if rate == 'p_pis':
+            nao_cumulativo = InvoiceItemPis.PIS_NAO_CUMULATIVO_PADRAO
+        else:
+            nao_cumulativo = InvoiceItemCofins.COFINS_NAO_CUMULATIVO_PADRAO
+        if v[rate] == nao_cumulativo:
+            v['v_bc'] = quantize(item.quantity * (item.price - cost))
+        else:
+            v['v_bc'] = quantize(item.quantity * item.price)
+
+        if v[rate] is not None:
+            v[value] = quantize(v['v_bc'] * v[rate] / 100)
@@ -27,7 +27,8 @@ __tests__ = 'stoqlib/domain/account.py'
 import datetime
 from storm.exceptions import OrderLoopError
 
-from stoqlib.domain.account import (Account, AccountTransaction,
+from stoqlib.domain.account import (Account, AccountBalanceCheckpoint,
+                                    AccountTransaction,
                                     AccountTransactionView,
                                     BillOption)
 from stoqlib.domain.purchase import PurchaseOrder
@@ -233,6 +234,47 @@ class TestAccount(DomainTest):
         self.assertEqual(
             a.get_total_for_interval(start, end), 200)
 
+    def test_get_total_for_interval_partial_months(self):
+        a = self.create_account()
+        b = self.create_account()
+        for date, value in [(datetime.datetime(2010, 1, 14), 10),
+                            (datetime.datetime(2010, 1, 15, 12), 20),
+                            (datetime.datetime(2010, 2, 10), 40),
+                            (datetime.datetime(2010, 3, 31, 23), 80),
+                            (datetime.datetime(2010, 4, 1), 160)]:
+            transaction = self.create_account_transaction(a, value=value,
+                                                          source=b)
+            transaction.date = date
+
+        # Only the transactions
+        self.assertEqual(
+            a.get_total_for_interval(datetime.datetime(2010, 1, 15),
+                                     datetime.datetime(2010, 1, 31)), 20)
+        # The transactions of January and April and the checkpoints of
+        # February and March
+        self.assertEqual(
+            a.get_total_for_interval(datetime.datetime(2010, 1, 15),
+                                     datetime.datetime(2010, 4, 1)), 300)
+        self.assertEqual(
+            b.get_total_for_interval(datetime.datetime(2010, 1, 15),
+                                     datetime.datetime(2010, 4, 1)), -300)
+        # Only the checkpoints
+        self.assertEqual(
+            a.get_total_for_interval(datetime.datetime(2010, 2, 1),
+                                     datetime.datetime(2010, 3, 31)), 120)
+        # A start with a time skips its own day
+        self.assertEqual(
+            a.get_total_for_interval(datetime.datetime(2010, 1, 14, 10),
+                                     datetime.datetime(2010, 2, 28)), 60)
+
+        # Transactions that were not adjusted don't change the total
+        transaction = self.create_account_transaction(a, value=320,
+                                                      source=a)
+        transaction.date = datetime.datetime(2010, 2, 1)
+        self.assertEqual(
+            a.get_total_for_interval(datetime.datetime(2010, 2, 1),
+                                     datetime.datetime(2010, 3, 31)), 120)
+
     def test_get_total_for_interval_error(self):
         a = self.create_account()
         good = datetime.datetime(2010, 1, 1)
@@ -257,6 +299,82 @@ class TestAccount(DomainTest):
         self.assertFalse(result3)
 
 
+class TestAccountBalanceCheckpoint(DomainTest):
+
+    def _get_checkpoints(self, account):
+        checkpoints = {}
+        for row in self.store.find(
+                (AccountBalanceCheckpoint.month,
+                 AccountBalanceCheckpoint.incoming,
+                 AccountBalanceCheckpoint.outgoing,
+                 AccountBalanceCheckpoint.total_incoming,
+                 AccountBalanceCheckpoint.total_outgoing),
+                AccountBalanceCheckpoint.account_id == account.id):
+            # The checkpoints that were zeroed are not removed
+            if row[1] or row[2]:
+                checkpoints[row[0]] = row[1:]
+        return checkpoints
+
+    def test_update(self):
+        a = self.create_account()
+        b = self.create_account()
+        january = datetime.datetime(2010, 1, 1)
+        february = datetime.datetime(2010, 2, 1)
+        transaction = self.create_account_transaction(a, value=10, source=b)
+        transaction.date = datetime.datetime(2010, 1, 20, 15)
+        # The trigger only records the changes, the checkpoints are
+        # updated later
+        self.store.flush()
+        self.assertEqual(self._get_checkpoints(a), {})
+        self.assertTrue(AccountBalanceCheckpoint.update(self.store) > 0)
+        self.assertEqual(self._get_checkpoints(a),
+                         {january: (10, 0, 10, 0)})
+        self.assertEqual(self._get_checkpoints(b),
+                         {january: (0, 10, 0, 10)})
+
+        other = self.create_account_transaction(a, value=3, source=b)
+        other.date = datetime.datetime(2010, 2, 3)
+        transaction.value = 15
+        AccountBalanceCheckpoint.update(self.store)
+        self.assertEqual(self._get_checkpoints(a),
+                         {january: (15, 0, 15, 0),
+                          february: (3, 0, 18, 0)})
+
+        transaction.date = datetime.datetime(2010, 2, 3)
+        transaction.source_account = a
+        AccountBalanceCheckpoint.update(self.store)
+        self.assertEqual(self._get_checkpoints(a),
+                         {february: (18, 15, 18, 15)})
+        self.assertEqual(self._get_checkpoints(b),
+                         {february: (0, 3, 0, 3)})
+
+        self.store.remove(transaction)
+        AccountBalanceCheckpoint.update(self.store)
+        self.assertEqual(self._get_checkpoints(a),
+                         {february: (3, 0, 3, 0)})
+
+    def test_verify_and_rebuild(self):
+        a = self.create_account()
+        b = self.create_account()
+        transaction = self.create_account_transaction(a, value=10, source=b)
+        transaction.date = datetime.datetime(2010, 1, 20)
+        # The changes not moved to the checkpoints yet are counted
+        self.assertEqual(AccountBalanceCheckpoint.verify(self.store), [])
+        AccountBalanceCheckpoint.update(self.store)
+        self.assertEqual(AccountBalanceCheckpoint.verify(self.store), [])
+
+        month = datetime.datetime(2010, 1, 1)
+        checkpoint = self.store.find(AccountBalanceCheckpoint,
+                                     account=a, month=month).one()
+        checkpoint.incoming = 5
+        self.assertEqual(AccountBalanceCheckpoint.verify(self.store),
+                         [(a.id, month, (10, 0, 10, 0), (5, 0, 10, 0))])
+
+        self.assertTrue(AccountBalanceCheckpoint.rebuild(self.store) > 0)
+        self.assertEqual(AccountBalanceCheckpoint.verify(self.store), [])
+        self.assertEqual(self._get_checkpoints(a), {month: (10, 0, 10, 0)})
+
+
 class TestAccountTransaction(DomainTest):
 
     def test_create_reverse(self):
@@ -439,6 +557,62 @@ class TestAccountTransactionView(DomainTest):
         views = AccountTransactionView.get_for_account(a1, self.store)
         self.assertEqual(views[0].get_value(a1), -100)
 
+    def _create_transactions(self, account, other):
+        # The second one was not adjusted
+        for date, value, source, dest in [
+                (datetime.datetime(2010, 1, 1), 100, other, account),
+                (datetime.datetime(2010, 1, 2, 10), 30, account, account),
+                (datetime.datetime(2010, 1, 2, 11), 50, account, other),
+                (datetime.datetime(2010, 1, 3), 20, other, account),
+                (datetime.datetime(2010, 1, 4), 10, other, account)]:
+            transaction = self.create_account_transaction(
+                dest, value=value, source=source, incoming=True)
+            transaction.date = date
+        self.store.flush()
+
+    def test_get_balance_view(self):
+        a1 = self.create_account()
+        a2 = self.create_account()
+        self._create_transactions(a1, a2)
+
+        view = AccountTransactionView.get_balance_view(a1)
+        self.assertIs(AccountTransactionView.get_balance_view(a1), view)
+        results = self.store.find(view).order_by(
+            *AccountTransactionView.balance_order)
+        self.assertEqual(
+            [(v.get_value(a1), v.account_value, v.balance) for v in results],
+            [(100, 100, 100), (30, 30, 100), (-50, -50, 50), (20, 20, 70),
+             (10, 10, 80)])
+
+        results = self.store.find(
+            AccountTransactionView.get_balance_view(a2)).order_by(
+                *AccountTransactionView.balance_order)
+        self.assertEqual([v.balance for v in results], [-100, -50, -70, -80])
+
+    def test_find_balance_page(self):
+        a1 = self.create_account()
+        a2 = self.create_account()
+        self._create_transactions(a1, a2)
+
+        first = AccountTransactionView.find_balance_page(self.store, a1,
+                                                         limit=2)
+        self.assertEqual([v.balance for v in first], [100, 100])
+        second = AccountTransactionView.find_balance_page(
+            self.store, a1, after=first[-1], limit=2)
+        self.assertEqual([v.balance for v in second], [50, 70])
+        third = AccountTransactionView.find_balance_page(
+            self.store, a1, after=second[-1], limit=2)
+        self.assertEqual([v.balance for v in third], [80])
+
+        # The query applies to all the pages
+        query = AccountTransaction.source_account_id == a2.id
+        first = AccountTransactionView.find_balance_page(self.store, a1,
+                                                         limit=2, query=query)
+        self.assertEqual([v.balance for v in first], [100, 120])
+        second = AccountTransactionView.find_balance_page(
+            self.store, a1, after=first[-1], query=query)
+        self.assertEqual([v.balance for v in second], [130])
+
     def test_transaction(self):
         a = self.create_account()
         t = self.create_account_transaction(a)
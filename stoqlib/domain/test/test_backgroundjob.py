@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+import datetime
+
+import mock
+
+from stoqlib.domain.backgroundjob import (BackgroundJob, register_job_handler,
+                                          run_pending_jobs)
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.lib.dateutils import localnow
+
+__tests__ = 'stoqlib/domain/backgroundjob.py'
+
+_calls = []
+
+
+@register_job_handler(u'test-job')
+def _test_job(store, value):
+    if value == u'broken':
+        raise ValueError(u'broken')
+    _calls.append(value)
+
+
+class TestBackgroundJob(DomainTest):
+
+    def setUp(self):
+        super(TestBackgroundJob, self).setUp()
+        self.clean_domain([BackgroundJob])
+        del _calls[:]
+
+    def _run_pending_jobs(self):
+        with mock.patch('stoqlib.domain.backgroundjob.run_in_transaction',
+                        new=lambda func, *args: func(self.store, *args)):
+            return run_pending_jobs()
+
+    def test_enqueue(self):
+        job = BackgroundJob.enqueue(self.store, u'test-job', value=u'foo')
+        self.assertEqual(job.status, BackgroundJob.STATUS_PENDING)
+        self.assertEqual(job.data, {u'value': u'foo'})
+        with self.assertRaises(AssertionError):
+            BackgroundJob.enqueue(self.store, u'unknown-job')
+
+    def test_fetch_next(self):
+        self.assertEqual(BackgroundJob.fetch_next(self.store), None)
+        first = BackgroundJob.enqueue(self.store, u'test-job', value=u'1')
+        first.run_after = localnow() - datetime.timedelta(minutes=1)
+        second = BackgroundJob.enqueue(self.store, u'test-job', value=u'2')
+        later = BackgroundJob.enqueue(self.store, u'test-job', value=u'3')
+        later.run_after = localnow() + datetime.timedelta(days=1)
+
+        self.assertEqual(BackgroundJob.fetch_next(self.store), first)
+        first.run()
+        self.assertEqual(BackgroundJob.fetch_next(self.store), second)
+        self.assertEqual(BackgroundJob.lock(self.store, later.id), later)
+
+    def test_run(self):
+        job = BackgroundJob.enqueue(self.store, u'test-job', value=u'foo')
+        job.run()
+        self.assertEqual(_calls, [u'foo'])
+        self.assertEqual(job.status, BackgroundJob.STATUS_DONE)
+        self.assertNotEqual(job.finished_date, None)
+
+    def test_fail(self):
+        job = BackgroundJob.enqueue(self.store, u'test-job', value=u'broken')
+        job.max_attempts = 2
+        before = localnow()
+        job.fail(ValueError(u'broken'))
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.error, u'broken')
+        self.assertEqual(job.status, BackgroundJob.STATUS_PENDING)
+        self.assertTrue(job.run_after >= before + BackgroundJob.RETRY_DELAY)
+
+        job.fail(ValueError(u'broken'))
+        self.assertEqual(job.status, BackgroundJob.STATUS_FAILED)
+        self.assertNotEqual(job.finished_date, None)
+
+    @mock.patch('stoqlib.domain.backgroundjob.log')
+    def test_run_pending_jobs(self, log):
+        done = BackgroundJob.enqueue(self.store, u'test-job', value=u'foo')
+        broken = BackgroundJob.enqueue(self.store, u'test-job', value=u'broken')
+
+        self.assertEqual(self._run_pending_jobs(), 2)
+        self.assertEqual(_calls, [u'foo'])
+        self.assertEqual(done.status, BackgroundJob.STATUS_DONE)
+        self.assertEqual(broken.status, BackgroundJob.STATUS_PENDING)
+        self.assertEqual(broken.attempts, 1)
+        self.assertEqual(broken.error, u'broken')
+
+        # The broken job will only be retried later
+        self.assertEqual(self._run_pending_jobs(), 0)
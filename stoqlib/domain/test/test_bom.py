@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+import time
+
+import mock
+
+from stoqlib.database.runtime import new_store
+from stoqlib.domain.bom import BillOfMaterials
+from stoqlib.domain.product import (Product, ProductComponent,
+                                    ProductSupplierInfo,
+                                    StockTransactionHistory)
+from stoqlib.domain.sellable import Sellable
+from stoqlib.domain.test.domaintest import DomainTest
+
+__tests__ = 'stoqlib/domain/bom.py'
+
+
+class TestBillOfMaterials(DomainTest):
+
+    def setUp(self):
+        super(TestBillOfMaterials, self).setUp()
+        self.bom = BillOfMaterials(listen=False)
+        self.branch = self.current_branch
+        #        table
+        #       /  |   \
+        #   2 leg  4 screw  1 top
+        #     |          /    \
+        #   2 screw  1 board  3 screw
+        self.table = self.create_product(with_supplier=False, storable=True)
+        self.table.is_composed = True
+        self.table.production_time = 2
+        self.leg = self.create_product(with_supplier=False, storable=True)
+        self.leg.is_composed = True
+        self.leg.production_time = 1
+        self.top = self.create_product(with_supplier=False, storable=True)
+        self.top.is_composed = True
+        self.top.production_time = 3
+        self.screw = self.create_product(with_supplier=False, storable=True)
+        self.board = self.create_product(with_supplier=False, storable=True)
+
+        self.create_product_component(self.table, self.leg, 2)
+        self.create_product_component(self.table, self.screw, 4)
+        self.create_product_component(self.table, self.top, 1)
+        self.create_product_component(self.leg, self.screw, 2)
+        self.create_product_component(self.top, self.board, 1)
+        self.create_product_component(self.top, self.screw, 3)
+
+    def _add_stock(self, product, quantity):
+        product.storable.increase_stock(quantity, self.branch,
+                                        StockTransactionHistory.TYPE_INITIAL,
+                                        None, self.current_user, unit_cost=1)
+
+    def test_get_components(self):
+        lines = self.bom.get_components(self.store, self.leg.id)
+        self.assertEqual([(l.component_id, l.quantity) for l in lines],
+                         [(self.screw.id, 2)])
+        self.assertEqual(self.bom.get_components(self.store, self.screw.id), ())
+
+        # All the levels were loaded at once
+        with mock.patch.object(self.store, 'execute',
+                               wraps=self.store.execute) as execute:
+            self.bom.get_components(self.store, self.table.id)
+            self.assertEqual(execute.call_count, 1)
+            self.bom.get_components(self.store, self.top.id)
+            self.bom.get_components(self.store, self.board.id)
+            self.assertEqual(execute.call_count, 1)
+
+    def test_get_component_ids(self):
+        self.assertEqual(
+            self.bom.get_component_ids(self.store, self.table.id),
+            set([self.leg.id, self.top.id, self.screw.id, self.board.id]))
+        self.assertEqual(self.bom.get_component_ids(self.store, self.top.id),
+                         set([self.screw.id, self.board.id]))
+        self.assertEqual(self.bom.get_component_ids(self.store, self.screw.id),
+                         set())
+
+    def test_explode(self):
+        needed = self.bom.explode(self.store, {self.table.id: 2})
+        self.assertEqual(needed, {
+            self.leg.id: 4,
+            self.top.id: 2,
+            self.board.id: 2,
+            # 2 * 4 on the table, 4 * 2 on the legs and 2 * 3 on the tops
+            self.screw.id: 22,
+        })
+
+        # The requirements are summed
+        needed = self.bom.explode(self.store, [(self.table.id, 1),
+                                               (self.top.id, 1),
+                                               (self.table.id, 1)])
+        self.assertEqual(needed[self.top.id], 2)
+        self.assertEqual(needed[self.board.id], 3)
+        self.assertEqual(needed[self.screw.id], 25)
+
+    def test_get_shortages(self):
+        self._add_stock(self.leg, 1)
+        self._add_stock(self.screw, 10)
+        self.board.manage_stock = False
+
+        shortages = self.bom.get_shortages(self.store, {self.table.id: 2},
+                                           self.branch)
+        self.assertEqual(set(shortages), set([self.leg.id, self.top.id,
+                                              self.screw.id, self.board.id]))
+
+        leg = shortages[self.leg.id]
+        self.assertEqual((leg.needed, leg.stock, leg.missing), (4, 1, 3))
+        self.assertTrue(leg.has_components)
+        top = shortages[self.top.id]
+        self.assertEqual((top.needed, top.stock, top.missing), (2, 0, 2))
+        # Only the legs and tops that are missing need screws
+        screw = shortages[self.screw.id]
+        self.assertEqual((screw.needed, screw.stock, screw.missing),
+                         (2 * 4 + 3 * 2 + 2 * 3, 10, 10))
+        self.assertFalse(screw.has_components)
+        board = shortages[self.board.id]
+        self.assertEqual((board.needed, board.missing), (2, 0))
+
+    def test_get_lead_times(self):
+        ProductSupplierInfo(store=self.store, product=self.screw,
+                            supplier=self.create_supplier(), lead_time=10)
+        ProductSupplierInfo(store=self.store, product=self.board,
+                            supplier=self.create_supplier(), lead_time=20)
+
+        lead_times = self.bom.get_lead_times(
+            self.store, {self.table.id: 1, self.leg.id: 1, self.screw.id: 1},
+            self.branch)
+        # The table waits for the top, that waits for the board
+        self.assertEqual(lead_times, {self.table.id: 2 + 3 + 20,
+                                      self.leg.id: 1 + 10,
+                                      self.screw.id: 10})
+
+        self._add_stock(self.board, 1)
+        self._add_stock(self.screw, 4)
+        lead_times = self.bom.get_lead_times(
+            self.store, {self.table.id: 1, self.leg.id: 1}, self.branch)
+        # The stock of each component is enough for each level on its own
+        self.assertEqual(lead_times, {self.table.id: 2 + 3,
+                                      self.leg.id: 1})
+        self.assertEqual(self.table.get_max_lead_time(1, self.branch), 2 + 3)
+
+    def test_get_order_requirements(self):
+        order = self.create_production_order()
+        item = self.create_production_item(quantity=5, order=order)
+        item.produced = 2
+        item.lost = 1
+        other = self.create_production_item(quantity=3, order=order)
+        other.produced = 3
+
+        self.assertEqual(self.bom.get_order_requirements(self.store, [order]),
+                         {item.product_id: 2})
+        self.assertEqual(self.bom.get_order_requirements(self.store, []), {})
+
+    @mock.patch('stoqlib.domain.bom.get_bill_of_materials')
+    def test_invalidate(self, get_bill_of_materials):
+        get_bill_of_materials.return_value = self.bom
+        self.assertEqual(self.bom.get_component_ids(self.store, self.leg.id),
+                         set([self.screw.id]))
+
+        component = self.create_product_component(self.leg, self.board, 1)
+        self.assertEqual(self.bom.get_component_ids(self.store, self.leg.id),
+                         set([self.screw.id, self.board.id]))
+
+        component.quantity = 4
+        self.assertEqual(self.bom.explode(self.store, {self.leg.id: 1}),
+                         {self.screw.id: 2, self.board.id: 4})
+
+        self.store.remove(component)
+        self.assertEqual(self.bom.get_component_ids(self.store, self.leg.id),
+                         set([self.screw.id]))
+
+    @mock.patch('stoqlib.domain.bom.get_bill_of_materials')
+    def test_rollback(self, get_bill_of_materials):
+        get_bill_of_materials.return_value = self.bom
+        self.assertEqual(self.bom.get_component_ids(self.store, self.leg.id),
+                         set([self.screw.id]))
+
+        self.store.savepoint('before_board')
+        self.create_product_component(self.leg, self.board, 1)
+        self.assertEqual(self.bom.get_component_ids(self.store, self.leg.id),
+                         set([self.screw.id, self.board.id]))
+
+        # The components were loaded with the new one, which is gone now
+        self.store.rollback_to_savepoint('before_board')
+        self.assertEqual(self.bom.get_component_ids(self.store, self.leg.id),
+                         set([self.screw.id]))
+
+    def test_deleted_by_other_store(self):
+        # The component is committed, so another store can delete it
+        store = new_store()
+        sellables = [Sellable(store=store, description=u'Other store',
+                              price=1) for i in range(2)]
+        product, part = [Product(store=store, sellable=sellable)
+                         for sellable in sellables]
+        component = ProductComponent(store=store, product=product,
+                                     component=part)
+        store.commit(close=False)
+
+        bom = BillOfMaterials()
+        try:
+            # Only the changes made after this are noticed
+            bom.poll()
+            self.assertEqual(bom.get_component_ids(self.store, product.id),
+                             set([part.id]))
+
+            store.remove(component)
+            store.commit(close=False)
+            # The notification is received by another thread
+            for i in range(50):
+                ids = bom.get_component_ids(self.store, product.id)
+                if not ids:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(ids, set())
+        finally:
+            bom.close()
+            for sellable in sellables:
+                sellable.remove()
+            store.commit(close=True)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+import mock
+
+from stoqlib.domain.categorytree import CategoryTree
+from stoqlib.domain.test.domaintest import DomainTest
+
+__tests__ = 'stoqlib/domain/categorytree.py'
+
+
+class TestCategoryTree(DomainTest):
+
+    def setUp(self):
+        super(TestCategoryTree, self).setUp()
+        self.tree = CategoryTree(listen=False)
+        #       A
+        #      / \
+        #     B   C
+        #    /
+        #   D
+        self.a = self.create_sellable_category(description=u'A')
+        self.b = self.create_sellable_category(description=u'B',
+                                               parent=self.a)
+        self.c = self.create_sellable_category(description=u'C',
+                                               parent=self.a)
+        self.d = self.create_sellable_category(description=u'D',
+                                               parent=self.b)
+
+    def test_get_parents(self):
+        self.assertEqual(
+            [p.description for p in self.tree.get_parents(self.store, self.d.id)],
+            [u'B', u'A'])
+        self.assertEqual(self.tree.get_parents(self.store, self.a.id), ())
+
+        # Everything is cached
+        with mock.patch.object(self.store, 'find') as find:
+            self.tree.get_parents(self.store, self.d.id)
+            self.tree.get_parents(self.store, self.c.id)
+            self.assertEqual(find.call_count, 0)
+
+    def test_get_children_ids(self):
+        self.assertEqual(self.tree.get_children_ids(self.store, self.a.id),
+                         set([self.b.id, self.c.id, self.d.id]))
+        self.assertEqual(self.tree.get_children_ids(self.store, self.b.id),
+                         set([self.d.id]))
+        self.assertEqual(self.tree.get_children_ids(self.store, self.d.id),
+                         set())
+
+    def test_new_category(self):
+        self.tree.get_children_ids(self.store, self.a.id)
+        # A category that is not in the tree makes it be loaded again
+        e = self.create_sellable_category(description=u'E', parent=self.c)
+        self.assertEqual(
+            [p.description for p in self.tree.get_parents(self.store, e.id)],
+            [u'C', u'A'])
+        self.assertEqual(self.tree.get_children_ids(self.store, self.a.id),
+                         set([self.b.id, self.c.id, self.d.id, e.id]))
+
+    @mock.patch('stoqlib.domain.categorytree.get_category_tree')
+    def test_invalidate(self, get_category_tree):
+        get_category_tree.return_value = self.tree
+        self.assertEqual(self.tree.get_children_ids(self.store, self.b.id),
+                         set([self.d.id]))
+
+        self.d.category = self.c
+        self.assertEqual(self.tree.get_children_ids(self.store, self.b.id),
+                         set())
+        self.assertEqual(self.tree.get_children_ids(self.store, self.c.id),
+                         set([self.d.id]))
+
+        self.c.suggested_markup = 15
+        self.assertEqual(
+            [p.suggested_markup for p in self.tree.get_parents(self.store,
+                                                               self.d.id)],
+            [15, self.a.suggested_markup])
+
+    @mock.patch('stoqlib.domain.categorytree.get_category_tree')
+    def test_rollback(self, get_category_tree):
+        get_category_tree.return_value = self.tree
+        self.tree.get_children_ids(self.store, self.a.id)
+
+        self.store.savepoint('before_e')
+        e = self.create_sellable_category(description=u'E', parent=self.c)
+        self.d.category = self.c
+        self.assertEqual(self.tree.get_children_ids(self.store, self.a.id),
+                         set([self.b.id, self.c.id, self.d.id, e.id]))
+        self.assertEqual(self.tree.get_children_ids(self.store, self.b.id),
+                         set())
+
+        # The tree was loaded with the changes, which are gone now
+        self.store.rollback_to_savepoint('before_e')
+        self.assertEqual(self.tree.get_children_ids(self.store, self.a.id),
+                         set([self.b.id, self.c.id, self.d.id]))
+        self.assertEqual(self.tree.get_children_ids(self.store, self.b.id),
+                         set([self.d.id]))
@@ -31,6 +31,7 @@ from stoqlib.domain.inventory import (Inventory, InventoryView,
 from stoqlib.domain.product import StockTransactionHistory
 from stoqlib.domain.sellable import Sellable
 from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.exceptions import StockError
 
 __tests__ = 'stoqlib/domain/inventory.py'
 
@@ -243,6 +244,63 @@ class TestInventory(DomainTest):
         inventory.cancel()
         self.assertRaises(AssertionError, inventory.close)
 
+    def test_adjust_items(self):
+        inventory = self.create_inventory()
+        inventory.invoice_number = 13
+        increased = self.create_inventory_item(inventory, 5)
+        increased.counted_quantity = 8
+        decreased = self.create_inventory_item(inventory, 5)
+        decreased.counted_quantity = 2
+        decreased.cfop_data = self.create_cfop_data()
+        unchanged = self.create_inventory_item(inventory, 5)
+        unchanged.counted_quantity = 5
+        not_counted = self.create_inventory_item(inventory, 5)
+
+        progress = list(inventory.adjust_items(self.current_user, u'test',
+                                               chunk_size=1))
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+
+        for item, quantity in [(increased, 8), (decreased, 2), (unchanged, 5)]:
+            self.assertEqual(item.actual_quantity, quantity)
+            self.assertEqual(item.reason, u'test')
+            storable = item.product.storable
+            self.assertEqual(storable.get_balance_for_branch(inventory.branch),
+                             quantity)
+        self.assertTrue(increased.is_adjusted)
+        self.assertTrue(decreased.is_adjusted)
+        self.assertFalse(unchanged.is_adjusted)
+        self.assertEqual(not_counted.actual_quantity, None)
+        self.assertFalse(not_counted.is_adjusted)
+
+        transactions = self.store.find(
+            StockTransactionHistory,
+            type=StockTransactionHistory.TYPE_INVENTORY_ADJUST)
+        self.assertEqual(
+            set((t.object_id, t.quantity) for t in transactions),
+            set([(increased.id, 3), (decreased.id, -3)]))
+        entries = self.store.find(FiscalBookEntry,
+                                  entry_type=FiscalBookEntry.TYPE_INVENTORY)
+        self.assertEqual(
+            set((e.cfop, e.invoice_number) for e in entries),
+            set([(None, 13), (decreased.cfop_data, 13)]))
+
+        # Nothing else to adjust
+        self.assertEqual(
+            list(inventory.adjust_items(self.current_user, u'test')), [])
+
+    def test_adjust_items_without_stock(self):
+        inventory = self.create_inventory()
+        item = self.create_inventory_item(inventory, 5)
+        item.counted_quantity = 2
+        storable = item.product.storable
+        storable.decrease_stock(4, inventory.branch,
+                                StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user)
+
+        with self.assertRaises(StockError):
+            list(inventory.adjust_items(self.current_user, u'test'))
+        self.assertFalse(item.is_adjusted)
+
     def test_all_items_counted(self):
         inventory = self.create_inventory()
         item1 = self.create_inventory_item(inventory)
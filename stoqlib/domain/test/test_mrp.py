@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+from stoqlib.domain.bom import BillOfMaterials
+from stoqlib.domain.mrp import (MaterialRequirementsPlan, MRPRequirement,
+                                PlannedProduction, PlannedPurchase,
+                                PlannedTransfer)
+from stoqlib.domain.product import ProductSupplierInfo, StockTransactionHistory
+from stoqlib.domain.production import ProductionMaterial, ProductionOrder
+from stoqlib.domain.purchase import PurchaseOrder
+from stoqlib.domain.transfer import TransferOrder
+from stoqlib.domain.test.domaintest import DomainTest
+
+__tests__ = 'stoqlib/domain/mrp.py'
+
+
+class TestMaterialRequirementsPlan(DomainTest):
+
+    def setUp(self):
+        super(TestMaterialRequirementsPlan, self).setUp()
+        self.branch = self.create_branch()
+        self.other_branch = self.create_branch()
+        #        table
+        #       /  |   \
+        #   2 leg  4 screw  1 top
+        #     |          /    \
+        #   2 screw  1 board  3 screw
+        self.table = self.create_product(with_supplier=False, storable=True)
+        self.leg = self.create_product(with_supplier=False, storable=True)
+        self.top = self.create_product(with_supplier=False, storable=True)
+        self.screw = self.create_product(with_supplier=False, storable=True)
+        self.board = self.create_product(with_supplier=False, storable=True)
+        self.create_product_component(self.table, self.leg, 2)
+        self.create_product_component(self.table, self.screw, 4)
+        self.create_product_component(self.table, self.top, 1)
+        self.create_product_component(self.leg, self.screw, 2)
+        self.create_product_component(self.top, self.board, 1)
+        self.create_product_component(self.top, self.screw, 3)
+
+        # The materials of 2 tables
+        self.order = self.create_production_order(branch=self.branch)
+        self.order.add_item(self.table.sellable, 2)
+        self.materials = {}
+        for product, needed in [(self.leg, 4), (self.screw, 8), (self.top, 2)]:
+            self.materials[product] = ProductionMaterial(
+                product=product, order=self.order, needed=needed,
+                store=self.store)
+
+    def _add_stock(self, product, branch, quantity):
+        product.storable.increase_stock(quantity, branch,
+                                        StockTransactionHistory.TYPE_INITIAL,
+                                        None, self.current_user, unit_cost=1)
+
+    def _run(self):
+        return MaterialRequirementsPlan(
+            self.store, branches=[self.branch, self.other_branch],
+            bom=BillOfMaterials(listen=False)).run()
+
+    def test_run(self):
+        self._add_stock(self.leg, self.branch, 1)
+        self._add_stock(self.top, self.other_branch, 5)
+        self._add_stock(self.screw, self.other_branch, 10)
+
+        purchase = self.create_purchase_order(branch=self.branch)
+        item = self.create_purchase_order_item(order=purchase,
+                                               sellable=self.screw.sellable)
+        item.quantity = 5
+        item.quantity_received = 2
+        purchase.status = PurchaseOrder.ORDER_CONFIRMED
+
+        plan = self._run()
+        b1, b2 = self.branch.id, self.other_branch.id
+        self.assertEqual(sorted(plan.requirements), sorted([
+            MRPRequirement(b1, self.leg.id, 4, 1, 0, 3),
+            MRPRequirement(b1, self.top.id, 2, 0, 0, 2),
+            # 8 for the tables and 2 * 3 for the legs that are missing
+            MRPRequirement(b1, self.screw.id, 14, 0, 3, 11),
+        ]))
+        # The other branch has enough tops, so no boards are needed
+        self.assertEqual(plan.productions,
+                         [PlannedProduction(b1, self.leg.id, 3)])
+        self.assertEqual(sorted(plan.transfers), sorted([
+            PlannedTransfer(b2, b1, self.top.id, 2),
+            PlannedTransfer(b2, b1, self.screw.id, 10),
+        ]))
+        self.assertEqual(plan.purchases,
+                         [PlannedPurchase(b1, self.screw.id, 1, None, 0)])
+
+    def test_run_scheduled(self):
+        self._add_stock(self.leg, self.branch, 4)
+        self._add_stock(self.top, self.branch, 2)
+        transfer = self.create_transfer_order(source_branch=self.other_branch,
+                                              dest_branch=self.branch)
+        self.create_transfer_order_item(transfer, quantity=6,
+                                        sellable=self.screw.sellable)
+        transfer.status = TransferOrder.STATUS_SENT
+
+        plan = self._run()
+        self.assertEqual(plan.productions, [])
+        self.assertEqual(plan.transfers, [])
+        self.assertEqual(plan.purchases,
+                         [PlannedPurchase(self.branch.id, self.screw.id, 2,
+                                          None, 0)])
+
+    def test_run_purchase_from_main_supplier(self):
+        self._add_stock(self.leg, self.branch, 4)
+        self._add_stock(self.top, self.branch, 2)
+        supplier = self.create_supplier()
+        ProductSupplierInfo(store=self.store, product=self.screw,
+                            supplier=supplier, lead_time=7,
+                            minimum_purchase=10, is_main_supplier=True)
+
+        plan = self._run()
+        self.assertEqual(plan.purchases,
+                         [PlannedPurchase(self.branch.id, self.screw.id, 10,
+                                          supplier.id, 7)])
+
+    def test_run_ignored_materials(self):
+        # Allocated materials were already taken from the stock
+        self.materials[self.leg].allocated = 4
+        # Products without stock control are always available
+        self.top.manage_stock = False
+        self.materials[self.screw].allocated = 5
+
+        plan = self._run()
+        self.assertEqual(plan.productions, [])
+        self.assertEqual(plan.purchases,
+                         [PlannedPurchase(self.branch.id, self.screw.id, 3,
+                                          None, 0)])
+
+        # Closed productions need nothing
+        self.order.status = ProductionOrder.ORDER_CLOSED
+        plan = self._run()
+        self.assertEqual(plan.requirements, [])
+        self.assertEqual(plan.purchases, [])
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+import datetime
+import os
+import tempfile
+from decimal import Decimal
+
+import mock
+from psycopg2.extensions import TransactionRollbackError
+
+from stoqlib.domain.offlinejournal import (OfflineJournal, OfflineReplayer,
+                                           OfflineSale)
+from stoqlib.domain.priceresolver import PriceResolver
+from stoqlib.domain.sale import Sale
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.domain.till import Till, TillEntry
+from stoqlib.lib.dateutils import localdatetime, localnow
+
+__tests__ = 'stoqlib/domain/offlinejournal.py'
+
+
+class TestOfflineJournal(DomainTest):
+
+    def setUp(self):
+        super(TestOfflineJournal, self).setUp()
+        fd, self.filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.journal = OfflineJournal(self.filename)
+
+    def tearDown(self):
+        self.journal.close()
+        os.unlink(self.filename)
+        super(TestOfflineJournal, self).tearDown()
+
+    def _create_sale(self, sellable, quantity=2):
+        sale = OfflineSale(self.current_branch.id, self.current_station.id,
+                           self.current_user.person.sales_person.id,
+                           date=datetime.datetime(2026, 3, 1, 10, 30))
+        sale.add_item(sellable.id, quantity, sellable.price)
+        sale.add_payment(u'money', sale.get_total())
+        return sale
+
+    def _replay(self):
+        replayer = OfflineReplayer(self.journal, self.current_user)
+        with mock.patch('stoqlib.domain.offlinejournal.run_in_transaction',
+                        new=lambda func, *args: func(self.store, *args)):
+            return replayer.replay()
+
+    def _get_till(self):
+        till = Till.get_current(self.store, self.current_station)
+        if till is None:
+            till = self.create_till()
+            till.open_till(self.current_user)
+        return till
+
+    def test_catalog(self):
+        self.assertEqual(self.journal.get_catalog_date(), None)
+        sellable = self.create_sellable(code=u'OFFLINE-CODE', price=15)
+        sellable.barcode = u'7890000000055'
+        storable = self.create_storable(product=sellable.product)
+        batch = self.create_storable_batch(storable=storable,
+                                           batch_number=u'OFFLINE-BATCH')
+        self.journal.save_catalog(self.store, self.current_branch)
+        self.assertNotEqual(self.journal.get_catalog_date(), None)
+
+        item = self.journal.find_sellable(u'7890000000055')
+        self.assertEqual(item.sellable_id, str(sellable.id))
+        self.assertEqual(item.price, Decimal(15))
+        self.assertEqual(item.batch_id, None)
+        self.assertEqual(self.journal.find_sellable(u'offline-code'), item)
+        self.assertEqual(self.journal.find_sellable(u'OFFLINE-BATCH'),
+                         item._replace(batch_id=str(batch.id)))
+        self.assertEqual(self.journal.find_sellable(u'not-found'), None)
+
+    def test_catalog_prices(self):
+        today = localnow().date()
+        sellable = self.create_sellable(code=u'OFFLINE-PROMO', price=10)
+        sellable.on_sale_price = 8
+        sellable.on_sale_start_date = localdatetime(today.year, today.month,
+                                                    today.day)
+        sellable.on_sale_end_date = (sellable.on_sale_start_date +
+                                     datetime.timedelta(days=2))
+        with mock.patch('stoqlib.domain.priceresolver.get_price_resolver',
+                        return_value=PriceResolver(listen=False)):
+            self.journal.save_catalog(self.store, self.current_branch)
+
+        # The promotion price while it lasts, the normal one after it
+        self.assertEqual(self.journal.find_sellable(u'offline-promo').price, 8)
+        self.assertEqual(self.journal.find_sellable(
+            u'offline-promo', today + datetime.timedelta(days=2)).price, 8)
+        self.assertEqual(self.journal.find_sellable(
+            u'offline-promo', today + datetime.timedelta(days=3)).price, 10)
+
+    def test_operations(self):
+        sellable = self.create_sellable(price=10)
+        sale = self._create_sale(sellable)
+        self.journal.add_sale(sale)
+        entry_id = self.journal.add_till_entry(self.current_station.id,
+                                               Decimal('-5.5'), u'Change')
+
+        sale_op, entry_op = self.journal.get_pending()
+        self.assertEqual(sale_op.id, sale.id)
+        self.assertEqual(sale_op.date, sale.date)
+        loaded = OfflineSale.from_dict(sale_op.id, sale_op.date, sale_op.data)
+        self.assertEqual(loaded.items, sale.items)
+        self.assertEqual(loaded.payments, sale.payments)
+        self.assertEqual(loaded.get_total(), 20)
+        self.assertEqual(entry_op.id, entry_id)
+        self.assertEqual(entry_op.data['value'], u'-5.5')
+
+        self.journal.set_status(sale.id, OfflineJournal.STATUS_REPLAYED)
+        self.journal.set_status(entry_id, OfflineJournal.STATUS_CONFLICT,
+                                u'No till')
+        self.assertEqual(self.journal.get_pending(), [])
+        self.assertEqual([op.error for op in self.journal.get_conflicts()],
+                         [u'No till'])
+        self.journal.purge()
+        self.assertEqual(len(self.journal.get_operations()), 1)
+
+    def test_replay(self):
+        till = self._get_till()
+        sellable = self.create_sellable(price=10)
+        self.create_storable(product=sellable.product,
+                             branch=self.current_branch, stock=10)
+        sale = self._create_sale(sellable)
+        self.journal.add_sale(sale)
+        entry_id = self.journal.add_till_entry(self.current_station.id,
+                                               Decimal(5), u'Change')
+
+        report = self._replay()
+        self.assertEqual(report.replayed, [sale.id, entry_id])
+        self.assertEqual(report.conflicts, [])
+
+        replayed = self.store.get(Sale, sale.id)
+        self.assertEqual(replayed.status, Sale.STATUS_CONFIRMED)
+        self.assertEqual(replayed.confirm_date, sale.date)
+        self.assertEqual(replayed.get_total_sale_amount(), 20)
+        self.assertEqual(
+            sellable.product.storable.get_balance_for_branch(
+                self.current_branch), 8)
+        entry = self.store.get(TillEntry, entry_id)
+        self.assertEqual(entry.till, till)
+        self.assertEqual(entry.value, 5)
+
+        # Replaying again does not duplicate anything
+        self.journal.set_status(sale.id, OfflineJournal.STATUS_PENDING)
+        report = self._replay()
+        self.assertEqual(report.replayed, [])
+        self.assertEqual(report.skipped, [sale.id])
+        self.assertEqual(self.journal.get_pending(), [])
+
+    def test_replay_conflict(self):
+        station = self.create_station()
+        self.journal.add_till_entry(station.id, Decimal(5), u'Change')
+        report = self._replay()
+        self.assertEqual(report.replayed, [])
+        self.assertEqual(len(report.conflicts), 1)
+        self.assertIn(u'There is no open till', report.format())
+        self.assertEqual(len(self.journal.get_conflicts()), 1)
+
+    def test_replay_transaction_conflict(self):
+        sellable = self.create_sellable(price=10)
+        sale = self._create_sale(sellable)
+        self.journal.add_sale(sale)
+        replayer = OfflineReplayer(self.journal, self.current_user)
+        with mock.patch('stoqlib.domain.offlinejournal.run_in_transaction',
+                        side_effect=TransactionRollbackError()):
+            report = replayer.replay()
+
+        # It is replayed again later, not as a conflict
+        self.assertEqual(report.replayed, [])
+        self.assertEqual(report.conflicts, [])
+        self.assertEqual([op.id for op in self.journal.get_pending()],
+                         [sale.id])
+
+    def test_replay_sale_without_till(self):
+        sellable = self.create_sellable(price=10)
+        sale = self._create_sale(sellable)
+        sale.station_id = self.create_station().id
+        self.journal.add_sale(sale)
+        other = self._create_sale(sellable)
+        other.station_id = u'6c9ec6a6-0000-11e6-8000-000000000000'
+        self.journal.add_sale(other)
+
+        report = self._replay()
+        self.assertEqual(report.replayed, [])
+        self.assertEqual([op_id for op_id, reason in report.conflicts],
+                         [sale.id, other.id])
+        self.assertIn(u'There is no open till', report.format())
+        self.assertIn(u'does not exist anymore', report.format())
+        self.assertEqual(self.store.get(Sale, sale.id), None)
@@ -818,6 +818,57 @@ class TestClient(_PersonFacetTest, DomainTest):
         payment.payment_type = payment.TYPE_IN
         self.assertEqual(client.credit_account_balance, -100)
 
+    def test_get_credit_account_balances(self):
+        method = PaymentMethod.get_by_name(self.store, u'credit')
+        client = self.create_client()
+        other = self.create_client()
+        for value in [100, 30]:
+            group = self.create_payment_group(payer=client.person)
+            payment = self.create_payment(payment_type=Payment.TYPE_OUT,
+                                          value=value, method=method,
+                                          group=group)
+            payment.set_pending()
+            payment.pay()
+
+        self.assertEqual(client.credit_account_balance, 130)
+        self.assertEqual(
+            Client.get_credit_account_balances(self.store, [client, other]),
+            {client.id: 130, other.id: 0})
+
+        # Cancelling the payment takes it out of the balance
+        payment.cancel()
+        self.assertEqual(
+            Client.get_credit_account_balances(self.store, [client, other]),
+            {client.id: 100, other.id: 0})
+        self.assertEqual(Client.get_credit_account_balances(self.store, []),
+                         {})
+
+    def test_get_remaining_store_credits(self):
+        method = PaymentMethod.get_by_name(self.store, u'store_credit')
+        client = self.create_client()
+        client.credit_limit = 1000
+        other = self.create_client()
+        other.credit_limit = 50
+        group = self.create_payment_group(payer=client.person)
+        payment = self.create_payment(payment_type=Payment.TYPE_IN,
+                                      value=200, method=method, group=group)
+        payment.set_pending()
+
+        self.assertEqual(client.remaining_store_credit, 800)
+        self.assertEqual(
+            Client.get_remaining_store_credits(self.store, [client, other]),
+            {client.id: 800, other.id: 50})
+
+        # Moving the payment to another payer moves its debit too
+        group.payer = other.person
+        self.assertEqual(
+            Client.get_remaining_store_credits(self.store, [client, other]),
+            {client.id: 1000, other.id: -150})
+
+        # Paid payments are not debit anymore
+        payment.pay()
+        self.assertEqual(other.remaining_store_credit, 50)
+
 
 class TestClientCategory(DomainTest):
     def test_get_description(self):
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+import datetime
+import time
+
+import mock
+
+from stoqlib.database.runtime import new_store
+from stoqlib.domain.person import ClientCategory
+from stoqlib.domain.priceresolver import PriceResolver, resolve_price
+from stoqlib.domain.sellable import ClientCategoryPrice, Sellable
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.lib.dateutils import localdate
+
+__tests__ = 'stoqlib/domain/priceresolver.py'
+
+
+class TestPriceResolver(DomainTest):
+
+    def setUp(self):
+        super(TestPriceResolver, self).setUp()
+        self.resolver = PriceResolver(listen=False)
+        self.sellable = self.create_sellable(price=10)
+        self.sellable.on_sale_price = 8
+        self.sellable.on_sale_start_date = localdate(2026, 3, 10)
+        self.sellable.on_sale_end_date = localdate(2026, 3, 20)
+        self.category = self.create_client_category()
+
+    def test_resolve_price(self):
+        day = datetime.date
+        self.assertEqual(resolve_price(self.sellable, day(2026, 3, 1)),
+                         (10, None, day(2026, 3, 9)))
+        self.assertEqual(resolve_price(self.sellable, day(2026, 3, 10)),
+                         (8, day(2026, 3, 10), day(2026, 3, 20)))
+        self.assertEqual(resolve_price(self.sellable, day(2026, 3, 21)),
+                         (10, day(2026, 3, 21), None))
+        self.assertEqual(resolve_price(self.sellable, day(2026, 3, 15),
+                                       category_price=7),
+                         (7, None, None))
+        self.assertEqual(resolve_price(self.sellable, day(2026, 3, 1),
+                                       default_price=9),
+                         (9, None, day(2026, 3, 9)))
+
+        self.sellable.on_sale_end_date = None
+        self.assertEqual(resolve_price(self.sellable, day(3001, 1, 1)),
+                         (8, day(2026, 3, 10), None))
+        self.sellable.on_sale_price = 0
+        self.assertEqual(resolve_price(self.sellable, day(2026, 3, 15)),
+                         (10, None, None))
+
+    def test_get_price(self):
+        # The same prices the sellable would give
+        other = self.create_sellable(price=20)
+        self.create_client_category_price(category=self.category,
+                                          sellable=other, price=15)
+        for category in [None, self.category]:
+            for sellable in [self.sellable, other]:
+                self.assertEqual(
+                    self.resolver.get_price(sellable, category),
+                    sellable.get_price_for_category(category))
+
+    def test_get_prices(self):
+        other = self.create_sellable(price=20)
+        self.create_client_category_price(category=self.category,
+                                          sellable=other, price=15)
+        default = self.create_client_category(name=u'Default')
+        self.create_client_category_price(category=default,
+                                          sellable=self.sellable, price=9)
+        sellables = [self.sellable, other]
+
+        with self.sysparam(DEFAULT_TABLE_PRICE=default):
+            prices = self.resolver.get_prices(sellables, self.category,
+                                              localdate(2026, 3, 1))
+            self.assertEqual(prices, {self.sellable.id: 9, other.id: 15})
+
+            # Everything is cached, including the promotion window
+            with mock.patch.object(self.store, 'find') as find:
+                self.assertEqual(
+                    self.resolver.get_prices(sellables, self.category,
+                                             localdate(2026, 3, 9)),
+                    prices)
+                self.assertEqual(find.call_count, 0)
+
+            # The promotion started
+            self.assertEqual(
+                self.resolver.get_prices(sellables, self.category,
+                                         localdate(2026, 3, 10)),
+                {self.sellable.id: 8, other.id: 15})
+
+        self.assertEqual(self.resolver.get_prices([], self.category), {})
+
+    @mock.patch('stoqlib.domain.priceresolver.get_price_resolver')
+    def test_invalidate(self, get_price_resolver):
+        get_price_resolver.return_value = self.resolver
+        date = localdate(2026, 3, 1)
+        self.assertEqual(self.resolver.get_price(self.sellable, date=date), 10)
+
+        self.sellable.base_price = 12
+        self.assertEqual(self.resolver.get_price(self.sellable, date=date), 12)
+
+        self.sellable.on_sale_start_date = localdate(2026, 2, 1)
+        self.assertEqual(self.resolver.get_price(self.sellable, date=date), 8)
+
+        self.sellable.on_sale_price = 0
+        self.assertEqual(self.resolver.get_price(self.sellable, date=date), 12)
+
+        info = self.create_client_category_price(category=self.category,
+                                                 sellable=self.sellable,
+                                                 price=5)
+        self.assertEqual(
+            self.resolver.get_price(self.sellable, self.category, date), 5)
+
+        info.price = 6
+        self.assertEqual(
+            self.resolver.get_price(self.sellable, self.category, date), 6)
+
+        info.remove()
+        self.assertEqual(
+            self.resolver.get_price(self.sellable, self.category, date), 12)
+
+    @mock.patch('stoqlib.domain.priceresolver.get_price_resolver')
+    def test_rollback(self, get_price_resolver):
+        get_price_resolver.return_value = self.resolver
+        date = localdate(2026, 3, 1)
+        self.assertEqual(self.resolver.get_price(self.sellable, date=date), 10)
+
+        self.store.savepoint('before_price')
+        self.sellable.base_price = 12
+        self.assertEqual(self.resolver.get_price(self.sellable, date=date), 12)
+
+        # The price was resolved with the change, which is gone now
+        self.store.rollback_to_savepoint('before_price')
+        self.assertEqual(self.resolver.get_price(self.sellable, date=date), 10)
+
+    def test_deleted_by_other_store(self):
+        # The category price is committed, so another store can delete it
+        store = new_store()
+        sellable = Sellable(store=store, description=u'Other store',
+                            price=10)
+        category = ClientCategory(store=store, name=u'Other store')
+        info = ClientCategoryPrice(store=store, sellable=sellable,
+                                   category=category, price=5)
+        store.commit(close=False)
+
+        resolver = PriceResolver()
+        try:
+            # Only the changes made after this are noticed
+            resolver.poll()
+            our_sellable = self.store.fetch(sellable)
+            our_category = self.store.fetch(category)
+            self.assertEqual(resolver.get_price(our_sellable, our_category),
+                             5)
+
+            info.remove()
+            store.commit(close=False)
+            # The notification is received by another thread
+            for i in range(50):
+                price = resolver.get_price(our_sellable, our_category)
+                if price != 5:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(price, 10)
+        finally:
+            resolver.close()
+            sellable.remove()
+            store.remove(category)
+            store.commit(close=True)
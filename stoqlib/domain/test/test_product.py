@@ -28,25 +28,27 @@ from storm.exceptions import NotOneError
 
 from stoqlib.exceptions import StockError
 from stoqlib.database.runtime import new_store
+from stoqlib.domain.backgroundjob import BackgroundJob
 from stoqlib.domain.events import (ProductCreateEvent, ProductEditEvent,
                                    ProductRemoveEvent)
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.person import Branch
 from stoqlib.domain.product import (ProductSupplierInfo, Product,
-                                    ProductStockItem,
+                                    ProductStockItem, ProductStockSummary,
                                     ProductHistory, ProductComponent,
                                     ProductQualityTest, Storable,
                                     StorableBatch, StorableBatchView,
                                     StockTransactionHistory, ProductManufacturer,
-                                    GridOption, GridGroup)
+                                    GridOption, GridGroup,
+                                    ProductStockSnapshot)
 from stoqlib.domain.production import (ProductionOrder, ProductionProducedItem,
                                        ProductionItemQualityResult,
                                        ProductionItem)
 from stoqlib.domain.purchase import PurchaseOrder
 from stoqlib.domain.sellable import Sellable
 from stoqlib.domain.test.domaintest import DomainTest
-from stoqlib.lib.dateutils import localtoday
+from stoqlib.lib.dateutils import localdatetime, localnow, localtoday
 
 """ This module test all class in stoqlib/domain/product.py """
 
@@ -1202,6 +1204,80 @@ class TestProductManufacturer(DomainTest):
         self.assertEqual(results, 0)
 
 
+class TestProductStockItem(DomainTest):
+
+    def test_lock_for_update(self):
+        branch = self.create_branch()
+        other_branch = self.create_branch()
+        storables = [self.create_storable() for i in range(3)]
+        for storable in storables:
+            storable.register_initial_stock(10, branch, unit_cost=1,
+                                            user=self.current_user)
+            storable.register_initial_stock(10, other_branch, unit_cost=1,
+                                            user=self.current_user)
+        service = self.create_service()
+
+        self.assertEqual(
+            ProductStockItem.lock_for_update(self.store, branch, []), [])
+
+        ids = [s.id for s in reversed(storables)] + [service.id]
+        locked = ProductStockItem.lock_for_update(self.store, branch, ids)
+        items = self.store.find(ProductStockItem, branch=branch)
+        self.assertEqual(locked, sorted(item.id for item in items))
+
+
+class TestProductStockSummary(DomainTest):
+
+    def _check_summary(self, storable, branch):
+        # The rows are changed by the database, so don't use the objects
+        # that might be in the store's cache
+        quantity, total_cost = self.store.find(
+            (ProductStockSummary.quantity, ProductStockSummary.total_cost),
+            ProductStockSummary.storable_id == storable.id,
+            ProductStockSummary.branch_id == branch.id).one()
+        items = self.store.find(ProductStockItem, storable=storable,
+                                branch=branch)
+        self.assertEqual(quantity, items.sum(ProductStockItem.quantity))
+        self.assertEqual(total_cost,
+                         items.sum(ProductStockItem.quantity *
+                                   ProductStockItem.stock_cost))
+        return quantity, total_cost
+
+    def test_trigger(self):
+        branch = self.create_branch()
+        other_branch = self.create_branch()
+        storable = self.create_storable(is_batch=True)
+        batch = self.create_storable_batch(storable=storable,
+                                           batch_number=u'SUMMARY-1')
+        other_batch = self.create_storable_batch(storable=storable,
+                                                 batch_number=u'SUMMARY-2')
+
+        storable.increase_stock(10, branch, StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, unit_cost=2,
+                                batch=batch)
+        storable.increase_stock(5, branch, StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, unit_cost=Decimal('3.3'),
+                                batch=other_batch)
+        storable.increase_stock(4, other_branch,
+                                StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, unit_cost=1,
+                                batch=batch)
+        self.assertEqual(self._check_summary(storable, branch),
+                         (15, Decimal('36.5')))
+        self.assertEqual(self._check_summary(storable, other_branch),
+                         (4, 4))
+
+        storable.decrease_stock(3, branch, StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, batch=other_batch)
+        storable.increase_stock(1, branch, StockTransactionHistory.TYPE_INITIAL,
+                                None, self.current_user, unit_cost=7,
+                                batch=batch)
+        quantity, total_cost = self._check_summary(storable, branch)
+        self.assertEqual(quantity, 13)
+        self.assertEqual(storable.get_balance_for_branch(branch), 13)
+        self.assertEqual(storable.get_total_balance(), 17)
+
+
 class TestStorable(DomainTest):
 
     def test_register_initial_stock(self):
@@ -1806,6 +1882,94 @@ class TestStockTransactionHistory(DomainTest):
                                   u'Used on work order {parent:05}.')
 
 
+class TestProductStockSnapshot(DomainTest):
+
+    def setUp(self):
+        super(TestProductStockSnapshot, self).setUp()
+        self.branch = self.create_branch()
+        self.storable = self.create_storable()
+        self._change_stock(10, localdatetime(2026, 1, 5))
+        self._change_stock(-4, localdatetime(2026, 2, 5))
+        self._change_stock(1, localdatetime(2026, 3, 10))
+
+    def _change_stock(self, quantity, date):
+        if quantity > 0:
+            self.storable.increase_stock(
+                quantity, self.branch, StockTransactionHistory.TYPE_INITIAL,
+                None, self.current_user)
+        else:
+            self.storable.decrease_stock(
+                -quantity, self.branch,
+                StockTransactionHistory.TYPE_MANUAL_ADJUST,
+                None, self.current_user)
+        history = self.store.find(StockTransactionHistory,
+                                  storable=self.storable,
+                                  quantity=quantity).one()
+        history.date = date
+
+    def _get_stock_at(self, date):
+        stock = ProductStockSnapshot.get_stock_at(
+            self.store, date, storable_ids=[self.storable.id])
+        return stock.get((self.storable.id, self.branch.id, None))
+
+    def test_get_stock_at(self):
+        self.assertEqual(self._get_stock_at(localdatetime(2026, 1, 1)), None)
+        self.assertEqual(self._get_stock_at(localdatetime(2026, 2, 5)), 10)
+        self.assertEqual(self._get_stock_at(localdatetime(2026, 3, 1)), 6)
+        self.assertEqual(self._get_stock_at(localdatetime(2026, 4, 1)), 7)
+
+        # The snapshot is used with the transactions after it
+        ProductStockSnapshot.create(self.store, localdatetime(2026, 2, 1))
+        snapshot = self.store.find(ProductStockSnapshot,
+                                   storable=self.storable).one()
+        self.assertEqual(snapshot.quantity, 10)
+        snapshot.quantity = 20
+        self.assertEqual(self._get_stock_at(localdatetime(2026, 1, 6)), 10)
+        self.assertEqual(self._get_stock_at(localdatetime(2026, 2, 1)), 20)
+        self.assertEqual(self._get_stock_at(localdatetime(2026, 4, 1)), 17)
+
+        stock = ProductStockSnapshot.get_stock_at(
+            self.store, localdatetime(2026, 4, 1),
+            branch=self.current_branch, storable_ids=[self.storable.id])
+        self.assertEqual(stock, {})
+
+    def test_update(self):
+        ProductStockSnapshot.create(self.store, localdatetime(2026, 1, 1))
+        self.assertEqual(ProductStockSnapshot.get_snapshot_date(
+            self.store, localdatetime(2026, 2, 1)), localdatetime(2026, 1, 1))
+
+        dates = ProductStockSnapshot.update(self.store)
+        self.assertEqual(dates[:3], [localdatetime(2026, 2, 1),
+                                     localdatetime(2026, 3, 1),
+                                     localdatetime(2026, 4, 1)])
+        self.assertTrue(dates[-1] <= localnow())
+        self.assertEqual(ProductStockSnapshot.update(self.store), [])
+        snapshots = self.store.find(ProductStockSnapshot,
+                                    storable=self.storable)
+        self.assertEqual(
+            [(s.date, s.quantity) for s in
+             snapshots.order_by(ProductStockSnapshot.date)][:3],
+            [(localdatetime(2026, 2, 1), 10),
+             (localdatetime(2026, 3, 1), 6),
+             (localdatetime(2026, 4, 1), 7)])
+
+        self.assertEqual(ProductStockSnapshot.rebuild(self.store)[-1],
+                         dates[-1])
+        self.assertEqual(ProductStockSnapshot.get_snapshot_date(
+            self.store, localdatetime(2026, 2, 1)), localdatetime(2026, 2, 1))
+
+    def test_job(self):
+        job = BackgroundJob.enqueue(self.store, u'stock-snapshots')
+        job.run()
+        self.assertEqual(job.status, BackgroundJob.STATUS_DONE)
+        self.assertEqual(self._get_stock_at(localnow()), 7)
+        pending = self.store.find(BackgroundJob,
+                                  job_type=u'stock-snapshots',
+                                  status=BackgroundJob.STATUS_PENDING).one()
+        self.assertEqual(pending.run_after.day, 1)
+        self.assertTrue(pending.run_after > localnow())
+
+
 class TestStorableBatchView(DomainTest):
 
     def test_find(self):
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+import datetime
+from decimal import Decimal
+
+from stoqlib.domain.backgroundjob import BackgroundJob
+from stoqlib.domain.product import ProductHistory, StockTransactionHistory
+from stoqlib.domain.purchase import PurchaseOrder
+from stoqlib.domain.reorder import (ProductReorderSuggestion,
+                                    SuggestedPurchaseView)
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.lib.dateutils import localnow
+
+__tests__ = 'stoqlib/domain/reorder.py'
+
+
+class TestProductReorderSuggestion(DomainTest):
+
+    def setUp(self):
+        super(TestProductReorderSuggestion, self).setUp()
+        self.branch = self.create_branch()
+        self.product = self._create_product(cost=10, sold=90)
+        self.product.storable.increase_stock(
+            5, self.branch, StockTransactionHistory.TYPE_INITIAL, None,
+            self.current_user, unit_cost=1)
+        self.supplier_info = self.create_product_supplier_info(
+            product=self.product)
+        self.supplier_info.lead_time = 10
+
+    def _create_product(self, cost, sold):
+        product = self.create_product(with_supplier=False, storable=True)
+        product.sellable.cost = cost
+        ProductHistory(branch=self.branch, sellable=product.sellable,
+                       quantity_sold=sold,
+                       sold_date=localnow() - datetime.timedelta(days=1),
+                       store=self.store)
+        # Older than the days considered
+        ProductHistory(branch=self.branch, sellable=product.sellable,
+                       quantity_sold=1000,
+                       sold_date=localnow() - datetime.timedelta(days=100),
+                       store=self.store)
+        return product
+
+    def _calculate(self, **kwargs):
+        suggestions = ProductReorderSuggestion.calculate(
+            self.store, branches=[self.branch], days=90, cover_days=30,
+            **kwargs)
+        return dict((suggestion.storable_id, suggestion)
+                    for suggestion in suggestions)
+
+    def test_calculate(self):
+        suggestion = self._calculate()[self.product.id]
+        self.assertEqual(suggestion.branch_id, self.branch.id)
+        self.assertEqual(suggestion.supplier_id,
+                         self.supplier_info.supplier_id)
+        self.assertEqual(suggestion.quantity_sold, 90)
+        self.assertEqual(suggestion.daily_sales, 1)
+        self.assertEqual(suggestion.stock, 5)
+        self.assertEqual(suggestion.to_receive, 0)
+        self.assertEqual(suggestion.lead_time, 10)
+        self.assertEqual(suggestion.days_of_cover, 5)
+        self.assertEqual(suggestion.abc_class, ProductReorderSuggestion.CLASS_A)
+        # What is sold while waiting for the supplier
+        self.assertEqual(suggestion.reorder_point, 10)
+        # Enough for the lead time and 30 more days
+        self.assertEqual(suggestion.suggested_quantity, 35)
+
+        # The minimum quantity is bigger than the sales in the lead time
+        self.product.storable.minimum_quantity = 20
+        self.product.storable.maximum_quantity = 100
+        suggestion = self._calculate()[self.product.id]
+        self.assertEqual(suggestion.reorder_point, 20)
+        self.assertEqual(suggestion.suggested_quantity, 95)
+
+    def test_calculate_to_receive(self):
+        order = self.create_purchase_order(branch=self.branch)
+        self.create_purchase_order_item(order=order,
+                                        sellable=self.product.sellable)
+        order.status = PurchaseOrder.ORDER_CONFIRMED
+
+        # The 8 pending leave the stock above the reorder point
+        suggestion = self._calculate()[self.product.id]
+        self.assertEqual(suggestion.to_receive, 8)
+        self.assertEqual(suggestion.suggested_quantity, 0)
+
+    def test_calculate_without_sales(self):
+        product = self.create_product(with_supplier=False, storable=True)
+        self.assertNotIn(product.id, self._calculate())
+
+        product.storable.maximum_quantity = Decimal('2.5')
+        suggestion = self._calculate()[product.id]
+        self.assertEqual(suggestion.daily_sales, 0)
+        self.assertEqual(suggestion.days_of_cover, None)
+        self.assertEqual(suggestion.abc_class, ProductReorderSuggestion.CLASS_C)
+        self.assertEqual(suggestion.supplier_id, None)
+        # The unit doesn't allow fractions
+        self.assertEqual(suggestion.suggested_quantity, 3)
+
+    def test_abc_class(self):
+        # The values sold are 900, 150 and 50. The ones before them are
+        # 0%, 81.8% and 95.5% of the total
+        product_b = self._create_product(cost=1, sold=150)
+        product_c = self._create_product(cost=1, sold=50)
+        suggestions = self._calculate()
+        self.assertEqual(suggestions[self.product.id].abc_class,
+                         ProductReorderSuggestion.CLASS_A)
+        self.assertEqual(suggestions[product_b.id].abc_class,
+                         ProductReorderSuggestion.CLASS_B)
+        self.assertEqual(suggestions[product_c.id].abc_class,
+                         ProductReorderSuggestion.CLASS_C)
+
+    def test_rebuild(self):
+        other_branch = self.create_branch()
+        old = ProductReorderSuggestion(
+            store=self.store, storable=self.product.storable,
+            branch=self.branch, calculated_date=localnow(), days=1)
+        other = ProductReorderSuggestion(
+            store=self.store, storable=self.product.storable,
+            branch=other_branch, calculated_date=localnow(), days=1)
+
+        count = ProductReorderSuggestion.rebuild(
+            self.store, branches=[self.branch], days=90, cover_days=30)
+        self.assertEqual(count, len(self._calculate()))
+        results = self.store.find(ProductReorderSuggestion,
+                                  storable_id=self.product.id)
+        self.assertNotIn(old, results)
+        self.assertIn(other, results)
+
+        suggestion = ProductReorderSuggestion.get_suggestion(
+            self.store, self.product, self.branch)
+        self.assertEqual(suggestion.suggested_quantity, 35)
+        self.assertIsNone(ProductReorderSuggestion.get_suggestion(
+            self.store, self.create_product(), self.branch))
+
+        views = self.store.find(SuggestedPurchaseView,
+                                branch_id=self.branch.id)
+        view = views.find(id=suggestion.id).one()
+        self.assertEqual(view.description, self.product.sellable.description)
+        self.assertEqual(view.supplier_name, u'Supplier')
+        self.assertEqual(view.total, 350)
+
+    def test_job(self):
+        job = BackgroundJob.enqueue(self.store, u'reorder-suggestions',
+                                    branch_ids=[self.branch.id])
+        job.run()
+        self.assertEqual(job.status, BackgroundJob.STATUS_DONE)
+        suggestion = ProductReorderSuggestion.get_suggestion(
+            self.store, self.product, self.branch)
+        self.assertEqual(suggestion.days, ProductReorderSuggestion.DEFAULT_DAYS)
@@ -32,7 +32,10 @@ from storm.expr import And, Eq, Ne
 from kiwi.component import provide_utility
 from kiwi.currency import currency
 from stoqlib.api import api
+from stoqlib.database.expr import Round
 from stoqlib.database.interfaces import ICurrentUser
+from stoqlib.database.runtime import new_store
+from stoqlib.domain.backgroundjob import BackgroundJob
 from stoqlib.domain.commission import Commission, CommissionSource
 from stoqlib.domain.event import Event
 from stoqlib.domain.events import SaleIsExternalEvent
@@ -52,6 +55,7 @@ from stoqlib.domain.till import TillEntry
 from stoqlib.domain.workorder import WorkOrder
 from stoqlib.exceptions import DatabaseInconsistency, SellError
 from stoqlib.lib.dateutils import localdate, localdatetime, localtoday
+from stoqlib.lib.defaults import DECIMAL_PRECISION
 from stoqlib.lib.formatters import format_quantity
 from stoqlib.lib.parameters import sysparam
 
@@ -1405,6 +1409,35 @@ class TestSale(DomainTest):
         self.assertEqual(commissions.count(), 1)
         self.assertEqual(commissions[0].value, Decimal('20.00'))
 
+    def test_commission_background_job(self):
+        sale = self.create_sale()
+        sellable = self.add_product(sale, price=200)
+        CommissionSource(sellable=sellable,
+                         direct_value=10,
+                         installments_value=5,
+                         store=self.store)
+        sale.order(self.current_user)
+        self.add_payments(sale, method_type=u'check')
+        with self.sysparam(SALE_PAY_COMMISSION_WHEN_CONFIRMED=True,
+                           SALE_CONFIRM_BACKGROUND_JOBS=True):
+            sale.confirm(self.current_user)
+
+        self.assertTrue(self.store.find(Commission, sale=sale).is_empty())
+        jobs = self.store.find(BackgroundJob, status=BackgroundJob.STATUS_PENDING)
+        jobs = [job for job in jobs if job.data == {'sale_id': sale.id}]
+        self.assertEqual(sorted(job.job_type for job in jobs),
+                         [u'sale-create-commissions', u'sale-log-confirmed'])
+
+        for job in jobs:
+            job.run()
+        commissions = self.store.find(Commission, sale=sale)
+        self.assertEqual(commissions.count(), 1)
+        self.assertEqual(commissions[0].value, Decimal('20.00'))
+        self.assertFalse(self.store.find(
+            Event, event_type=Event.TYPE_SALE,
+            description=u"Sale %s without a client was confirmed with value "
+                        u"200.00." % (sale.identifier, )).is_empty())
+
     def test_commission_amount_multiple(self):
         sale = self.create_sale()
         sellable = self.add_product(sale, price=200)
@@ -1734,6 +1767,81 @@ class TestSale(DomainTest):
         sale.surcharge_value = 5
         self.assertEqual(sale.get_total_sale_amount(subtotal), 45)
 
+    def _sum_items(self, sale):
+        items = self.store.find(SaleItem, sale=sale)
+        subtotal = items.sum(
+            Round(SaleItem.price * SaleItem.quantity, DECIMAL_PRECISION))
+        return subtotal or 0, items.sum(SaleItem.quantity) or 0
+
+    def test_items_totals(self):
+        sale = self.create_sale()
+        other_sale = self.create_sale()
+        self.assertEqual(sale.get_sale_subtotal(), 0)
+        self.assertEqual(sale.get_items_total_quantity(), 0)
+
+        sellable = self.create_sellable(price=10)
+        item1 = sale.add_sellable(sellable, quantity=5)
+        item2 = sale.add_sellable(sellable, quantity=Decimal('1.5'),
+                                  price=Decimal('3.3'))
+        item3 = sale.add_sellable(sellable, quantity=2)
+        self.assertEqual(sale.get_sale_subtotal(), Decimal('74.95'))
+        self.assertEqual(sale.get_items_total_quantity(), Decimal('8.5'))
+        self.assertEqual((sale.get_sale_subtotal(),
+                          sale.get_items_total_quantity()),
+                         self._sum_items(sale))
+
+        # Re-pricing and changing the quantity
+        item1.price = 8
+        item2.quantity = 3
+        self.assertEqual(sale.get_sale_subtotal(), Decimal('69.9'))
+        self.assertEqual((sale.get_sale_subtotal(),
+                          sale.get_items_total_quantity()),
+                         self._sum_items(sale))
+
+        # Removing and moving items to other sales
+        sale.remove_item(item2, self.current_user)
+        self.assertEqual(other_sale.get_sale_subtotal(), 0)
+        item3.sale = other_sale
+        self.assertEqual(sale.get_sale_subtotal(), 40)
+        self.assertEqual(sale.get_items_total_quantity(), 5)
+        self.assertEqual((sale.get_sale_subtotal(),
+                          sale.get_items_total_quantity()),
+                         self._sum_items(sale))
+        self.assertEqual(other_sale.get_sale_subtotal(), 20)
+        self.assertEqual((other_sale.get_sale_subtotal(),
+                          other_sale.get_items_total_quantity()),
+                         self._sum_items(other_sale))
+
+        # The ipi value is changed on the tax object
+        item1.ipi_info.v_ipi = 2
+        self.assertEqual(sale.get_sale_subtotal(), 42)
+        item1.ipi_info.v_ipi = 0
+        self.assertEqual(sale.get_sale_subtotal(), 40)
+
+        # A sale loaded from the database sums its items again
+        sale._items_totals = None
+        self.assertEqual(sale.get_sale_subtotal(), 40)
+        self.assertEqual(sale.get_items_total_quantity(), 5)
+
+    def test_items_totals_changed_by_other_store(self):
+        # A sale that was already committed, so its items can be changed
+        # by another store
+        sale = self.store.find(Sale).order_by(Sale.identifier).first()
+        item = sale.get_items().order_by(SaleItem.id).first()
+        subtotal = sale.get_sale_subtotal()
+        quantity = sale.get_items_total_quantity()
+
+        store = new_store()
+        other_item = store.fetch(item)
+        try:
+            other_item.quantity += 1
+            store.commit(close=False)
+            self.assertEqual(sale.get_sale_subtotal(), subtotal + item.price)
+            self.assertEqual(sale.get_items_total_quantity(), quantity + 1)
+        finally:
+            other_item.quantity -= 1
+            store.commit(close=True)
+
     def test_get_total_to_pay(self):
         item = self.create_sale_item()
         self.add_payments(item.sale)
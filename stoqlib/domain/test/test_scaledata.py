@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+import datetime
+
+from stoqlib.domain.product import ProductStockItem, StockTransactionHistory
+from stoqlib.domain.sale import Sale, SaleItem
+from stoqlib.domain.scaledata import ScaleDataCreator, ean13_checksum
+from stoqlib.domain.test.domaintest import DomainTest
+
+__tests__ = 'stoqlib/domain/scaledata.py'
+
+
+class TestScaleDataCreator(DomainTest):
+
+    def _create_creator(self, seed=0):
+        return ScaleDataCreator(self.store, self.current_user, seed=seed,
+                                branches=2, sellables=30, days=2,
+                                sales_per_day=3, max_items_per_sale=4,
+                                start_date=datetime.date(2020, 1, 1),
+                                chunk_size=7)
+
+    def test_ean13_checksum(self):
+        self.assertEqual(ean13_checksum(u'789100000001'), u'4')
+        self.assertEqual(ean13_checksum(u'400638133393'), u'1')
+
+    def test_iter_sellables_reproducible(self):
+        rows1 = list(self._create_creator().iter_sellables())
+        rows2 = list(self._create_creator().iter_sellables())
+        rows3 = list(self._create_creator(seed=1).iter_sellables())
+        self.assertEqual(len(rows1), 30)
+        self.assertEqual(rows1, rows2)
+        self.assertNotEqual(rows1, rows3)
+
+    def test_create(self):
+        creator = self._create_creator()
+        timings = creator.create()
+        self.assertEqual([name for name, elapsed in timings],
+                         ['branches', 'categories', 'sellables', 'stock',
+                          'sales', 'accounts'])
+
+        branch_ids = [b.id for b in creator.branches]
+        stock_items = self.store.find(
+            ProductStockItem, ProductStockItem.branch_id.is_in(branch_ids))
+        self.assertEqual(stock_items.count(), 60)
+
+        sales = self.store.find(Sale, Sale.branch_id.is_in(branch_ids))
+        self.assertEqual(sales.count(), 12)
+        for sale in sales:
+            self.assertEqual(sale.status, Sale.STATUS_CONFIRMED)
+            self.assertEqual(sale.total_amount, sale.get_sale_subtotal())
+
+        # The stock was decreased for every item sold
+        sold = self.store.find(
+            SaleItem, SaleItem.sale_id == Sale.id,
+            Sale.branch_id.is_in(branch_ids)).sum(SaleItem.quantity)
+        decreased = self.store.find(
+            StockTransactionHistory,
+            StockTransactionHistory.type == StockTransactionHistory.TYPE_SELL,
+            StockTransactionHistory.branch_id.is_in(branch_ids)).sum(
+                StockTransactionHistory.quantity)
+        self.assertEqual(sold, -decreased)
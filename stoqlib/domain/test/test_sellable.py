@@ -144,6 +144,28 @@ class TestSellableCategory(DomainTest):
         self.assertEqual(category.get_children_recursively(), set())
         self.assertEqual(base_category.get_children_recursively(), set([category]))
 
+        sub_category = SellableCategory(description=u"29'",
+                                        category=category,
+                                        store=self.store)
+        self.assertEqual(base_category.get_children_recursively(),
+                         set([category, sub_category]))
+
+    def test_get_subtree_ids(self):
+        category = self._create_category(u'LCD', parent=self._base_category)
+        sub_category = self._create_category(u"29'", category)
+        self.assertEqual(self._base_category.get_subtree_ids(),
+                         set([self._base_category.id, category.id,
+                              sub_category.id]))
+        self.assertEqual(sub_category.get_subtree_ids(),
+                         set([sub_category.id]))
+
+        sellable = self.create_sellable()
+        sellable.category = sub_category
+        self.assertEqual(
+            self.store.find(Sellable, Sellable.category_id.is_in(
+                self._base_category.get_subtree_ids())).one(),
+            sellable)
+
     def test_on_create(self):
         category = self._create_category(u'cat')
         with mock.patch('stoqlib.domain.sellable.CategoryCreateEvent') as f:
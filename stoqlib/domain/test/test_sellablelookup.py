@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+#
+# Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+# All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., or visit: http://www.gnu.org/.
+#
+# Author(s): Stoq Team <stoq-devel@async.com.br>
+#
+
+import mock
+
+from stoqlib.database.notifications import Changes
+from stoqlib.domain.product import StorableBatch
+from stoqlib.domain.sellable import Sellable
+from stoqlib.domain.sellablelookup import SellableLookupIndex
+from stoqlib.domain.test.domaintest import DomainTest
+
+__tests__ = 'stoqlib/domain/sellablelookup.py'
+
+
+class TestSellableLookupIndex(DomainTest):
+
+    def setUp(self):
+        super(TestSellableLookupIndex, self).setUp()
+        self.sellable = self.create_sellable(code=u'LOOKUP-CODE')
+        self.sellable.barcode = u'7890000000017'
+        self.other = self.create_sellable(code=u'7890000000017')
+        self.other.barcode = u'7890000000031'
+        storable = self.create_storable(product=self.sellable.product)
+        self.batch = self.create_storable_batch(storable=storable,
+                                                batch_number=u'LOOKUP-BATCH')
+        self.index = SellableLookupIndex(listen=False)
+
+    def _find(self, text, **kwargs):
+        return self.index.find(self.store, text, **kwargs)
+
+    def test_find(self):
+        self.index.load(self.store)
+        entry = self.index.get_entry(self.sellable.id)
+        self.assertEqual(entry.barcode, u'7890000000017')
+        self.assertEqual(entry.status, Sellable.STATUS_AVAILABLE)
+
+        # Everything is found without querying the database
+        with mock.patch.object(self.store, 'find') as find:
+            self.assertEqual(self._find(u'7890000000017'),
+                             (self.sellable, None))
+            self.assertEqual(self._find(u'lookup-code'),
+                             (self.sellable, None))
+            self.assertEqual(self._find(u'lookup-batch'),
+                             (self.sellable, self.batch))
+            self.assertEqual(self._find(u'7890000000031'),
+                             (self.other, None))
+            self.assertEqual(find.call_count, 0)
+
+        self.assertEqual(self._find(u'not-found'), (None, None))
+
+    def test_find_precedence(self):
+        # The barcode has precedence over the code
+        self.index.load(self.store)
+        self.assertEqual(self._find(u'7890000000017'), (self.sellable, None))
+        self.sellable.close()
+        self.assertEqual(self._find(u'7890000000017'), (self.other, None))
+
+    def test_find_not_loaded(self):
+        self.assertFalse(self.index.loaded)
+        self.assertEqual(self._find(u'7890000000017'), (self.sellable, None))
+        self.assertEqual(self._find(u'LOOKUP-CODE'), (self.sellable, None))
+        self.assertEqual(self._find(u'LOOKUP-BATCH'),
+                         (self.sellable, self.batch))
+        self.assertEqual(self._find(u'not-found'), (None, None))
+
+    def test_iter_load(self):
+        loading = self.index.iter_load(self.store, chunk_size=10)
+        self.assertEqual(next(loading), 10)
+        # The index is not used until all the chunks are loaded
+        self.assertFalse(self.index.loaded)
+        self.assertEqual(self._find(u'LOOKUP-BATCH'),
+                         (self.sellable, self.batch))
+
+        counts = [10] + list(loading)
+        self.assertTrue(self.index.loaded)
+        self.assertEqual(sum(counts), self.store.find(Sellable).count() +
+                         self.store.find(StorableBatch).count())
+        self.assertEqual(self.index.get_entry(self.sellable.id).code,
+                         u'LOOKUP-CODE')
+        with mock.patch.object(self.store, 'find') as find:
+            self.assertEqual(self._find(u'lookup-batch'),
+                             (self.sellable, self.batch))
+            self.assertEqual(find.call_count, 0)
+
+    def test_find_outdated(self):
+        self.index.load(self.store)
+
+        # Changes not notified yet should not give wrong results
+        self.sellable.barcode = u'7890000000048'
+        self.assertEqual(self._find(u'7890000000017'), (self.other, None))
+        self.assertEqual(self._find(u'7890000000048'), (self.sellable, None))
+
+        self.sellable.close()
+        self.assertEqual(self._find(u'7890000000048'), (None, None))
+        self.assertEqual(self._find(u'LOOKUP-BATCH'), (None, None))
+
+    def test_find_viewable(self):
+        self.index.load(self.store)
+        self.sellable.close()
+        self.assertEqual(self._find(u'LOOKUP-CODE'), (None, None))
+
+        query = Sellable.status == Sellable.STATUS_CLOSED
+        self.assertEqual(self._find(u'LOOKUP-CODE', viewable=Sellable,
+                                    query=query),
+                         (self.sellable, None))
+        self.assertEqual(self._find(u'LOOKUP-BATCH', viewable=Sellable,
+                                    query=query),
+                         (self.sellable, self.batch))
+        self.assertEqual(self._find(u'7890000000031', viewable=Sellable,
+                                    query=query),
+                         (None, None))
+
+    def test_refresh(self):
+        self.index.load(self.store)
+        self.sellable.barcode = u'7890000000048'
+        batch = self.create_storable_batch(storable=self.batch.storable,
+                                           batch_number=u'NEW-BATCH')
+        self.store.flush()
+
+        changes = Changes()
+        changes[Sellable.__storm_table__].add(self.sellable.te_id)
+        changes[StorableBatch.__storm_table__].add(batch.te_id)
+        # Deleted by another process
+        changes.deleted[StorableBatch.__storm_table__].add(self.batch.id)
+        with mock.patch.object(self.index, 'poll') as poll:
+            poll.return_value = changes
+            self.index.refresh(self.store)
+
+        self.assertEqual(self.index.get_entry(self.sellable.id).barcode,
+                         u'7890000000048')
+        self.assertNotIn(u'lookup-batch', self.index._batch_numbers)
+        with mock.patch.object(self.store, 'find') as find:
+            self.assertEqual(self._find(u'7890000000048'),
+                             (self.sellable, None))
+            self.assertEqual(self._find(u'new-batch'), (self.sellable, batch))
+            self.assertEqual(find.call_count, 0)
+
+        self.index.close()
+        self.assertFalse(self.index.loaded)
+        self.assertEqual(self.index.get_entry(self.sellable.id), None)
@@ -22,16 +22,19 @@
 ## Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 
+import random
 from decimal import Decimal
 
 from dateutil.relativedelta import relativedelta
+from storm.info import get_cls_info
 from stoqlib.domain.taxes import (ProductCofinsTemplate,
                                   ProductIpiTemplate,
                                   ProductPisTemplate,
                                   ProductTaxTemplate,
                                   InvoiceItemIpi,
                                   InvoiceItemPis,
-                                  InvoiceItemCofins)
+                                  InvoiceItemCofins,
+                                  InvoiceTaxCalculator)
 from stoqlib.domain.test.domaintest import DomainTest
 from stoqlib.lib.dateutils import localnow
 
@@ -533,3 +536,96 @@ class TestInvoiceItemCofins(DomainTest):
 
         self.assertNotEqual(cofins1, invoice_item_cofins.get_tax_template(sale_item2))
         self.assertNotEqual(cofins2, invoice_item_cofins.get_tax_template(sale_item2))
+
+
+class TestInvoiceTaxCalculator(DomainTest):
+
+    percents = [None, Decimal(0), Decimal('1.65'), Decimal('7.6'),
+                Decimal('4.5'), Decimal('18')]
+    values = [None, Decimal(0), Decimal('3.21')]
+
+    fields = {
+        'icms_info': {
+            'cst': [None, 0, 10, 20, 30, 40, 41, 50, 51, 60, 70, 90],
+            'csosn': [None, 101, 201, 202, 203, 300, 400, 500, 900],
+            'bc_include_ipi': [True, False],
+            'bc_st_include_ipi': [True, False],
+            'p_red_bc': percents,
+            'p_icms': percents,
+            'p_fcp': percents,
+            'p_red_bc_st': percents,
+            'p_mva_st': percents,
+            'p_icms_st': percents,
+            'p_fcp_st': percents,
+            'p_cred_sn': percents,
+            'v_icms': values,
+            'v_icms_st': values,
+            'v_fcp': values,
+            'v_fcp_st': values,
+        },
+        'ipi_info': {
+            'cst': [None, 0, 49, 50, 52, 99],
+            'calculo': [InvoiceItemIpi.CALC_ALIQUOTA,
+                        InvoiceItemIpi.CALC_UNIDADE],
+            'p_ipi': percents,
+            'q_unid': [None, Decimal(2)],
+            'v_unid': values,
+            'v_ipi': [Decimal(0), Decimal('1.5')],
+        },
+        'pis_info': {
+            'cst': [None, 1, 4, 49, 99],
+            'p_pis': percents,
+        },
+        'cofins_info': {
+            'cst': [None, 1, 9, 49, 99],
+            'p_cofins': percents,
+        },
+    }
+
+    def _create_sale(self, rand, crt):
+        sale = self.create_sale()
+        sale.branch.crt = crt
+        for i in range(10):
+            sellable = self.create_sellable(
+                price=rand.choice([Decimal('0.99'), 10, Decimal('123.45')]))
+            item = sale.add_sellable(
+                sellable, quantity=rand.choice([1, Decimal('2.5'), 7]))
+            item.average_cost = rand.choice([0, Decimal('0.5'), 5])
+            for info, fields in self.fields.items():
+                for field, choices in fields.items():
+                    setattr(getattr(item, info), field, rand.choice(choices))
+        return sale
+
+    def _get_state(self, items):
+        state = []
+        for item in items:
+            for info in self.fields:
+                obj = getattr(item, info)
+                for column in get_cls_info(type(obj)).columns:
+                    if column.name in ['id', 'te_id']:
+                        continue
+                    state.append((item, info, column.name,
+                                  getattr(obj, column.name)))
+        return state
+
+    def _set_state(self, state):
+        for item, info, field, value in state:
+            setattr(getattr(item, info), field, value)
+
+    def test_update_matches_update_values(self):
+        rand = random.Random(1234)
+        for i in range(20):
+            sale = self._create_sale(rand, crt=rand.choice([1, 2, 3]))
+            items = list(sale.get_items())
+            initial = self._get_state(items)
+
+            for item in items:
+                item.update_tax_values()
+            expected = self._get_state(items)
+
+            self._set_state(initial)
+            InvoiceTaxCalculator(items).update()
+            self.assertEqual(self._get_state(items), expected)
+
+    def test_update_empty(self):
+        InvoiceTaxCalculator([]).update()
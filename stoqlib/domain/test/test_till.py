@@ -32,7 +32,8 @@ from kiwi.currency import currency
 from stoqlib.exceptions import TillError
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment
-from stoqlib.domain.till import Till, TillEntry
+from stoqlib.domain.till import (Till, TillEntry, TillReconciliationItem,
+                                 TillSummary)
 from stoqlib.domain.test.domaintest import DomainTest
 from stoqlib.lib.dateutils import localnow, localtoday
 from stoqlib.lib.pluginmanager import PluginManager
@@ -373,3 +374,55 @@ class TestTillSummary(DomainTest):
 
         card_summary = [i for i in summary if i.method.method_name == 'card'][0]
         self.assertEqual(card_summary.description, 'Card VISA Credit')
+
+    def _create_entries(self, till):
+        till.add_credit_entry(currency(10), u"")
+        till.add_debit_entry(currency(4), u"")
+        payment = self.create_card_payment(provider_id='VISA',
+                                           payment_value=30)
+        payment.due_date = till.opening_date
+        payment.set_pending()
+        TillEntry(description=u'test', value=payment.value, till=till,
+                  station=self.current_station, branch=till.station.branch,
+                  payment=payment, store=self.store)
+        return payment
+
+    def test_get_entries_totals(self):
+        till = self.create_till()
+        till.open_till(self.current_user)
+        money = PaymentMethod.get_by_name(self.store, u'money')
+        self.assertEqual(till.get_entries_totals(), {})
+
+        payment = self._create_entries(till)
+        self.assertEqual(till.get_entries_totals(), {
+            (money.id, None, None): 6,
+            (payment.method_id, payment.card_data.provider_id,
+             payment.card_data.card_type): 30})
+
+    def test_get_day_summary_totals(self):
+        till = self.create_till()
+        till.open_till(self.current_user)
+        self._create_entries(till)
+
+        summary = till.get_day_summary()
+        self.assertEqual(
+            sorted((i.description, i.system_value) for i in summary),
+            [('Card VISA Credit', 30), ('Money', 6)])
+        self.assertEqual(set(summary),
+                         set(self.store.find(TillSummary, till=till)))
+
+    def test_get_reconciliation(self):
+        till = self.create_till()
+        till.open_till(self.current_user)
+        self._create_entries(till)
+        self.assertEqual(till.get_reconciliation(), [
+            TillReconciliationItem('Card VISA Credit', 30, None, None),
+            TillReconciliationItem('Money', 6, None, None)])
+
+        for summary in till.get_day_summary():
+            summary.user_value = summary.system_value + 1
+            if summary.method.method_name == u'money':
+                summary.verify_value = summary.system_value
+        self.assertEqual(till.get_reconciliation(), [
+            TillReconciliationItem('Card VISA Credit', 30, 31, None),
+            TillReconciliationItem('Money', 6, 7, 6)])
@@ -29,6 +29,7 @@ from kiwi.datatypes import converter
 
 from stoqlib.database.expr import Date
 from stoqlib.database.viewable import Viewable
+from stoqlib.domain.account import AccountBalanceCheckpoint
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.payment.payment import Payment, PaymentChangeHistory
 from stoqlib.domain.payment.views import (BasePaymentView, InPaymentView,
@@ -726,6 +727,12 @@ class TestAccountView(DomainTest):
         # The negative sum of t1 and t2 plus the sum of t3 and t4
         self.assertEqual(results[0].get_combined_value(), 90)
 
+        # The balance is the same after the changes are moved to the
+        # checkpoints
+        AccountBalanceCheckpoint.update(self.store)
+        results = self.store.find(AccountView, id=a1.id)
+        self.assertEqual(results[0].get_combined_value(), 90)
+
     def test_repr(self):
         a1 = self.create_account()
         results = self.store.find(AccountView, id=a1.id)
@@ -818,6 +825,23 @@ class TestProductBrandByBranchView(DomainTest):
             total_products += i.quantity
         self.assertNotEqual(total_products, 0)
 
+    def test_find_by_category_include_children(self):
+        branch = self.create_branch(name=u"branch1")
+        p1 = self.create_product(branch=branch, stock=5)
+        category = self.create_sellable_category(description=u"Category")
+        p1.sellable.category = category
+        p2 = self.create_product(branch=branch, stock=1)
+        p2.sellable.category = self.create_sellable_category(
+            description=u"Subcategory", parent=category)
+
+        results = ProductBrandByBranchView.find_by_category(self.store,
+                                                            category)
+        self.assertEqual(sum(r.quantity for r in results), 5)
+
+        results = ProductBrandByBranchView.find_by_category(
+            self.store, category, include_children=True)
+        self.assertEqual(sum(r.quantity for r in results), 6)
+
 
 class TestClientWithSalesView(DomainTest):
     def test_find_by_birth_date(self):
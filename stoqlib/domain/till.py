@@ -28,19 +28,22 @@
 
 import collections
 import logging
+import operator
+import uuid
 
 from kiwi.currency import currency
-from storm.expr import And, Eq, Join, LeftJoin, Or
+from storm.expr import And, Coalesce, Eq, Join, LeftJoin, Or, Sum
 from storm.info import ClassAlias
 from storm.references import Reference, ReferenceSet
 
-from stoqlib.database.expr import Date, TransactionTimestamp
+from stoqlib.database.bulk import bulk_insert
+from stoqlib.database.expr import Case, Date, TransactionTimestamp
 from stoqlib.database.properties import (PriceCol, DateTimeCol, UnicodeCol,
                                          IdentifierCol, IdCol, EnumCol)
 from stoqlib.database.viewable import Viewable
 from stoqlib.domain.base import Domain, IdentifiableDomain
 from stoqlib.domain.events import TillOpenedEvent, TillClosedEvent
-from stoqlib.domain.payment.card import CreditCardData
+from stoqlib.domain.payment.card import CreditCardData, CreditProvider
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.person import Person, LoginUser
@@ -55,6 +58,12 @@ _ = stoqlib_gettext
 
 log = logging.getLogger(__name__)
 
+#: A line of :meth:`Till.get_reconciliation`. *user_value* and
+#: *verify_value* are ``None`` when they were not informed
+TillReconciliationItem = collections.namedtuple(
+    'TillReconciliationItem',
+    ['description', 'system_value', 'user_value', 'verify_value'])
+
 #
 # Domain Classes
 #
@@ -373,28 +382,77 @@ class Till(IdentifiableDomain):
         will save the values all payment methods used.
         """
         money_method = PaymentMethod.get_by_name(self.store, u'money')
-        day_history = {}
-        # Keys are (method, provider, card_type), provider and card_type may be None if
-        # payment was not with card
-        day_history[(money_method, None, None)] = 0
-
-        for entry in self.get_entries():
-            provider = card_type = None
-            payment = entry.payment
-            method = payment.method if payment else money_method
-            if payment and payment.card_data:
-                provider = payment.card_data.provider
-                card_type = payment.card_data.card_type
-
-            key = (method, provider, card_type)
-            day_history.setdefault(key, 0)
-            day_history[key] += entry.value
-
-        summary = []
-        for (method, provider, card_type), value in day_history.items():
-            summary.append(TillSummary(till=self, method=method, provider=provider,
-                                       card_type=card_type, system_value=value))
-        return summary
+        day_history = self.get_entries_totals()
+        day_history.setdefault((money_method.id, None, None), 0)
+
+        ids = []
+        rows = []
+        for (method_id, provider_id, card_type), value in day_history.items():
+            summary_id = str(uuid.uuid4())
+            ids.append(summary_id)
+            rows.append((summary_id, self.id, method_id, provider_id,
+                         card_type, value))
+
+        bulk_insert(self.store,
+                    (TillSummary.id, TillSummary.till_id,
+                     TillSummary.method_id, TillSummary.provider_id,
+                     TillSummary.card_type, TillSummary.system_value),
+                    rows)
+        return list(self.store.find(TillSummary, TillSummary.id.is_in(ids)))
+
+    def get_entries_totals(self):
+        """Sum the entries of this till by payment method and card
+
+        The entries are summed by the database, without being loaded.
+
+        :returns: a dict mapping (method id, provider id, card type) to the
+          sum of the entries. The provider id and the card type are ``None``
+          if the payments were not made with a card, and entries without a
+          |payment| are summed with the money ones
+        """
+        money_method = PaymentMethod.get_by_name(self.store, u'money')
+        totals = {}
+        for view in self.store.find(TillEntrySummaryView, till_id=self.id):
+            key = (view.method_id or money_method.id, view.provider_id,
+                   view.card_type)
+            totals[key] = totals.get(key, 0) + view.value
+        return totals
+
+    def get_reconciliation(self):
+        """Compare the entries of this till with the values counted on closing
+
+        The values counted are the ones of the |tillsummaries| created by
+        :meth:`.get_day_summary`. The system values are summed again from
+        the entries.
+
+        :returns: a list of :class:`TillReconciliationItem`, sorted by
+          description
+        """
+        totals = self.get_entries_totals()
+        summaries = dict(
+            ((summary.method_id, summary.provider_id, summary.card_type),
+             summary)
+            for summary in self.store.find(TillSummary, till=self))
+
+        items = []
+        for key in set(totals) | set(summaries):
+            summary = summaries.get(key)
+            if summary is not None:
+                description = summary.description
+                user_value = summary.user_value
+                verify_value = summary.verify_value
+            else:
+                method_id, provider_id, card_type = key
+                description = TillSummary.get_description_for(
+                    self.store.get(PaymentMethod, method_id),
+                    provider_id and self.store.get(CreditProvider,
+                                                   provider_id),
+                    card_type)
+                user_value = verify_value = None
+            items.append(TillReconciliationItem(
+                description, currency(totals.get(key, 0)),
+                user_value, verify_value))
+        return sorted(items, key=operator.attrgetter('description'))
 
     #
     # Private
@@ -506,12 +564,54 @@ class TillSummary(Domain):
 
     @property
     def description(self):
-        if not self.card_type:
-            return self.method.get_description()
+        return self.get_description_for(self.method, self.provider,
+                                        self.card_type)
+
+    @classmethod
+    def get_description_for(cls, method, provider, card_type):
+        """Get the description of a summary
+
+        :param method: the |paymentmethod|
+        :param provider: the |creditprovider| or ``None``
+        :param card_type: the card type or ``None``
+        """
+        if not card_type:
+            return method.get_description()
+
+        return '%s %s %s' % (method.get_description(),
+                             provider.short_name,
+                             CreditCardData.short_desc[card_type])
+
+
+class TillEntrySummaryView(Viewable):
+    """The |tillentries| of each |till| summed by payment method and card
+
+    The entries without a |payment| don't have a method, and the ones
+    whose payments were not made with a card don't have a provider and
+    a card type.
+    """
+
+    till_id = TillEntry.till_id
+    method_id = Payment.method_id
+    provider_id = CreditCardData.provider_id
+    card_type = CreditCardData.card_type
+
+    #: the sum of the entries
+    value = Sum(TillEntry.value)
+
+    #: the sum of the positive entries
+    credits_total = Coalesce(Sum(Case(TillEntry.value > 0, TillEntry.value)), 0)
+
+    #: the sum of the negative entries
+    debits_total = Coalesce(Sum(Case(TillEntry.value < 0, TillEntry.value)), 0)
+
+    tables = [
+        TillEntry,
+        LeftJoin(Payment, Payment.id == TillEntry.payment_id),
+        LeftJoin(CreditCardData, CreditCardData.payment_id == Payment.id),
+    ]
 
-        return '%s %s %s' % (self.method.get_description(),
-                             self.provider.short_name,
-                             CreditCardData.short_desc[self.card_type])
+    group_by = [till_id, method_id, provider_id, card_type]
 
 
 class TillClosedView(Viewable):
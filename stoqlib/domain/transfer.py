@@ -42,7 +42,8 @@ from stoqlib.database.viewable import Viewable
 from stoqlib.domain.base import Domain, IdentifiableDomain
 from stoqlib.domain.events import StockOperationConfirmedEvent
 from stoqlib.domain.fiscal import Invoice
-from stoqlib.domain.product import ProductHistory, StockTransactionHistory
+from stoqlib.domain.product import (ProductHistory, ProductStockItem,
+                                    StockTransactionHistory)
 from stoqlib.domain.person import Person, Branch, Company, LoginUser, Employee
 from stoqlib.domain.interfaces import IContainer, IInvoice, IInvoiceItem
 from stoqlib.domain.sellable import Sellable
@@ -395,6 +396,7 @@ class TransferOrder(IdentifiableDomain):
         """
         assert self.can_send()
 
+        self._lock_stock_items(self.source_branch)
         for item in self.get_items():
             item.send(user)
 
@@ -411,6 +413,7 @@ class TransferOrder(IdentifiableDomain):
         """
         assert self.can_receive()
 
+        self._lock_stock_items(self.destination_branch)
         for item in self.get_items():
             item.receive(user)
 
@@ -423,6 +426,7 @@ class TransferOrder(IdentifiableDomain):
         """Cancel a transfer order"""
         assert self.can_cancel(current_branch)
 
+        self._lock_stock_items(self.source_branch)
         for item in self.get_items():
             item.cancel(user)
 
@@ -470,6 +474,15 @@ class TransferOrder(IdentifiableDomain):
         """
         return sum([item.quantity for item in self.get_items()], 0)
 
+    #
+    # Private
+    #
+
+    def _lock_stock_items(self, branch):
+        ProductStockItem.lock_for_update(
+            self.store, branch,
+            [item.sellable_id for item in self.get_items()])
+
 
 class BaseTransferView(Viewable):
     BranchDest = ClassAlias(Branch, 'branch_dest')
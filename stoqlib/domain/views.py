@@ -32,7 +32,7 @@ from storm.info import ClassAlias
 from stoqlib.database.expr import (Case, Distinct, Field, NullIf,
                                    StatementTimestamp, Date, Concat, Round)
 from stoqlib.database.viewable import Viewable
-from stoqlib.domain.account import Account, AccountTransaction
+from stoqlib.domain.account import Account, AccountBalanceCheckpoint
 from stoqlib.domain.address import Address
 from stoqlib.domain.commission import CommissionSource
 from stoqlib.domain.costcenter import CostCenterEntry
@@ -44,6 +44,7 @@ from stoqlib.domain.person import (Person, Supplier, Company, LoginUser,
                                    Individual, SalesPerson, ClientView)
 from stoqlib.domain.product import (Product,
                                     ProductStockItem,
+                                    ProductStockSummary,
                                     ProductHistory,
                                     ProductManufacturer,
                                     ProductSupplierInfo,
@@ -70,16 +71,15 @@ from stoqlib.lib.defaults import DECIMAL_PRECISION
 _StockBranchSummary = Alias(Select(
     columns=[Alias(Storable.id, 'storable_id'),
              Alias(Branch.id, 'branch_id'),
-             Alias(Sum(ProductStockItem.quantity), 'stock'),
-             Alias(Sum(ProductStockItem.quantity
-                       * ProductStockItem.stock_cost),
-                   'total_stock_cost')],
+             Alias(ProductStockSummary.quantity, 'stock'),
+             Alias(ProductStockSummary.total_cost, 'total_stock_cost')],
     tables=[Storable,
             # This is equivalent to a cross join
             Join(Branch, And(True)),
-            LeftJoin(ProductStockItem, And(ProductStockItem.branch_id == Branch.id,
-                                           ProductStockItem.storable_id == Storable.id))],
-    group_by=[Storable.id, Branch.id]), '_stock_summary')
+            LeftJoin(ProductStockSummary,
+                     And(ProductStockSummary.branch_id == Branch.id,
+                         ProductStockSummary.storable_id == Storable.id))]),
+    '_stock_summary')
 
 _price_search = Case(
     condition=Or(And(Date(StatementTimestamp()) >= Date(Sellable.on_sale_start_date),
@@ -151,16 +151,17 @@ class ProductFullStockView(Viewable):
     category_description = SellableCategory.description
     unit = SellableUnit.description
 
-    # Aggregates
-    total_stock_cost = Coalesce(Sum(ProductStockItem.quantity *
-                                    ProductStockItem.stock_cost), 0)
-    stock = Coalesce(Sum(ProductStockItem.quantity), 0)
+    # Aggregates. There's one summary for each branch, so this doesn't
+    # need to aggregate all the stock items (one for each batch)
+    total_stock_cost = Coalesce(Sum(ProductStockSummary.total_cost), 0)
+    stock = Coalesce(Sum(ProductStockSummary.quantity), 0)
 
     tables = [
         Sellable,
         Join(Product, Product.id == Sellable.id),
         LeftJoin(Storable, Storable.id == Product.id),
-        LeftJoin(ProductStockItem, ProductStockItem.storable_id == Storable.id),
+        LeftJoin(ProductStockSummary,
+                 ProductStockSummary.storable_id == Storable.id),
         LeftJoin(SellableTaxConstant,
                  SellableTaxConstant.id == Sellable.tax_constant_id),
         LeftJoin(SellableCategory, SellableCategory.id == Sellable.category_id),
@@ -203,7 +204,7 @@ class ProductFullStockView(Viewable):
             return store.find(cls)
 
         # Highjack the class being queried, since we need to add the branch
-        # on the ProductStockItem join to filter it.
+        # on the ProductStockSummary join to filter it.
         # Make sure to create it only once or else Viewable would fail to
         # compare both objects as their class would be different.
         hv = cls.highjacked.get(branch.id, None)
@@ -212,14 +213,14 @@ class ProductFullStockView(Viewable):
             for i, table in enumerate(tables):
                 if not isinstance(table, JoinExpr):
                     continue
-                if table.right is ProductStockItem:
+                if table.right is ProductStockSummary:
                     tables[i] = LeftJoin(
-                        ProductStockItem,
-                        And(ProductStockItem.storable_id == Storable.id,
-                            ProductStockItem.branch_id == branch.id))
+                        ProductStockSummary,
+                        And(ProductStockSummary.storable_id == Storable.id,
+                            ProductStockSummary.branch_id == branch.id))
                     break
             else:  # pragma nocoverage
-                raise AssertionError("Did not find ProductStockItem join")
+                raise AssertionError("Did not find ProductStockSummary join")
 
             hv = type(
                 "Highjacked%s" % (cls.__name__, ),
@@ -322,7 +323,7 @@ class ProductWithStockBranchView(ProductFullStockView):
     filter, otherwise, the results may be duplicated (once for each branch in
     the database)
     """
-    branch_id = ProductStockItem.branch_id
+    branch_id = ProductStockSummary.branch_id
     minimum_quantity = Storable.minimum_quantity
     maximum_quantity = Storable.maximum_quantity
 
@@ -350,7 +351,7 @@ _PurchaseItemTotal = Select(
 
 class ProductFullStockItemView(ProductFullStockView):
     # ProductFullStockView already joins with a 1 to Many table (Sellable
-    # with ProductStockItem).
+    # with ProductStockSummary).
     #
     # This is why we must join PurchaseItem (another 1 to many table) in a
     # subquery
@@ -449,14 +450,14 @@ class ProductBranchStockView(Viewable):
 
     id = Branch.id
     branch_name = Coalesce(NullIf(Company.fancy_name, u''), Person.name)
-    storable_id = ProductStockItem.storable_id
-    stock = Sum(ProductStockItem.quantity)
+    storable_id = ProductStockSummary.storable_id
+    stock = Sum(ProductStockSummary.quantity)
 
     tables = [
         Branch,
         Join(Person, Person.id == Branch.person_id),
         Join(Company, Company.person_id == Person.id),
-        Join(ProductStockItem, ProductStockItem.branch_id == Branch.id),
+        Join(ProductStockSummary, ProductStockSummary.branch_id == Branch.id),
     ]
 
     group_by = [Branch, branch_name, storable_id]
@@ -799,7 +800,7 @@ class PurchasedItemAndStockView(Viewable):
     product_id = Product.id
 
     # Aggregate
-    stocked = Sum(ProductStockItem.quantity)
+    stocked = Sum(ProductStockSummary.quantity)
 
     tables = [
         PurchaseItem,
@@ -808,11 +809,12 @@ class PurchasedItemAndStockView(Viewable):
         LeftJoin(Sellable, Sellable.id == PurchaseItem.sellable_id),
         LeftJoin(Product, Product.id == PurchaseItem.sellable_id),
         LeftJoin(Storable, Storable.id == Product.id),
-        LeftJoin(ProductStockItem, ProductStockItem.storable_id == Storable.id),
+        LeftJoin(ProductStockSummary,
+                 ProductStockSummary.storable_id == Storable.id),
     ]
 
     clause = And(PurchaseOrder.status == PurchaseOrder.ORDER_CONFIRMED,
-                 PurchaseOrder.branch_id == ProductStockItem.branch_id,
+                 PurchaseOrder.branch_id == ProductStockSummary.branch_id,
                  PurchaseItem.quantity > PurchaseItem.quantity_received, )
 
     group_by = [PurchaseItem, Branch, order_identifier, purchased_date,
@@ -824,7 +826,7 @@ class ConsignedItemAndStockView(PurchasedItemAndStockView):
     returned = PurchaseItem.quantity_returned
 
     clause = And(Eq(PurchaseOrder.consigned, True),
-                 PurchaseOrder.branch_id == ProductStockItem.branch_id)
+                 PurchaseOrder.branch_id == ProductStockSummary.branch_id)
 
 
 _ReceivingItemSummary = Select(columns=[ReceivingOrderItem.receiving_order_id,
@@ -1132,9 +1134,11 @@ class ProductBrandByBranchView(Viewable):
                 SellableCategory.id]
 
     @classmethod
-    def find_by_category(cls, store, category):
+    def find_by_category(cls, store, category, include_children=False):
         queries = []
-        if category:
+        if category and include_children:
+            queries.append(Sellable.category_id.is_in(category.get_subtree_ids()))
+        elif category:
             queries.append(Sellable.category == category)
         if queries:
             return store.find(cls, And(*queries))
@@ -1152,17 +1156,17 @@ class ProductBrandStockView(Viewable):
     id = Product.brand
     brand = Coalesce(Product.brand, u'')
 
-    quantity = Sum(ProductStockItem.quantity)
+    quantity = Sum(ProductStockSummary.quantity)
     company = u''
 
     tables = [
         Product,
         LeftJoin(Storable,
                  Storable.id == Product.id),
-        LeftJoin(ProductStockItem,
-                 ProductStockItem.storable_id == Storable.id),
+        LeftJoin(ProductStockSummary,
+                 ProductStockSummary.storable_id == Storable.id),
         LeftJoin(Sellable, Sellable.id == Product.id),
-        LeftJoin(Branch, Branch.id == ProductStockItem.branch_id)
+        LeftJoin(Branch, Branch.id == ProductStockSummary.branch_id)
     ]
     group_by = [id, brand]
 
@@ -1432,17 +1436,7 @@ class LoanItemView(Viewable):
     ]
 
 
-_SourceSum = Select(
-    columns=[AccountTransaction.source_account_id,
-             Alias(Sum(AccountTransaction.value), 'value')],
-    tables=[AccountTransaction],
-    group_by=[AccountTransaction.source_account_id])
-
-_DestSum = Select(
-    columns=[AccountTransaction.account_id,
-             Alias(Sum(AccountTransaction.value), 'value')],
-    tables=[AccountTransaction],
-    group_by=[AccountTransaction.account_id])
+_AccountBalance = AccountBalanceCheckpoint.get_balance_query()
 
 
 class AccountView(Viewable):
@@ -1456,15 +1450,13 @@ class AccountView(Viewable):
     description = Account.description
     code = Account.code
 
-    source_value = Field('source_sum', 'value')
-    dest_value = Field('dest_sum', 'value')
+    source_value = Field('account_balance', 'outgoing')
+    dest_value = Field('account_balance', 'incoming')
 
     tables = [
         Account,
-        LeftJoin(Alias(_SourceSum, 'source_sum'),
-                 Field('source_sum', 'source_account_id') == Account.id),
-        LeftJoin(Alias(_DestSum, 'dest_sum'),
-                 Field('dest_sum', 'account_id') == Account.id),
+        LeftJoin(Alias(_AccountBalance, 'account_balance'),
+                 Field('account_balance', 'account_id') == Account.id),
     ]
 
     @property
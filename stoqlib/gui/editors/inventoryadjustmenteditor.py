@@ -34,12 +34,14 @@ from kiwi.ui.objectlist import Column
 
 from stoqlib.api import api
 from stoqlib.domain.inventory import Inventory, InventoryItem
+from stoqlib.exceptions import StockError
 from stoqlib.gui.base.dialogs import run_dialog
+from stoqlib.gui.dialogs.progressdialog import ProgressDialog
 from stoqlib.gui.editors.baseeditor import BaseEditor
 from stoqlib.gui.fields import CfopField
 from stoqlib.lib.decorators import cached_property
 from stoqlib.lib.formatters import format_quantity, format_sellable_description
-from stoqlib.lib.message import yesno
+from stoqlib.lib.message import warning, yesno
 from stoqlib.lib.translation import stoqlib_gettext
 
 _ = stoqlib_gettext
@@ -172,13 +174,27 @@ class InventoryAdjustmentEditor(BaseEditor):
         self._run_adjustment_dialog(selected)
 
     def on_adjust_all_button__clicked(self, button):
-        for item in self.inventory_items:
-            if item.is_adjusted:
-                continue
-            item.actual_quantity = item.counted_quantity
-            item.reason = _(u'Automatic adjustment')
-            item.adjust(api.get_current_user(self.store), self.model.invoice_number)
-            self.inventory_items.update(item)
+        progress_dialog = ProgressDialog(_('Adjusting products'), pulse=False)
+        progress_dialog.set_transient_for(self.main_dialog)
+        progress_dialog.start(wait=0)
+        progress_dialog.cancel.hide()
+
+        self.store.savepoint('before_adjust_all')
+        try:
+            for adjusted, total in self.model.adjust_items(
+                    api.get_current_user(self.store), _(u'Automatic adjustment')):
+                progress_dialog.set_text('%s/%s' % (adjusted, total))
+                progress_dialog.progressbar.set_fraction(adjusted / float(total))
+                while Gtk.events_pending():
+                    Gtk.main_iteration_do(False)
+        except StockError as e:
+            self.store.rollback_to_savepoint('before_adjust_all')
+            warning(str(e))
+        finally:
+            progress_dialog.stop()
+
+        self.inventory_items.refresh()
+        self._update_widgets()
 
     def on_inventory_items__row_activated(self, objectlist, item):
         if not self.adjust_button.get_sensitive():
@@ -38,8 +38,9 @@ from stoqlib.domain.account import AccountTransaction
 from stoqlib.domain.events import (TillOpenEvent, TillCloseEvent,
                                    TillAddTillEntryEvent,
                                    TillAddCashEvent, TillRemoveCashEvent)
+from stoqlib.domain.payment.method import PaymentMethod
 from stoqlib.domain.person import Employee
-from stoqlib.domain.till import Till
+from stoqlib.domain.till import Till, TillEntrySummaryView
 from stoqlib.exceptions import DeviceError, TillError
 from stoqlib.gui.editors.baseeditor import BaseEditor
 from stoqlib.gui.slaves.tillslave import RemoveCashSlave, BaseCashSlave
@@ -244,18 +245,21 @@ class TillClosingEditor(BaseEditor):
         day_history = {}
         day_history[_(u'Initial Amount')] = self.till.initial_cash_amount
 
-        for entry in self.till.get_entries():
-            payment = entry.payment
-            if payment is not None:
-                desc = payment.method.get_description()
+        store = self.till.store
+        for view in store.find(TillEntrySummaryView, till_id=self.till.id):
+            if view.method_id is not None:
+                method = store.get(PaymentMethod, view.method_id)
+                values = [(method.get_description(), view.value)]
             else:
-                if entry.value > 0:
-                    desc = _(u'Cash In')
-                else:
-                    desc = _(u'Cash Out')
-
-            day_history.setdefault(desc, 0)
-            day_history[desc] += entry.value
+                # The entries are never zero, so there are no entries of
+                # a kind when its total is zero
+                values = [(desc, value) for desc, value in [
+                    (_(u'Cash In'), view.credits_total),
+                    (_(u'Cash Out'), view.debits_total)] if value]
+
+            for desc, value in values:
+                day_history.setdefault(desc, 0)
+                day_history[desc] += value
 
         for description, value in day_history.items():
             yield Settable(description=description, system_value=value, user_value=0)
@@ -26,12 +26,19 @@
 import datetime
 from decimal import Decimal
 
+from kiwi.currency import currency
+
+from stoqlib.domain.reorder import (ProductReorderSuggestion,
+                                    SuggestedPurchaseView)
 from stoqlib.domain.views import PurchasedItemAndStockView
 from stoqlib.gui.editors.purchaseeditor import PurchaseItemEditor
 from stoqlib.gui.search.productsearch import ProductSearch
-from stoqlib.gui.search.searchcolumns import SearchColumn, Column
+from stoqlib.gui.search.searchcolumns import (SearchColumn, Column,
+                                              QuantityColumn)
 from stoqlib.gui.search.searchoptions import (Any, Today, ThisWeek, NextWeek,
                                               ThisMonth, NextMonth)
+from stoqlib.lib.defaults import sort_sellable_code
+from stoqlib.lib.formatters import get_formatted_cost
 from stoqlib.lib.translation import stoqlib_gettext
 from stoqlib.reporting.purchase import PurchasedItemsReport
 
@@ -77,3 +84,68 @@ class PurchasedItemsSearch(ProductSearch):
 
     def get_editor_model(self, model):
         return model.purchase_item
+
+
+class SuggestedPurchaseSearch(ProductSearch):
+    """The purchases suggested for the |storables|
+
+    The suggestions are calculated by a job that reads the sales, the
+    stock and the pending purchases of all of them, so this only reads
+    its results. See :mod:`stoqlib.domain.reorder`.
+    """
+
+    title = _('Suggested Purchases Search')
+    search_spec = SuggestedPurchaseView
+    report_class = None
+    csv_data = (_('Suggested purchases'), _('suggested-purchases'))
+    has_print_price_button = False
+    has_new_button = False
+    text_field_columns = [SuggestedPurchaseView.code,
+                          SuggestedPurchaseView.description,
+                          SuggestedPurchaseView.supplier_name]
+    branch_filter_column = SuggestedPurchaseView.branch_id
+    unlimited_results = True
+
+    def _get_abc_classes(self):
+        return ([(_('Any'), None)] +
+                [(v, k) for k, v in ProductReorderSuggestion.abc_classes.items()])
+
+    def create_filters(self):
+        # To prevent calling the superclass method
+        pass
+
+    #
+    #  ProductSearch
+    #
+
+    def get_columns(self):
+        return [SearchColumn('code', title=_('Code'), data_type=str,
+                             sort_func=sort_sellable_code),
+                SearchColumn('description', title=_('Description'),
+                             data_type=str, expand=True, sorted=True),
+                SearchColumn('category_description', title=_('Category'),
+                             data_type=str, visible=False),
+                SearchColumn('supplier_name', title=_('Supplier'),
+                             data_type=str),
+                SearchColumn('branch_name', title=_('Branch'), data_type=str,
+                             visible=False),
+                SearchColumn('abc_class', title=_('Class'), data_type=str,
+                             width=60,
+                             valid_values=self._get_abc_classes()),
+                QuantityColumn('daily_sales', title=_('Sold per day'),
+                               visible=False),
+                QuantityColumn('stock', title=_('In Stock')),
+                QuantityColumn('to_receive', title=_('To Receive')),
+                SearchColumn('days_of_cover', title=_('Days of cover'),
+                             data_type=Decimal, width=90),
+                SearchColumn('lead_time', title=_('Lead time'), data_type=int,
+                             visible=False),
+                QuantityColumn('reorder_point', title=_('Reorder point'),
+                               visible=False),
+                QuantityColumn('suggested_quantity', title=_('Suggested')),
+                SearchColumn('cost', title=_('Cost'), data_type=currency,
+                             format_func=get_formatted_cost, visible=False),
+                SearchColumn('total', title=_('Total'), data_type=currency,
+                             width=100),
+                SearchColumn('calculated_date', title=_('Calculated'),
+                             data_type=datetime.date, visible=False)]
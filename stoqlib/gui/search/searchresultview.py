@@ -91,9 +91,10 @@ class SearchResultListView(ObjectList):
         if summary_label is None:
             return
         if self._lazy_updater and len(self):
-            post = self.get_model().get_post_data()
-            if post is not None:
-                summary_label.update_total(post.sum)
+            model = self.get_model()
+            model.connect('post-data-changed',
+                          self._on_model__post_data_changed)
+            self._update_lazy_summary(model.get_post_data())
         else:
             summary_label.update_total()
 
@@ -108,10 +109,28 @@ class SearchResultListView(ObjectList):
     def lazy_search_enabled(self):
         return self._lazy_updater is not None
 
+    #
+    # Private
+    #
+
+    def _update_lazy_summary(self, post):
+        summary_label = self._search.get_summary_label()
+        if summary_label is None or post is None:
+            return
+        if post.estimated:
+            # The total will be shown when the exact summary is ready
+            summary_label.set_value('')
+        else:
+            summary_label.update_total(post.sum)
+
     #
     # Callbacks
     #
 
+    def _on_model__post_data_changed(self, model, post):
+        if model is self.get_model():
+            self._update_lazy_summary(post)
+
     def _on__double_click(self, object_list, item):
         self.emit('item-activated', item)
 
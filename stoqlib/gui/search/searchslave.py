@@ -517,6 +517,10 @@ class SearchSlave(SlaveDelegate):
         if self.result_view:
             self.result_view.enable_lazy_search()
         self._lazy_search = True
+        # The rows are loaded as they are shown, so they can be shown
+        # before the results are counted
+        self.get_query_executer().set_summary_mode(
+            QueryExecuter.SUMMARY_ESTIMATE)
 
     def set_auto_search(self, auto_search):
         """
@@ -45,7 +45,9 @@ from stoqlib.gui.dialogs.tilldetails import TillDetailsDialog
 from stoqlib.gui.search.searchcolumns import IdentifierColumn, SearchColumn
 from stoqlib.gui.search.searchdialog import SearchDialog
 from stoqlib.gui.search.searchfilters import DateSearchFilter, ComboSearchFilter
+from stoqlib.gui.utils.printing import print_report
 from stoqlib.lib.translation import stoqlib_gettext
+from stoqlib.reporting.till import TillReconciliationReport
 
 
 _ = stoqlib_gettext
@@ -137,6 +139,7 @@ class TillClosedSearch(SearchDialog):
     size = (750, 500)
     searching_by_date = True
     branch_filter_column = TillClosedView.branch_id
+    report_class = TillReconciliationReport
 
     def setup_widgets(self):
         self.update_widgets()
@@ -144,6 +147,14 @@ class TillClosedSearch(SearchDialog):
     def update_widgets(self):
         selected = self.get_selection()
         self.set_details_button_sensitive(bool(selected))
+        self.set_print_button_sensitive(bool(selected))
+
+    def print_report(self):
+        # The button is also made sensitive when the search finds tills
+        view = self.results.get_selected()
+        if view is None:
+            return
+        print_report(self.report_class, self.store.get(Till, view.id))
 
     def create_filters(self):
         self.set_text_field_columns(['responsible_open_name',
@@ -291,6 +291,8 @@ _bindings = [
      _("Search for purchased items")),
     ('app.purchase.search_products_sold', '',
      _("Search for sold products")),
+    ('app.purchase.search_suggested_purchases', '',
+     _("Search for suggested purchases")),
     ('app.purchase.search_prices', '',
      _("Search for prices")),
     ('app.purchase.search_consignment_items', '',
@@ -397,6 +399,8 @@ _bindings = [
      _("Search for product history")),
     ('app.stock.search_purchased_stock_items', '',
      _("Search for purchased stock items")),
+    ('app.stock.search_suggested_purchases', '',
+     _("Search for suggested purchases")),
     ('app.stock.search_stock_items', "<Primary><Alt>s",
      _("Search for stock items")),
     ('app.stock.search_brand_items', "",
@@ -27,6 +27,7 @@ from pygtkcompat.generictreemodel import GenericTreeModel
 
 from kiwi.datatypes import number
 from kiwi.ui.objectlist import empty_marker, ListLabel
+from kiwi.utils import gsignal
 
 from stoqlib.lib.translation import stoqlib_gettext
 
@@ -64,6 +65,10 @@ class LazyObjectModel(GenericTreeModel, Gtk.TreeSortable):
 
     __gtype_name__ = 'LazyObjectModel'
 
+    #: Emitted when the exact summary of an estimated result is ready.
+    #: The number of rows was already updated when this is emitted
+    gsignal('post-data-changed', object)
+
     def __init__(self, objectlist, result, executer, initial_count):
         """
         :param objectlist: a ObjectList
@@ -79,6 +84,7 @@ class LazyObjectModel(GenericTreeModel, Gtk.TreeSortable):
         self._initial_count = initial_count
         self._iters = []
         self._orig_result = result
+        self._post_operation = None
         self._post_result = None
         self._result = None
         self._values = []
@@ -92,6 +98,10 @@ class LazyObjectModel(GenericTreeModel, Gtk.TreeSortable):
         self._load_result_set(result)
 
     def _load_result_set(self, result):
+        if self._post_operation is not None:
+            self._post_operation.cancel()
+            self._post_operation = None
+
         self._post_result = self._executer.get_post_result(result)
         if self._post_result is not None:
             count = self._post_result.count
@@ -103,6 +113,42 @@ class LazyObjectModel(GenericTreeModel, Gtk.TreeSortable):
         self._values = [empty_marker] * count
         self.load_items_from_results(0, self._initial_count)
 
+        if self._post_result is not None and self._post_result.estimated:
+            # Show the rows now, using the estimated count, and fix the
+            # count when the exact one is ready
+            self._post_operation = self._executer.get_post_result_async(
+                result, self._on_exact_post_result)
+
+    def _set_count(self, count):
+        old_count = self._count
+        if count == old_count:
+            return
+
+        self._count = count
+        self._iters = list(range(0, count))
+        if self._sort_order == Gtk.SortType.DESCENDING:
+            # The rows were loaded from the end of the results, so they
+            # are all in the wrong positions now
+            self._values = [empty_marker] * count
+            for i in range(min(old_count, count)):
+                self.row_changed((i, ), self.create_tree_iter(i))
+        elif count < old_count:
+            del self._values[count:]
+        else:
+            self._values.extend([empty_marker] * (count - old_count))
+
+        for i in reversed(range(count, old_count)):
+            self.row_deleted((i, ))
+        for i in range(old_count, count):
+            self.row_inserted((i, ), self.create_tree_iter(i))
+        self.load_items_from_results(0, self._initial_count)
+
+    def _on_exact_post_result(self, post_result):
+        self._post_operation = None
+        self._post_result = post_result
+        self._set_count(post_result.count)
+        self.emit('post-data-changed', post_result)
+
     # GtkTreeModel
 
     @debug
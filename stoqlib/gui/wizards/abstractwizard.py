@@ -39,14 +39,15 @@ from kiwi.datatypes import ValidationError
 from kiwi.ui.objectlist import SummaryLabel
 from kiwi.utils import gsignal
 from kiwi.python import Settable
-from storm.expr import And, Lower
 
 from stoqlib.api import api
 from stoqlib.domain.sellable import Sellable
 from stoqlib.domain.payment.payment import Payment
 from stoqlib.domain.payment.group import PaymentGroup
-from stoqlib.domain.product import Product, StorableBatch
+from stoqlib.domain.priceresolver import get_price_resolver
+from stoqlib.domain.product import Product
 from stoqlib.domain.sale import SaleItem
+from stoqlib.domain.sellablelookup import get_sellable_lookup_index
 from stoqlib.domain.workorder import WorkOrderItem
 from stoqlib.domain.service import ServiceView
 from stoqlib.domain.views import (ProductFullStockItemView,
@@ -669,35 +670,8 @@ class SellableItemSlave(BaseEditorSlave):
           ``None`` if nothing was found.
         """
         viewable, default_query = self.get_sellable_view_query()
-
-        # FIXME: Put this logic for getting the sellable based on
-        # barcode/code/batch_number on domain. Note that something very
-        # simular is done on POS app
-
-        # First try barcode, then code since there might be a product
-        # with a code equal to another product's barcode
-        for attr in [viewable.barcode, viewable.code]:
-            query = Lower(attr) == text.lower()
-            if default_query:
-                query = And(query, default_query)
-
-            result = self.store.find(viewable, query).one()
-            if result:
-                return result.sellable, None
-
-        # if none of the above worked, try to find by batch number
-        query = Lower(StorableBatch.batch_number) == text.lower()
-        batch = self.store.find(StorableBatch, query).one()
-        if batch:
-            sellable = batch.storable.product.sellable
-            query = viewable.id == sellable.id
-            if default_query:
-                query = And(query, default_query)
-            # Make sure batch's sellable is in the view
-            if not self.store.find(viewable, query).is_empty():
-                return sellable, batch
-
-        return None, None
+        return get_sellable_lookup_index().find(
+            self.store, text, viewable=viewable, query=default_query)
 
     def _get_sellable_and_batch(self):
         """This method always read the barcode and searches de database.
@@ -814,7 +788,7 @@ class SellableItemSlave(BaseEditorSlave):
 
         if self.validate_price:
             category = getattr(self.model, 'client_category', None)
-            default_price = sellable.get_price_for_category(category)
+            default_price = get_price_resolver().get_price(sellable, category)
             if (not sysparam.get_bool('ALLOW_HIGHER_SALE_PRICE') and
                     value > default_price):
                 return ValidationError(_(u'The sell price cannot be greater '
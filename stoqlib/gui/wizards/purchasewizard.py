@@ -38,6 +38,7 @@ from stoqlib.domain.person import Branch, Supplier, Transporter
 from stoqlib.domain.product import ProductSupplierInfo
 from stoqlib.domain.purchase import PurchaseOrder, PurchaseItem
 from stoqlib.domain.receiving import ReceivingOrder, ReceivingInvoice
+from stoqlib.domain.reorder import ProductReorderSuggestion
 from stoqlib.domain.sellable import Sellable
 from stoqlib.domain.views import ProductFullStockItemSupplierView
 from stoqlib.gui.base.dialogs import run_dialog
@@ -271,15 +272,18 @@ class PurchaseItemStep(SellableItemStep):
 
     def sellable_selected(self, sellable, batch=None):
         super(PurchaseItemStep, self).sellable_selected(sellable, batch=batch)
+        suggested = self._get_suggested_quantity(sellable)
         supplier_info = self._get_supplier_info()
         if not supplier_info:
+            if suggested:
+                self.quantity.set_value(suggested)
             return
 
         minimum = supplier_info.minimum_purchase
         self.quantity.set_adjustment(Gtk.Adjustment(lower=minimum,
                                                     upper=MAX_INT,
                                                     step_increment=1))
-        self.quantity.set_value(minimum)
+        self.quantity.set_value(max(minimum, suggested))
         self.cost.set_value(supplier_info.base_cost)
 
     def get_sellable_search_extra_kwargs(self):
@@ -316,6 +320,15 @@ class PurchaseItemStep(SellableItemStep):
     # Private API
     #
 
+    def _get_suggested_quantity(self, sellable):
+        if sellable is None or sellable.product is None:
+            return 0
+        suggestion = ProductReorderSuggestion.get_suggestion(
+            self.store, sellable.product, self.model.branch)
+        if suggestion is None:
+            return 0
+        return suggestion.suggested_quantity
+
     def _get_supplier_info(self):
         sellable = self.proxy.model.sellable
         if not sellable:
@@ -40,6 +40,7 @@ from stoqlib.domain.event import Event
 from stoqlib.domain.fiscal import CfopData
 from stoqlib.domain.payment.group import PaymentGroup
 from stoqlib.domain.person import ClientCategory, Client, SalesPerson
+from stoqlib.domain.priceresolver import get_price_resolver
 from stoqlib.domain.product import ProductStockItem
 from stoqlib.domain.sale import Delivery, Sale, SaleItem, SaleComment
 from stoqlib.domain.sellable import Sellable
@@ -314,7 +315,8 @@ class SaleQuoteItemStep(SellableItemStep):
             self.slave.clear_message()
 
     def add_sellable(self, sellable, parent=None, reset_proxy=True):
-        price = sellable.get_price_for_category(self.model.client_category)
+        price = get_price_resolver().get_price(sellable,
+                                               self.model.client_category)
         new_price = self.cost.read()
 
         # Percentage of discount
@@ -453,8 +455,8 @@ class SaleQuoteItemStep(SellableItemStep):
         # the batch when confirming a sale.
         SellableItemStep.sellable_selected(self, sellable, batch=None)
         if sellable:
-            price = sellable.get_price_for_category(
-                self.model.client_category)
+            price = get_price_resolver().get_price(
+                sellable, self.model.client_category)
             self.cost.update(price)
 
     def get_extra_discount(self, sellable):
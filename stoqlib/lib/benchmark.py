@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Infrastructure for benchmarking the business hot paths
+
+A :class:`Benchmark` prepares some data on :meth:`Benchmark.setup` and
+exercises a single operation on :meth:`Benchmark.run`. The
+:class:`BenchmarkRunner` runs each benchmark a number of times, each one on
+a new store that is rolled back in the end, so that the database is left
+untouched. For every benchmark the wall time, the number of queries sent
+to the database and the peak memory allocated are recorded.
+
+The results can be saved to a json file and used as a baseline for
+future runs, see :func:`compare_results`.
+"""
+
+import datetime
+import json
+import logging
+import time
+import tracemalloc
+
+from storm.tracer import install_tracer, remove_tracer_type
+
+from stoqlib.database.runtime import new_store
+
+log = logging.getLogger(__name__)
+
+#: The version of the format of the json files
+RESULTS_VERSION = 1
+
+
+class SkipBenchmark(Exception):
+    """Raised by :meth:`Benchmark.setup` when the benchmark cannot run
+    on the current database (e.g. a plugin is not installed)
+    """
+
+
+class QueryCounter(object):
+    """A storm tracer that counts the statements sent to the database"""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self):
+        self.count = 0
+        install_tracer(self)
+
+    def remove(self):
+        remove_tracer_type(type(self))
+
+    def connection_raw_execute_success(self, connection, raw_cursor,
+                                       statement, params):
+        self.count += 1
+
+    def connection_raw_execute_error(self, connection, raw_cursor,
+                                     statement, params, error):
+        self.count += 1
+
+
+class Benchmark(object):
+    """Base class for benchmarks
+
+    Subclasses must define :attr:`name` and implement :meth:`run`.
+    A new instance is created for each iteration.
+
+    :param store: the store where the benchmark runs. It will be rolled
+        back after the iteration
+    :param branch: the |branch| where the operations happen
+    :param station: the |branchstation| where the operations happen
+    :param user: the |loginuser| doing the operations
+    """
+
+    #: The name used to identify this benchmark in the results
+    name = None
+
+    #: A short description of what is being measured
+    description = u''
+
+    def __init__(self, store, branch, station, user):
+        self.store = store
+        self.branch = branch
+        self.station = station
+        self.user = user
+
+    def setup(self):
+        """Prepare the data needed by :meth:`run`.
+
+        This is not measured. Raise :exc:`SkipBenchmark` if the benchmark
+        cannot run on this database.
+        """
+
+    def run(self):
+        """Execute the operation being measured"""
+        raise NotImplementedError
+
+
+class BenchmarkResult(object):
+    """The result of running a benchmark a number of times
+
+    :ivar times: the wall time, in seconds, of each iteration
+    :ivar queries: the number of queries executed by one iteration
+    :ivar peak_memory: the peak memory allocated by one iteration, in bytes
+    :ivar skipped: the reason the benchmark was skipped, if it was
+    :ivar error: the error the benchmark failed with, if it did
+    """
+
+    def __init__(self, name, times=None, queries=None, peak_memory=None,
+                 skipped=None, error=None):
+        self.name = name
+        self.times = times or []
+        self.queries = queries
+        self.peak_memory = peak_memory
+        self.skipped = skipped
+        self.error = error
+
+    @property
+    def median(self):
+        if not self.times:
+            return None
+        times = sorted(self.times)
+        middle = len(times) // 2
+        if len(times) % 2:
+            return times[middle]
+        return (times[middle - 1] + times[middle]) / 2
+
+    @property
+    def ok(self):
+        return self.skipped is None and self.error is None
+
+    def to_dict(self):
+        data = dict(times=self.times,
+                    median=self.median,
+                    queries=self.queries,
+                    peak_memory=self.peak_memory)
+        if self.skipped is not None:
+            data['skipped'] = self.skipped
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, times=data.get('times'),
+                   queries=data.get('queries'),
+                   peak_memory=data.get('peak_memory'),
+                   skipped=data.get('skipped'),
+                   error=data.get('error'))
+
+    def __repr__(self):
+        return '<BenchmarkResult %s median=%r queries=%r>' % (
+            self.name, self.median, self.queries)
+
+
+class BenchmarkRunner(object):
+    """Runs benchmarks and collects their results
+
+    :param branch: the |branch| passed to the benchmarks
+    :param station: the |branchstation| passed to the benchmarks
+    :param user: the |loginuser| passed to the benchmarks
+    :param repeat: how many timed iterations each benchmark has
+    """
+
+    def __init__(self, branch, station, user, repeat=5):
+        self.branch = branch
+        self.station = station
+        self.user = user
+        self.repeat = repeat
+
+    #
+    #  Public API
+    #
+
+    def run(self, benchmarks):
+        """Run the benchmarks
+
+        :param benchmarks: a sequence of :class:`Benchmark` subclasses
+        :returns: a list of :class:`BenchmarkResult`
+        """
+        return [self.run_benchmark(benchmark) for benchmark in benchmarks]
+
+    def run_benchmark(self, benchmark_class):
+        """Run a single benchmark
+
+        The first iteration is used to warm up the caches and to measure
+        the peak memory, since tracing the allocations slows down the
+        execution considerably. The following iterations are timed.
+
+        :param benchmark_class: a :class:`Benchmark` subclass
+        :returns: a :class:`BenchmarkResult`
+        """
+        result = BenchmarkResult(benchmark_class.name)
+        counter = QueryCounter()
+        try:
+            result.peak_memory = self._run_iteration(benchmark_class,
+                                                     trace_memory=True)
+            queries = []
+            for i in range(self.repeat):
+                counter.install()
+                try:
+                    elapsed = self._run_iteration(benchmark_class)
+                finally:
+                    counter.remove()
+                result.times.append(elapsed)
+                queries.append(counter.count)
+            # The number of queries should be the same on every iteration,
+            # but be robust against something else using the database
+            result.queries = min(queries)
+        except SkipBenchmark as e:
+            log.info('Skipping benchmark %s: %s', result.name, e)
+            result.skipped = str(e)
+        except Exception as e:
+            log.exception('Error running benchmark %s', result.name)
+            result.error = '%s: %s' % (type(e).__name__, e)
+        return result
+
+    #
+    #  Private
+    #
+
+    def _run_iteration(self, benchmark_class, trace_memory=False):
+        store = new_store()
+        try:
+            benchmark = benchmark_class(store, store.fetch(self.branch),
+                                        store.fetch(self.station),
+                                        store.fetch(self.user))
+            benchmark.setup()
+            store.flush()
+
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            benchmark.run()
+            # Make sure pending changes are included in the measurement
+            store.flush()
+            elapsed = time.perf_counter() - start
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                return peak
+            return elapsed
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            store.rollback(close=True)
+
+
+def save_results(results, filename):
+    """Save benchmark results to a json file
+
+    :param results: a list of :class:`BenchmarkResult`
+    :param filename: the file to write
+    """
+    data = dict(version=RESULTS_VERSION,
+                date=datetime.datetime.now().isoformat(),
+                results=dict((r.name, r.to_dict()) for r in results))
+    with open(filename, 'w') as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    """Load benchmark results saved by :func:`save_results`
+
+    :param filename: the file to read
+    :returns: a list of :class:`BenchmarkResult`
+    """
+    with open(filename) as fp:
+        data = json.load(fp)
+    if data.get('version') != RESULTS_VERSION:
+        raise ValueError("Unsupported benchmark results version: %r" % (
+            data.get('version'), ))
+    return [BenchmarkResult.from_dict(name, values)
+            for name, values in sorted(data['results'].items())]
+
+
+def compare_results(baseline, results, tolerance=0.2):
+    """Compare benchmark results against a baseline
+
+    A regression is flagged when the median time or the peak memory grows
+    more than *tolerance* or when the number of queries grows at all, since
+    that usually means a query is being executed inside a loop.
+
+    :param baseline: a list of :class:`BenchmarkResult` used as reference
+    :param results: a list of :class:`BenchmarkResult` to be checked
+    :param tolerance: the allowed relative increase for time and memory
+    :returns: a list of (benchmark name, metric, baseline value,
+        new value) tuples, one for each regression found
+    """
+    reference = dict((r.name, r) for r in baseline)
+    regressions = []
+    for result in results:
+        old = reference.get(result.name)
+        if old is None or not old.ok or not result.ok:
+            continue
+
+        if result.median > old.median * (1 + tolerance):
+            regressions.append((result.name, 'time',
+                                old.median, result.median))
+        if result.queries > old.queries:
+            regressions.append((result.name, 'queries',
+                                old.queries, result.queries))
+        if result.peak_memory > old.peak_memory * (1 + tolerance):
+            regressions.append((result.name, 'peak_memory',
+                                old.peak_memory, result.peak_memory))
+    return regressions
+
+
+def format_results(results):
+    """Format the results as a text table
+
+    :param results: a list of :class:`BenchmarkResult`
+    :returns: a string
+    """
+    lines = ['%-30s %10s %10s %8s %12s' % (
+        'benchmark', 'median', 'min', 'queries', 'peak memory')]
+    for result in results:
+        if result.skipped is not None:
+            lines.append('%-30s skipped: %s' % (result.name, result.skipped))
+        elif result.error is not None:
+            lines.append('%-30s error: %s' % (result.name, result.error))
+        else:
+            lines.append('%-30s %9.2fms %9.2fms %8d %10.1fKB' % (
+                result.name, result.median * 1000, min(result.times) * 1000,
+                result.queries, result.peak_memory / 1024.0))
+    return '\n'.join(lines)
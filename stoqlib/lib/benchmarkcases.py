@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Benchmarks for the business hot paths
+
+These are meant to be run against a database populated by
+:mod:`stoqlib.domain.scaledata`, but they work on any database that has
+some storables in stock on the benchmarked branch.
+"""
+
+import csv
+import fnmatch
+import io
+from decimal import Decimal
+
+from storm.expr import And, Eq, Join
+
+from stoqlib.database.queryexecuter import QueryExecuter, StringQueryState
+from stoqlib.lib.benchmark import Benchmark, SkipBenchmark
+from stoqlib.lib.parameters import sysparam
+from stoqlib.lib.pluginmanager import get_plugin_manager
+
+
+def get_sellables_in_stock(store, branch, limit, minimum=1):
+    """Get available |sellables| with stock on a |branch|
+
+    :param store: a store
+    :param branch: the |branch|
+    :param limit: the maximum number of sellables to return
+    :param minimum: the minimum quantity in stock of the sellables
+    :returns: a list of |sellables|, ordered by their code
+    """
+    from stoqlib.domain.product import Product, ProductStockItem, Storable
+    from stoqlib.domain.sellable import Sellable
+
+    tables = [Sellable,
+              Join(Product, Product.id == Sellable.id),
+              Join(Storable, Storable.id == Product.id),
+              Join(ProductStockItem,
+                   ProductStockItem.storable_id == Storable.id)]
+    query = And(Sellable.status == Sellable.STATUS_AVAILABLE,
+                Eq(Storable.is_batch, False),
+                Eq(Product.is_grid, False),
+                ProductStockItem.branch_id == branch.id,
+                ProductStockItem.quantity >= minimum)
+    return list(store.using(*tables).find(Sellable, query).order_by(
+        Sellable.code)[:limit])
+
+
+def create_ordered_sale(store, branch, station, user, sellables):
+    """Create an ordered |sale| with a money payment, ready to be confirmed
+
+    :param sellables: the |sellables| that will be sold, one of each
+    """
+    from stoqlib.domain.payment.group import PaymentGroup
+    from stoqlib.domain.payment.method import PaymentMethod
+    from stoqlib.domain.payment.payment import Payment
+    from stoqlib.domain.sale import Sale
+
+    group = PaymentGroup(store=store)
+    sale = Sale(store=store,
+                status=Sale.STATUS_QUOTE,
+                branch=branch,
+                station=station,
+                salesperson=user.person.sales_person,
+                group=group,
+                cfop_id=sysparam.get_object_id('DEFAULT_SALES_CFOP'),
+                coupon_id=None)
+    for sellable in sellables:
+        sale.add_sellable(sellable, quantity=1)
+    sale.order(user)
+
+    method = PaymentMethod.get_by_name(store, u'money')
+    method.create_payment(branch, station, Payment.TYPE_IN, group,
+                          sale.get_total_sale_amount())
+    return sale
+
+
+class PosBarcodeLookupBenchmark(Benchmark):
+    name = 'pos_barcode_lookup'
+    description = u'Look up 100 codes typed on the POS barcode entry'
+
+    #: If the lookup index should be loaded, like when the till is opened
+    load_index = True
+
+    def setup(self):
+        sellables = get_sellables_in_stock(self.store, self.branch, 90,
+                                           minimum=0)
+        if not sellables:
+            raise SkipBenchmark("There are no sellables in stock")
+        # Most of the time the barcode is read, sometimes the code is typed
+        # and a few times the code is not found at all
+        self.texts = [s.barcode or s.code for s in sellables[:60]]
+        self.texts.extend(s.code for s in sellables[60:])
+        self.texts.extend(u'not-found-%d' % i for i in range(10))
+
+        from stoqlib.domain.sellablelookup import SellableLookupIndex
+        self.index = SellableLookupIndex(listen=False)
+        if self.load_index:
+            self.index.load(self.store)
+
+    def run(self):
+        for text in self.texts:
+            self.index.find(self.store, text)
+
+
+class PosBarcodeLookupUncachedBenchmark(PosBarcodeLookupBenchmark):
+    name = 'pos_barcode_lookup_uncached'
+    description = (u'Look up 100 codes typed on the POS barcode entry, '
+                   u'without the lookup index')
+    load_index = False
+
+
+class SaleConfirmBenchmark(Benchmark):
+    #: How many items the sale has
+    n_items = None
+
+    def setup(self):
+        from stoqlib.domain.till import Till
+
+        sellables = get_sellables_in_stock(self.store, self.branch,
+                                           self.n_items)
+        if len(sellables) < self.n_items:
+            raise SkipBenchmark("There are not %d sellables in stock" % (
+                self.n_items, ))
+        self.sale = create_ordered_sale(self.store, self.branch, self.station,
+                                        self.user, sellables)
+        self.till = Till.get_current(self.store, self.station)
+
+    def run(self):
+        self.sale.confirm(self.user, till=self.till)
+
+
+class SaleConfirm1Benchmark(SaleConfirmBenchmark):
+    name = 'sale_confirm_1'
+    description = u'Confirm a sale with 1 item'
+    n_items = 1
+
+
+class SaleConfirm20Benchmark(SaleConfirmBenchmark):
+    name = 'sale_confirm_20'
+    description = u'Confirm a sale with 20 items'
+    n_items = 20
+
+
+class SaleConfirm300Benchmark(SaleConfirmBenchmark):
+    name = 'sale_confirm_300'
+    description = u'Confirm a sale with 300 items'
+    n_items = 300
+
+
+class StockSearchBenchmark(Benchmark):
+    name = 'stock_search'
+    description = u'Search the stock of a branch using text filters'
+
+    #: The texts typed on the search entry
+    texts = [u'product 12', u'789000', u'scale product', u'not-found']
+
+    def setup(self):
+        from stoqlib.domain.views import ProductFullStockView
+
+        self.executer = QueryExecuter(self.store)
+        self.executer.set_search_spec(ProductFullStockView)
+        self.executer.set_query(
+            lambda store: ProductFullStockView.find_by_branch(store,
+                                                              self.branch))
+        self.executer.set_filter_columns(self, ['code', 'barcode',
+                                                'description'])
+        self.executer.set_limit(1000)
+
+    def run(self):
+        for text in self.texts:
+            results = self.executer.search([StringQueryState(self, text)])
+            # The search dialog displays the results and the summary row
+            list(results)
+            self.executer.get_post_result(results)
+
+
+class ReceivingConfirmBenchmark(Benchmark):
+    name = 'receiving_confirm'
+    description = u'Confirm a receiving order with 20 items'
+
+    def setup(self):
+        from stoqlib.domain.payment.group import PaymentGroup
+        from stoqlib.domain.person import Supplier
+        from stoqlib.domain.purchase import PurchaseOrder
+        from stoqlib.domain.receiving import ReceivingInvoice, ReceivingOrder
+
+        supplier = self.store.find(Supplier).order_by(Supplier.te_id).first()
+        if supplier is None:
+            raise SkipBenchmark("There are no suppliers")
+        sellables = get_sellables_in_stock(self.store, self.branch, 20,
+                                           minimum=0)
+        if len(sellables) < 20:
+            raise SkipBenchmark("There are not 20 sellables in stock")
+
+        purchase = PurchaseOrder(store=self.store,
+                                 supplier=supplier,
+                                 branch=self.branch,
+                                 station=self.station,
+                                 group=PaymentGroup(store=self.store),
+                                 responsible=self.user)
+        for sellable in sellables:
+            purchase.add_item(sellable, quantity=10, cost=sellable.cost)
+        purchase.confirm(self.user)
+
+        invoice = ReceivingInvoice(store=self.store,
+                                   invoice_number=1,
+                                   supplier=supplier,
+                                   branch=self.branch,
+                                   station=self.station,
+                                   group=purchase.group,
+                                   responsible=self.user)
+        self.receiving = ReceivingOrder(store=self.store,
+                                        invoice_number=1,
+                                        responsible=self.user,
+                                        branch=self.branch,
+                                        station=self.station,
+                                        receiving_invoice=invoice)
+        self.receiving.add_purchase(purchase)
+        for item in purchase.get_items():
+            self.receiving.add_purchase_item(item)
+
+    def run(self):
+        self.receiving.confirm(self.user)
+
+
+class InventoryCreateBenchmark(Benchmark):
+    name = 'inventory_create'
+    description = u'Open an inventory for a category of products'
+
+    def setup(self):
+        from stoqlib.domain.sellable import Sellable
+
+        sellables = get_sellables_in_stock(self.store, self.branch, 1)
+        if not sellables or sellables[0].category is None:
+            raise SkipBenchmark("There are no categorized sellables in stock")
+        self.query = Sellable.category_id == sellables[0].category_id
+
+    def run(self):
+        from stoqlib.domain.inventory import Inventory
+        Inventory.create_inventory(self.store, self.branch, self.station,
+                                   self.user, query=self.query)
+
+
+class ProductImportBenchmark(Benchmark):
+    name = 'csv_product_import'
+    description = u'Import 200 products from a csv file'
+
+    def setup(self):
+        from stoqlib.importers.productimporter import ProductImporter
+
+        fp = io.StringIO()
+        writer = csv.writer(fp)
+        for i in range(200):
+            writer.writerow([u'Imported', u'299%09d' % i, u'Imported %d' % (i % 10),
+                             u'Imported product %d' % i, u'10.50', u'5.25',
+                             u'5', u'4', u'100', u'110', u'12345678'])
+        fp.seek(0)
+
+        try:
+            self.importer = ProductImporter()
+        except ValueError as e:
+            raise SkipBenchmark(str(e))
+        self.importer.feed(fp, filename='benchmark.csv')
+
+    def run(self):
+        for i in range(self.importer.get_n_items()):
+            self.importer.process_item(self.store, i)
+
+
+class ObjectListReportBenchmark(Benchmark):
+    name = 'objectlist_report'
+    description = u'Render a stock report with 1000 products'
+
+    def setup(self):
+        from kiwi.currency import currency
+        from kiwi.ui.objectlist import Column, ObjectList
+        from stoqlib.domain.views import ProductFullStockView
+
+        self.objectlist = ObjectList([
+            Column('code', title=u'Code', data_type=str),
+            Column('barcode', title=u'Barcode', data_type=str),
+            Column('description', title=u'Description', data_type=str),
+            Column('price', title=u'Price', data_type=currency),
+            Column('stock', title=u'Stock', data_type=Decimal)])
+        self.data = list(
+            ProductFullStockView.find_by_branch(self.store, self.branch)
+            .order_by(ProductFullStockView.code)[:1000])
+
+    def run(self):
+        from stoqlib.reporting.product import ProductStockReport
+        report = ProductStockReport(None, self.objectlist, self.data,
+                                    filter_strings=[u'Benchmark'])
+        report.get_html()
+
+
+class NFeGenerationBenchmark(Benchmark):
+    name = 'nfe_generation'
+    description = u'Generate the NF-e of a sale with 20 items'
+
+    def setup(self):
+        if not get_plugin_manager().is_active('nfe'):
+            raise SkipBenchmark("The nfe plugin is not active")
+
+        sellables = get_sellables_in_stock(self.store, self.branch, 20)
+        if len(sellables) < 20:
+            raise SkipBenchmark("There are not 20 sellables in stock")
+        self.sale = create_ordered_sale(self.store, self.branch, self.station,
+                                        self.user, sellables)
+        self.sale.confirm(self.user)
+
+    def run(self):
+        from nfe.nfegenerator import NFeGenerator
+        NFeGenerator(self.sale, self.store).generate()
+
+
+#: All the available benchmarks, in the order they are executed
+BENCHMARKS = [
+    PosBarcodeLookupBenchmark,
+    PosBarcodeLookupUncachedBenchmark,
+    SaleConfirm1Benchmark,
+    SaleConfirm20Benchmark,
+    SaleConfirm300Benchmark,
+    StockSearchBenchmark,
+    ReceivingConfirmBenchmark,
+    InventoryCreateBenchmark,
+    ProductImportBenchmark,
+    ObjectListReportBenchmark,
+    NFeGenerationBenchmark,
+]
+
+
+def get_benchmarks(patterns=None):
+    """Get the benchmarks matching some patterns
+
+    :param patterns: a list of shell-style patterns (e.g. ``sale_*``)
+        matched against the benchmark names, or ``None`` for all of them
+    :returns: a list of :class:`stoqlib.lib.benchmark.Benchmark` subclasses
+    """
+    if not patterns:
+        return BENCHMARKS[:]
+    return [b for b in BENCHMARKS
+            if any(fnmatch.fnmatch(b.name, p) for p in patterns)]
@@ -26,25 +26,62 @@ Identify and apply to a product, the defined taxes by
 IBPT - Instituto Brasileiro de Planejamento Tributário (Brazilian Institute
 of Tributary Planning)
 According to Law 12,741 of 12/08/2012 - Taxes in Coupon.
+
+The IBPT tables are distributed as one CSV file per state. Parsing them is
+too slow to be done by every process that prints a coupon, so they are
+compiled into an index (see :func:`compile_ibpt_index`): a binary file with
+fixed size records sorted by NCM and EX, that is memory mapped and searched
+in place. Opening it is almost instantaneous and the pages are shared by
+all the processes using it.
+
+The indexes should be compiled when installing or updating (with
+``stoqdbadmin compile_ibpt``). If they are missing or older than the CSV
+files, they are compiled to the application directory when first needed.
 """
 from collections import namedtuple
 
 from kiwi.environ import environ
 
 import csv
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
 from decimal import Decimal
 
-from stoqlib.database.runtime import get_current_branch, new_store
+from stoqlib.database.runtime import get_current_branch, get_default_store
 from stoqlib.lib.defaults import quantize
+from stoqlib.lib.osutils import get_application_dir
 from stoqlib.lib.parameters import sysparam
 
-taxes_data = {}
+log = logging.getLogger(__name__)
+
 TaxInfo = namedtuple('TaxInfo', 'nacionalfederal, importadosfederal, estadual,'
                      'fonte, chave')
 
+_INDEX_MAGIC = b'STOQIBPT'
+_INDEX_VERSION = 1
+# magic, version, number of records, offset of the strings
+_HEADER = struct.Struct('<8sIII')
+# ncm, ex and the indexes of nacionalfederal, importadosfederal,
+# estadual, fonte and chave in the strings
+_RECORD = struct.Struct('<12s4s5I')
+
+# state -> IBPTIndex
+_indexes = {}
+
+
+def _pack_key(value, size):
+    key = value.encode('ascii')
+    if len(key) > size:
+        raise ValueError("%r is too long to be indexed" % (value, ))
+    return key.ljust(size, b'\0')
 
-def load_taxes_csv():
-    """ Load the fields of IBPT table.
+
+def compile_ibpt_index(csv_filename, index_filename):
+    """Compile an IBPT table to an index that can be used by :class:`IBPTIndex`
 
     - Fields:
         - ncm: Nomenclatura Comum do Sul.
@@ -60,37 +97,193 @@ def load_taxes_csv():
         - chave: Chave que associa a Tabela IBPT baixada com a empresa.
         - versao: Versão das alíquotas usadas para cálculo.
         - Fonte: Fonte
+
+    The index is written to a temporary file and then renamed, so processes
+    that are using the old one are not affected.
+
+    :param csv_filename: the ``TabelaIBPTax<UF>.csv`` file
+    :param index_filename: where to write the index
+    """
+    strings = []
+    string_ids = {}
+
+    def get_string_id(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    records = {}
+    with open(csv_filename, 'r', encoding='latin1') as csv_file:
+        for (ncm, ex, tipo, descricao, nacionalfederal, importadosfederal,
+             estadual, municipal, vigenciainicio, vigenciafim, chave,
+             versao, fonte) in csv.reader(csv_file, delimiter=';'):
+            # Ignore service codes (NBS - Nomenclatura Brasileira de Serviços)
+            if tipo == '1':
+                continue
+            records[(_pack_key(ncm, 12), _pack_key(ex, 4))] = (
+                get_string_id(nacionalfederal),
+                get_string_id(importadosfederal),
+                get_string_id(estadual),
+                get_string_id(fonte),
+                get_string_id(chave))
+
+    tmp_filename = '%s.%d.tmp' % (index_filename, os.getpid())
+    with open(tmp_filename, 'wb') as index_file:
+        index_file.write(_HEADER.pack(
+            _INDEX_MAGIC, _INDEX_VERSION, len(records),
+            _HEADER.size + _RECORD.size * len(records)))
+        for key in sorted(records):
+            index_file.write(_RECORD.pack(key[0], key[1], *records[key]))
+        index_file.write(json.dumps(strings).encode('utf-8'))
+    os.replace(tmp_filename, index_filename)
+
+
+def compile_ibpt_indexes(directory=None):
+    """Compile the IBPT tables of all the states
+
+    :param directory: where to write the indexes. By default they are
+        written beside the tables
+    :returns: the filenames of the indexes
+    """
+    tables_dir = environ.get_resource_filename('stoq', 'csv', 'ibpt_tables')
+    filenames = []
+    for csv_filename in sorted(glob.glob(os.path.join(tables_dir, '*.csv'))):
+        index_filename = _get_index_basename(csv_filename)
+        if directory is not None:
+            index_filename = os.path.join(directory,
+                                          os.path.basename(index_filename))
+        compile_ibpt_index(csv_filename, index_filename)
+        filenames.append(index_filename)
+    return filenames
+
+
+def _get_index_basename(csv_filename):
+    return os.path.splitext(csv_filename)[0] + '.idx'
+
+
+def _is_up_to_date(index_filename, csv_filename):
+    try:
+        return (os.path.getmtime(index_filename) >=
+                os.path.getmtime(csv_filename))
+    except OSError:
+        return False
+
+
+class IBPTIndex(object):
+    """A compiled IBPT table
+
+    See :func:`compile_ibpt_index`
+
+    :param filename: the index file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count, strings_offset = _HEADER.unpack_from(
+            self._mmap, 0)
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            self.close()
+            raise ValueError("%s is not a valid IBPT index" % (filename, ))
+        self._strings = json.loads(
+            self._mmap[strings_offset:].decode('utf-8'))
+
+    def __len__(self):
+        return self._count
+
+    #
+    #  Public API
+    #
+
+    def get_options(self, code):
+        """Get the taxes of a NCM (or service code)
+
+        :param code: the NCM
+        :returns: a dict mapping each EX of the NCM (``''`` for the one
+            without an EX) to its :class:`TaxInfo`
+        """
+        try:
+            key = _pack_key(code, 12)
+        except (ValueError, UnicodeEncodeError):
+            return {}
+
+        # The records are sorted by NCM and EX, so look for the first one
+        # of the NCM and read them until the NCM changes
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = _HEADER.size + mid * _RECORD.size
+            if self._mmap[offset:offset + 12] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        options = {}
+        strings = self._strings
+        for i in range(lo, self._count):
+            record = _RECORD.unpack_from(self._mmap,
+                                         _HEADER.size + i * _RECORD.size)
+            if record[0] != key:
+                break
+            ex = record[1].rstrip(b'\0').decode('ascii')
+            options[ex] = TaxInfo(*[strings[j] for j in record[2:]])
+        return options
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def get_ibpt_index(state):
+    """Get the :class:`IBPTIndex` of a state
+
+    The index is compiled if it is missing or older than the table.
+
+    :param state: the state, e.g. ``'SP'``
     """
+    index = _indexes.get(state)
+    if index is not None:
+        return index
 
-    # Avoid load taxes more than once.
-    if taxes_data:
-        return
+    csv_filename = environ.get_resource_filename(
+        'stoq', 'csv', 'ibpt_tables', 'TabelaIBPTax%s.csv' % state)
+    index_filename = _get_index_basename(csv_filename)
+    if not _is_up_to_date(index_filename, csv_filename):
+        index_dir = os.path.join(get_application_dir(), 'ibpt')
+        os.makedirs(index_dir, exist_ok=True)
+        index_filename = os.path.join(index_dir,
+                                      os.path.basename(index_filename))
+        if not _is_up_to_date(index_filename, csv_filename):
+            log.info('Compiling the IBPT table %s', csv_filename)
+            compile_ibpt_index(csv_filename, index_filename)
 
-    store = new_store()
-    branch = get_current_branch(store)
-    address = branch.person.get_main_address()
-    state = address.city_location.state
+    index = _indexes[state] = IBPTIndex(index_filename)
+    return index
 
-    filename = environ.get_resource_filename('stoq', 'csv', 'ibpt_tables',
-                                             'TabelaIBPTax%s.csv' % state)
-    csv_file = (csv.reader(open(filename, "r", encoding='latin1'), delimiter=';'))
 
-    for (ncm, ex, tipo, descricao, nacionalfederal, importadosfederal,
-         estadual, municipal, vigenciainicio, vigenciafim, chave,
-         versao, fonte) in csv_file:
-        # Ignore service codes (NBS - Nomenclatura Brasileira de Serviços)
-        if tipo == '1':
-            continue
-        tax_dict = taxes_data.setdefault(ncm, {})
-        tax_dict[ex] = TaxInfo(nacionalfederal, importadosfederal, estadual,
-                               fonte, chave)
+def load_taxes_csv(state=None):
+    """Load the IBPT table of a state
+
+    :param state: the state, defaults to the one of the current |branch|
+    :returns: the :class:`IBPTIndex` of the state
+    """
+    if state is None:
+        branch = get_current_branch(get_default_store())
+        address = branch.person.get_main_address()
+        state = address.city_location.state
+    return get_ibpt_index(state)
 
 
 class IBPTGenerator(object):
     def __init__(self, items, include_services=False):
-        load_taxes_csv()
+        self.index = load_taxes_csv()
         self.items = items
         self.include_services = include_services
+        # Many items usually share the same NCM, so resolve each one once
+        self._options = {}
+        self._delivery = None
 
     def _format_ex(self, ex_tipi):
         if not ex_tipi:
@@ -103,7 +296,10 @@ class IBPTGenerator(object):
         sellable = item.sellable
         product = sellable.product
         service = sellable.service
-        delivery = sysparam.get_object(item.store, 'DELIVERY_SERVICE').sellable
+        if self._delivery is None:
+            self._delivery = sysparam.get_object(item.store,
+                                                 'DELIVERY_SERVICE').sellable
+        delivery = self._delivery
         if product:
             code = product.ncm or ''
             ex_tipi = self._format_ex(product.ex_tipi)
@@ -114,7 +310,9 @@ class IBPTGenerator(object):
             code = '%04d' % int(service.service_list_item_code.replace('.', ''))
             ex_tipi = ''
 
-        options = taxes_data.get(code, {})
+        options = self._options.get(code)
+        if options is None:
+            options = self._options[code] = self.index.get_options(code)
         n_options = len(options)
         if n_options == 0:
             tax_values = TaxInfo('0', '0', '0', '', '0')
@@ -136,8 +334,9 @@ class IBPTGenerator(object):
         sellable = item.sellable
         product = sellable.product
 
-        if product and product.get_icms_template(item.parent.branch):
-            origin = product.get_icms_template(item.parent.branch).orig
+        icms_template = product and product.get_icms_template(item.parent.branch)
+        if icms_template:
+            origin = icms_template.orig
         else:
             # If the product does not have any fiscal information or it's a
             # service, defaults to national origin
@@ -161,6 +360,7 @@ class IBPTGenerator(object):
 
     def get_ibpt_message(self):
         federal_tax = state_tax = 0
+        tax_values = None
         for item in self.items:
             tax_values = self._load_tax_values(item)
             federal_tax += self._calculate_federal_tax(item, tax_values)
@@ -182,5 +382,13 @@ class IBPTGenerator(object):
 
 
 def generate_ibpt_message(items, include_services=False):
+    """Generate the message with the approximate taxes of *items*
+
+    All the items are resolved against the IBPT table at once, looking up
+    each NCM only once.
+
+    :param items: the |saleitems| (or other invoice items)
+    :param include_services: if the taxes of the services should be included
+    """
     generator = IBPTGenerator(items, include_services)
     return generator.get_ibpt_message()
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Concurrent POS load generator
+
+Simulates a number of POS stations doing checkouts at the same time,
+each one in its own thread and database connection. A checkout does what
+the POS application does: it creates a |sale|, adds some |sellables| to
+it, orders it, creates a money or card payment and confirms the sale on
+the station's |till|.
+
+Since the work is mostly done by the database server, threads are enough
+to create contention. To also put more load on the client side, run more
+than one load test at the same time using different station prefixes.
+"""
+
+import collections
+import logging
+import math
+import random
+import threading
+import time
+
+from stoqlib.database.exceptions import (DEADLOCK_DETECTED,
+                                         SERIALIZATION_FAILURE)
+from stoqlib.database.runtime import (get_transaction_retries, new_store,
+                                      run_in_transaction)
+from stoqlib.lib.parameters import sysparam
+
+log = logging.getLogger(__name__)
+
+
+def percentile(values, p):
+    """Get the p-th percentile of a list of values (nearest-rank method)
+
+    :param values: a sequence of numbers
+    :param p: the percentile, between 0 and 100
+    :returns: the percentile or ``None`` if values is empty
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(math.ceil(p / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+class LoadTestStats(object):
+    """Statistics collected by the load test, shared by all the stations
+
+    :ivar latencies: the time, in seconds, of each successful checkout
+    :ivar deadlocks: how many checkouts failed because of a deadlock
+    :ivar serialization_failures: how many checkouts failed because of
+        a serialization failure
+    :ivar errors: a counter of other errors, by exception name
+    :ivar retries: how many times checkouts were retried because of
+        deadlocks or serialization failures
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.deadlocks = 0
+        self.serialization_failures = 0
+        self.errors = collections.Counter()
+        self.retries = 0
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def elapsed(self):
+        if self.start_time is None or self.end_time is None:
+            return 0
+        return self.end_time - self.start_time
+
+    @property
+    def throughput(self):
+        """The number of successful checkouts per second"""
+        if not self.elapsed:
+            return 0
+        return len(self.latencies) / self.elapsed
+
+    def add_success(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def add_failure(self, error):
+        pgcode = getattr(error, 'pgcode', None)
+        with self._lock:
+            if pgcode == DEADLOCK_DETECTED:
+                self.deadlocks += 1
+            elif pgcode == SERIALIZATION_FAILURE:
+                self.serialization_failures += 1
+            else:
+                self.errors[type(error).__name__] += 1
+
+    def get_summary(self):
+        """Get a summary of the statistics
+
+        :returns: a dict with the number of sales, throughput, latency
+            percentiles (in seconds) and failures
+        """
+        with self._lock:
+            latencies = self.latencies[:]
+            return dict(
+                sales=len(latencies),
+                elapsed=self.elapsed,
+                throughput=self.throughput,
+                p50=percentile(latencies, 50),
+                p90=percentile(latencies, 90),
+                p99=percentile(latencies, 99),
+                max=max(latencies) if latencies else None,
+                deadlocks=self.deadlocks,
+                serialization_failures=self.serialization_failures,
+                retries=self.retries,
+                errors=dict(self.errors))
+
+    def format(self):
+        summary = self.get_summary()
+        lines = ['sales: %(sales)d in %(elapsed).2fs '
+                 '(%(throughput).2f sales/s)' % summary]
+        if summary['sales']:
+            lines.append('latency: p50=%.1fms p90=%.1fms p99=%.1fms '
+                         'max=%.1fms' % tuple(
+                             summary[k] * 1000
+                             for k in ['p50', 'p90', 'p99', 'max']))
+        lines.append('deadlocks: %(deadlocks)d' % summary)
+        lines.append('serialization failures: '
+                     '%(serialization_failures)d' % summary)
+        lines.append('retries: %(retries)d' % summary)
+        for name, count in sorted(summary['errors'].items()):
+            lines.append('%s: %d' % (name, count))
+        return '\n'.join(lines)
+
+
+class _StationWorker(threading.Thread):
+
+    def __init__(self, load_test, station_id, seed):
+        super(_StationWorker, self).__init__()
+        self.daemon = True
+        self.load_test = load_test
+        self.station_id = station_id
+        self.random = random.Random(seed)
+
+    def run(self):
+        load_test = self.load_test
+        rand = self.random
+        for i in range(load_test.sales_per_station):
+            # Decide what will be sold beforehand, so that a retried
+            # checkout sells the same items
+            n_items = min(rand.randint(1, load_test.max_items),
+                          len(load_test.sellable_ids))
+            sellable_ids = rand.sample(load_test.sellable_ids, n_items)
+            method_name = (u'card' if rand.random() < load_test.card_ratio
+                           else u'money')
+
+            start = time.perf_counter()
+            try:
+                run_in_transaction(self._checkout, sellable_ids, method_name,
+                                   max_retries=load_test.retries)
+            except Exception as e:
+                log.debug('Checkout failed on station %s: %s',
+                          self.station_id, e)
+                load_test.stats.add_failure(e)
+            else:
+                load_test.stats.add_success(time.perf_counter() - start)
+
+            if load_test.think_time:
+                time.sleep(rand.uniform(0, load_test.think_time))
+
+    def _checkout(self, store, sellable_ids, method_name):
+        from stoqlib.domain.payment.group import PaymentGroup
+        from stoqlib.domain.payment.method import PaymentMethod
+        from stoqlib.domain.payment.payment import Payment
+        from stoqlib.domain.person import Branch, LoginUser
+        from stoqlib.domain.sale import Sale
+        from stoqlib.domain.sellable import Sellable
+        from stoqlib.domain.station import BranchStation
+        from stoqlib.domain.till import Till
+
+        load_test = self.load_test
+        branch = store.get(Branch, load_test.branch_id)
+        station = store.get(BranchStation, self.station_id)
+        user = store.get(LoginUser, load_test.user_id)
+
+        group = PaymentGroup(store=store)
+        sale = Sale(store=store,
+                    status=Sale.STATUS_QUOTE,
+                    branch=branch,
+                    station=station,
+                    salesperson=user.person.sales_person,
+                    group=group,
+                    cfop_id=load_test.cfop_id,
+                    coupon_id=None)
+        for sellable_id in sellable_ids:
+            sale.add_sellable(store.get(Sellable, sellable_id))
+        sale.order(user)
+
+        method = PaymentMethod.get_by_name(store, method_name)
+        method.create_payment(branch, station, Payment.TYPE_IN, group,
+                              sale.get_total_sale_amount())
+
+        sale.confirm(user, till=Till.get_current(store, station))
+        store.retval = load_test.commit
+
+
+class PosLoadTest(object):
+    """Drives checkouts on a number of simulated POS stations
+
+    :param branch: the |branch| where the sales are made
+    :param user: the |loginuser| doing the sales
+    :param stations: how many stations are simulated
+    :param sales_per_station: how many sales each station does
+    :param max_items: the maximum number of items of a sale
+    :param sellables: how many |sellables| the sales pick their items
+        from. A smaller number means more contention on the stock
+    :param card_ratio: the ratio of sales paid with card
+    :param think_time: the maximum number of seconds a station waits
+        between sales
+    :param station_prefix: the prefix of the name of the stations
+    :param commit: if the sales should be committed. When ``False``, they
+        are rolled back after being confirmed, which still exercises all
+        the locking
+    :param retries: how many times a checkout that failed because of a
+        deadlock or a serialization failure is retried
+    :param seed: the seed for the random generators
+    """
+
+    def __init__(self, branch, user, stations=30, sales_per_station=100,
+                 max_items=20, sellables=200, card_ratio=0.3, think_time=0,
+                 station_prefix=u'loadtest', commit=True, retries=0,
+                 seed=0):
+        self.branch_id = branch.id
+        self.user_id = user.id
+        self.n_stations = stations
+        self.sales_per_station = sales_per_station
+        self.max_items = max_items
+        self.n_sellables = sellables
+        self.card_ratio = card_ratio
+        self.think_time = think_time
+        self.station_prefix = station_prefix
+        self.commit = commit
+        self.retries = retries
+        self.seed = seed
+
+        self.cfop_id = sysparam.get_object_id('DEFAULT_SALES_CFOP')
+        self.station_ids = []
+        self.sellable_ids = []
+        self.stats = LoadTestStats()
+
+    #
+    #  Public API
+    #
+
+    def prepare(self):
+        """Prepare the stations and pick the sellables
+
+        The stations are created if they don't exist and their tills are
+        opened. This is committed to the database.
+        """
+        from stoqlib.domain.person import Branch, LoginUser
+        from stoqlib.domain.station import BranchStation
+        from stoqlib.domain.till import Till
+        from stoqlib.lib.benchmarkcases import get_sellables_in_stock
+
+        with new_store() as store:
+            branch = store.get(Branch, self.branch_id)
+            user = store.get(LoginUser, self.user_id)
+            self.station_ids = []
+            for i in range(self.n_stations):
+                name = u'%s-%02d' % (self.station_prefix, i + 1)
+                station = store.find(BranchStation, name=name).one()
+                if station is None:
+                    station = BranchStation(store=store, branch=branch,
+                                            name=name, is_active=True)
+                if Till.get_current(store, station) is None:
+                    till = Till(store=store, branch=branch, station=station)
+                    till.open_till(user)
+                self.station_ids.append(station.id)
+
+            # Make sure there is enough stock for all the sales, with some
+            # margin since the items are picked randomly
+            sold = (self.n_stations * self.sales_per_station *
+                    (self.max_items + 1) / 2.0)
+            minimum = int(math.ceil(2 * sold / self.n_sellables))
+            self.sellable_ids = [
+                s.id for s in get_sellables_in_stock(
+                    store, branch, self.n_sellables, minimum=minimum)]
+
+        if not self.sellable_ids:
+            raise ValueError("There are no sellables with at least %d items "
+                             "in stock" % (minimum, ))
+
+    def run(self):
+        """Run the load test, blocking until all the stations are done
+
+        :returns: the :class:`LoadTestStats`
+        """
+        if not self.station_ids:
+            self.prepare()
+
+        workers = [_StationWorker(self, station_id, '%s-%d' % (self.seed, i))
+                   for i, station_id in enumerate(self.station_ids)]
+        name = _StationWorker._checkout.__qualname__
+        retries = get_transaction_retries().get(name, 0)
+        self.stats.start_time = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.stats.end_time = time.perf_counter()
+        self.stats.retries = get_transaction_retries().get(name, 0) - retries
+        return self.stats
@@ -329,6 +329,17 @@ _details = [
           u'hotel room, a real token in a convenience store and so on. '),
         bool, initial=False),
 
+    ParameterDetails(
+        u'SALE_CONFIRM_BACKGROUND_JOBS',
+        _(u'Sales'),
+        _(u'Run sale confirmation side effects in background'),
+        _(u'Once this parameter is set, the work that does not need to be '
+          u'done while the customer waits (e.g. creating the commissions and '
+          u'logging the event of the sale) will be done in background, '
+          u'after the sale is confirmed. Requires the background job '
+          u'worker to be running.'),
+        bool, initial=False),
+
     ParameterDetails(
         u'DEFAULT_PAYMENT_METHOD',
         _(u'Sales'),
@@ -1246,6 +1257,13 @@ class ParameterAccess(object):
         """Clears the internal cache so it can be rebuilt on next access"""
         self._values_cache = None
 
+    def load(self):
+        """Loads the values of all the parameters at once
+
+        Otherwise they are loaded the first time a parameter is accessed.
+        """
+        return self._values
+
     def ensure_system_parameters(self, store, update=False):
         """
         :param update: ``True`` if we're upgrading a database,
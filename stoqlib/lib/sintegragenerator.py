@@ -34,6 +34,7 @@ from stoqlib.domain.devices import FiscalDayHistory
 from stoqlib.domain.inventory import Inventory
 from stoqlib.domain.person import (Company,
                                    Individual)
+from stoqlib.domain.product import ProductStockSnapshot
 from stoqlib.domain.receiving import ReceivingOrder
 from stoqlib.domain.sale import Sale
 from stoqlib.lib.sintegra import SintegraFile, SintegraError
@@ -330,19 +331,28 @@ class StoqlibSintegraGenerator(object):
                                   0, 0, 0, 0)
 
     def _add_inventory(self, inventory, state):
-        for item in inventory.get_items():
+        items = list(inventory.get_items())
+        # The items that were not counted keep the stock they had when the
+        # inventory was closed
+        stock = ProductStockSnapshot.get_stock_at(
+            self.store, inventory.close_date, branch=inventory.branch,
+            storable_ids=[item.product_id for item in items
+                          if item.actual_quantity is None])
+        for item in items:
             sellable = item.product.sellable
+            quantity = item.actual_quantity
+            if quantity is None:
+                quantity = stock.get(
+                    (item.product_id, inventory.branch_id, item.batch_id), 0)
             # Before bug #3708 the inventory items did not store the product's
             # cost, in this case, we use the current cost.
-            if item.product_cost:
-                total_product_value = item.get_total_cost()
-            else:
-                total_product_value = sellable.cost * item.actual_quantity
+            cost = item.product_cost or sellable.cost
+            total_product_value = cost * quantity
 
             self.sintegra.add_inventory_item(
                 inventory.close_date,
                 product_code=sellable.code,
-                product_quantity=item.actual_quantity,
+                product_quantity=quantity,
                 total_product_value=total_product_value,
                 # we are assuming that the main company owns all the products
                 # see the link in bug #3708 for further details.
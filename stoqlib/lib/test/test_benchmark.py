@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+import os
+import tempfile
+
+from stoqlib.domain.sellable import Sellable
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.lib.benchmark import (Benchmark, BenchmarkResult,
+                                   BenchmarkRunner, SkipBenchmark,
+                                   compare_results, load_results,
+                                   save_results)
+from stoqlib.lib.benchmarkcases import BENCHMARKS, get_benchmarks
+
+__tests__ = 'stoqlib/lib/benchmark.py'
+
+
+class _QueryBenchmark(Benchmark):
+    name = 'query'
+
+    def run(self):
+        self.store.find(Sellable).count()
+        self.store.find(Sellable).count()
+
+
+class _SkippedBenchmark(Benchmark):
+    name = 'skipped'
+
+    def setup(self):
+        raise SkipBenchmark('not available')
+
+
+class _BrokenBenchmark(Benchmark):
+    name = 'broken'
+
+    def run(self):
+        raise ValueError('broken')
+
+
+class TestBenchmark(DomainTest):
+
+    def _run(self, *benchmarks):
+        runner = BenchmarkRunner(self.current_branch, self.current_station,
+                                 self.current_user, repeat=3)
+        return runner.run(benchmarks)
+
+    def test_runner(self):
+        result, skipped, broken = self._run(_QueryBenchmark, _SkippedBenchmark,
+                                            _BrokenBenchmark)
+        self.assertTrue(result.ok)
+        self.assertEqual(len(result.times), 3)
+        self.assertEqual(result.queries, 2)
+        self.assertTrue(result.peak_memory > 0)
+
+        self.assertFalse(skipped.ok)
+        self.assertEqual(skipped.skipped, 'not available')
+        self.assertFalse(broken.ok)
+        self.assertEqual(broken.error, 'ValueError: broken')
+
+    def test_median(self):
+        self.assertEqual(BenchmarkResult('a').median, None)
+        self.assertEqual(BenchmarkResult('a', times=[3, 1, 2]).median, 2)
+        self.assertEqual(BenchmarkResult('a', times=[4, 1, 2, 3]).median, 2.5)
+
+    def test_save_load(self):
+        results = [BenchmarkResult('a', times=[0.1, 0.2], queries=10,
+                                   peak_memory=1024),
+                   BenchmarkResult('b', skipped='not available')]
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            filename = f.name
+        try:
+            save_results(results, filename)
+            loaded = load_results(filename)
+        finally:
+            os.unlink(filename)
+
+        self.assertEqual([r.to_dict() for r in loaded],
+                         [r.to_dict() for r in results])
+
+    def test_compare_results(self):
+        baseline = [BenchmarkResult('a', times=[1.0], queries=10,
+                                    peak_memory=1000),
+                    BenchmarkResult('b', times=[1.0], queries=10,
+                                    peak_memory=1000)]
+        results = [BenchmarkResult('a', times=[1.1], queries=10,
+                                   peak_memory=1100),
+                   BenchmarkResult('b', times=[1.5], queries=11,
+                                   peak_memory=2000),
+                   BenchmarkResult('c', times=[1.0], queries=1,
+                                   peak_memory=1)]
+        self.assertEqual(compare_results(baseline, results), [
+            ('b', 'time', 1.0, 1.5),
+            ('b', 'queries', 10, 11),
+            ('b', 'peak_memory', 1000, 2000)])
+        self.assertEqual(compare_results(baseline, results, tolerance=1), [
+            ('b', 'queries', 10, 11)])
+
+    def test_get_benchmarks(self):
+        self.assertEqual(get_benchmarks(), BENCHMARKS)
+        self.assertEqual(
+            [b.name for b in get_benchmarks(['sale_confirm_*'])],
+            ['sale_confirm_1', 'sale_confirm_20', 'sale_confirm_300'])
+        names = [b.name for b in BENCHMARKS]
+        self.assertEqual(len(names), len(set(names)))
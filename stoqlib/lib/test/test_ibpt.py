@@ -22,12 +22,21 @@
 ##  Author(s): Stoq Team <stoq-devel@async.com.br>
 ##
 
+import os
+import shutil
+import tempfile
+import unittest
 from decimal import Decimal
 
+import mock
+from kiwi.environ import environ
+
 from stoqlib.database.runtime import get_current_branch
 from stoqlib.domain.taxes import ProductTaxTemplate, ProductIcmsTemplate
 from stoqlib.domain.test.domaintest import DomainTest
-from stoqlib.lib.ibpt import IBPTGenerator, generate_ibpt_message
+from stoqlib.lib.ibpt import (IBPTGenerator, IBPTIndex, TaxInfo,
+                              compile_ibpt_index, generate_ibpt_message,
+                              get_ibpt_index)
 
 
 class TestCalculateTaxForItem(DomainTest):
@@ -162,3 +171,78 @@ class TestCalculateTaxForItem(DomainTest):
         expected_federal_tax = total_item * (Decimal("21.45") / 100)
         federal = generator._calculate_federal_tax(sale_item, tax_values)
         self.assertEqual(federal, expected_federal_tax)
+
+
+class TestIBPTIndex(unittest.TestCase):
+    def setUp(self):
+        super(TestIBPTIndex, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_filename = os.path.join(self.tmpdir, 'TabelaIBPTaxXX.csv')
+        with open(self.csv_filename, 'w', encoding='latin1') as f:
+            f.write('codigo;ex;tipo;descricao;nacionalfederal;'
+                    'importadosfederal;estadual;municipal;vigenciainicio;'
+                    'vigenciafim;chave;versao;fonte\n'
+                    '39269090;;0;Outras;17.24;34.49;18.00;0.00;01/01/2018;'
+                    '31/03/2018;A5G7R1;18.1.A;IBPT\n'
+                    '39269090;01;0;Ex 01;4.20;21.45;18.00;0.00;01/01/2018;'
+                    '31/03/2018;A5G7R1;18.1.A;IBPT\n'
+                    '01012100;;0;Cavalos;4.20;6.20;18.00;0.00;01/01/2018;'
+                    '31/03/2018;A5G7R1;18.1.A;IBPT\n'
+                    '0104;;1;Servico NBS;1.00;1.00;0.00;0.00;01/01/2018;'
+                    '31/03/2018;A5G7R1;18.1.A;IBPT\n')
+        self.index_filename = os.path.join(self.tmpdir, 'TabelaIBPTaxXX.idx')
+        compile_ibpt_index(self.csv_filename, self.index_filename)
+        self.index = IBPTIndex(self.index_filename)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmpdir)
+        super(TestIBPTIndex, self).tearDown()
+
+    def test_get_options(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.get_options('01012100'), {
+            '': TaxInfo('4.20', '6.20', '18.00', 'IBPT', 'A5G7R1')})
+        self.assertEqual(self.index.get_options('39269090'), {
+            '': TaxInfo('17.24', '34.49', '18.00', 'IBPT', 'A5G7R1'),
+            '01': TaxInfo('4.20', '21.45', '18.00', 'IBPT', 'A5G7R1')})
+        # Services codes (NBS) are ignored
+        self.assertEqual(self.index.get_options('0104'), {})
+        self.assertEqual(self.index.get_options('00000000'), {})
+        self.assertEqual(self.index.get_options('99999999'), {})
+        self.assertEqual(self.index.get_options(''), {})
+        self.assertEqual(self.index.get_options('0' * 20), {})
+
+    def test_invalid(self):
+        with open(self.index_filename, 'wb') as f:
+            f.write(b'x' * 100)
+        with self.assertRaises(ValueError):
+            IBPTIndex(self.index_filename)
+
+    def test_shipped_tables(self):
+        csv_filename = environ.get_resource_filename(
+            'stoq', 'csv', 'ibpt_tables', 'TabelaIBPTaxSP.csv')
+        index_filename = os.path.join(self.tmpdir, 'TabelaIBPTaxSP.idx')
+        compile_ibpt_index(csv_filename, index_filename)
+        index = IBPTIndex(index_filename)
+        self.assertEqual(index.get_options('01012100'), {
+            '': TaxInfo('4.20', '6.20', '18.00',
+                        'IBPT/empresometro.com.br', 'A5G7R1')})
+        index.close()
+
+    @mock.patch('stoqlib.lib.ibpt._indexes', new={})
+    @mock.patch('stoqlib.lib.ibpt.get_application_dir')
+    @mock.patch('stoqlib.lib.ibpt.environ.get_resource_filename')
+    def test_get_ibpt_index(self, get_resource_filename, get_application_dir):
+        get_resource_filename.return_value = self.csv_filename
+        get_application_dir.return_value = self.tmpdir
+        # Older than the table, so it is compiled again
+        os.utime(self.index_filename, (0, 0))
+
+        index = get_ibpt_index('XX')
+        self.assertEqual(index.filename,
+                         os.path.join(self.tmpdir, 'ibpt',
+                                      'TabelaIBPTaxXX.idx'))
+        self.assertIn('01', index.get_options('39269090'))
+        self.assertIs(get_ibpt_index('XX'), index)
+        index.close()
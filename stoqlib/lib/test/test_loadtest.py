@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+import unittest
+
+import mock
+
+from stoqlib.database.exceptions import (DEADLOCK_DETECTED,
+                                         SERIALIZATION_FAILURE)
+from stoqlib.lib.loadtest import LoadTestStats, percentile
+
+__tests__ = 'stoqlib/lib/loadtest.py'
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), None)
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([3, 1, 2], 0), 1)
+
+    def test_stats(self):
+        stats = LoadTestStats()
+        stats.start_time = 10
+        stats.end_time = 12
+        for latency in [0.1, 0.2, 0.3, 0.4]:
+            stats.add_success(latency)
+
+        stats.add_failure(mock.Mock(pgcode=DEADLOCK_DETECTED))
+        stats.add_failure(mock.Mock(pgcode=SERIALIZATION_FAILURE))
+        stats.add_failure(mock.Mock(pgcode=SERIALIZATION_FAILURE))
+        stats.add_failure(ValueError())
+
+        summary = stats.get_summary()
+        self.assertEqual(summary['sales'], 4)
+        self.assertEqual(summary['throughput'], 2)
+        self.assertEqual(summary['p50'], 0.2)
+        self.assertEqual(summary['max'], 0.4)
+        self.assertEqual(summary['deadlocks'], 1)
+        self.assertEqual(summary['serialization_failures'], 2)
+        self.assertEqual(summary['errors'], {'ValueError': 1})
+        self.assertIn('deadlocks: 1', stats.format())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+import mock
+
+from stoqlib.domain.offlinejournal import OfflineJournal
+from stoqlib.domain.sellablelookup import SellableLookupIndex
+from stoqlib.domain.test.domaintest import DomainTest
+from stoqlib.lib.warmup import TillWarmup
+
+__tests__ = 'stoqlib/lib/warmup.py'
+
+
+class TestTillWarmup(DomainTest):
+
+    @mock.patch('stoqlib.lib.ibpt.load_taxes_csv')
+    @mock.patch('stoqlib.domain.sellablelookup.get_sellable_lookup_index')
+    @mock.patch('stoqlib.domain.offlinejournal.get_offline_journal')
+    def test_run(self, get_offline_journal, get_sellable_lookup_index,
+                 load_taxes_csv):
+        index = SellableLookupIndex(listen=False)
+        get_sellable_lookup_index.return_value = index
+        journal = OfflineJournal(filename=':memory:')
+        get_offline_journal.return_value = journal
+
+        warmup = TillWarmup(self.store, self.current_station)
+        results = warmup.run()
+
+        self.assertEqual([r.name for r in results],
+                         [name for name, func in warmup.steps])
+        self.assertEqual([r for r in results if r.error is not None], [])
+        self.assertTrue(all(r.elapsed >= 0 for r in results))
+        load_taxes_csv.assert_called_once_with()
+        self.assertTrue(index.loaded)
+        self.assertNotEqual(journal.get_catalog_date(), None)
+        self.assertIn('lookup_index: ', warmup.format())
+
+    @mock.patch('gi.repository.GLib.idle_add')
+    def test_run_idle(self, idle_add):
+        chunks = []
+
+        def chunked():
+            for i in range(3):
+                chunks.append(i)
+                yield i
+
+        callback = mock.Mock()
+        warmup = TillWarmup(self.store, self.current_station)
+        warmup.steps = [('chunked', chunked), ('plain', mock.Mock())]
+        warmup.run_idle(callback=callback)
+        self.assertTrue(warmup.running)
+
+        # Each call runs a chunk of a step, or a step without chunks
+        run_next, = idle_add.call_args[0]
+        for i in range(3):
+            self.assertTrue(run_next())
+            self.assertEqual(chunks, list(range(i + 1)))
+        self.assertTrue(run_next())
+        self.assertEqual([r.name for r in warmup.results], ['chunked'])
+        self.assertFalse(run_next())
+
+        self.assertFalse(warmup.running)
+        self.assertEqual([r.name for r in warmup.results],
+                         ['chunked', 'plain'])
+        callback.assert_called_once_with(warmup.results)
+
+    def test_run_error(self):
+        warmup = TillWarmup(self.store, self.current_station)
+        warmup.steps = [('broken', mock.Mock(side_effect=ValueError('broken'))),
+                        ('ok', mock.Mock())]
+        broken, ok = warmup.run()
+        self.assertEqual(str(broken.error), 'broken')
+        self.assertEqual(ok.error, None)
+        self.assertIn('broken: ', warmup.format())
+        self.assertIn('(failed: broken)', warmup.format())
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# vi:si:et:sw=4:sts=4:ts=4
+
+##
+## Copyright (C) 2026 Async Open Source <http://www.async.com.br>
+## All rights reserved
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU Lesser General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU Lesser General Public License
+## along with this program; if not, write to the Free Software
+## Foundation, Inc., or visit: http://www.gnu.org/.
+##
+## Author(s): Stoq Team <stoq-devel@async.com.br>
+##
+
+"""Warm-up of the caches used when selling
+
+Most of what the first sale of the day needs is loaded lazily: the
+parameters, the IBPT tables, payment methods, CFOPs, tax templates, units,
+the modules of the plugins and the |sellable| lookup index. That makes the
+first sale visibly slower than the next ones.
+
+The catalog snapshot of the :class:`offline journal
+<stoqlib.domain.offlinejournal.OfflineJournal>` is also saved, so the
+station can keep selling if the database becomes unreachable.
+
+:class:`TillWarmup` loads all of that beforehand, usually right after the
+|till| is opened, and reports how long each step took.
+"""
+
+import collections
+import collections.abc
+import importlib
+import logging
+import pkgutil
+import sys
+import time
+
+from stoqlib.lib.parameters import sysparam
+from stoqlib.lib.pluginmanager import get_plugin_manager
+
+log = logging.getLogger(__name__)
+
+#: The result of a warm-up step. *elapsed* is in seconds and *error* is
+#: the exception raised by the step, if any
+WarmupResult = collections.namedtuple('WarmupResult',
+                                      ['name', 'elapsed', 'error'])
+
+
+class TillWarmup(object):
+    """Warms up the caches of a station
+
+    The objects are loaded in *store*, so they are already in its cache
+    when they are needed by the sale.
+
+    :param store: the store used by the application that sells
+    :param station: the |branchstation|
+    """
+
+    def __init__(self, store, station):
+        self.store = store
+        self.station = station
+        #: if :meth:`.run_idle` is still running the steps
+        self.running = False
+        self.results = []
+        self.steps = [
+            ('parameters', self.load_parameters),
+            ('ibpt', self.load_ibpt),
+            ('payment_methods', self.load_payment_methods),
+            ('cfops', self.load_cfops),
+            ('tax_templates', self.load_tax_templates),
+            ('units', self.load_units),
+            ('plugins', self.import_plugins),
+            ('queries', self.run_queries),
+            ('lookup_index', self.load_lookup_index),
+            ('offline_catalog', self.save_offline_catalog),
+        ]
+
+    #
+    #  Public API
+    #
+
+    def run(self):
+        """Run all the steps
+
+        :returns: a list of :class:`WarmupResult`
+        """
+        for name, func in self.steps:
+            for chunk in self._run_step(name, func):
+                pass
+        return self.results
+
+    def run_idle(self, callback=None):
+        """Run the steps in the main loop, one at a time
+
+        The steps run when the main loop is idle, so the interface is still
+        responsive between them. A step that returns an iterator (like
+        :meth:`.load_lookup_index`) runs one chunk at a time.
+
+        :param callback: called with the list of :class:`WarmupResult`
+            when all the steps are done
+        """
+        from gi.repository import GLib
+
+        steps = collections.deque(self._run_step(name, func)
+                                  for name, func in self.steps)
+
+        def run_next():
+            try:
+                next(steps[0])
+            except StopIteration:
+                steps.popleft()
+            if steps:
+                return True
+            self.running = False
+            if callback is not None:
+                callback(self.results)
+            return False
+
+        self.running = True
+        GLib.idle_add(run_next)
+
+    def format(self):
+        lines = []
+        for result in self.results:
+            line = '%s: %.1fms' % (result.name, result.elapsed * 1000)
+            if result.error is not None:
+                line += ' (failed: %s)' % (result.error, )
+            lines.append(line)
+        return '\n'.join(lines)
+
+    #
+    #  Steps
+    #
+
+    def load_parameters(self):
+        sysparam.load()
+
+    def load_ibpt(self):
+        from stoqlib.lib.ibpt import load_taxes_csv
+        load_taxes_csv()
+
+    def load_payment_methods(self):
+        from stoqlib.domain.payment.method import PaymentMethod
+        for method in self.store.find(PaymentMethod, is_active=True):
+            # The operation is looked up on a registry when first used
+            method.operation
+
+    def load_cfops(self):
+        from stoqlib.domain.fiscal import CfopData
+        list(self.store.find(CfopData))
+
+    def load_tax_templates(self):
+        from stoqlib.domain.taxes import (ProductCofinsTemplate,
+                                          ProductIcmsTemplate,
+                                          ProductIpiTemplate,
+                                          ProductPisTemplate,
+                                          ProductTaxTemplate)
+        for cls in [ProductTaxTemplate, ProductIcmsTemplate,
+                    ProductIpiTemplate, ProductPisTemplate,
+                    ProductCofinsTemplate]:
+            list(self.store.find(cls))
+
+    def load_units(self):
+        from stoqlib.domain.sellable import SellableTaxConstant, SellableUnit
+        list(self.store.find(SellableUnit))
+        list(self.store.find(SellableTaxConstant))
+
+    def import_plugins(self):
+        manager = get_plugin_manager()
+        for name in manager.active_plugins_names:
+            plugin = manager.get_plugin(name)
+            package = type(plugin).__module__.rpartition('.')[0]
+            if not package:
+                continue
+            path = getattr(sys.modules[package], '__path__', None)
+            for module_info in pkgutil.iter_modules(path):
+                if module_info.name.startswith('test'):
+                    continue
+                module = '%s.%s' % (package, module_info.name)
+                try:
+                    importlib.import_module(module)
+                except Exception as e:
+                    log.debug('Could not import %s: %s', module, e)
+
+    def run_queries(self):
+        # Run the shape of the queries done by every sale once, so
+        # everything they need (e.g. the classes of the domain and the
+        # server's caches) is loaded
+        from storm.expr import Lower
+        from stoqlib.domain.product import ProductStockItem, StorableBatch
+        from stoqlib.domain.sellable import Sellable
+        from stoqlib.domain.till import Till
+
+        Till.get_current(self.store, self.station)
+        for attr in [Sellable.barcode, Sellable.code]:
+            self.store.find(Sellable, Lower(attr) == u'').any()
+        self.store.find(StorableBatch,
+                        Lower(StorableBatch.batch_number) == u'').any()
+        self.store.find(ProductStockItem,
+                        branch_id=self.station.branch_id).any()
+
+    def load_lookup_index(self):
+        from stoqlib.domain.sellablelookup import get_sellable_lookup_index
+        index = get_sellable_lookup_index()
+        if not index.loaded:
+            return index.iter_load(self.store)
+
+    def save_offline_catalog(self):
+        from stoqlib.domain.offlinejournal import get_offline_journal
+        return get_offline_journal().iter_save_catalog(self.store,
+                                                       self.station.branch)
+
+    #
+    #  Private
+    #
+
+    def _run_step(self, name, func):
+        # Yields between the chunks of the steps that return an iterator.
+        # Only the time spent running the step is counted
+        error = None
+        elapsed = 0
+        start = time.perf_counter()
+        try:
+            chunks = func()
+            if isinstance(chunks, collections.abc.Iterator):
+                for chunk in chunks:
+                    elapsed += time.perf_counter() - start
+                    yield
+                    start = time.perf_counter()
+        except Exception as e:
+            log.warning('Warm-up step %s failed: %s', name, e)
+            error = e
+        elapsed += time.perf_counter() - start
+        log.info('Warm-up step %s took %.1fms', name, elapsed * 1000)
+        self.results.append(WarmupResult(name, elapsed, error))
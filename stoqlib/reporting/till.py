@@ -28,8 +28,10 @@
 from storm.expr import And
 
 from stoqlib.domain.till import TillClosedView
+from stoqlib.lib.formatters import get_formatted_price
 from stoqlib.lib.translation import stoqlib_gettext as _
-from stoqlib.reporting.report import ObjectListReport, HTMLReport
+from stoqlib.reporting.report import (ObjectListReport, HTMLReport,
+                                      TableReport)
 
 N_ = _
 
@@ -43,6 +45,58 @@ class TillHistoryReport(ObjectListReport):
     summary = ['value']
 
 
+class TillReconciliationReport(TableReport):
+    """This report compares the values of the entries of a |till| with
+    the ones counted when it was closed, for each payment method.
+    """
+    title = _("Till Reconciliation")
+    main_object_name = (_("payment method"), _("payment methods"))
+
+    def __init__(self, filename, till, *args, **kwargs):
+        self.till = till
+        TableReport.__init__(self, filename, till.get_reconciliation(),
+                             *args, **kwargs)
+
+    def _format(self, value):
+        if value is None:
+            return ''
+        return get_formatted_price(value)
+
+    def _get_difference(self, item):
+        counted = item.verify_value
+        if counted is None:
+            counted = item.user_value
+        if counted is None:
+            return None
+        return counted - item.system_value
+
+    def get_columns(self):
+        return [dict(title=_('Description')),
+                dict(title=_('System value'), align='right'),
+                dict(title=_('User value'), align='right'),
+                dict(title=_('Verified value'), align='right'),
+                dict(title=_('Difference'), align='right')]
+
+    def reset(self):
+        self._system_total = 0
+        self._difference_total = 0
+
+    def accumulate(self, item):
+        self._system_total += item.system_value
+        self._difference_total += self._get_difference(item) or 0
+
+    def get_row(self, item):
+        return [item.description,
+                self._format(item.system_value),
+                self._format(item.user_value),
+                self._format(item.verify_value),
+                self._format(self._get_difference(item))]
+
+    def get_summary_row(self):
+        return [_('Total'), self._format(self._system_total), '', '',
+                self._format(self._difference_total)]
+
+
 class TillDailyMovementReport(HTMLReport):
     """This report shows all the financial transactions on till
     """